@@ -0,0 +1,85 @@
+"""
+Server-side count/sum aggregation with a streaming fallback
+
+Firestore aggregation queries (`count()`, `sum()`) are answered from the
+index: one request, billed as one document read per 1000 matched index
+entries, instead of downloading every matching document. Backends whose
+queries don't support aggregation (local/in-memory clients), or a query
+whose composite index hasn't been deployed yet (see firestore.indexes.json),
+fall back to streaming the documents and aggregating in Python, so callers
+always get an answer.
+"""
+import math
+from typing import Any, Dict, Optional
+
+# Index entries covered by one billed read of an aggregation query
+INDEX_ENTRIES_PER_READ = 1000
+
+
+def billed_reads(matched: int) -> int:
+    """Document reads billed for one aggregation over `matched` entries."""
+    return max(1, math.ceil(matched / INDEX_ENTRIES_PER_READ))
+
+
+def _result_values(results: Any) -> Dict[str, Any]:
+    """Flatten AggregationQuery.get() output into {alias: value}."""
+    values: Dict[str, Any] = {}
+    for row in results or []:
+        for item in (row if isinstance(row, (list, tuple)) else [row]):
+            values[item.alias] = item.value
+    return values
+
+
+def _to_float(value: Any) -> float:
+    try:
+        return float(value or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def aggregate(query: Any, count_alias: Optional[str] = "count",
+              sums: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    """Count the documents matching `query` and sum some of their fields.
+
+    `sums` maps result alias -> field name. Returns {alias: value}, with
+    counts as int and sums as float.
+    """
+    sums = sums or {}
+    if hasattr(query, "count") and hasattr(query, "sum"):
+        try:
+            agg = None
+            if count_alias:
+                agg = query.count(alias=count_alias)
+            for alias, field in sums.items():
+                agg = (agg or query).sum(field, alias=alias)
+            if agg is not None:
+                values = _result_values(agg.get())
+                result: Dict[str, Any] = {}
+                if count_alias:
+                    result[count_alias] = int(values.get(count_alias) or 0)
+                for alias in sums:
+                    result[alias] = _to_float(values.get(alias))
+                return result
+        except Exception as e:
+            print(f"⚠️ Aggregation query failed, aggregating by streaming: {e}")
+
+    result = {alias: 0.0 for alias in sums}
+    matched = 0
+    for doc in query.stream():
+        matched += 1
+        data = doc.to_dict() or {}
+        for alias, field in sums.items():
+            result[alias] += _to_float(data.get(field))
+    if count_alias:
+        result[count_alias] = matched
+    return result
+
+
+def count(query: Any) -> int:
+    """Number of documents matching `query`."""
+    return aggregate(query, count_alias="count")["count"]
+
+
+def sum_field(query: Any, field: str) -> float:
+    """Sum of a numeric field over the documents matching `query`."""
+    return aggregate(query, count_alias=None, sums={"total": field})["total"]
@@ -1,14 +1,16 @@
 """
 OpenAI integration for voice transcription and command parsing
 """
-import os
 import json
-import tempfile
 import re
 from typing import Optional, Dict, Any
-import requests
-from openai import OpenAI
+import threading
 
+from config import Config
+import openai_guard
+import tracing
+import transcript_cache
+import voice_ingest
 from models import ParsedCommand, CommandAction
 
 
@@ -16,34 +18,60 @@ class AIService:
     """OpenAI service for Whisper and GPT-4o-mini"""
 
     def __init__(self, api_key: str, model: str = "gpt-4o-mini"):
-        """Initialize OpenAI client"""
-        self.client = OpenAI(api_key=api_key)
+        """Keep the key; the OpenAI client is built on first use (see `client`)."""
+        self.api_key = api_key
         self.model = model
-
-    def transcribe_audio(self, audio_url: str, audio_format: str = "ogg") -> Optional[str]:
+        self._client = None
+        self._client_lock = threading.Lock()
+
+    @property
+    def client(self):
+        """The OpenAI client, behind openai_guard (deadlines, concurrency cap,
+        circuit breaker). `openai` takes ~0.6s to import, so it is only
+        imported (once, thread-safely) when a request needs Whisper or GPT.
+        The SDK's own retries are off by default (OPENAI_MAX_RETRIES): a retry
+        would run past the deadline the guard gave the call."""
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    from openai import OpenAI
+                    self._client = openai_guard.GuardedClient(OpenAI(
+                        api_key=self.api_key,
+                        max_retries=Config.OPENAI_MAX_RETRIES,
+                    ))
+        return self._client
+
+    @client.setter
+    def client(self, value):
+        # Stand-ins (tests, load harness) go through the same guard
+        self._client = openai_guard.GuardedClient(value)
+
+    def transcribe_audio(self, audio_url: str, audio_format: str = "ogg",
+                         headers: Optional[Dict[str, str]] = None) -> Optional[str]:
         """Transcribe audio using OpenAI Whisper (or compatible model).
 
+        The media is streamed from `audio_url` into the Whisper upload
+        (voice_ingest), never written to disk; `headers` are sent with the
+        download (provider auth). Repeats of a note are answered from
+        transcript_cache.
+
         Returns plain text or None if something goes wrong.
         """
-        temp_file_path = None
+        audio = None
         try:
-            print(f"🔊 Downloading audio from {audio_url} ...")
-            response = requests.get(audio_url, timeout=30)
-            response.raise_for_status()
-            print(f"   Downloaded {len(response.content)} bytes (format={audio_format})")
-
-            # Save to temporary file
-            with tempfile.NamedTemporaryFile(delete=False, suffix=f".{audio_format}") as temp_file:
-                temp_file.write(response.content)
-                temp_file_path = temp_file.name
+            print(f"🔊 Streaming audio from {audio_url} (format={audio_format}) ...")
+            audio = voice_ingest.open_media(audio_url, audio_format, headers=headers)
 
             # Transcribe using Whisper, but always return English text
             # (use Whisper translation so Hindi audio becomes English text)
-            with open(temp_file_path, "rb") as audio_file:
-                transcript = self.client.audio.translations.create(
+            # A note we have seen before is answered from transcript_cache
+            transcript = transcript_cache.CACHE.transcribe(
+                audio, "translate", lambda file: self.client.audio.translations.create(
                     model="whisper-1",  # or gpt-4o-transcribe if enabled
-                    file=audio_file,
-                )
+                    file=file,
+                ))
+            audio.finish()
+            print(f"   Streamed {audio.bytes_read} bytes")
 
             text = getattr(transcript, "text", None)
             print(f"   📝 Whisper Transcript (RAW): {repr(text)}")
@@ -66,15 +94,18 @@ class AIService:
 
             return cleaned_text
 
+        except openai_guard.Unavailable as e:
+            tracing.log(f"⚠️ Whisper skipped: {e}")
+            return None
+        except (voice_ingest.VoiceTooLarge, voice_ingest.MediaDownloadFailed) as e:
+            tracing.log(f"⚠️ Voice note not transcribed: {e}")
+            return None
         except Exception as e:
             print(f"Error transcribing audio: {e}")
             return None
         finally:
-            if temp_file_path and os.path.exists(temp_file_path):
-                try:
-                    os.unlink(temp_file_path)
-                except Exception:
-                    pass
+            if audio is not None:
+                audio.close()
 
     def _convert_hindi_numbers_to_digits(self, text: str) -> str:
         """Convert Hindi and English number words to digits.
@@ -1932,16 +1963,18 @@ Do not include any explanation, just the JSON."""
         # "10 maggi add kar do".
         user_prompt = f"Parse this message: {hinglish_message}"
 
+        tracing.annotate("llm")
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                temperature=0.3,
-                response_format={"type": "json_object"}
-            )
+            with tracing.span("openai_parse"):
+                response = self.client.chat.completions.create(
+                    model=self.model,
+                    messages=[
+                        {"role": "system", "content": system_prompt},
+                        {"role": "user", "content": user_prompt}
+                    ],
+                    temperature=0.3,
+                    response_format={"type": "json_object"}
+                )
 
             result = json.loads(response.choices[0].message.content)
 
@@ -1987,6 +2020,9 @@ Do not include any explanation, just the JSON."""
                 raw_message=message
             )
 
+        except openai_guard.Unavailable as e:
+            tracing.log(f"⚠️ LLM parse skipped ({e.reason}), using the keyword parser")
+            return self._keyword_parse(hinglish_message, message)
         except Exception as e:
             print(f"Error parsing command: {e}")
             return ParsedCommand(
@@ -1997,6 +2033,58 @@ Do not include any explanation, just the JSON."""
                 raw_message=message
             )
 
+    # Intent keywords for _keyword_parse, matched as whole words and checked in this order
+    # (a question like "kitna aaya" is a check, not an add). No product-like words ("daal").
+    _FALLBACK_KEYWORDS = (
+        (CommandAction.REDUCE_STOCK, ("sold", "bik", "bika", "biki", "bike", "bech", "becha", "bechi", "beche",
+                                      "nikala", "nikali", "nikale", "customer ko diya", "sale ho")),
+        (CommandAction.CHECK_STOCK, ("kitna", "kitne", "kitni", "how much", "how many", "batao", "check",
+                                     "remaining", "bacha", "bachi", "bache")),
+        (CommandAction.ADD_STOCK, ("add", "added", "laya", "laye", "layi", "aaya", "aaye", "aayi", "purchase",
+                                   "purchased", "bought", "received", "new stock", "got")),
+    )
+    _FALLBACK_FILLER = {
+        "kar", "karo", "do", "diya", "gaya", "gaye", "gayi", "hai", "hain", "ka", "ke", "ki", "ko", "me", "mein",
+        "ne", "se", "aur", "bhi", "abhi", "aaj", "today", "i", "we", "the", "a", "of", "packet", "packets",
+        "customer", "new", "have", "much", "many", "how", "ho", "stock",
+        "kg", "kilo", "gm", "gram", "grams", "litre", "liter", "ml", "dozen", "piece", "pieces", "pcs",
+    }
+
+    def _keyword_parse(self, hinglish_message: str, message: str) -> ParsedCommand:
+        """Parse without the LLM, when openai_guard refused the call.
+
+        Stock add / sale / check only: the action from the first keyword
+        group with a whole-word match, the first number as quantity and the
+        remaining words as the product. Adds and sales get a confidence
+        under 0.5. Anything else stays UNKNOWN.
+        """
+        tracing.annotate("keyword_fallback")
+        text = (hinglish_message or "").lower()
+        unknown = ParsedCommand(action=CommandAction.UNKNOWN, product_name=None, quantity=None,
+                                confidence=0.0, raw_message=message)
+        action = next((candidate for candidate, keywords in self._FALLBACK_KEYWORDS
+                       if any(re.search(r"\b" + re.escape(kw) + r"\b", text) for kw in keywords)), None)
+        if action is None:
+            return unknown
+
+        quantity_match = re.search(r"\b(\d+(?:\.\d+)?)\b", text)
+        quantity = float(quantity_match.group(1)) if quantity_match else None
+        rest = re.sub(r"\b\d+(?:\.\d+)?\b", " ", text)
+        for kw in sorted((kw for _, keywords in self._FALLBACK_KEYWORDS for kw in keywords), key=len, reverse=True):
+            rest = re.sub(r"\b" + re.escape(kw) + r"\b", " ", rest)
+        words = [w for w in re.findall(r"[a-z\u0900-\u097f]+", rest) if w not in self._FALLBACK_FILLER]
+        product = " ".join(words).strip() or None
+        if product is None or (action != CommandAction.CHECK_STOCK and quantity is None):
+            return unknown
+        return ParsedCommand(
+            action=action,
+            product_name=product,
+            quantity=quantity if action != CommandAction.CHECK_STOCK else None,
+            # Under command_processor's 0.5 for adds and sales, so they are also saved for review
+            confidence=0.6 if action == CommandAction.CHECK_STOCK else 0.4,
+            raw_message=message
+        )
+
     def generate_response(self, action: str, result: Dict[str, Any], language: str = "hinglish") -> str:
         """Generate a natural language response for the user.
 
@@ -2042,7 +2130,7 @@ Do not include any explanation, just the JSON."""
                 alert_product = low_stock_alert.get('product_name', product_name)
                 alert_brand = low_stock_alert.get('brand')
                 alert_stock = low_stock_alert.get('current_stock', new_stock)
-                alert_threshold = low_stock_alert.get('threshold', 10)
+                alert_threshold = low_stock_alert.get('threshold', 5)
                 alert_unit = low_stock_alert.get('unit', unit)
 
                 # Build display name
@@ -2157,6 +2245,11 @@ Do not include any explanation, just the JSON."""
                     response = "📦 Aapke shop ke products:\r\n" + lines_str
 
             response += f"\r\nTotal products: {total}"
+            if total > len(products):
+                if is_english:
+                    response += f" (showing {len(products)})"
+                else:
+                    response += f" ({len(products)} dikhaye)"
             return response
 
         elif action == 'low_stock':
@@ -2178,7 +2271,11 @@ Do not include any explanation, just the JSON."""
                 name = p.get('name', 'Product')
                 stock = p.get('stock', 0)
                 unit = p.get('unit', 'pieces')
-                response += f"• {name}: {stock} {unit}{nl}"
+                own_threshold = p.get('threshold')
+                if own_threshold is not None and own_threshold != threshold:
+                    response += f"• {name}: {stock} {unit} (≤ {own_threshold}){nl}"
+                else:
+                    response += f"• {name}: {stock} {unit}{nl}"
 
             total_low = result.get('total_low_products', len(low_products))
             response += f"{nl}Total low-stock products: {total_low}"
@@ -3191,6 +3288,16 @@ Do not include any explanation, just the JSON."""
                     lines.append(f"🔑 Popular categories: {', '.join(festival_keywords[:5])}")
                 lines.append("")
 
+            # Year-over-year change for the whole season
+            season_yoy = result.get('yoy_change_pct')
+            if season_yoy is not None:
+                trend = f"+{season_yoy}%" if season_yoy >= 0 else f"{season_yoy}%"
+                if is_english:
+                    lines.append(f"📅 Season sales vs last year: {trend}")
+                else:
+                    lines.append(f"📅 Pichle saal se: {trend}")
+                lines.append("")
+
             # Add top products with intelligent insights
             if is_english:
                 lines.append("🏆 Top Products (Based on Historical Sales):")
@@ -3205,6 +3312,7 @@ Do not include any explanation, just the JSON."""
                 current_stock = product.get('current_stock', 0)
                 stock_status = product.get('stock_status', 'unknown')
                 suggested_order = product.get('suggested_order', 0)
+                product_yoy = product.get('yoy_change_pct')
 
                 # Status emoji
                 if stock_status == 'sufficient':
@@ -3220,6 +3328,8 @@ Do not include any explanation, just the JSON."""
                     lines.append(f"{idx}. {status_emoji} {name}")
                     lines.append(f"   📈 Historical sales: {historical_sales:.0f} units")
                     lines.append(f"   📊 Current stock: {current_stock:.0f} units [{status_text_en}]")
+                    if product_yoy is not None:
+                        lines.append(f"   📅 vs last year: {product_yoy:+.0f}%")
                     if suggested_order > 0:
                         lines.append(f"   🛒 Suggested order: {suggested_order:.0f} units")
                     lines.append("")
@@ -3227,6 +3337,8 @@ Do not include any explanation, just the JSON."""
                     lines.append(f"{idx}. {status_emoji} {name}")
                     lines.append(f"   📈 Pehle bika: {historical_sales:.0f} units")
                     lines.append(f"   📊 Abhi stock: {current_stock:.0f} units [{status_text_hi}]")
+                    if product_yoy is not None:
+                        lines.append(f"   📅 Pichle saal se: {product_yoy:+.0f}%")
                     if suggested_order > 0:
                         lines.append(f"   🛒 Order karna chahiye: {suggested_order:.0f} units")
                     lines.append("")
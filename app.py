@@ -1,73 +1,115 @@
 """
 Flask application for Kirana Shop Management
 """
-from flask import Flask, request, jsonify, render_template, send_from_directory, session, redirect, url_for
+from flask import Blueprint, Flask, current_app, request, jsonify, render_template, send_from_directory, session, redirect, url_for
 from functools import wraps
 import os
+import time
 import uuid
-from datetime import datetime
+from datetime import datetime, timedelta
+import catalog_sync
+import firestore_accounting
+import idempotency
+import offline_sync
+import openai_guard
+import services
+import tracing
+import transcription_strategy
+import voice_ingest
 from config import Config
-from database import FirestoreDB
-from ai_service import AIService
 from whatsapp_service import WhatsAppService
-from command_processor import CommandProcessor
 from models import UserRole, TransactionType
-from otp_service import OTPService
-
-# Initialize Flask app
-app = Flask(__name__)
-app.config.from_object(Config)
-app.secret_key = os.getenv('SECRET_KEY', 'your-secret-key-change-in-production-' + str(uuid.uuid4()))
-
-# Validate configuration
-try:
-    Config.validate()
-except ValueError as e:
-    print(f"Configuration error: {e}")
-    print("Please check your .env file and ensure all required variables are set.")
-    exit(1)
-
-# Initialize services
-print(f"🔧 Initializing database with:")
-print(f"   credentials_path: {Config.GOOGLE_APPLICATION_CREDENTIALS}")
-print(f"   project_id: {Config.FIREBASE_PROJECT_ID}")
-
-db = FirestoreDB(
-    credentials_path=Config.GOOGLE_APPLICATION_CREDENTIALS,
-    project_id=Config.FIREBASE_PROJECT_ID
-)
-
-print(f"✅ Database initialized")
-
-# Initialize OTP service
-otp_service = OTPService(db.db)
-
-ai_service = AIService(
-    api_key=Config.OPENAI_API_KEY,
-    model=Config.OPENAI_MODEL
-)
-
-# Determine WhatsApp provider
-whatsapp_provider = "wati" if Config.WATI_API_KEY else "whatsapp_cloud"
-
-if whatsapp_provider == "wati":
-    whatsapp_service = WhatsAppService(
-        provider="wati",
-        api_key=Config.WATI_API_KEY,
-        base_url=Config.WATI_BASE_URL
-    )
-else:
-    whatsapp_service = WhatsAppService(
-        provider="whatsapp_cloud",
-        access_token=Config.WHATSAPP_ACCESS_TOKEN,
-        phone_number_id=Config.WHATSAPP_PHONE_NUMBER_ID
+from expiry_index import normalize_expiry_date, normalize_batches
+from display_sessions import DisplaySessionStore
+
+# Services are built on first use (see services.py), not at import
+from services import db, otp_service, ai_service, whatsapp_service, command_processor
+
+routes = Blueprint('kirana', __name__)
+
+
+def create_app() -> Flask:
+    """Build the Flask app. Cheap: no service is constructed until a request
+    (or GET /ready, or the gunicorn warm-up) needs it."""
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    app.secret_key = os.getenv('SECRET_KEY', 'your-secret-key-change-in-production-' + str(uuid.uuid4()))
+    app.register_blueprint(routes)
+    return app
+
+
+# ==================== TRACING & METRICS ====================
+
+@routes.before_app_request
+def start_request_trace():
+    """Open a trace and a Firestore usage scope per request (see tracing.py,
+    firestore_accounting.py); /metrics scrapes and /ready probes aren't traced."""
+    if request.path in ('/metrics', '/ready'):
+        return
+    request.environ['kirana.started'] = time.perf_counter()
+    request.environ['kirana.firestore'] = firestore_accounting.begin()
+    request.environ['kirana.openai_budget'] = openai_guard.start_request()
+    rule = request.url_rule.rule if request.url_rule else request.path
+    tracing.start_trace(
+        f"{request.method} {rule}",
+        request.headers.get('X-Request-Id') or request.headers.get('X-Trace-Id'),
     )
 
-command_processor = CommandProcessor(
-    db=db,
-    ai_service=ai_service,
-    whatsapp_service=whatsapp_service
-)
+
+@routes.after_app_request
+def record_request_metrics(response):
+    started = request.environ.get('kirana.started')
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    if started is not None:
+        tracing.HTTP_SECONDS.observe(
+            time.perf_counter() - started,
+            method=request.method,
+            route=route,
+            status=response.status_code,
+        )
+    usage = request.environ.get('kirana.firestore')
+    if usage is not None:
+        firestore_accounting.observe_request(route, usage)
+        if firestore_accounting.usage_header_enabled():
+            response.headers['X-Firestore-Usage'] = usage.header()
+        budget = firestore_accounting.read_budget_per_request()
+        if budget is not None and usage.reads > budget:
+            tracing.log(f"⚠️ {request.method} {route} read {usage.reads} Firestore documents "
+                        f"(budget {budget}; {usage.header()})")
+    trace_id = tracing.current_trace_id()
+    if trace_id:
+        response.headers['X-Trace-Id'] = trace_id
+    return response
+
+
+@routes.teardown_app_request
+def finish_request_trace(exc=None):
+    usage = request.environ.pop('kirana.firestore', None)
+    if usage is not None:
+        firestore_accounting.end(usage)
+    budget = request.environ.pop('kirana.openai_budget', None)
+    if budget is not None:
+        openai_guard.end_request(budget)
+    tracing.end_trace()
+
+
+@routes.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus scrape endpoint; set METRICS_TOKEN to require a bearer token."""
+    token = Config.METRICS_TOKEN
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return 'Forbidden', 403
+    return current_app.response_class(tracing.REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+
+@routes.route('/ready', methods=['GET'])
+def ready():
+    """Readiness probe: builds any service not built yet (config, database,
+    OpenAI, WhatsApp, OTP, command processor) and reports each one; 503 until
+    all of them are up."""
+    report = services.warm()
+    ok = all(entry['ready'] for entry in report.values())
+    return jsonify({'success': ok, 'services': report}), 200 if ok else 503
 
 
 # ==================== AUTHENTICATION DECORATOR ====================
@@ -77,20 +119,20 @@ def login_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
         if 'user_phone' not in session:
-            return redirect(url_for('login_page'))
+            return redirect(url_for('kirana.login_page'))
         return f(*args, **kwargs)
     return decorated_function
 
 
 # ==================== OTP AUTHENTICATION ROUTES ====================
 
-@app.route('/login')
+@routes.route('/login')
 def login_page():
     """OTP login page"""
     return render_template('login.html')
 
 
-@app.route('/api/auth/send-otp', methods=['POST'])
+@routes.route('/api/auth/send-otp', methods=['POST'])
 def send_otp():
     """Send OTP to phone number with rate limiting and security"""
     try:
@@ -155,7 +197,7 @@ def send_otp():
         }), 500
 
 
-@app.route('/api/auth/verify-otp', methods=['POST'])
+@routes.route('/api/auth/verify-otp', methods=['POST'])
 def verify_otp():
     """Verify OTP and login user"""
     try:
@@ -243,7 +285,7 @@ def verify_otp():
         }), 500
 
 
-@app.route('/api/auth/logout', methods=['POST'])
+@routes.route('/api/auth/logout', methods=['POST'])
 def logout():
     """Logout user"""
     session.clear()
@@ -253,7 +295,7 @@ def logout():
     })
 
 
-@app.route('/api/auth/check', methods=['GET'])
+@routes.route('/api/auth/check', methods=['GET'])
 def check_auth():
     """Check if user is authenticated"""
     if 'user_phone' in session:
@@ -271,7 +313,7 @@ def check_auth():
 
 # ==================== MAIN ROUTES ====================
 
-@app.route('/')
+@routes.route('/')
 def index():
     """Serve the React POS app at root. Falls back to health check JSON if not built yet."""
     react_index = os.path.join(os.path.dirname(__file__), 'static', 'react', 'index.html')
@@ -280,7 +322,7 @@ def index():
     return jsonify({'status': 'ok', 'service': 'KiranaBuddy API', 'version': '1.0.0'})
 
 
-@app.route('/test')
+@routes.route('/test')
 @login_required
 def test_interface():
     """Test interface - No WhatsApp required!"""
@@ -307,13 +349,13 @@ def test_interface():
 
 
 
-@app.route('/stock')
+@routes.route('/stock')
 def stock_management():
     """Simple stock management page to view & edit products for a shop."""
     return render_template('stock_management.html')
 
 
-@app.route('/test/audio-upload', methods=['POST'])
+@routes.route('/test/audio-upload', methods=['POST'])
 def test_audio_upload():
     """Upload voice note from test interface and return a temporary URL.
 
@@ -333,7 +375,7 @@ def test_audio_upload():
     if not ext:
         ext = '.webm'
 
-    audio_dir = os.path.join(app.root_path, 'temp_audio')
+    audio_dir = os.path.join(current_app.root_path, 'temp_audio')
     os.makedirs(audio_dir, exist_ok=True)
 
     filename = f"{uuid.uuid4().hex}{ext}"
@@ -348,14 +390,14 @@ def test_audio_upload():
     return jsonify({'success': True, 'url': url, 'format': ext.lstrip('.')})
 
 
-@app.route('/test/audio/<path:filename>')
+@routes.route('/test/audio/<path:filename>')
 def test_audio_file(filename):
     """Serve uploaded test audio file for transcription."""
-    audio_dir = os.path.join(app.root_path, 'temp_audio')
+    audio_dir = os.path.join(current_app.root_path, 'temp_audio')
     return send_from_directory(audio_dir, filename)
 
 
-@app.route('/api/transcribe-voice', methods=['POST'])
+@routes.route('/api/transcribe-voice', methods=['POST'])
 def transcribe_voice():
     """
     Transcribe voice audio directly using Whisper API
@@ -370,80 +412,25 @@ def transcribe_voice():
         if not audio_file or audio_file.filename == '':
             return jsonify({'success': False, 'error': 'Empty audio file'}), 400
 
-        print(f"🎤 Received voice file: {audio_file.filename}, size: {audio_file.content_length} bytes")
-
-        # Process audio in-memory (no disk storage needed)
-        # This works on any server without needing temp directories
-        print(f"🔊 Transcribing with Whisper (in-memory)...")
-
-        # Read audio data into memory
-        audio_file.seek(0)  # Reset file pointer to beginning
-        audio_data = audio_file.read()
-        print(f"   Audio size: {len(audio_data)} bytes")
-
-        # Create a file-like object from bytes for Whisper API
-        from io import BytesIO
-        audio_buffer = BytesIO(audio_data)
-        audio_buffer.name = "voice.webm"  # Whisper needs a filename
+        print(f"🎤 Received voice file: {audio_file.filename}, size: {request.content_length} bytes")
 
         try:
-            # Two-pass approach:
-            # Pass 1: Auto-detect and check what script is used
-            # Pass 2: If Urdu script detected, re-transcribe as Hindi (Devanagari)
-            print(f"   Pass 1: Auto-detecting language...")
-
-            # First pass - auto-detect
-            transcript_detect = ai_service.client.audio.transcriptions.create(
-                model="whisper-1",
-                file=audio_buffer,
-                response_format="verbose_json"
+            # Stream the upload to Whisper as is: no copies, no disk (voice_ingest)
+            audio_stream = voice_ingest.wrap_upload(audio_file.stream, "voice.webm", request.content_length)
+            print(f"🔊 Transcribing with Whisper (streamed)...")
+
+            # One Whisper pass where the shop's history says Hindi, else
+            # auto-detect with a Hindi re-run on Urdu script (transcription_strategy)
+            result = transcription_strategy.STRATEGY.transcribe(
+                session.get('shop_id') or request.form.get('shop_id'),
+                audio_stream,
+                lambda **params: ai_service.client.audio.transcriptions.create(model="whisper-1", **params),
             )
+            audio_stream.finish()
+            print(f"   ✅ Transcribed ({result.hint}, {result.passes} pass(es), {result.seconds:.2f}s): "
+                  f"{result.text[:100]!r}")
 
-            detected_language = transcript_detect.language
-            detected_text = transcript_detect.text
-            print(f"   🌐 Detected language: {detected_language}")
-            print(f"   📝 Detected text: {detected_text[:50]}...")
-
-            # Check if text contains Urdu/Arabic script (U+0600 to U+06FF)
-            import re
-            has_urdu_script = bool(re.search(r'[\u0600-\u06FF]', detected_text))
-            has_devanagari = bool(re.search(r'[\u0900-\u097F]', detected_text))
-            has_latin = bool(re.search(r'[a-zA-Z]', detected_text))
-
-            print(f"   Script analysis: Urdu={has_urdu_script}, Devanagari={has_devanagari}, Latin={has_latin}")
-
-            # If Urdu script detected, re-transcribe as Hindi (Devanagari)
-            if has_urdu_script:
-                print(f"   🔄 Urdu script detected! Re-transcribing as Hindi (Devanagari)...")
-
-                # Create fresh buffer
-                audio_buffer_new = BytesIO(audio_data)
-                audio_buffer_new.name = "voice.webm"
-
-                transcript = ai_service.client.audio.transcriptions.create(
-                    model="whisper-1",
-                    file=audio_buffer_new,
-                    response_format="text",
-                    language="hi"  # Force Devanagari script
-                )
-                print(f"   ✅ Re-transcribed in Devanagari: {transcript[:50]}...")
-            else:
-                # English or already Devanagari - use original
-                print(f"   ✅ Using original transcription")
-                transcript = detected_text
-
-            print(f"   Final transcript: {transcript[:100]}...")
-
-            # Get text from response
-            print(f"   Transcript type: {type(transcript)}")
-            print(f"   Transcript value: {repr(transcript)}")
-
-            if isinstance(transcript, str):
-                text = transcript
-            else:
-                text = getattr(transcript, 'text', str(transcript))
-
-            text = text.strip()
+            text = result.text.strip()
 
             print(f"📝 Raw transcript: {repr(text)}")
             print(f"📝 Transcript length: {len(text)} characters")
@@ -451,7 +438,7 @@ def transcribe_voice():
 
             if not text:
                 print(f"❌ Empty transcript received from Whisper!")
-                print(f"   Audio file size was: {os.path.getsize(temp_path)} bytes")
+                print(f"   Audio file size was: {audio_stream.bytes_read} bytes")
                 return jsonify({
                     'success': False,
                     'error': 'Whisper returned empty transcript. Audio may be too short or unclear.'
@@ -485,6 +472,24 @@ def transcribe_voice():
                 'raw_text': text
             })
 
+        except openai_guard.Unavailable as unavailable:
+            print(f"⚠️ Voice transcription unavailable: {unavailable}")
+            response = jsonify({
+                'success': False,
+                'error': 'Voice input is busy right now, please type the item instead.',
+                'reason': unavailable.reason
+            })
+            retry_after = openai_guard.GUARD.breaker.cooldown_seconds if unavailable.reason == 'breaker_open' else 5
+            response.headers['Retry-After'] = str(int(retry_after))
+            return response, 503
+
+        except voice_ingest.VoiceTooLarge as too_large:
+            print(f"⚠️ Voice note rejected: {too_large}")
+            return jsonify({
+                'success': False,
+                'error': 'Voice note is too long, please record a shorter one.'
+            }), 413
+
         except Exception as inner_e:
             print(f"❌ Error during transcription: {inner_e}")
             import traceback
@@ -505,17 +510,17 @@ def transcribe_voice():
 
 
 
-@app.route('/favicon.ico')
+@routes.route('/favicon.ico')
 def favicon():
     """Serve favicon"""
     return send_from_directory(
-        os.path.join(app.root_path, 'static'),
+        os.path.join(current_app.root_path, 'static'),
         'favicon.svg',
         mimetype='image/svg+xml'
     )
 
 
-@app.route('/webhook', methods=['GET', 'POST'])
+@routes.route('/webhook', methods=['GET', 'POST'])
 def webhook():
     """
     WhatsApp webhook endpoint
@@ -540,7 +545,7 @@ def webhook():
                 return jsonify({'status': 'error', 'message': 'No payload'}), 400
 
             # Parse webhook based on provider
-            if whatsapp_provider == "wati":
+            if services.whatsapp_provider() == "wati":
                 message_data = WhatsAppService.parse_wati_webhook(payload)
             else:
                 message_data = WhatsAppService.parse_whatsapp_cloud_webhook(payload)
@@ -561,10 +566,11 @@ def webhook():
             reply_sent = False
             if result.get('send_reply') and result.get('message'):
                 try:
-                    reply_sent = whatsapp_service.send_message(
-                        to_phone=message_data['from_phone'],
-                        message=result['message']
-                    )
+                    with tracing.span("send_message"):
+                        reply_sent = whatsapp_service.send_message(
+                            to_phone=message_data['from_phone'],
+                            message=result['message']
+                        )
                 except Exception as e:
                     print(f"WhatsApp send failed (this is OK for testing): {e}")
                     reply_sent = False
@@ -590,7 +596,7 @@ def webhook():
             }), 500
 
 
-@app.route('/api/shops', methods=['POST'])
+@routes.route('/api/shops', methods=['POST'])
 def create_shop():
     """Create a new shop"""
     try:
@@ -625,7 +631,7 @@ def create_shop():
         return jsonify({'error': str(e)}), 500
 
 
-@app.route('/api/shops/<shop_id>/users', methods=['POST'])
+@routes.route('/api/shops/<shop_id>/users', methods=['POST'])
 def add_staff(shop_id):
     """Add staff member to a shop"""
     try:
@@ -659,7 +665,7 @@ def add_staff(shop_id):
         return jsonify({'error': str(e)}), 500
 
 
-@app.route('/api/shops/<shop_id>/products', methods=['GET'])
+@routes.route('/api/shops/<shop_id>/products', methods=['GET'])
 def get_products(shop_id):
     """Get all products for a shop"""
     try:
@@ -674,7 +680,7 @@ def get_products(shop_id):
         return jsonify({'error': str(e)}), 500
 
 
-@app.route('/api/shops/<shop_id>/transactions', methods=['GET'])
+@routes.route('/api/shops/<shop_id>/transactions', methods=['GET'])
 def get_transactions(shop_id):
     """Get recent transactions for a shop"""
     try:
@@ -691,7 +697,20 @@ def get_transactions(shop_id):
 
 
 
-@app.route('/api/reports/eod', methods=['GET'])
+@routes.route('/api/shops/<shop_id>/reconciliation', methods=['GET'])
+def get_reconciliation(shop_id):
+    """Latest stock vs ledger reconciliation report (tools/reconcile_stock.py)"""
+    try:
+        report = db.get_reconciliation_report(shop_id)
+        if report is None:
+            return jsonify({'success': False, 'message': 'No reconciliation has run for this shop yet'}), 404
+        return jsonify(report), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@routes.route('/api/reports/eod', methods=['GET'])
 def end_of_day_report():
     """End-of-day sales report for the shop identified by phone.
 
@@ -723,21 +742,12 @@ def end_of_day_report():
         top_revenue = sorted(revenue_by.items(), key=lambda x: x[1], reverse=True)[:5]
         top_qty     = sorted(qty_by.items(),     key=lambda x: x[1], reverse=True)[:5]
 
-        # Count today's sale transactions
-        from datetime import datetime, timezone
-        today_start = datetime.now(timezone.utc).replace(
-            hour=0, minute=0, second=0, microsecond=0)
-
-        all_txns = db.get_transactions_by_shop(shop_id, limit=500)
-        sale_txns_today = [
-            t for t in all_txns
-            if t.transaction_type in ('sale', 'reduce_stock')
-            and (
-                t.timestamp.replace(tzinfo=timezone.utc)
-                if t.timestamp and t.timestamp.tzinfo is None
-                else t.timestamp or datetime.min.replace(tzinfo=timezone.utc)
-            ) >= today_start
-        ]
+        # Count today's checkouts (UTC day, like stored timestamps): each POS
+        # bill once, plus sale rows not on a bill (chat/voice sales)
+        today_start = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+        sales_today = db.get_sales_totals(shop_id, since=today_start)
+        bills_today = db.get_bill_totals(shop_id, since=today_start)
+        total_txns = int(sales_today['transactions'] - bills_today['lines'] + bills_today['bills'])
 
         return jsonify({
             'success': True,
@@ -747,7 +757,9 @@ def end_of_day_report():
             'total_cost':    round(data.get('total_cost',    0), 2),
             'total_profit':  round(data.get('total_profit',  0), 2),
             'total_items':   round(data.get('total_items_sold', 0), 2),
-            'total_txns':    len(sale_txns_today),
+            'total_txns':    total_txns,
+            'total_bills':   bills_today['bills'],
+            'avg_bill_value': bills_today['avg_bill_value'],
             'top_by_revenue': [{'name': n, 'revenue': round(v, 2)} for n, v in top_revenue],
             'top_by_qty':     [{'name': n, 'qty': round(v, 2)}     for n, v in top_qty],
         }), 200
@@ -756,7 +768,7 @@ def end_of_day_report():
         return jsonify({'success': False, 'message': str(e)}), 500
 
 
-@app.route('/api/transactions', methods=['GET'])
+@routes.route('/api/transactions', methods=['GET'])
 def get_transactions_by_phone():
     """Get recent transactions for the shop identified by phone number.
 
@@ -819,9 +831,16 @@ def get_transactions_by_phone():
         return jsonify({'success': False, 'message': str(e)}), 500
 
 
-@app.route('/api/stock/products', methods=['GET'])
+@routes.route('/api/stock/products', methods=['GET'])
 def get_stock_products():
-    """Get all products for the shop identified by phone (for stock UI)."""
+    """Get products for the shop identified by phone (for stock UI).
+
+    Conditional and incremental (see catalog_sync.py): the response carries
+    an ETag and `If-None-Match` with the current one gets a 304;
+    `updated_since=<cursor>` returns only products changed since that
+    cursor plus `deleted` product ids. Every response has the `cursor` for
+    the next delta. Large bodies are gzipped when the client accepts it.
+    """
     try:
         phone = (request.args.get('phone') or '').strip()
         if not phone:
@@ -836,16 +855,65 @@ def get_stock_products():
                 return jsonify({'success': False, 'message': 'Shop or user not found for phone'}), 404
             shop_id = shop.shop_id
 
-        products = db.get_products_by_shop(shop_id)
-        return jsonify({
+        since = (request.args.get('updated_since') or '').strip() or None
+        # Taken before reading, so a write racing this request changes the next ETag
+        etag = db.get_catalog_etag(
+            shop_id, catalog_sync.representation(since, request.headers.get('Accept-Encoding')))
+        if catalog_sync.etag_matches(request.headers.get('If-None-Match'), etag):
+            response = current_app.response_class(status=304)
+            response.headers['ETag'] = etag
+            response.headers['Cache-Control'] = 'no-cache'
+            response.headers['Vary'] = 'Accept-Encoding'
+            return response
+
+        delta = db.get_catalog_delta(shop_id, since)
+        payload = {
             'success': True,
-            'products': [p.to_dict() for p in products]
-        }), 200
+            'products': [p.to_dict() for p in delta['products']],
+            'cursor': delta['cursor'],
+            'full': since is None,
+        }
+        if since:
+            payload['deleted'] = delta['deleted']
+
+        response = jsonify(payload)
+        response.headers['ETag'] = etag
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['Vary'] = 'Accept-Encoding'
+        compressed = catalog_sync.compress(response.get_data(), request.headers.get('Accept-Encoding'))
+        if compressed is not None:
+            response.set_data(compressed)
+            response.headers['Content-Encoding'] = 'gzip'
+        return response, 200
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+
+@routes.route('/api/stock/products/<product_id>', methods=['DELETE'])
+def delete_stock_product(product_id):
+    """Delete a product of the caller's shop (clients see it in `deleted` of catalog deltas)."""
+    try:
+        phone = (request.args.get('phone') or '').strip()
+        if not phone:
+            return jsonify({'success': False, 'message': 'phone is required'}), 400
+
+        user = db.get_user_by_phone(phone)
+        if user:
+            shop_id = user.shop_id
+        else:
+            shop = db.get_shop_by_phone(phone)
+            if not shop:
+                return jsonify({'success': False, 'message': 'Shop or user not found for phone'}), 404
+            shop_id = shop.shop_id
+
+        if not db.delete_product(shop_id, product_id):
+            return jsonify({'success': False, 'message': 'Product not found'}), 404
+        return jsonify({'success': True, 'product_id': product_id}), 200
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
 
 
-@app.route('/api/stock/products/<product_id>', methods=['PATCH'])
+@routes.route('/api/stock/products/<product_id>', methods=['PATCH'])
 def update_stock_product(product_id):
     """Update product fields (barcode, batch expiry/qty) for stock UI.
 
@@ -907,12 +975,18 @@ def update_stock_product(product_id):
 
         # Optional simple expiry_date override
         if 'expiry_date' in data:
-            expiry_val = (data.get('expiry_date') or '').strip() or None
-            updates['expiry_date'] = expiry_val
+            try:
+                updates['expiry_date'] = normalize_expiry_date(data.get('expiry_date'))
+            except ValueError as e:
+                return jsonify({'success': False, 'message': str(e)}), 400
 
         # Optional batches payload: recompute current_stock from per-batch qty
         batches_val = data.get('batches')
         if isinstance(batches_val, dict):
+            try:
+                batches_val = normalize_batches(batches_val)
+            except ValueError as e:
+                return jsonify({'success': False, 'message': str(e)}), 400
             total_qty = 0.0
             for b in batches_val.values():
                 if not isinstance(b, dict):
@@ -937,9 +1011,10 @@ def update_stock_product(product_id):
 
 
 
-@app.route('/api/sales/record', methods=['POST'])
+@routes.route('/api/sales/record', methods=['POST'])
 def record_sale():
-    """Record a POS sale — deducts stock for each item in the cart.
+    """Record a POS sale — deducts stock for each item in the cart and keeps
+    the checkout as one bill (see FirestoreDB.record_bill).
 
     Expects JSON:
     {
@@ -950,8 +1025,11 @@ def record_sale():
         ],
         "total": 120.0,
         "payment_mode": "Cash",
-        "cash_given": 150.0
+        "cash_given": 150.0,
+        "idempotency_key": "client-generated id"   (or an Idempotency-Key header)
     }
+
+    A retry with the same key gets the original answer and changes nothing.
     """
     try:
         data = request.get_json() or {}
@@ -963,6 +1041,13 @@ def record_sale():
         if not items:
             return jsonify({'success': False, 'message': 'items is required'}), 400
 
+        # A retried checkout gets its original answer (see idempotency.py)
+        idem_key = idempotency.clean_key(request.headers.get('Idempotency-Key') or data.get('idempotency_key'))
+        if idem_key:
+            original = db.find_pos_request(idem_key, phone)
+            if original is not None:
+                return jsonify({**original, 'replayed': True}), 200
+
         # Resolve shop
         user = db.get_user_by_phone(phone)
         if user:
@@ -973,7 +1058,14 @@ def record_sale():
                 return jsonify({'success': False, 'message': 'Shop not found'}), 404
             shop_id = shop.shop_id
 
+        if idem_key:
+            original = db.find_pos_request(idem_key, phone, shop_id=shop_id)
+            if original is not None:
+                return jsonify({**original, 'replayed': True}), 200
+
         results = []
+        lines = []       # (product, qty) pairs going on the bill
+        untracked = []   # sold but not stocked by this shop
         for item in items:
             if not isinstance(item, dict):
                 continue
@@ -1000,60 +1092,122 @@ def record_sale():
                 if not real_product:
                     # Product not in this shop's DB — skip stock deduction.
                     # This prevents ghost product creation for DEMO/unregistered items.
-                    results.append({
-                        'name': name,
-                        'quantity': qty,
-                        'note': 'product not in shop database — stock unchanged'
-                    })
+                    untracked.append({'name': name, 'quantity': qty, 'price': item.get('price')})
                     continue
 
-                # ---- Direct stock update using product_id ----
-                # Bypass reduce_stock / get_or_create_product entirely to prevent
-                # ghost products being created when the normalized_name differs.
-                previous_stock = real_product.current_stock
-                new_stock = max(0.0, previous_stock - qty)
-
-                db.update_product_stock(real_product.product_id, new_stock)
-
-                # Compute sale price if available
-                unit_price = getattr(real_product, 'selling_price', None)
-                total_amount = (float(unit_price) * qty) if unit_price is not None else None
-
-                db.create_transaction(
-                    shop_id=shop_id,
-                    product_id=real_product.product_id,
-                    product_name=real_product.name,
-                    transaction_type=TransactionType.SALE,
-                    quantity=qty,
-                    previous_stock=previous_stock,
-                    new_stock=new_stock,
-                    user_phone=phone,
-                    unit_price=float(unit_price) if unit_price is not None else None,
-                    total_amount=total_amount,
-                    notes='React POS checkout',
-                )
-
-                results.append({
-                    'name': real_product.name,
-                    'quantity': qty,
-                    'new_stock': new_stock,
-                })
+                lines.append((real_product, qty))
             except Exception as item_err:
                 results.append({'name': name, 'error': str(item_err)})
 
-        return jsonify({'success': True, 'items': results,
-                        'total': data.get('total', 0),
-                        'payment_mode': data.get('payment_mode', 'Cash')}), 200
+        # ---- One bill for the whole checkout ----
+        # Direct stock updates by product_id (never reduce_stock /
+        # get_or_create_product, which could create ghost products); the
+        # bill, ledger rows and stock changes are written together, through
+        # the local sales journal when it is enabled.
+        cash_given = data.get('cash_given')
+        recorded = db.record_bill(
+            shop_id=shop_id,
+            lines=lines,
+            user_phone=phone,
+            payment_mode=data.get('payment_mode', 'Cash'),
+            cash_given=float(cash_given) if cash_given not in (None, '') else None,
+            client_total=float(data['total']) if data.get('total') not in (None, '') else None,
+            untracked=untracked,
+            notes='React POS checkout',
+            idempotency_key=idem_key,
+        )
+        response = recorded['response']
+        if recorded['replayed']:
+            return jsonify({**response, 'replayed': True}), 200
+
+        return jsonify({**response, 'items': response['items'] + results}), 200
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+
+@routes.route('/api/bills', methods=['GET'])
+def list_bills():
+    """POS bills for the shop identified by phone, newest first.
+
+    Query params:
+      phone  – required
+      limit  – bills per page (default 50)
+      before – next_cursor from the previous page
+      filter – 'today' | 'week' | 'all'  (default 'all')
+    """
+    try:
+        phone  = (request.args.get('phone') or '').strip()
+        limit  = int(request.args.get('limit', 50))
+        before = request.args.get('before') or None
+        filt   = (request.args.get('filter') or 'all').lower()
+
+        if not phone:
+            return jsonify({'success': False, 'message': 'phone is required'}), 400
+
+        user = db.get_user_by_phone(phone)
+        if user:
+            shop_id = user.shop_id
+        else:
+            shop = db.get_shop_by_phone(phone)
+            if not shop:
+                return jsonify({'success': False, 'message': 'Shop not found'}), 404
+            shop_id = shop.shop_id
+
+        since = None
+        if filt == 'today':
+            since = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+        elif filt == 'week':
+            since = datetime.utcnow() - timedelta(days=7)
+
+        page = db.get_bills(shop_id, since=since, limit=limit, before=before)
+        return jsonify({
+            'success': True,
+            'bills': [b.to_dict() for b in page['bills']],
+            'count': len(page['bills']),
+            'next_cursor': page['next_cursor'],
+        }), 200
+
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
 
 
-@app.route('/api/sales/return', methods=['POST'])
+@routes.route('/api/bills/<bill_id>', methods=['GET'])
+def get_bill(bill_id):
+    """A single POS bill with its line items
+
+    Query params:
+      phone  – required; only the phone's own shop's bills are found
+    """
+    try:
+        phone = (request.args.get('phone') or '').strip()
+        if not phone:
+            return jsonify({'success': False, 'message': 'phone is required'}), 400
+
+        user = db.get_user_by_phone(phone)
+        if user:
+            shop_id = user.shop_id
+        else:
+            shop = db.get_shop_by_phone(phone)
+            if not shop:
+                return jsonify({'success': False, 'message': 'Shop not found'}), 404
+            shop_id = shop.shop_id
+
+        bill = db.get_bill(bill_id, shop_id)
+        if not bill:
+            return jsonify({'success': False, 'message': 'Bill not found'}), 404
+        return jsonify({'success': True, 'bill': bill.to_dict()}), 200
+
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+
+@routes.route('/api/sales/return', methods=['POST'])
 def process_return():
     """Process a product return.
 
     Increases stock for each returned item and records a RETURN transaction.
-    Body: { phone, items: [{ name, barcode, quantity }] }
+    Body: { phone, items: [{ name, barcode, quantity }], idempotency_key? }
+    (or an Idempotency-Key header; a retry gets the original answer)
     """
     try:
         data  = request.get_json() or {}
@@ -1065,6 +1219,12 @@ def process_return():
         if not items:
             return jsonify({'success': False, 'message': 'items is required'}), 400
 
+        idem_key = idempotency.clean_key(request.headers.get('Idempotency-Key') or data.get('idempotency_key'))
+        if idem_key:
+            original = db.find_pos_request(idem_key, phone)
+            if original is not None:
+                return jsonify({**original, 'replayed': True}), 200
+
         user = db.get_user_by_phone(phone)
         if user:
             shop_id = user.shop_id
@@ -1074,7 +1234,13 @@ def process_return():
                 return jsonify({'success': False, 'message': 'Shop not found'}), 404
             shop_id = shop.shop_id
 
+        if idem_key:
+            original = db.find_pos_request(idem_key, phone, shop_id=shop_id)
+            if original is not None:
+                return jsonify({**original, 'replayed': True}), 200
+
         results = []
+        lines = []
         for item in items:
             name    = (item.get('name')    or '').strip()
             barcode = (item.get('barcode') or '').strip()
@@ -1092,43 +1258,72 @@ def process_return():
             if not product:
                 results.append({'name': name or barcode, 'error': 'product not found'})
                 continue
+            lines.append((product, qty))
 
-            previous_stock = product.current_stock
-            new_stock      = previous_stock + qty
-            db.update_product_stock(product.product_id, new_stock)
-
-            unit_price   = float(product.selling_price) if product.selling_price else None
-            total_amount = unit_price * qty if unit_price else None
-
-            db.create_transaction(
-                shop_id          = shop_id,
-                product_id       = product.product_id,
-                product_name     = product.name,
-                transaction_type = TransactionType.RETURN,
-                quantity         = qty,
-                previous_stock   = previous_stock,
-                new_stock        = new_stock,
-                user_phone       = phone,
-                unit_price       = unit_price,
-                total_amount     = total_amount,
-                notes            = 'POS return',
-            )
+        # All returned items are written together (through the sales journal when enabled)
+        recorded = db.record_returns(shop_id, lines, phone, notes='POS return', idempotency_key=idem_key)
+        response = recorded['response']
+        if recorded['replayed']:
+            return jsonify({**response, 'replayed': True}), 200
 
-            results.append({
-                'name':       product.name,
-                'quantity':   qty,
-                'new_stock':  new_stock,
-                'refund':     total_amount,
-                'unit_price': unit_price,
-            })
+        return jsonify({**response, 'items': response['items'] + results}), 200
 
-        return jsonify({'success': True, 'items': results}), 200
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
 
+
+@routes.route('/api/sales/journal', methods=['GET'])
+def sales_journal_status():
+    """Flush lag of the local sales journal (see sales_journal.py)."""
+    if db.sales_journal is None:
+        return jsonify({'success': True, 'enabled': False}), 200
+    try:
+        return jsonify({'success': True, 'enabled': True, **db.sales_journal.stats()}), 200
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
 
 
-@app.route('/api/stock/bill', methods=['POST'])
+@routes.route('/api/sync', methods=['POST'])
+def sync_offline_ops():
+    """Apply a queue of POS operations made offline (see offline_sync.py).
+
+    Body: { phone, ops: [{ op_id, type, client_ts, ... }], catalog_since? }
+    Returns a result per op, in order, and the catalog delta since
+    catalog_since with the cursor for the next sync.
+    """
+    try:
+        data = request.get_json() or {}
+        phone = (data.get('phone') or '').strip()
+        ops = data.get('ops')
+
+        if not phone:
+            return jsonify({'success': False, 'message': 'phone is required'}), 400
+        if not isinstance(ops, list):
+            return jsonify({'success': False, 'message': 'ops must be a list'}), 400
+        if len(ops) > offline_sync.MAX_OPS_PER_REQUEST:
+            return jsonify({
+                'success': False,
+                'message': f'at most {offline_sync.MAX_OPS_PER_REQUEST} ops per request',
+            }), 413
+
+        user = db.get_user_by_phone(phone)
+        if user:
+            shop_id = user.shop_id
+        else:
+            shop = db.get_shop_by_phone(phone)
+            if not shop:
+                return jsonify({'success': False, 'message': 'Shop not found'}), 404
+            shop_id = shop.shop_id
+
+        result = offline_sync.OfflineSync(db).apply(shop_id, phone, ops, catalog_since=data.get('catalog_since'))
+        print(f"🔄 Synced {len(ops)} offline ops for shop {shop_id}: {result['summary']}")
+        return jsonify(result), 200
+
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+
+@routes.route('/api/stock/bill', methods=['POST'])
 def add_stock_bill():
     """Fast bill entry: add stock for multiple products in one go.
 
@@ -1229,7 +1424,7 @@ def add_stock_bill():
         return jsonify({'success': False, 'message': str(e)}), 500
 
 
-@app.route('/api/stock/create-product', methods=['POST'])
+@routes.route('/api/stock/create-product', methods=['POST'])
 def create_new_product():
     """Create a new product with barcode, name, quantity, and expiry date.
 
@@ -1254,7 +1449,6 @@ def create_new_product():
         brand = (data.get('brand') or '').strip() or None
         quantity = data.get('quantity')
         unit = (data.get('unit') or 'pieces').strip()
-        expiry_date = (data.get('expiry_date') or '').strip() or None
         selling_price = data.get('selling_price')
         cost_price = data.get('cost_price')
 
@@ -1267,6 +1461,10 @@ def create_new_product():
             return jsonify({'success': False, 'message': 'name is required'}), 400
         if quantity is None or quantity < 0:
             return jsonify({'success': False, 'message': 'valid quantity is required'}), 400
+        try:
+            expiry_date = normalize_expiry_date(data.get('expiry_date'))
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
 
         # Resolve shop from phone
         user = db.get_user_by_phone(phone)
@@ -1324,7 +1522,7 @@ def create_new_product():
         )
 
         # Save to database
-        db.db.collection("products").document(product_id).set(product.to_dict())
+        db.save_product(product)
 
         # Create transaction record for initial stock
         from models import TransactionType
@@ -1352,54 +1550,14 @@ def create_new_product():
         return jsonify({'success': False, 'message': str(e)}), 500
 
 
-DEMO_PRODUCTS = [
-    # Vegetables (loose / per kg)
-    {"name":"Onion",              "barcode":"VEG-001", "selling_price":30,  "stock":50,  "unit":"kg"},
-    {"name":"Tomato",             "barcode":"VEG-002", "selling_price":25,  "stock":40,  "unit":"kg"},
-    {"name":"Potato",             "barcode":"VEG-003", "selling_price":22,  "stock":60,  "unit":"kg"},
-    {"name":"Garlic",             "barcode":"VEG-004", "selling_price":200, "stock":20,  "unit":"kg"},
-    {"name":"Ginger",             "barcode":"VEG-005", "selling_price":120, "stock":25,  "unit":"kg"},
-    {"name":"Carrot",             "barcode":"VEG-006", "selling_price":40,  "stock":35,  "unit":"kg"},
-    {"name":"Capsicum",           "barcode":"VEG-007", "selling_price":60,  "stock":30,  "unit":"kg"},
-    {"name":"Cauliflower",        "barcode":"VEG-008", "selling_price":35,  "stock":20,  "unit":"kg"},
-    {"name":"Spinach",            "barcode":"VEG-009", "selling_price":20,  "stock":15,  "unit":"kg"},
-    {"name":"Brinjal",            "barcode":"VEG-010", "selling_price":30,  "stock":25,  "unit":"kg"},
-    {"name":"Bhindi",             "barcode":"VEG-011", "selling_price":45,  "stock":20,  "unit":"kg"},
-    {"name":"Cucumber",           "barcode":"VEG-012", "selling_price":25,  "stock":30,  "unit":"kg"},
-    {"name":"Lemon",              "barcode":"VEG-013", "selling_price":80,  "stock":10,  "unit":"kg"},
-    {"name":"Green Chilli",       "barcode":"VEG-014", "selling_price":60,  "stock":15,  "unit":"kg"},
-    {"name":"Peas",               "barcode":"VEG-015", "selling_price":50,  "stock":20,  "unit":"kg"},
-    # Packaged goods
-    {"name":"Maggi Noodles",      "barcode":"8901058001329", "selling_price":14,  "stock":120, "unit":"pieces"},
-    {"name":"Amul Butter 500g",   "barcode":"8901063028481", "selling_price":55,  "stock":60,  "unit":"pieces"},
-    {"name":"Tata Salt 1kg",      "barcode":"8901058852017", "selling_price":22,  "stock":200, "unit":"pieces"},
-    {"name":"Parle-G Biscuit",    "barcode":"8901820000059", "selling_price":10,  "stock":300, "unit":"pieces"},
-    {"name":"Aashirvaad Atta 5kg","barcode":"8901725133496", "selling_price":280, "stock":45,  "unit":"pieces"},
-    {"name":"Surf Excel 1kg",     "barcode":"8901030827372", "selling_price":190, "stock":80,  "unit":"pieces"},
-    {"name":"Amul Milk 1L",       "barcode":"8901063013739", "selling_price":60,  "stock":150, "unit":"pieces"},
-    {"name":"Lifebuoy Soap",      "barcode":"8901030728931", "selling_price":35,  "stock":90,  "unit":"pieces"},
-    {"name":"Colgate 200g",       "barcode":"8901030038591", "selling_price":89,  "stock":70,  "unit":"pieces"},
-    {"name":"Dettol Handwash",    "barcode":"6290255052136", "selling_price":115, "stock":55,  "unit":"pieces"},
-    {"name":"Bru Coffee 100g",    "barcode":"8901030784576", "selling_price":199, "stock":40,  "unit":"pieces"},
-    {"name":"Good Day Biscuit",   "barcode":"8901820007812", "selling_price":30,  "stock":180, "unit":"pieces"},
-    {"name":"Haldiram Mixture",   "barcode":"8906002960019", "selling_price":50,  "stock":95,  "unit":"pieces"},
-    {"name":"Saffola Oil 1L",     "barcode":"8901058009622", "selling_price":165, "stock":35,  "unit":"pieces"},
-    {"name":"Lays Chips",         "barcode":"8901491502606", "selling_price":20,  "stock":200, "unit":"pieces"},
-    {"name":"Dairy Milk 40g",     "barcode":"8901233051400", "selling_price":40,  "stock":110, "unit":"pieces"},
-    {"name":"Tata Tea Gold 250g", "barcode":"8901058003279", "selling_price":165, "stock":60,  "unit":"pieces"},
-    {"name":"Vim Dishwash Bar",   "barcode":"8901030007490", "selling_price":30,  "stock":75,  "unit":"pieces"},
-    {"name":"Frooti Mango 200ml", "barcode":"8906022302888", "selling_price":15,  "stock":250, "unit":"pieces"},
-    {"name":"Rin Detergent 1kg",  "barcode":"8901030861278", "selling_price":90,  "stock":65,  "unit":"pieces"},
-]
-
-
-@app.route('/api/seed-demo-products', methods=['POST'])
+@routes.route('/api/seed-demo-products', methods=['POST'])
 def seed_demo_products():
     """Seed demo Indian products into Firestore for the logged-in shop."""
     try:
         import uuid as _uuid
         from datetime import datetime as _dt
         from models import Product as _Product
+        from demo_catalog import DEMO_PRODUCTS
 
         phone = (request.get_json() or {}).get('phone', '').strip()
         if not phone:
@@ -1438,7 +1596,7 @@ def seed_demo_products():
                 created_at=_dt.utcnow(),
                 updated_at=_dt.utcnow(),
             )
-            db.db.collection('products').document(product_id).set(product.to_dict())
+            db.save_product(product)
             created += 1
 
         return jsonify({
@@ -1453,7 +1611,7 @@ def seed_demo_products():
         return jsonify({'success': False, 'message': str(e)}), 500
 
 
-@app.route('/api/product-by-barcode', methods=['GET'])
+@routes.route('/api/product-by-barcode', methods=['GET'])
 def get_product_by_barcode():
     """Lookup a product by barcode for the test interface.
 
@@ -1496,7 +1654,7 @@ def get_product_by_barcode():
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
 
-@app.route('/api/test/parse', methods=['POST'])
+@routes.route('/api/test/parse', methods=['POST'])
 def test_parse():
     """Test endpoint to parse a command without executing it"""
     try:
@@ -1523,7 +1681,7 @@ def test_parse():
         return jsonify({'error': str(e)}), 500
 
 
-@app.route('/api/chat', methods=['POST'])
+@routes.route('/api/chat', methods=['POST'])
 def chat():
     """AI chat endpoint for the React POS frontend.
 
@@ -1555,14 +1713,14 @@ def chat():
 
 # ==================== BUG TRACKING ROUTES ====================
 
-@app.route('/bug')
+@routes.route('/bug')
 @login_required
 def bug_page():
     """Page to view unrecognized commands (bugs)"""
     return render_template('bug.html')
 
 
-@app.route('/api/bug', methods=['GET'])
+@routes.route('/api/bug', methods=['GET'])
 def get_bug_api():
     """API endpoint to get unrecognized commands for a shop"""
     try:
@@ -1611,7 +1769,8 @@ def get_bug_api():
             'success': True,
             'shop_id': shop.shop_id,
             'shop_name': shop.name,
-            'commands': commands_data
+            'commands': commands_data,
+            'counts': db.count_unresolved_commands(shop.shop_id),
         }), 200
 
     except Exception as e:
@@ -1622,7 +1781,7 @@ def get_bug_api():
         }), 500
 
 
-@app.route('/api/bug/resolve', methods=['POST'])
+@routes.route('/api/bug/resolve', methods=['POST'])
 def resolve_bug():
     """API endpoint to mark a command as resolved"""
     try:
@@ -1651,7 +1810,7 @@ def resolve_bug():
         }), 500
 
 
-@app.route('/api/bug/delete', methods=['POST'])
+@routes.route('/api/bug/delete', methods=['POST'])
 def delete_bug():
     """API endpoint to delete a command"""
     try:
@@ -1680,74 +1839,52 @@ def delete_bug():
 
 
 # ==================== CUSTOMER DISPLAY ROUTES ====================
-# In-memory store for live customer display sessions.
-# Each entry: { session_id, shop_name, items, grand_total, subtotal,
-#               tax_amt, tax_name, tax_rate, currency, status, updated_at }
-# 'status' is 'active' while scanning, 'checked_out' after payment.
-_display_sessions: dict = {}
+# Live carts mirrored to the customer screen, in this worker's memory (see display_sessions.py)
+display_sessions = DisplaySessionStore()
 
 
-@app.route('/customer-display')
+@routes.route('/customer-display')
 def customer_display_page():
     """Serve the customer-facing live bill display page."""
     session_id = request.args.get('session', '')
     return render_template('customer_display.html', session_id=session_id)
 
 
-@app.route('/api/display-session', methods=['POST'])
+@routes.route('/api/display-session', methods=['POST'])
 def create_display_session():
     """Create a new live display session (called by cashier screen)."""
     try:
         data = request.get_json() or {}
-        sid = str(uuid.uuid4())
-        _display_sessions[sid] = {
-            'session_id': sid,
-            'shop_name': data.get('shop_name', 'Kirana Shop'),
-            'items': [],
-            'grand_total': 0,
-            'subtotal': 0,
-            'tax_amt': 0,
-            'tax_name': None,
-            'tax_rate': 0,
-            'currency': '₹',
-            'status': 'active',
-            'updated_at': datetime.utcnow().isoformat(),
-        }
+        sid = display_sessions.create(data.get('shop_name', 'Kirana Shop'))
         return jsonify({'success': True, 'session_id': sid}), 200
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
 
 
-@app.route('/api/display-session/<session_id>', methods=['GET'])
+@routes.route('/api/display-session/<session_id>', methods=['GET'])
 def get_display_session(session_id):
     """Return current cart state (polled by customer screen every ~1.5 s)."""
-    sess = _display_sessions.get(session_id)
+    sess = display_sessions.get(session_id)
     if not sess:
         return jsonify({'success': False, 'message': 'Session not found'}), 404
     return jsonify({'success': True, 'session': sess}), 200
 
 
-@app.route('/api/display-session/<session_id>', methods=['PATCH'])
+@routes.route('/api/display-session/<session_id>', methods=['PATCH'])
 def update_display_session(session_id):
     """Update cart items / totals / status (called by cashier screen)."""
-    sess = _display_sessions.get(session_id)
-    if not sess:
-        return jsonify({'success': False, 'message': 'Session not found'}), 404
     data = request.get_json() or {}
-    for field in ('items', 'grand_total', 'status',
-                  'subtotal', 'tax_amt', 'tax_name', 'tax_rate', 'currency'):
-        if field in data:
-            sess[field] = data[field]
-    sess['updated_at'] = datetime.utcnow().isoformat()
+    if not display_sessions.update(session_id, data):
+        return jsonify({'success': False, 'message': 'Session not found'}), 404
     return jsonify({'success': True}), 200
 
 
 # ── Serve React app ────────────────────────────────────────────────────────
 REACT_DIR = os.path.join(os.path.dirname(__file__), 'static', 'react')
 
-@app.route('/react/', defaults={'path': ''})
-@app.route('/react/<path:path>')
-@app.route('/assets/<path:path>')
+@routes.route('/react/', defaults={'path': ''})
+@routes.route('/react/<path:path>')
+@routes.route('/assets/<path:path>')
 def serve_react(path):
     """Serve the built React app and its assets."""
     if path and os.path.exists(os.path.join(REACT_DIR, path)):
@@ -1759,6 +1896,9 @@ def serve_react(path):
     return send_from_directory(REACT_DIR, 'index.html')
 
 
+app = create_app()
+
+
 if __name__ == "__main__":
     port = int(os.getenv("PORT", 5000))
     app.run(host="0.0.0.0", port=port, debug=True)
\ No newline at end of file
@@ -0,0 +1,80 @@
+"""
+Documents read per request: streaming counts vs Firestore aggregation queries
+
+For each shop, runs the old streaming implementation and the aggregation
+query behind the same number for:
+
+  - /api/reports/eod  total_txns      (today's sale transactions)
+  - list products     total_products  (whole catalog)
+  - /api/bug          unresolved count
+
+and prints billed document reads and latency for both. Aggregation reads
+use Firestore's billing rule (1 read per 1000 matched index entries, min 1).
+Needs the same credentials as the app:
+
+    python benchmarks/bench_aggregation_reads.py SHOP_ID [SHOP_ID ...]
+"""
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import aggregations  # noqa: E402
+from config import Config  # noqa: E402
+from database import FirestoreDB  # noqa: E402
+
+
+def _timed(fn):
+    start = time.perf_counter()
+    value = fn()
+    return value, (time.perf_counter() - start) * 1000
+
+
+def _streamed(query):
+    """Old path: download every matching document (reads = documents)."""
+    return sum(1 for _ in query.stream())
+
+
+def bench_shop(db: FirestoreDB, shop_id: str):
+    today_start = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    rows = []
+
+    # EOD: old code streamed the latest 500 transactions and filtered in Python
+    old_query = db.db.collection("transactions").where("shop_id", "==", shop_id).limit(500)
+    old_reads, old_ms = _timed(lambda: _streamed(old_query))
+    totals, new_ms = _timed(lambda: db.get_sales_totals(shop_id, since=today_start))
+    rows.append(("eod total_txns", old_reads, old_ms, aggregations.billed_reads(totals["transactions"]), new_ms))
+
+    products = db.db.collection("products").where("shop_id", "==", shop_id)
+    old_reads, old_ms = _timed(lambda: _streamed(products))
+    count, new_ms = _timed(lambda: db.count_products(shop_id))
+    rows.append(("total_products", old_reads, old_ms, aggregations.billed_reads(count), new_ms))
+
+    commands = db.db.collection("unrecognized_commands").where("shop_id", "==", shop_id)
+    old_reads, old_ms = _timed(lambda: _streamed(commands))
+    counts, new_ms = _timed(lambda: db.count_unresolved_commands(shop_id))
+    new_reads = sum(aggregations.billed_reads(v) for v in counts.values())
+    rows.append(("bug unresolved", old_reads, old_ms, new_reads, new_ms))
+
+    print(f"\nShop {shop_id}")
+    print(f"{'request':<16} {'reads before':>12} {'ms':>8} {'reads after':>12} {'ms':>8}")
+    for name, r0, t0, r1, t1 in rows:
+        print(f"{name:<16} {r0:>12} {t0:>8.1f} {r1:>12} {t1:>8.1f}")
+
+
+def main(shop_ids):
+    if not shop_ids:
+        print(__doc__)
+        return
+    db = FirestoreDB(
+        credentials_path=Config.GOOGLE_APPLICATION_CREDENTIALS,
+        project_id=Config.FIREBASE_PROJECT_ID,
+    )
+    for shop_id in shop_ids:
+        bench_shop(db, shop_id)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
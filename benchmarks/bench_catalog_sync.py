@@ -0,0 +1,116 @@
+"""
+/api/stock/products payload: full catalog vs gzip vs 304 vs delta
+
+Seeds one shop with --products SKUs, then sizes what a stock UI / POS load
+costs in each mode of catalog_sync.py: the full JSON body, the same body
+gzipped, a revalidation that comes back 304, and a delta after a few sales
+and a deletion. Bodies are built the way the route builds them (compact
+JSON of Product.to_dict()). Runs on a temporary SQLite file.
+
+Run:
+    python benchmarks/bench_catalog_sync.py [--products 5000] [--changes 25]
+"""
+import argparse
+import gzip
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from database import FirestoreDB  # noqa: E402
+
+PHONE = "+919999900000"
+
+
+def seed(db: FirestoreDB, products: int, seed_value: int = 7) -> str:
+    rng = random.Random(seed_value)
+    shop = db.create_shop("Catalog Bench Kirana", PHONE)
+    batch = db.db.batch()
+    for i in range(products):
+        product_id = f"bench-p{i}"
+        batch.set(db.db.collection("products").document(product_id), {
+            "product_id": product_id,
+            "shop_id": shop.shop_id,
+            "name": f"Item {i:05d}",
+            "normalized_name": f"item {i:05d}",
+            "current_stock": float(rng.randint(0, 80)),
+            "unit": "pieces",
+            "brand": "Bench",
+            "barcode": f"890{i:010d}",
+            "selling_price": float(rng.randint(10, 300)),
+            "cost_price": float(rng.randint(5, 200)),
+            "created_at": "2026-01-01T09:00:00",
+            "updated_at": "2026-01-01T09:00:00",
+            "batches": {
+                f"batch_{b:03d}": {"expiry_date": f"2026-{rng.randint(1, 12):02d}-15", "qty": rng.randint(1, 20)}
+                for b in range(3)
+            },
+        })
+        if (i + 1) % 400 == 0:
+            batch.commit()
+            batch = db.db.batch()
+    batch.commit()
+    return shop.shop_id
+
+
+def body(delta, since) -> bytes:
+    payload = {
+        "success": True,
+        "products": [p.to_dict() for p in delta["products"]],
+        "cursor": delta["cursor"],
+        "full": since is None,
+    }
+    if since:
+        payload["deleted"] = delta["deleted"]
+    return json.dumps(payload, separators=(",", ":")).encode("utf-8")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--products", type=int, default=5000)
+    parser.add_argument("--changes", type=int, default=25)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = FirestoreDB(backend="sqlite", sqlite_path=os.path.join(tmp, "bench.db"))
+        shop_id = seed(db, args.products)
+
+        t0 = time.perf_counter()
+        full = db.get_catalog_delta(shop_id)
+        full_ms = (time.perf_counter() - t0) * 1000
+        raw = body(full, None)
+        zipped = gzip.compress(raw, compresslevel=6)
+
+        etag = db.get_catalog_etag(shop_id)
+        t0 = time.perf_counter()
+        unchanged = db.get_catalog_etag(shop_id) == etag
+        etag_ms = (time.perf_counter() - t0) * 1000
+
+        rng = random.Random(11)
+        for i in range(args.changes):
+            db.update_product_stock(f"bench-p{rng.randrange(args.products)}", float(i))
+        db.delete_product(shop_id, f"bench-p{args.products - 1}")
+        t0 = time.perf_counter()
+        delta = db.get_catalog_delta(shop_id, full["cursor"])
+        delta_ms = (time.perf_counter() - t0) * 1000
+        delta_raw = body(delta, full["cursor"])
+
+        print(f"\n{args.products} products, {args.changes} stock changes + 1 deletion since the last load")
+        print(f"{'mode':<28}{'bytes':>14}{'vs full':>10}{'server ms':>12}")
+        rows = [
+            ("full JSON", len(raw), full_ms),
+            ("full JSON, gzip", len(zipped), full_ms),
+            ("304 (ETag unchanged)" if unchanged else "304 (ETag CHANGED?)", 0, etag_ms),
+            (f"delta ({len(delta['products'])} + {len(delta['deleted'])} deleted)", len(delta_raw), delta_ms),
+            ("delta, gzip", len(gzip.compress(delta_raw, compresslevel=6)), delta_ms),
+        ]
+        for name, size, ms in rows:
+            print(f"{name:<28}{size:>14,}{size / len(raw):>9.1%}{ms:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
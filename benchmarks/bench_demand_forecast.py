@@ -0,0 +1,126 @@
+"""
+Accuracy and runtime benchmark: EW demand forecast vs month-to-date heuristic
+
+Generates a synthetic sales ledger with a known demand process (weekday
+profile + slow trend + Poisson noise) and compares, for several "as of"
+days of the month, how well each method predicts the next 7 days of sales.
+
+Run:
+    python benchmarks/bench_demand_forecast.py [--skus 2000] [--days 90]
+"""
+import argparse
+import math
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import demand_forecast  # noqa: E402
+
+WEEKDAY_PROFILE = [0.85, 0.8, 0.9, 0.95, 1.1, 1.3, 1.1]  # Mon..Sun
+
+
+def _poisson(rng: random.Random, lam: float) -> int:
+    # Knuth's method is fine for the small rates a kirana SKU has
+    if lam <= 0:
+        return 0
+    limit, k, p = math.exp(-lam), 0, 1.0
+    while True:
+        p *= rng.random()
+        if p <= limit:
+            return k
+        k += 1
+
+
+def synthetic_ledger(skus: int, start: datetime, days: int, seed: int = 7):
+    """Return (transactions, true_rate_fn) for a synthetic shop."""
+    rng = random.Random(seed)
+    base = [rng.choice([0.2, 0.5, 1, 2, 4, 8]) * rng.uniform(0.6, 1.4) for _ in range(skus)]
+    trend = [rng.uniform(-0.01, 0.015) for _ in range(skus)]
+
+    def true_rate(sku: int, day: datetime) -> float:
+        age = (day - start).days
+        return max(0.0, base[sku] * (1 + trend[sku] * age)) * WEEKDAY_PROFILE[day.weekday()]
+
+    txns = []
+    for d in range(days):
+        day = start + timedelta(days=d)
+        for sku in range(skus):
+            qty = _poisson(rng, true_rate(sku, day))
+            if qty:
+                txns.append({
+                    "product_id": f"p{sku}",
+                    "transaction_type": "sale",
+                    "quantity": qty,
+                    "timestamp": (day + timedelta(hours=rng.randint(8, 21))).isoformat(),
+                })
+    return txns, true_rate
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--skus", type=int, default=2000)
+    parser.add_argument("--days", type=int, default=90)
+    args = parser.parse_args()
+
+    start = datetime(2026, 1, 1)
+    t0 = time.perf_counter()
+    txns, true_rate = synthetic_ledger(args.skus, start, args.days)
+    print(f"Synthetic ledger: {args.skus} SKUs, {args.days} days, {len(txns)} sale rows "
+          f"({time.perf_counter() - t0:.1f}s to generate)\n")
+
+    print(f"{'as of':<12}{'heuristic MAE':>15}{'EW MAE':>10}{'EW+dow MAE':>12}   (units over next 7 days)")
+    for as_of in (datetime(2026, 3, 1), datetime(2026, 3, 2), datetime(2026, 3, 3),
+                  datetime(2026, 3, 10), datetime(2026, 3, 20)):
+        history = [t for t in txns if t["timestamp"] < as_of.isoformat()]
+        heuristic, _ = demand_forecast.month_to_date_velocity(history, as_of - timedelta(microseconds=1))
+        ew = demand_forecast.forecast_demand(history, as_of.date(), seasonality=False).demand_by_product()
+        ew_dow = demand_forecast.forecast_demand(history, as_of.date(), seasonality=True)
+        ew_dow_rate = ew_dow.demand_by_product()
+        factors = ew_dow.weekday_factors
+
+        errors = {"heuristic": 0.0, "ew": 0.0, "ew_dow": 0.0}
+        for sku in range(args.skus):
+            pid = f"p{sku}"
+            horizon = [as_of + timedelta(days=i) for i in range(7)]
+            actual = sum(true_rate(sku, day) for day in horizon)
+            errors["heuristic"] += abs(heuristic.get(pid, 0.0) * 7 - actual)
+            errors["ew"] += abs(ew.get(pid, 0.0) * 7 - actual)
+            errors["ew_dow"] += abs(sum(ew_dow_rate.get(pid, 0.0) * factors[d.weekday()] for d in horizon) - actual)
+        n = float(args.skus)
+        print(f"{as_of.strftime('%Y-%m-%d'):<12}{errors['heuristic'] / n:>15.2f}"
+              f"{errors['ew'] / n:>10.2f}{errors['ew_dow'] / n:>12.2f}")
+
+    # Runtime: the old path aggregates the month per call; the new one
+    # builds the forecast once and then only recomputes stock-out days.
+    as_of = datetime(2026, 3, 20)
+    history = [t for t in txns if t["timestamp"] < as_of.isoformat()]
+    stock = {f"p{sku}": 25.0 for sku in range(args.skus)}
+    runs = 5
+
+    t0 = time.perf_counter()
+    for _ in range(runs):
+        demand_forecast.month_to_date_velocity(history, as_of)
+    heuristic_ms = (time.perf_counter() - t0) / runs * 1000
+
+    t0 = time.perf_counter()
+    for _ in range(runs):
+        forecast = demand_forecast.forecast_demand(history, as_of.date())
+    forecast_ms = (time.perf_counter() - t0) / runs * 1000
+
+    t0 = time.perf_counter()
+    for _ in range(runs):
+        demand_forecast.days_to_stockout(forecast, stock, as_of.date())
+    cached_ms = (time.perf_counter() - t0) / runs * 1000
+
+    print(f"\nRuntime over {len(history)} rows ({runs} runs each):")
+    print(f"  month-to-date heuristic (every call): {heuristic_ms:8.1f} ms")
+    print(f"  EW forecast build (first call/sale):   {forecast_ms:8.1f} ms")
+    print(f"  stock-out days from cached forecast:   {cached_ms:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
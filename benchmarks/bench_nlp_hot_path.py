@@ -0,0 +1,257 @@
+"""
+Micro-benchmarks for the NLP hot path, with saved baselines
+
+Times the text functions every message goes through before (or instead
+of) an OpenAI call:
+
+    clean_voice_text, _convert_hindi_numbers_to_digits,
+    _normalize_hindi_to_hinglish, normalize_command_structure,
+    detect_language, parse_command (heuristic paths only), generate_response
+
+The corpus is every phrase in the root test_*.py scripts (first string of
+each tuple, or each string, in their list literals), read with `ast` so the
+scripts don't run. parse_command is only timed on phrases the heuristics
+answer; phrases that would reach the LLM are counted and left out. Output
+from the functions' print() calls goes to a null stream, as it would cost
+in production but shouldn't flood the terminal.
+
+Each benchmark runs the whole corpus per round: a warm-up, then --rounds
+timed rounds sized to at least --min-round-ms, each preceded by a round of a
+fixed calibration workload (regex and string work of the same kind). A
+benchmark is scored by the median of its per-round ratios to the
+calibration, so a machine that is faster or slower than when the baseline
+was saved (CPU boost, noisy neighbours on a shared runner) doesn't read as
+a change in the code. A benchmark whose score is more than --threshold
+(default 25%) above the baseline's is a regression and the exit status is 1.
+
+Run:
+    python benchmarks/bench_nlp_hot_path.py                    # compare with the baseline
+    python benchmarks/bench_nlp_hot_path.py --save-baseline    # record a new baseline
+    python benchmarks/bench_nlp_hot_path.py --only parse_command --threshold 0.1
+
+The calibration absorbs speed differences, not different Python versions or
+CPU architectures; record the baseline with the interpreter CI runs.
+"""
+import argparse
+import ast
+import contextlib
+import glob
+import json
+import os
+import platform
+import re
+import statistics
+import sys
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from ai_service import AIService  # noqa: E402
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines", "nlp_hot_path.json")
+DEFAULT_THRESHOLD = 0.25
+
+RESPONSE_CASES = [
+    ("add_stock", {"success": True, "product_name": "Maggi", "quantity": 10, "new_stock": 42, "unit": "pieces"}),
+    ("reduce_stock", {"success": True, "product_name": "Parle G", "quantity": 2, "new_stock": 3, "unit": "pieces",
+                      "low_stock_alert": {"triggered": True, "product_name": "Parle G", "brand": "Parle",
+                                          "current_stock": 3, "threshold": 5, "unit": "pieces"}}),
+    ("check_stock", {"success": True, "product_name": "Atta", "current_stock": 12, "unit": "kg"}),
+    ("adjust_stock", {"success": True, "product_name": "Oil", "old_quantity": 3, "new_quantity": 1,
+                      "new_stock": 9, "unit": "bottles"}),
+    ("total_sales", {"success": True, "total_items_sold": 57, "total_revenue": 2310.0}),
+    ("add_stock", {"success": False}),
+]
+
+
+class _NullStream:
+    def write(self, _):
+        return 0
+
+    def flush(self):
+        pass
+
+
+class _NoLLM:
+    """OpenAI stand-in that only records whether parse_command asked it."""
+
+    def __init__(self):
+        self.asked = False
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _create(self, **_):
+        self.asked = True
+        raise RuntimeError("benchmark: no LLM")
+
+
+_CALIBRATION_TEXT = ["Maggi  ke 10 packet add karo", "do kilo atta becha um", "sugar kitna hai bhai"]
+
+
+def _calibration():
+    """Fixed regex/string workload the benchmarks are scored against."""
+    for text in _CALIBRATION_TEXT:
+        cleaned = re.sub(r"\s+", " ", text.strip())
+        cleaned = re.sub(r"\bum\b", " ", cleaned, flags=re.IGNORECASE)
+        words = cleaned.lower().split()
+        " ".join(w for w in words if not w.isdigit())
+        re.findall(r"\d+", cleaned)
+
+
+def load_corpus(root: str = ROOT):
+    """Phrases from the root test_*.py scripts, deduplicated, in a stable order."""
+    phrases = set()
+    for path in sorted(glob.glob(os.path.join(root, "test_*.py"))):
+        try:
+            with open(path, encoding="utf-8") as f:
+                tree = ast.parse(f.read())
+        except (SyntaxError, UnicodeDecodeError):
+            continue
+        for node in ast.walk(tree):
+            if not isinstance(node, ast.List):
+                continue
+            for item in node.elts:
+                if isinstance(item, ast.Tuple) and item.elts:
+                    item = item.elts[0]
+                if isinstance(item, ast.Constant) and isinstance(item.value, str):
+                    text = item.value.strip()
+                    if 2 <= len(text) <= 200 and not text.startswith(("http", "+", "/")):
+                        phrases.add(text)
+    return sorted(phrases)
+
+
+def build_benchmarks(ai: AIService, corpus):
+    llm = _NoLLM()
+    # Unguarded: once _NoLLM's errors opened the circuit breaker, LLM-bound
+    # phrases would no longer reach it and be taken for heuristic ones
+    ai._client = llm
+    heuristic = []
+    with contextlib.redirect_stdout(_NullStream()):
+        for phrase in corpus:
+            llm.asked = False
+            ai.parse_command(phrase)
+            if not llm.asked:
+                heuristic.append(phrase)
+
+    def over(fn, inputs):
+        def run():
+            for value in inputs:
+                fn(value)
+        return run, len(inputs)
+
+    def responses():
+        for action, result in RESPONSE_CASES:
+            ai.generate_response(action, result, language="hinglish")
+            ai.generate_response(action, result, language="english")
+
+    benchmarks = {
+        "clean_voice_text": over(ai.clean_voice_text, corpus),
+        "convert_hindi_numbers_to_digits": over(ai._convert_hindi_numbers_to_digits, corpus),
+        "normalize_hindi_to_hinglish": over(ai._normalize_hindi_to_hinglish, corpus),
+        "normalize_command_structure": over(ai.normalize_command_structure, corpus),
+        "detect_language": over(ai.detect_language, corpus),
+        "parse_command": over(ai.parse_command, heuristic),
+        "generate_response": (responses, 2 * len(RESPONSE_CASES)),
+    }
+    return benchmarks, len(corpus) - len(heuristic)
+
+
+def _loops(run, min_round_ms: float) -> int:
+    run()  # warm-up (regex compilation, caches)
+    start = time.perf_counter()
+    run()
+    once = max(time.perf_counter() - start, 1e-9)
+    return max(1, int((min_round_ms / 1000.0) / once + 0.999))
+
+
+def _timed(run, loops: int) -> float:
+    start = time.perf_counter()
+    for _ in range(loops):
+        run()
+    return time.perf_counter() - start
+
+
+def measure(run, calls: int, rounds: int, min_round_ms: float):
+    """Seconds per call (min, median) and the median ratio to the calibration.
+
+    Calibration and benchmark rounds alternate, so each ratio compares two
+    timings taken under the same machine conditions.
+    """
+    with contextlib.redirect_stdout(_NullStream()):
+        ref_loops = _loops(_calibration, min_round_ms)
+        loops = _loops(run, min_round_ms)
+        samples, ratios = [], []
+        for _ in range(rounds):
+            reference = _timed(_calibration, ref_loops) / ref_loops
+            per_call = _timed(run, loops) / (loops * calls)
+            samples.append(per_call)
+            ratios.append(per_call / reference)
+    return min(samples), statistics.median(samples), statistics.median(ratios)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="allowed slowdown vs baseline, as a fraction (default 0.25)")
+    parser.add_argument("--rounds", type=int, default=9)
+    parser.add_argument("--min-round-ms", type=float, default=50.0)
+    parser.add_argument("--only", nargs="*", help="benchmark names to run")
+    args = parser.parse_args()
+
+    corpus = load_corpus()
+    benchmarks, llm_bound = build_benchmarks(AIService(api_key="benchmark"), corpus)
+    names = [name for name in benchmarks if not args.only or name in args.only]
+    print(f"corpus: {len(corpus)} phrases from the root test_*.py scripts "
+          f"({llm_bound} reach the LLM and are left out of parse_command)\n")
+
+    baseline = {}
+    if not args.save_baseline and os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f).get("results", {})
+
+    results, regressions = {}, []
+    print(f"{'benchmark':<34}{'calls':>7}{'min µs':>10}{'median µs':>12}{'relative':>10}{'baseline':>10}{'change':>9}")
+    for name in names:
+        run, calls = benchmarks[name]
+        best, median, relative = measure(run, calls, args.rounds, args.min_round_ms)
+        results[name] = {"relative": round(relative, 4), "per_call_us": round(best * 1e6, 3),
+                         "median_us": round(median * 1e6, 3), "calls": calls}
+        line = f"{name:<34}{calls:>7}{best * 1e6:>10.1f}{median * 1e6:>12.1f}{relative:>10.3f}"
+        base = baseline.get(name, {}).get("relative")
+        if base:
+            change = relative / base - 1.0
+            flag = "  ❌" if change > args.threshold else ""
+            if change > args.threshold:
+                regressions.append((name, change))
+            line += f"{base:>10.3f}{change:>+9.0%}{flag}"
+        print(line)
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({
+                "created": datetime.utcnow().isoformat(timespec="seconds"),
+                "python": platform.python_version(),
+                "machine": f"{platform.system()} {platform.machine()}",
+                "corpus_phrases": len(corpus),
+                "results": results,
+            }, f, indent=2, ensure_ascii=False)
+            f.write("\n")
+        print(f"\nbaseline saved to {os.path.relpath(args.baseline)}")
+        return 0
+
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) beyond {args.threshold:.0%}: "
+              + ", ".join(f"{name} {change:+.0%}" for name, change in regressions))
+        return 1
+    if baseline:
+        print(f"\nno regressions beyond {args.threshold:.0%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
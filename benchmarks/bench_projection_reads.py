@@ -0,0 +1,133 @@
+"""
+Bytes read and deserialization time: whole documents vs named projections
+
+Seeds one large shop (products with per-batch expiry maps, a ledger with
+notes) and reads it once per use case in projections.py, with and without
+the field mask. "bytes" is the JSON size of the documents returned (a proxy
+for what crosses the wire); "decode ms" is the time to turn them into
+Products / sale rows. SQLite always runs on a temporary file; pass
+--firestore to also run against the app's project or the emulator.
+
+Run:
+    python benchmarks/bench_projection_reads.py [--products 2000] [--batches 20] [--sales 20000]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import projections  # noqa: E402
+from config import Config  # noqa: E402
+from database import FirestoreDB  # noqa: E402
+from models import Product  # noqa: E402
+
+PHONE = "+919999900000"
+
+
+def seed(db: FirestoreDB, products: int, batches: int, sales: int, seed_value: int = 7) -> str:
+    rng = random.Random(seed_value)
+    shop = db.create_shop("Projection Bench Kirana", PHONE)
+    product_ids = []
+    batch = db.db.batch()
+    for i in range(products):
+        product_id = f"bench-p{i}"
+        product_ids.append(product_id)
+        batch.set(db.db.collection("products").document(product_id), {
+            "product_id": product_id,
+            "shop_id": shop.shop_id,
+            "name": f"Item {i:05d}",
+            "normalized_name": f"item {i:05d}",
+            "current_stock": float(rng.randint(0, 80)),
+            "unit": "pieces",
+            "brand": "Bench",
+            "barcode": f"890{i:010d}",
+            "selling_price": float(rng.randint(10, 300)),
+            "cost_price": float(rng.randint(5, 200)),
+            "batches": {
+                f"batch_{b:03d}": {"expiry": f"2026-{rng.randint(1, 12):02d}-15", "qty": rng.randint(1, 20)}
+                for b in range(batches)
+            },
+        })
+        if (i + 1) % 400 == 0:
+            batch.commit()
+            batch = db.db.batch()
+    for i in range(sales):
+        idx = rng.randrange(products)
+        batch.set(db.db.collection("transactions").document(f"bench-t{i}"), {
+            "transaction_id": f"bench-t{i}",
+            "shop_id": shop.shop_id,
+            "product_id": product_ids[idx],
+            "product_name": f"Item {idx:05d}",
+            "transaction_type": "sale",
+            "quantity": float(rng.randint(1, 4)),
+            "previous_stock": 50.0,
+            "new_stock": 48.0,
+            "user_phone": PHONE,
+            "timestamp": f"2026-0{rng.randint(1, 9)}-{rng.randint(10, 28)}T12:00:00",
+            "unit_price": 20.0,
+            "total_amount": 40.0,
+            "notes": "React POS checkout, cash, counter 1, customer paid exact change",
+        })
+        if (i + 1) % 400 == 0:
+            batch.commit()
+            batch = db.db.batch()
+    batch.commit()
+    return shop.shop_id
+
+
+def measure(db: FirestoreDB, collection: str, shop_id: str, fields, decode):
+    query = projections.select(db.db.collection(collection).where("shop_id", "==", shop_id), fields)
+    t0 = time.perf_counter()
+    docs = [doc.to_dict() for doc in query.stream()]
+    read_ms = (time.perf_counter() - t0) * 1000
+    t0 = time.perf_counter()
+    for data in docs:
+        decode(data)
+    decode_ms = (time.perf_counter() - t0) * 1000
+    size = sum(len(json.dumps(data, default=str)) for data in docs)
+    return size, read_ms, decode_ms
+
+
+def bench(db: FirestoreDB, label: str, args) -> None:
+    shop_id = seed(db, args.products, args.batches, args.sales)
+    cases = [
+        ("products / match", "products", projections.PRODUCT_MATCH, Product.from_dict),
+        ("products / low stock", "products", projections.PRODUCT_LOW_STOCK, Product.from_dict),
+        ("products / cost", "products", projections.PRODUCT_COST, Product.from_dict),
+        ("transactions / sales", "transactions", projections.TRANSACTION_SALES, dict),
+    ]
+    print(f"\n{label}: {args.products} products x {args.batches} batches, {args.sales} sales")
+    print(f"{'use case':<24}{'bytes full':>14}{'bytes proj':>14}{'read ms':>18}{'decode ms':>18}")
+    for name, collection, fields, decode in cases:
+        full = measure(db, collection, shop_id, None, decode)
+        proj = measure(db, collection, shop_id, fields, decode)
+        print(f"{name:<24}{full[0]:>14,}{proj[0]:>14,}"
+              f"{full[1]:>9.1f}→{proj[1]:<8.1f}{full[2]:>9.1f}→{proj[2]:<8.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--products", type=int, default=2000)
+    parser.add_argument("--batches", type=int, default=20)
+    parser.add_argument("--sales", type=int, default=20000)
+    parser.add_argument("--firestore", action="store_true")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        bench(FirestoreDB(backend="sqlite", sqlite_path=os.path.join(tmp, "bench.db")), "sqlite", args)
+    if args.firestore:
+        db = FirestoreDB(
+            credentials_path=Config.GOOGLE_APPLICATION_CREDENTIALS,
+            project_id=Config.FIREBASE_PROJECT_ID,
+            backend="firestore",
+        )
+        bench(db, "firestore", args)
+
+
+if __name__ == "__main__":
+    main()
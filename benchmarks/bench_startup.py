@@ -0,0 +1,109 @@
+"""
+Cold-start time: importing app.py, and warming its services
+
+Each run is a fresh interpreter (as a new gunicorn worker is) that times:
+
+    import    `import app` - what a worker pays before it can answer
+    first     the first request that needs no service (GET /)
+    ready     GET /ready - builds config, database, OpenAI client, WhatsApp,
+              OTP and the command processor
+    after     GET /ready again, everything built
+
+plus the heaviest modules `import app` pulled in (-X importtime). Runs
+offline on the SQLite backend with placeholder credentials; no request
+reaches OpenAI or WhatsApp.
+
+Run:
+    python benchmarks/bench_startup.py [--runs 5] [--top 8]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+CHILD = r"""
+import contextlib, io, json, time
+started = time.perf_counter()
+with contextlib.redirect_stdout(io.StringIO()):
+    import app as module
+imported = time.perf_counter()
+client = module.app.test_client()
+client.get('/')
+first = time.perf_counter()
+with contextlib.redirect_stdout(io.StringIO()):
+    response = client.get('/ready')
+ready = time.perf_counter()
+client.get('/ready')
+after = time.perf_counter()
+print(json.dumps({
+    "import": imported - started, "first": first - imported, "ready": ready - first,
+    "after": after - ready, "status": response.status_code, "services": response.get_json()["services"],
+}))
+"""
+
+
+def child_env():
+    env = dict(os.environ)
+    env.update({
+        "DATABASE_BACKEND": "sqlite",
+        "SQLITE_PATH": ":memory:",
+        "OPENAI_API_KEY": "startup-bench",
+        "WHATSAPP_ACCESS_TOKEN": "startup-bench",
+        "WATI_API_KEY": "",
+        "SALES_JOURNAL_PATH": "",
+        "TRACE_LOG": "0",
+    })
+    return env
+
+
+def run_once():
+    out = subprocess.run([sys.executable, "-c", CHILD], cwd=ROOT, env=child_env(),
+                         capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def heaviest_imports(top: int):
+    """(cumulative µs, module) for the slowest top-level imports under app."""
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app"], cwd=ROOT,
+                         env=child_env(), capture_output=True, text=True, check=True)
+    rows = []
+    for line in out.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        if depth == 1 and cumulative.strip().isdigit():
+            rows.append((int(cumulative), name.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=8)
+    args = parser.parse_args()
+
+    runs = [run_once() for _ in range(args.runs)]
+    print(f"{args.runs} cold starts (fresh interpreter each), median [min-max]:\n")
+    for key, label in (("import", "import app"), ("first", "first request"),
+                       ("ready", "GET /ready (warm)"), ("after", "GET /ready again")):
+        values = [r[key] * 1000 for r in runs]
+        print(f"  {label:<20}{statistics.median(values):>9.1f} ms  [{min(values):.1f}-{max(values):.1f}]")
+
+    last = runs[-1]
+    print(f"\n/ready -> {last['status']}; build time per service:")
+    for name, entry in last["services"].items():
+        detail = f"{entry['seconds'] * 1000:.1f} ms" if entry["ready"] else f"failed: {entry.get('error')}"
+        print(f"  {name:<20}{detail}")
+
+    print("\nheaviest imports under `import app`:")
+    for cumulative, name in heaviest_imports(args.top):
+        print(f"  {name:<28}{cumulative / 1000:>9.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Per-command latency: SQLite backend vs Firestore
+
+Seeds one shop (products + a sales ledger) and times the database work
+behind common WhatsApp/POS commands on each backend, printing p50/p95 in
+milliseconds. SQLite always runs on a temporary file; Firestore runs when
+--firestore is given (uses the app's credentials, or the emulator if
+FIRESTORE_EMULATOR_HOST is set).
+
+Run:
+    python benchmarks/bench_storage_backends.py [--products 300] [--sales 3000] [--repeat 30] [--firestore]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from config import Config  # noqa: E402
+from database import FirestoreDB  # noqa: E402
+from models import Transaction, TransactionType  # noqa: E402
+
+PHONE = "+919999900000"
+
+
+def seed(db: FirestoreDB, products: int, sales: int, seed_value: int = 5):
+    """Create a shop with `products` products and `sales` historical sales."""
+    rng = random.Random(seed_value)
+    shop = db.create_shop("Bench Kirana", PHONE)
+    names = [f"Item {i:04d}" for i in range(products)]
+    product_ids = []
+    for name in names:
+        product = db.get_or_create_product(shop.shop_id, name)
+        db.update_product_fields(product.product_id, {
+            "current_stock": float(rng.randint(0, 80)),
+            "selling_price": float(rng.randint(10, 300)),
+            "barcode": f"890{len(product_ids):010d}",
+        })
+        product_ids.append(product.product_id)
+
+    batch = db.db.batch()
+    for i in range(sales):
+        idx = rng.randrange(products)
+        txn = Transaction.from_dict({
+            "transaction_id": f"bench-{i}",
+            "shop_id": shop.shop_id,
+            "product_id": product_ids[idx],
+            "product_name": names[idx],
+            "transaction_type": TransactionType.SALE.value,
+            "quantity": float(rng.randint(1, 4)),
+            "previous_stock": 50.0,
+            "new_stock": 48.0,
+            "user_phone": PHONE,
+            "timestamp": f"2026-0{rng.randint(1, 9)}-{rng.randint(10, 28)}T12:00:00",
+        })
+        batch.set(db.db.collection("transactions").document(txn.transaction_id), txn.to_dict())
+        if (i + 1) % 400 == 0:
+            batch.commit()
+            batch = db.db.batch()
+    batch.commit()
+    return shop.shop_id, names
+
+
+def commands(shop_id, names):
+    rng = random.Random(11)
+    return {
+        "add_stock": lambda db: db.add_stock(shop_id, rng.choice(names), 5, PHONE),
+        "reduce_stock": lambda db: db.reduce_stock(shop_id, rng.choice(names), 1, PHONE),
+        "check_stock": lambda db: db.check_stock(shop_id, rng.choice(names)),
+        "barcode_lookup": lambda db: db.find_product_by_barcode(shop_id, f"890{rng.randrange(len(names)):010d}"),
+        "list_products": lambda db: db.get_products_summary(shop_id, limit=100),
+        "low_stock": lambda db: db.get_low_stock_products(shop_id, threshold=5),
+        "total_sales_today": lambda db: db.get_total_sales_today(shop_id),
+        "recent_transactions": lambda db: db.get_transactions_by_shop(shop_id, limit=50),
+    }
+
+
+def bench(db: FirestoreDB, label: str, args) -> dict:
+    start = time.perf_counter()
+    shop_id, names = seed(db, args.products, args.sales)
+    print(f"{label}: seeded {args.products} products / {args.sales} sales in {time.perf_counter() - start:.1f}s")
+
+    results = {}
+    for name, fn in commands(shop_id, names).items():
+        samples = []
+        for _ in range(args.repeat):
+            t0 = time.perf_counter()
+            fn(db)
+            samples.append((time.perf_counter() - t0) * 1000)
+        samples.sort()
+        results[name] = (statistics.median(samples), samples[int(0.95 * (len(samples) - 1))])
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--products", type=int, default=300)
+    parser.add_argument("--sales", type=int, default=3000)
+    parser.add_argument("--repeat", type=int, default=30)
+    parser.add_argument("--firestore", action="store_true")
+    args = parser.parse_args()
+
+    runs = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        runs["sqlite"] = bench(FirestoreDB(backend="sqlite", sqlite_path=os.path.join(tmp, "bench.db")), "sqlite", args)
+    if args.firestore:
+        db = FirestoreDB(
+            credentials_path=Config.GOOGLE_APPLICATION_CREDENTIALS,
+            project_id=Config.FIREBASE_PROJECT_ID,
+            backend="firestore",
+        )
+        runs["firestore"] = bench(db, "firestore", args)
+
+    header = f"{'command':<20}" + "".join(f"{b + ' p50':>16}{b + ' p95':>16}" for b in runs)
+    print("\n" + header)
+    for name in next(iter(runs.values())):
+        row = f"{name:<20}"
+        for res in runs.values():
+            p50, p95 = res[name]
+            row += f"{p50:>16.2f}{p95:>16.2f}"
+        print(row)
+
+
+if __name__ == "__main__":
+    main()
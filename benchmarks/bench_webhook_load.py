@@ -0,0 +1,62 @@
+"""
+Throughput and latency of /webhook and /api/chat, fully offline
+
+Boots the app on the in-memory store with stub OpenAI / WhatsApp backends
+(see load_harness.py), replays a seeded message mix from many shops at a
+target rate and prints throughput, p50/p95/p99 per message kind and the
+per-stage breakdown from the app's traces. Same seed and latencies give the
+same messages and the same stub behaviour on every run.
+
+Run:
+    python benchmarks/bench_webhook_load.py [--messages 400] [--rate 40] [--workers 32] [--shops 20]
+        [--mix text=55,llm=15,voice=20,batch=10] [--whisper-ms 800] [--chat-ms 600] [--send-ms 150]
+        [--jitter-ms 0] [--seed 7]
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from load_harness import boot_app, generate_messages, report, run_load  # noqa: E402
+
+
+def parse_mix(value: str):
+    mix = {}
+    for part in value.split(","):
+        kind, _, weight = part.partition("=")
+        mix[kind.strip()] = float(weight)
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=400)
+    parser.add_argument("--rate", type=float, default=40.0, help="messages per second (0 = unpaced)")
+    parser.add_argument("--workers", type=int, default=32)
+    parser.add_argument("--shops", type=int, default=20)
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("text=55,llm=15,voice=20,batch=10"))
+    parser.add_argument("--whisper-ms", type=float, default=800.0)
+    parser.add_argument("--chat-ms", type=float, default=600.0)
+    parser.add_argument("--send-ms", type=float, default=150.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    harness = boot_app(shops=args.shops, whisper_ms=args.whisper_ms, chat_ms=args.chat_ms,
+                       send_ms=args.send_ms, jitter_ms=args.jitter_ms, seed=args.seed)
+    try:
+        messages = generate_messages(harness, args.messages, args.mix, seed=args.seed)
+        result = run_load(harness, messages, rate=args.rate, workers=args.workers)
+    finally:
+        harness.close()
+
+    print(f"\n{args.messages} messages from {args.shops} shops at {args.rate:g}/s, {args.workers} workers, "
+          f"mix {args.mix}")
+    print(f"stub latency: whisper {args.whisper_ms:g}ms, chat {args.chat_ms:g}ms, send {args.send_ms:g}ms "
+          f"(±{args.jitter_ms:g})\n")
+    print(report(result))
+
+
+if __name__ == "__main__":
+    main()
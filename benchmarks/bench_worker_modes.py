@@ -0,0 +1,183 @@
+"""
+Serving modes compared: sync vs gthread vs gevent under the harness's mixed traffic
+
+Starts real gunicorn (gunicorn.conf.py, so the same derived settings as
+production) once per SERVING_MODE on the offline stubbed app
+(load_app.py), replays the same seeded message mix over HTTP at the same
+rate and prints throughput, latency percentiles per message kind and
+errors for each mode. Stub OpenAI / WhatsApp latencies stand in for the
+I/O a worker waits on. Modes whose worker isn't installed (gevent) are
+reported and skipped.
+
+Run:
+    python benchmarks/bench_worker_modes.py [--modes sync,gthread,gevent] [--messages 300] [--rate 20]
+        [--clients 128] [--workers N] [--threads 8] [--shops 10] [--mix text=55,llm=15,voice=20,batch=10]
+        [--whisper-ms 800] [--chat-ms 600] [--send-ms 150] [--seed 7]
+
+--workers pins WEB_CONCURRENCY for every mode; by default each mode gets
+its CPU-derived worker count (see concurrency.py).
+"""
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Tuple
+
+import requests
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.join(HERE, "..")
+sys.path.insert(0, HERE)
+sys.path.insert(0, ROOT)
+
+import concurrency  # noqa: E402
+from config import Config  # noqa: E402
+from bench_webhook_load import parse_mix  # noqa: E402
+from load_harness import fixtures, generate_messages, percentile, post_message  # noqa: E402
+
+
+class _Response:
+    def __init__(self, response: requests.Response):
+        self.status_code = response.status_code
+        self._response = response
+
+    def get_json(self, silent: bool = False) -> Any:
+        try:
+            return self._response.json()
+        except ValueError:
+            if silent:
+                return None
+            raise
+
+
+class _HTTPClient:
+    """The slice of Flask's test client that post_message() uses, over HTTP."""
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url
+        self.session = requests.Session()
+
+    def post(self, path: str, json: Any = None) -> _Response:
+        return _Response(self.session.post(self.base_url + path, json=json, timeout=120))
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(mode: str, args: argparse.Namespace) -> Tuple[subprocess.Popen, str]:
+    port = _free_port()
+    env = dict(os.environ, SERVING_MODE=mode, GUNICORN_THREADS=str(args.threads), WARM_SERVICES="1",
+               KIRANA_LOAD_PARAMS=json.dumps({"shops": args.shops, "whisper_ms": args.whisper_ms,
+                                              "chat_ms": args.chat_ms, "send_ms": args.send_ms,
+                                              "seed": args.seed}))
+    if args.workers:
+        env["WEB_CONCURRENCY"] = str(args.workers)
+    server = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", os.path.join(ROOT, "gunicorn.conf.py"), "--chdir", HERE,
+         "-b", f"127.0.0.1:{port}", "--log-level", "warning", "load_app:app"],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 120
+    while time.time() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"gunicorn ({mode}) exited: {server.stderr.read()[-2000:]}")
+        try:
+            if requests.get(base_url + "/ready", timeout=30).status_code == 200:
+                return server, base_url
+        except requests.RequestException:
+            pass
+        time.sleep(0.25)
+    server.terminate()
+    raise RuntimeError(f"gunicorn ({mode}) not ready after 120s")
+
+
+def run_http_load(base_url: str, messages: List[Any], rate: float, clients: int) -> Dict[str, Any]:
+    latencies: Dict[str, List[float]] = {}
+    errors = [0]
+    lock = threading.Lock()
+    local = threading.local()
+
+    def send(message: Any, scheduled: float) -> None:
+        client = getattr(local, "client", None)
+        if client is None:
+            client = local.client = _HTTPClient(base_url)
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        try:
+            status, body = post_message(client, message)
+            failed = status != 200 or body.get("status") == "error"
+        except requests.RequestException:
+            failed = True
+        elapsed = time.perf_counter() - scheduled
+        with lock:
+            latencies.setdefault(message.kind, []).append(elapsed)
+            errors[0] += failed
+
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        start = time.perf_counter()
+        interval = 1.0 / rate if rate > 0 else 0.0
+        futures = [pool.submit(send, message, start + i * interval) for i, message in enumerate(messages)]
+        for future in futures:
+            future.result()
+        wall = time.perf_counter() - start
+    return {"latencies": latencies, "errors": errors[0], "wall": wall, "sent": len(messages)}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--modes", default="sync,gthread,gevent")
+    parser.add_argument("--messages", type=int, default=300)
+    parser.add_argument("--rate", type=float, default=20.0, help="messages per second (0 = unpaced)")
+    parser.add_argument("--clients", type=int, default=128, help="concurrent HTTP clients")
+    parser.add_argument("--workers", type=int, default=0, help="WEB_CONCURRENCY for every mode (0 = derived)")
+    parser.add_argument("--threads", type=int, default=Config.GUNICORN_THREADS)
+    parser.add_argument("--shops", type=int, default=10)
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("text=55,llm=15,voice=20,batch=10"))
+    parser.add_argument("--whisper-ms", type=float, default=800.0)
+    parser.add_argument("--chat-ms", type=float, default=600.0)
+    parser.add_argument("--send-ms", type=float, default=150.0)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    messages = generate_messages(fixtures(args.shops), args.messages, args.mix, seed=args.seed)
+    print(f"{args.messages} messages at {args.rate:g}/s from {args.shops} shops, mix {args.mix}; "
+          f"stub latency whisper {args.whisper_ms:g}ms, chat {args.chat_ms:g}ms, send {args.send_ms:g}ms\n")
+
+    rows = []
+    for mode in [m.strip() for m in args.modes.split(",") if m.strip()]:
+        if mode == "gevent" and not concurrency.gevent_available():
+            print(f"{mode}: skipped (gevent is not installed)")
+            continue
+        if args.workers:
+            os.environ["WEB_CONCURRENCY"] = str(args.workers)
+        settings = concurrency.gunicorn_settings(mode)
+        per_worker = {"gthread": args.threads, "gevent": settings["worker_connections"]}.get(mode, 1)
+        server, base_url = start_server(mode, args)
+        try:
+            result = run_http_load(base_url, messages, args.rate, args.clients)
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+        rows.append((mode, f"{settings['workers']}x{per_worker}", result))
+
+    print(f"\n{'mode':<9}{'workers':>9}{'msg/s':>8}{'errors':>8}   {'latency ms':<10}{'p50':>8}{'p95':>8}{'p99':>8}")
+    for mode, shape, result in rows:
+        everything = [v for values in result["latencies"].values() for v in values]
+        for i, (kind, values) in enumerate(sorted(result["latencies"].items()) + [("all", everything)]):
+            head = (f"{mode:<9}{shape:>9}{result['sent'] / result['wall']:>8.1f}{result['errors']:>8}"
+                    if i == 0 else " " * 34)
+            print(f"{head}   {kind:<10}" + "".join(f"{percentile(values, p) * 1000:>8.0f}" for p in (50, 95, 99)))
+
+
+if __name__ == "__main__":
+    main()
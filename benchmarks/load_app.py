@@ -0,0 +1,19 @@
+"""
+WSGI entry point serving the load harness's stubbed app (see load_harness.py)
+
+For running the offline harness under a real server, one booted copy per
+worker process; bench_worker_modes.py starts gunicorn on it:
+
+    KIRANA_LOAD_PARAMS='{"shops": 20, "whisper_ms": 800}' \
+        gunicorn -c gunicorn.conf.py --chdir benchmarks load_app:app
+"""
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from load_harness import boot_app  # noqa: E402
+
+harness = boot_app(**json.loads(os.environ.get("KIRANA_LOAD_PARAMS") or "{}"))
+app = harness.app
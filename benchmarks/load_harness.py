@@ -0,0 +1,387 @@
+"""
+Offline, deterministic load harness for the /webhook and /api/chat pipeline
+
+Boots the real Flask app (app.py) with nothing external behind it:
+
+- the SQLite document store in memory instead of Firestore
+- StubOpenAI in place of the OpenAI client: canned Whisper transcripts
+  and JSON parse answers, each after a configurable latency
+- StubWhatsApp in place of the WATI / Cloud API sender
+- a local HTTP server that serves the "voice notes" (the bytes encode the
+  transcript)
+
+It then replays a seeded mix of text, voice and barcode-batch messages
+from many shops at a target rate (open loop: latency is measured from each
+message's scheduled time, so queueing shows up). The result has
+throughput, p50/p95/p99 latency per message kind, and a per-stage
+breakdown taken from the app's own traces (see tracing.py).
+
+benchmarks/bench_webhook_load.py is the command line; other benchmarks
+import boot_app() / run_load() from here.
+"""
+import contextlib
+import io
+import json
+import math
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+AUDIO_PREFIX = b"STUBAUDIO:"
+
+PRODUCTS = ["Maggi", "Atta", "Sugar", "Toor Dal", "Parle G", "Tata Salt", "Amul Butter", "Surf Excel"]
+
+# Phrases the heuristics resolve, and free-form ones that go to the LLM
+# with the parse the stub answers for them
+TEXT_TEMPLATES = [
+    "{qty} {product} add kar do",
+    "{qty} {product} bik gaya",
+    "{product} kitna stock hai",
+    "aaj ki sale kitni hui",
+    "low stock dikhao",
+]
+LLM_MESSAGES = {
+    "bhai woh peeli wali {product} ki thaili {qty} aayi thi": {"action": "add_stock", "quantity": "{qty}"},
+    "customer ne abhi {product} wapas nahi kiya, {qty} le gaya": {"action": "reduce_stock", "quantity": "{qty}"},
+}
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of `values` (0 if empty)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = math.ceil(pct / 100.0 * len(ordered))
+    return ordered[max(0, min(len(ordered), rank) - 1)]
+
+
+class _Latency:
+    def __init__(self, mean_ms: float, jitter_ms: float, seed: int):
+        self.mean_ms = mean_ms
+        self.jitter_ms = jitter_ms
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sleep(self) -> None:
+        with self._lock:
+            jitter = self._rng.uniform(-self.jitter_ms, self.jitter_ms) if self.jitter_ms else 0.0
+        delay = max(0.0, self.mean_ms + jitter) / 1000.0
+        if delay:
+            time.sleep(delay)
+
+
+class StubOpenAI:
+    """Enough of the OpenAI client for AIService: audio and chat completions."""
+
+    def __init__(self, whisper_ms: float = 800.0, chat_ms: float = 600.0, jitter_ms: float = 0.0,
+                 parses: Optional[Dict[str, Dict[str, Any]]] = None, seed: int = 1):
+        self.whisper = _Latency(whisper_ms, jitter_ms, seed)
+        self.chat_latency = _Latency(chat_ms, jitter_ms, seed + 1)
+        self.parses = parses or {}
+        self.calls = {"audio": 0, "chat": 0}
+        self._lock = threading.Lock()
+        transcribe = SimpleNamespace(create=self._transcribe)
+        self.audio = SimpleNamespace(translations=transcribe, transcriptions=transcribe)
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._complete))
+
+    def _count(self, kind: str) -> None:
+        with self._lock:
+            self.calls[kind] += 1
+
+    def _transcribe(self, model: str = "whisper-1", file: Any = None, **_: Any) -> Any:
+        self._count("audio")
+        # A file object, raw bytes or a (filename, bytes) tuple, as the real client takes
+        if isinstance(file, tuple):
+            file = file[1]
+        data = bytes((file.read() if hasattr(file, "read") else file) or b"")
+        self.whisper.sleep()
+        text = data[len(AUDIO_PREFIX):].decode("utf-8") if data.startswith(AUDIO_PREFIX) else ""
+        return SimpleNamespace(text=text)
+
+    def _complete(self, model: str = "", messages: Optional[List[Dict[str, str]]] = None, **_: Any) -> Any:
+        self._count("chat")
+        self.chat_latency.sleep()
+        prompt = (messages or [{}])[-1].get("content", "")
+        message = prompt.split(":", 1)[-1].strip().lower()
+        parsed = self.parses.get(message, {"action": "unknown", "product_name": None, "quantity": None,
+                                           "confidence": 0.2})
+        content = json.dumps(parsed)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+class StubWhatsApp:
+    """Stands in for WhatsAppService: sends take `send_ms`; media ids resolve to the audio server."""
+
+    def __init__(self, media_base_url: str, send_ms: float = 150.0, jitter_ms: float = 0.0, seed: int = 3):
+        self.media_base_url = media_base_url
+        self.latency = _Latency(send_ms, jitter_ms, seed)
+        self.sent = 0
+        self._lock = threading.Lock()
+
+    def send_message(self, to_phone: str, message: str) -> bool:
+        self.latency.sleep()
+        with self._lock:
+            self.sent += 1
+        return True
+
+    def download_media(self, media_id: str) -> Optional[str]:
+        return f"{self.media_base_url}/{media_id}"
+
+    def media_headers(self) -> Dict[str, str]:
+        return {}
+
+
+class AudioServer:
+    """Local HTTP server for voice notes: GET /<hex of transcript> returns the stub audio."""
+
+    def __init__(self):
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                try:
+                    text = bytes.fromhex(self.path.strip("/")).decode("utf-8")
+                except ValueError:
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                body = AUDIO_PREFIX + text.encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "audio/ogg")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *_):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def start(self) -> "AudioServer":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+
+
+def media_id(transcript: str) -> str:
+    return transcript.encode("utf-8").hex()
+
+
+@dataclass
+class Message:
+    kind: str          # "text" | "llm" | "voice" | "batch"
+    phone: str
+    body: str          # text, transcript (voice) or newline-separated barcode lines
+    endpoint: str      # "/webhook" | "/api/chat"
+
+
+@dataclass
+class Harness:
+    app: Any
+    module: Any
+    openai: StubOpenAI
+    whatsapp: StubWhatsApp
+    audio: AudioServer
+    shops: List[Tuple[str, str]] = field(default_factory=list)  # (shop_id, phone)
+    barcodes: Dict[str, List[str]] = field(default_factory=dict)
+
+    def close(self) -> None:
+        self.audio.stop()
+
+
+def shop_phone(i: int) -> str:
+    return f"+9198{i:08d}"
+
+
+def shop_barcode(i: int, j: int) -> str:
+    return f"89{i:05d}{j:06d}"
+
+
+def fixtures(shops: int) -> SimpleNamespace:
+    """The phones and barcodes boot_app() seeds, without booting anything:
+    enough for generate_messages() when the app runs in another process."""
+    return SimpleNamespace(
+        shops=[(None, shop_phone(i)) for i in range(shops)],
+        barcodes={shop_phone(i): [shop_barcode(i, j) for j in range(len(PRODUCTS))] for i in range(shops)},
+    )
+
+
+def boot_app(shops: int = 20, whisper_ms: float = 800.0, chat_ms: float = 600.0, send_ms: float = 150.0,
+             jitter_ms: float = 0.0, seed: int = 7, sqlite_path: str = ":memory:") -> Harness:
+    """Import app.py against in-memory/stub backends and seed `shops` shops."""
+    os.environ.update({
+        "DATABASE_BACKEND": "sqlite",
+        "SQLITE_PATH": sqlite_path,
+        "OPENAI_API_KEY": "stub-openai-key",
+        "WHATSAPP_ACCESS_TOKEN": "stub-whatsapp-token",
+        "WATI_API_KEY": "",
+        "SALES_JOURNAL_PATH": "",
+        "TRACE_LOG": "0",
+    })
+    with contextlib.redirect_stdout(io.StringIO()):
+        import app as module
+        import services
+
+    audio = AudioServer().start()
+    parses = {}
+    rng = random.Random(seed)
+    for template, parse in LLM_MESSAGES.items():
+        for product in PRODUCTS:
+            for qty in range(1, 10):
+                message = template.format(product=product.lower(), qty=qty).lower()
+                parses[message] = {"action": parse["action"], "product_name": product,
+                                   "quantity": float(parse["quantity"].format(qty=qty)), "confidence": 0.9}
+    openai = StubOpenAI(whisper_ms=whisper_ms, chat_ms=chat_ms, jitter_ms=jitter_ms, parses=parses, seed=seed)
+    whatsapp = StubWhatsApp(audio.url, send_ms=send_ms, jitter_ms=jitter_ms, seed=seed + 2)
+    with contextlib.redirect_stdout(io.StringIO()):
+        services.ai_service.client = openai
+        services.whatsapp_service.set(whatsapp)
+
+    harness = Harness(app=module.app, module=module, openai=openai, whatsapp=whatsapp, audio=audio)
+    db = module.db
+    with contextlib.redirect_stdout(io.StringIO()):
+        for i in range(shops):
+            phone = shop_phone(i)
+            shop = db.create_shop(f"Load Kirana {i}", phone)
+            harness.shops.append((shop.shop_id, phone))
+            codes = []
+            for j, name in enumerate(PRODUCTS):
+                db.add_stock(shop.shop_id, name, float(rng.randint(50, 200)), phone)
+                product = db.find_existing_product_by_name(shop.shop_id, name)
+                barcode = shop_barcode(i, j)
+                db.update_product_fields(product.product_id, {"barcode": barcode})
+                codes.append(barcode)
+            harness.barcodes[phone] = codes
+    return harness
+
+
+def generate_messages(harness: Any, count: int, mix: Dict[str, float], seed: int = 11,
+                      chat_share: float = 0.2) -> List[Message]:
+    """A seeded message mix; `mix` weights "text", "llm", "voice" and "batch"."""
+    rng = random.Random(seed)
+    kinds, weights = zip(*sorted(mix.items()))
+    messages = []
+    for _ in range(count):
+        kind = rng.choices(kinds, weights)[0]
+        _, phone = rng.choice(harness.shops)
+        product, qty = rng.choice(PRODUCTS).lower(), rng.randint(1, 9)
+        if kind == "batch":
+            body = "\n".join(f"{code} {rng.choice(['-1', '-2', '+5'])}"
+                             for code in rng.sample(harness.barcodes[phone], 3))
+        elif kind == "llm":
+            body = rng.choice(list(LLM_MESSAGES)).format(product=product, qty=qty)
+        else:
+            body = rng.choice(TEXT_TEMPLATES).format(product=product, qty=qty)
+        endpoint = "/api/chat" if kind in ("text", "llm") and rng.random() < chat_share else "/webhook"
+        messages.append(Message(kind=kind, phone=phone, body=body, endpoint=endpoint))
+    return messages
+
+
+def post_message(client: Any, message: Message) -> Tuple[int, Dict[str, Any]]:
+    if message.endpoint == "/api/chat":
+        response = client.post("/api/chat", json={"phone": message.phone, "message": message.body})
+    else:
+        if message.kind == "voice":
+            content = {"type": "audio", "audio": {"id": media_id(message.body), "mime_type": "audio/ogg"}}
+        else:
+            content = {"type": "text", "text": {"body": message.body}}
+        payload = {"entry": [{"changes": [{"value": {"messages": [{"from": message.phone, **content}]}}]}]}
+        response = client.post("/webhook", json=payload)
+    return response.status_code, response.get_json(silent=True) or {}
+
+
+@dataclass
+class LoadResult:
+    sent: int
+    errors: int
+    wall_seconds: float
+    latencies: Dict[str, List[float]]              # kind -> seconds, from scheduled send
+    stages: Dict[str, List[float]]                 # stage -> seconds
+    openai_calls: Dict[str, int]
+    replies_sent: int
+
+    @property
+    def throughput(self) -> float:
+        return self.sent / self.wall_seconds if self.wall_seconds else 0.0
+
+
+def run_load(harness: Harness, messages: List[Message], rate: float, workers: int = 16) -> LoadResult:
+    """Send `messages` at `rate` per second (0 = as fast as possible) from `workers` threads."""
+    latencies: Dict[str, List[float]] = {}
+    stages: Dict[str, List[float]] = {}
+    errors = [0]
+    lock = threading.Lock()
+    local = threading.local()
+
+    def on_trace(trace: Any) -> None:
+        with lock:
+            for stage, detail, seconds, _ in trace.stages:
+                stages.setdefault(f"{stage}[{detail}]" if detail else stage, []).append(seconds)
+
+    def send(message: Message, scheduled: float) -> None:
+        client = getattr(local, "client", None)
+        if client is None:
+            client = local.client = harness.app.test_client()
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        status, body = post_message(client, message)
+        elapsed = time.perf_counter() - scheduled
+        with lock:
+            latencies.setdefault(message.kind, []).append(elapsed)
+            if status != 200 or body.get("status") == "error":
+                errors[0] += 1
+
+    import tracing
+    tracing.add_trace_listener(on_trace)
+    openai_before, sent_before = dict(harness.openai.calls), harness.whatsapp.sent
+    try:
+        with contextlib.redirect_stdout(io.StringIO()), ThreadPoolExecutor(max_workers=workers) as pool:
+            start = time.perf_counter()
+            interval = 1.0 / rate if rate > 0 else 0.0
+            futures = [pool.submit(send, message, start + i * interval) for i, message in enumerate(messages)]
+            for future in futures:
+                future.result()
+            wall = time.perf_counter() - start
+    finally:
+        tracing.remove_trace_listener(on_trace)
+    return LoadResult(
+        sent=len(messages),
+        errors=errors[0],
+        wall_seconds=wall,
+        latencies=latencies,
+        stages=stages,
+        openai_calls={k: harness.openai.calls[k] - openai_before.get(k, 0) for k in harness.openai.calls},
+        replies_sent=harness.whatsapp.sent - sent_before,
+    )
+
+
+def report(result: LoadResult) -> str:
+    lines = [
+        f"sent {result.sent} in {result.wall_seconds:.1f}s → {result.throughput:.1f} msg/s, "
+        f"{result.errors} errors, {result.replies_sent} replies, "
+        f"OpenAI calls: {result.openai_calls['audio']} whisper / {result.openai_calls['chat']} chat",
+        "",
+        f"{'latency (ms)':<22}{'n':>7}{'p50':>9}{'p95':>9}{'p99':>9}",
+    ]
+    everything = [v for values in result.latencies.values() for v in values]
+    for kind, values in sorted(result.latencies.items()) + [("all", everything)]:
+        lines.append(f"{kind:<22}{len(values):>7}" + "".join(
+            f"{percentile(values, p) * 1000:>9.0f}" for p in (50, 95, 99)))
+    lines += ["", f"{'stage (ms)':<34}{'n':>7}{'mean':>9}{'p50':>9}{'p95':>9}{'p99':>9}"]
+    for stage, values in sorted(result.stages.items(), key=lambda item: -sum(item[1])):
+        lines.append(f"{stage:<34}{len(values):>7}{sum(values) / len(values) * 1000:>9.1f}" + "".join(
+            f"{percentile(values, p) * 1000:>9.1f}" for p in (50, 95, 99)))
+    return "\n".join(lines)
@@ -0,0 +1,108 @@
+"""
+Catalog sync: version/ETag, deltas with tombstones and gzip for the stock UI
+
+stock_management.html and the POS load the whole catalog from
+/api/stock/products on every visit. A shop's catalog version is the newest
+`updated_at` of its products (every product write stamps it) or
+`deleted_at` of its tombstones, so it moves on any product write without a
+shared counter document that every sale would have to update. The ETag
+adds the shop's unflushed sales journal deltas, which change stock before
+updated_at does, and the representation asked for (the `updated_since`
+cursor and whether the body may be gzipped), so a 304 never confirms a
+different body. Working it out costs two single-document reads.
+
+    GET /api/stock/products?phone=...                     full catalog + ETag
+        If-None-Match: <etag>                             304, no body
+    GET /api/stock/products?phone=...&updated_since=<cursor>
+        products changed after the cursor and `deleted` product ids
+
+Deleting a product leaves catalog_tombstones/{product_id} ({shop_id,
+product_id, deleted_at}), so clients holding a cursor learn about it.
+Timestamps stay ISO-8601 UTC strings like every other stamp in the store;
+they sort the same as native timestamps.
+
+The stamps come from the writing worker's clock when it builds the write,
+so a write can become visible after a newer stamp already has. The cursor
+handed out is therefore CATALOG_CURSOR_OVERLAP_SECONDS (30) behind the
+newest stamp seen; the next delta repeats those products, which clients
+simply apply again.
+
+Full responses are gzipped for clients that accept it (CATALOG_GZIP_MIN_BYTES,
+default 1024). benchmarks/bench_catalog_sync.py measures the payload sizes.
+"""
+import gzip
+import hashlib
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from config import Config
+
+TOMBSTONE_COLLECTION = "catalog_tombstones"
+
+
+def gzip_min_bytes() -> int:
+    """Smallest body worth compressing (CATALOG_GZIP_MIN_BYTES, default 1024)."""
+    return Config.CATALOG_GZIP_MIN_BYTES
+
+
+def cursor_overlap_seconds() -> float:
+    """How far cursors trail the newest stamp (CATALOG_CURSOR_OVERLAP_SECONDS, default 30)."""
+    return Config.CATALOG_CURSOR_OVERLAP_SECONDS
+
+
+def next_cursor(stamps: List[str], since: Optional[str] = None) -> Optional[str]:
+    """Cursor for the next delta: the newest stamp less the overlap, never before `since`."""
+    if not stamps:
+        return since
+    newest = max(stamps)
+    try:
+        cursor = (datetime.fromisoformat(newest) - timedelta(seconds=cursor_overlap_seconds())).isoformat()
+    except ValueError:
+        cursor = newest
+    return max(cursor, since) if since else cursor
+
+
+def catalog_etag(shop_id: str, version: Optional[str], pending: Optional[Dict[str, float]] = None,
+                 variant: str = "") -> str:
+    """Strong ETag for a shop's catalog at `version` plus unflushed stock deltas.
+
+    `variant` names the representation (see representation()).
+    """
+    parts = [shop_id, version or "", variant]
+    parts += [f"{product_id}={delta:g}" for product_id, delta in sorted((pending or {}).items())]
+    return '"' + hashlib.sha1("|".join(parts).encode("utf-8")).hexdigest()[:20] + '"'
+
+
+def representation(updated_since: Optional[str], accept_encoding: Optional[str]) -> str:
+    """ETag variant of a catalog response: its cursor and whether it may be gzipped."""
+    return f"{updated_since or ''};{'gzip' if accepts_gzip(accept_encoding) else 'identity'}"
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header names `etag` (weak or strong, or *)."""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+def accepts_gzip(accept_encoding: Optional[str]) -> bool:
+    for coding in (accept_encoding or "").split(","):
+        name, _, params = coding.strip().partition(";")
+        if name.strip().lower() in ("gzip", "*"):
+            return params.replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000")
+    return False
+
+
+def compress(body: bytes, accept_encoding: Optional[str]) -> Optional[bytes]:
+    """`body` gzipped if the client accepts it and it's big enough, else None."""
+    if len(body) < gzip_min_bytes() or not accepts_gzip(accept_encoding):
+        return None
+    return gzip.compress(body, compresslevel=6)
@@ -5,6 +5,10 @@ from typing import Dict, Any, Optional, List
 from datetime import datetime, timedelta
 import re
 
+import firestore_accounting
+import tracing
+import transcription_strategy
+from config import Config
 from models import CommandAction, ParsedCommand
 from database import FirestoreDB
 from ai_service import AIService
@@ -39,11 +43,12 @@ class CommandProcessor:
         """
         try:
             # Step 1: Get or validate user and shop
-            user = self.db.get_user_by_phone(from_phone)
+            with tracing.span("resolve_user"):
+                user = self.db.get_user_by_phone(from_phone)
+                shop = None if user else self.db.get_shop_by_phone(from_phone)
 
             if not user:
                 # Try to find shop by owner phone
-                shop = self.db.get_shop_by_phone(from_phone)
                 if not shop:
                     return {
                         'success': False,
@@ -65,17 +70,21 @@ class CommandProcessor:
                     }
 
                 # Download media if needed (for WhatsApp Cloud API)
+                media_headers = None
                 if not media_url.startswith("http"):
-                    media_url = self.whatsapp_service.download_media(media_url)
+                    with tracing.span("media_download"):
+                        media_url = self.whatsapp_service.download_media(media_url)
                     if not media_url:
                         return {
                             'success': False,
                             'message': "❌ Could not download voice message.",
                             'send_reply': True,
                         }
+                    media_headers = self.whatsapp_service.media_headers()
 
                 # Transcribe audio
-                text = self.ai_service.transcribe_audio(media_url, media_format or "ogg")
+                with tracing.span("transcribe_audio"):
+                    text = self.ai_service.transcribe_audio(media_url, media_format or "ogg", headers=media_headers)
 
                 if not text:
                     print("⚠️ Voice transcription returned no text.")
@@ -99,10 +108,14 @@ class CommandProcessor:
             if message_type == "voice":
                 response_language = "english"
             else:
-                response_language = self.ai_service.detect_language(text)
+                with tracing.span("detect_language"):
+                    response_language = self.ai_service.detect_language(text)
+                # Typed messages tell the voice upload route how this shop speaks
+                transcription_strategy.STRATEGY.history.record(shop_id, response_language)
 
             # Check if user has a pending product selection
-            pending = self.db.get_pending_selection(from_phone)
+            with tracing.span("pending_selection"):
+                pending = self.db.get_pending_selection(from_phone)
             if pending and not pending.is_expired():
                 # User might be responding with a number to select a product
                 number_match = re.match(r'^\s*(\d+)\s*$', text.strip())
@@ -152,17 +165,20 @@ class CommandProcessor:
                         }
 
             # Special handling: batch of multiple barcode + quantity lines
-            batch_result = self._try_process_barcode_batch(
-                shop_id=shop_id,
-                user_phone=from_phone,
-                text=text,
-                response_language=response_language,
-            )
+            with tracing.span("barcode_batch"):
+                batch_result = self._try_process_barcode_batch(
+                    shop_id=shop_id,
+                    user_phone=from_phone,
+                    text=text,
+                    response_language=response_language,
+                )
             if batch_result is not None:
                 return batch_result
 
             # Step 3: Parse single command using AI
-            parsed_command = self.ai_service.parse_command(text)
+            # The detail becomes "llm" if the heuristics fell through to OpenAI
+            with tracing.span("parse_command", detail="heuristic"):
+                parsed_command = self.ai_service.parse_command(text)
 
             print(
                 f"Parsed command: action={parsed_command.action.value}, "
@@ -218,7 +234,10 @@ class CommandProcessor:
                 }
 
             # Step 5: Execute command
-            result = self._execute_command(shop_id, from_phone, parsed_command)
+            with tracing.span("execute_command", detail=parsed_command.action.value), \
+                    firestore_accounting.measure() as usage:
+                result = self._execute_command(shop_id, from_phone, parsed_command)
+            firestore_accounting.observe_command(parsed_command.action.value, usage)
 
             # Debug output for seasonal suggestion
             if parsed_command.action == CommandAction.SEASONAL_SUGGESTION:
@@ -232,11 +251,12 @@ class CommandProcessor:
                 response_message = result['message']
             elif result['success']:
                 # Generate response using AI service
-                response_message = self.ai_service.generate_response(
-                    parsed_command.action.value,
-                    result,
-                    language=response_language,
-                )
+                with tracing.span("generate_response", detail=parsed_command.action.value):
+                    response_message = self.ai_service.generate_response(
+                        parsed_command.action.value,
+                        result,
+                        language=response_language,
+                    )
             else:
                 response_message = result.get('message', '❌ Command failed.')
 
@@ -248,7 +268,7 @@ class CommandProcessor:
             }
 
         except Exception as e:
-            print(f"❌ ERROR in process_message: {e}")
+            tracing.log(f"❌ ERROR in process_message: {e}")
             import traceback
             traceback.print_exc()
 
@@ -611,6 +631,7 @@ class CommandProcessor:
                 return self.db.get_products_summary(
                     shop_id=shop_id,
                     keyword=command.product_name,
+                    limit=Config.LIST_PRODUCTS_LIMIT or None,
                 )
 
 
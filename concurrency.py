@@ -0,0 +1,105 @@
+"""
+Worker concurrency model for gunicorn (read by gunicorn.conf.py)
+
+A request spends most of its time waiting on OpenAI (Whisper, GPT),
+WhatsApp and Firestore, so one request per worker process (gunicorn's sync
+worker) lets two voice notes stall a shop's POS. SERVING_MODE picks how a
+worker overlaps that waiting:
+
+    gthread  (default)  a pool of GUNICORN_THREADS threads per worker
+    gevent              GUNICORN_WORKER_CONNECTIONS greenlets per worker;
+                        needs the gevent package, falls back to gthread
+    sync                one request at a time per worker (the old setup)
+
+Worker processes default from the CPU count (2 x CPUs + 1 for sync, where
+processes are the only concurrency; max(2, CPUs) otherwise, as threads and
+greenlets already cover the waiting). WEB_CONCURRENCY overrides the count,
+GUNICORN_TIMEOUT the 120 s request timeout.
+
+Everything a worker shares between requests is safe for both models: the
+services are built once behind a lock (services.py), the caches
+(idempotency, low-stock sets, expiry indexes, display sessions, metrics)
+lock their updates, and per-thread SQLite connections stay per OS thread
+under gevent (thread_local()). The Firestore client needs gRPC's gevent
+integration, which init_worker() switches on before the client is built.
+"""
+import os
+import threading
+from typing import Any, Dict, Optional
+
+from config import Config
+
+MODES = ("sync", "gthread", "gevent")
+DEFAULT_MODE = "gthread"
+
+_WORKER_CLASSES = {"sync": "sync", "gthread": "gthread", "gevent": "gevent"}
+
+
+def gevent_available() -> bool:
+    try:
+        import gevent  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def serving_mode() -> str:
+    """SERVING_MODE, validated; gevent without the package falls back to gthread."""
+    mode = Config.SERVING_MODE
+    if mode not in MODES:
+        print(f"⚠️ Unknown SERVING_MODE {mode!r}, using {DEFAULT_MODE}")
+        return DEFAULT_MODE
+    if mode == "gevent" and not gevent_available():
+        print("⚠️ SERVING_MODE=gevent but gevent is not installed, using gthread")
+        return "gthread"
+    return mode
+
+
+def gunicorn_settings(mode: Optional[str] = None, cpu_count: Optional[int] = None) -> Dict[str, Any]:
+    """worker_class, workers, threads, worker_connections and timeouts for `mode`."""
+    mode = mode or serving_mode()
+    cpus = cpu_count or os.cpu_count() or 1
+    default_workers = 2 * cpus + 1 if mode == "sync" else max(2, cpus)
+    timeout = Config.GUNICORN_TIMEOUT
+    return {
+        "mode": mode,
+        "worker_class": _WORKER_CLASSES[mode],
+        "workers": Config.WEB_CONCURRENCY or default_workers,
+        "threads": Config.GUNICORN_THREADS if mode == "gthread" else 1,
+        "worker_connections": Config.GUNICORN_WORKER_CONNECTIONS,
+        "timeout": timeout,
+        "graceful_timeout": min(timeout, 30),
+        # Keep idle connections from the POS (polling display, catalog) open between requests
+        "keepalive": 5 if mode != "sync" else 2,
+    }
+
+
+def is_gevent_patched() -> bool:
+    try:
+        from gevent import monkey
+        return monkey.is_module_patched("threading")
+    except ImportError:
+        return False
+
+
+def thread_local() -> Any:
+    """A threading.local that stays per OS thread when gevent has patched
+    threading (where threading.local becomes per greenlet). For objects like
+    SQLite connections: greenlets on one thread may share them, since sqlite3
+    calls never yield, and a connection per request would be wasted."""
+    if is_gevent_patched():
+        from gevent import monkey
+        return monkey.get_original("_thread", "_local")()
+    return threading.local()
+
+
+def init_worker(mode: str) -> None:
+    """Per-worker setup before any service is built (gunicorn post_worker_init)."""
+    if mode != "gevent":
+        return
+    try:
+        # gRPC (the Firestore client) blocks the hub unless told about gevent
+        from grpc.experimental import gevent as grpc_gevent
+        grpc_gevent.init_gevent()
+    except ImportError:
+        pass
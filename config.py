@@ -7,6 +7,15 @@ from dotenv import load_dotenv
 load_dotenv()
 
 
+def env_number(name, default, cast=float, minimum=None):
+    """Environment variable `name` as a number; unset, empty or unparsable gives `default`."""
+    try:
+        value = cast(float(os.getenv(name) or default))
+    except ValueError:
+        return default
+    return value if minimum is None else max(minimum, value)
+
+
 class Config:
     """Application configuration"""
     
@@ -17,10 +26,76 @@ class Config:
     # Firebase
     GOOGLE_APPLICATION_CREDENTIALS = os.getenv('GOOGLE_APPLICATION_CREDENTIALS')
     FIREBASE_PROJECT_ID = os.getenv('FIREBASE_PROJECT_ID')
+
+    # Storage backend: "firestore" or "sqlite" (single-box deployments, tests)
+    DATABASE_BACKEND = (os.getenv('DATABASE_BACKEND') or 'firestore').lower()
+    SQLITE_PATH = os.getenv('SQLITE_PATH') or 'kiranabuddy.db'
+    # Local write-ahead journal for POS sales/returns; unset = write straight through
+    SALES_JOURNAL_PATH = os.getenv('SALES_JOURNAL_PATH')
+    SALES_JOURNAL_FLUSH_SECONDS = env_number('SALES_JOURNAL_FLUSH_SECONDS', 2.0)
+    # Flush attempts before an entry is parked as dead (sales_journal.py)
+    SALES_JOURNAL_MAX_ATTEMPTS = env_number('SALES_JOURNAL_MAX_ATTEMPTS', 10, int, 1)
+    # Layout for new shops ("global", "dual" or "nested", see shop_layout.py) and how
+    # long a shop's layout is cached, i.e. how soon other workers follow a cut-over
+    DEFAULT_DATA_LAYOUT = (os.getenv('DEFAULT_DATA_LAYOUT') or 'global').lower()
+    SHOP_LAYOUT_TTL_SECONDS = env_number('SHOP_LAYOUT_TTL_SECONDS', 30.0)
+
+    # Ledger compaction (ledger_archive.py): months older than the horizon are
+    # summarized and archived, to gzip'd files under LEDGER_ARCHIVE_DIR when set
+    LEDGER_COMPACTION_HORIZON_DAYS = env_number('LEDGER_COMPACTION_HORIZON_DAYS', 365, int, 1)
+    LEDGER_ARCHIVE_DIR = os.getenv('LEDGER_ARCHIVE_DIR')
+    # Products replayed in parallel by stock reconciliation (reconciliation.py)
+    RECONCILE_WORKERS = env_number('RECONCILE_WORKERS', 8, int, 1)
+
+    # POS request replay cache (idempotency.py)
+    IDEMPOTENCY_CACHE_SIZE = env_number('IDEMPOTENCY_CACHE_SIZE', 10000, int, 0)
+
+    # Catalog sync for POS clients (catalog_sync.py)
+    CATALOG_GZIP_MIN_BYTES = env_number('CATALOG_GZIP_MIN_BYTES', 1024, int, 0)
+    CATALOG_CURSOR_OVERLAP_SECONDS = env_number('CATALOG_CURSOR_OVERLAP_SECONDS', 30.0, float, 0.0)
+
+    # Request tracing (tracing.py): TRACE_LOG=0 silences the per-request line,
+    # TRACE_LOG_MIN_MS only logs slower requests; METRICS_TOKEN guards /metrics
+    TRACE_LOG = os.getenv('TRACE_LOG', '1') != '0'
+    TRACE_LOG_MIN_MS = env_number('TRACE_LOG_MIN_MS', 0.0)
+    METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+
+    # Firestore read/write accounting (firestore_accounting.py); a read budget of
+    # 0 (default) logs no over-budget requests
+    FIRESTORE_ACCOUNTING = os.getenv('FIRESTORE_ACCOUNTING', '1') != '0'
+    FIRESTORE_USAGE_HEADER = os.getenv('FIRESTORE_USAGE_HEADER', '0') == '1'
+    FIRESTORE_READ_BUDGET = env_number('FIRESTORE_READ_BUDGET', 0, int, 0)
+
+    # WARM_SERVICES=0 leaves each gunicorn worker's services to the first request that needs them
+    WARM_SERVICES = os.getenv('WARM_SERVICES', '1') != '0'
+
+    # Gunicorn serving model (concurrency.py); WEB_CONCURRENCY 0 = from the CPU count
+    SERVING_MODE = (os.getenv('SERVING_MODE') or 'gthread').lower()
+    WEB_CONCURRENCY = env_number('WEB_CONCURRENCY', 0, int, 0)
+    GUNICORN_THREADS = env_number('GUNICORN_THREADS', 8, int, 1)
+    GUNICORN_WORKER_CONNECTIONS = env_number('GUNICORN_WORKER_CONNECTIONS', 100, int, 1)
+    GUNICORN_TIMEOUT = env_number('GUNICORN_TIMEOUT', 120, int, 1)
+    # Customer-display sessions untouched this long are dropped (display_sessions.py)
+    DISPLAY_SESSION_TTL_SECONDS = env_number('DISPLAY_SESSION_TTL_SECONDS', 43200.0)
     
     # OpenAI
     OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
     OPENAI_MODEL = os.getenv('OPENAI_MODEL', 'gpt-4o-mini')
+
+    # OpenAI guard: per-request budget, circuit breaker and concurrency cap (openai_guard.py)
+    REQUEST_BUDGET_SECONDS = env_number('REQUEST_BUDGET_SECONDS', 25.0)
+    OPENAI_BREAKER_WINDOW = env_number('OPENAI_BREAKER_WINDOW', 20, int, 1)
+    OPENAI_BREAKER_MIN_CALLS = env_number('OPENAI_BREAKER_MIN_CALLS', 5, int, 1)
+    OPENAI_BREAKER_FAILURE_RATIO = env_number('OPENAI_BREAKER_FAILURE_RATIO', 0.5)
+    OPENAI_SLOW_CALL_SECONDS = env_number('OPENAI_SLOW_CALL_SECONDS', 8.0)
+    OPENAI_BREAKER_COOLDOWN_SECONDS = env_number('OPENAI_BREAKER_COOLDOWN_SECONDS', 30.0)
+    OPENAI_MAX_IN_FLIGHT = env_number('OPENAI_MAX_IN_FLIGHT', 8, int, 1)
+    OPENAI_QUEUE_WAIT_SECONDS = env_number('OPENAI_QUEUE_WAIT_SECONDS', 2.0)
+    OPENAI_CHAT_TIMEOUT_SECONDS = env_number('OPENAI_CHAT_TIMEOUT_SECONDS', 10.0)
+    OPENAI_AUDIO_TIMEOUT_SECONDS = env_number('OPENAI_AUDIO_TIMEOUT_SECONDS', 20.0)
+    OPENAI_MIN_CALL_SECONDS = env_number('OPENAI_MIN_CALL_SECONDS', 0.5)
+    # SDK retries would run past the guard's deadline, so they are off by default
+    OPENAI_MAX_RETRIES = env_number('OPENAI_MAX_RETRIES', 0, int, 0)
     
     # WhatsApp / WATI
     WATI_API_KEY = os.getenv('WATI_API_KEY')
@@ -33,16 +108,46 @@ class Config:
     WHATSAPP_VERIFY_TOKEN = os.getenv('WHATSAPP_VERIFY_TOKEN', 'kirana-verify-token')
     
     # App Settings
-    MAX_VOICE_FILE_SIZE = int(os.getenv('MAX_VOICE_FILE_SIZE', 25 * 1024 * 1024))  # 25MB
+    MAX_VOICE_FILE_SIZE = env_number('MAX_VOICE_FILE_SIZE', 25 * 1024 * 1024, int)  # 25MB
     SUPPORTED_AUDIO_FORMATS = ['ogg', 'mp3', 'wav', 'm4a', 'opus']
+    # Opt-in cap on products per WhatsApp list reply; 0 (default) lists them all
+    LIST_PRODUCTS_LIMIT = env_number('LIST_PRODUCTS_LIMIT', 0, int, 0)
+
+    # Voice notes streamed to Whisper (voice_ingest.py)
+    VOICE_CHUNK_BYTES = env_number('VOICE_CHUNK_BYTES', 64 * 1024, int, 1024)
+    VOICE_POOL_SIZE = env_number('VOICE_POOL_SIZE', 16, int, 1)
+
+    # Whisper transcript cache (transcript_cache.py): entries kept in memory, plus an
+    # optional shared disk store; size 0 without a directory switches it off
+    TRANSCRIPT_CACHE_SIZE = env_number('TRANSCRIPT_CACHE_SIZE', 1000, int, 0)
+    TRANSCRIPT_CACHE_DIR = os.getenv('TRANSCRIPT_CACHE_DIR') or None
+
+    # Per-shop language history for the Whisper language hint (transcription_strategy.py)
+    TRANSCRIBE_HISTORY_SIZE = env_number('TRANSCRIBE_HISTORY_SIZE', 50, int, 1)
+    TRANSCRIBE_HISTORY_SHOPS = env_number('TRANSCRIBE_HISTORY_SHOPS', 10000, int, 1)
+    TRANSCRIBE_MIN_HISTORY = env_number('TRANSCRIBE_MIN_HISTORY', 5, int)
+    TRANSCRIBE_HINDI_SHARE = env_number('TRANSCRIBE_HINDI_SHARE', 0.6)
+    TRANSCRIBE_PROBE_EVERY = env_number('TRANSCRIBE_PROBE_EVERY', 10, int)
+
+    # Demand forecast behind predictive alerts (demand_forecast.py)
+    FORECAST_WINDOW_DAYS = env_number('FORECAST_WINDOW_DAYS', 28, int, 1)
+    FORECAST_HALF_LIFE_DAYS = env_number('FORECAST_HALF_LIFE_DAYS', 7.0)
+    FORECAST_SEASONALITY = os.getenv('FORECAST_SEASONALITY', 'true').lower() != 'false'
+    # Other workers don't see a sale's cache invalidation, so entries also expire
+    FORECAST_CACHE_TTL_SECONDS = env_number('FORECAST_CACHE_TTL_SECONDS', 600.0)
+
+    # Per-shop expiry index; rebuilt after this long to pick up other workers' writes
+    EXPIRY_INDEX_TTL_SECONDS = env_number('EXPIRY_INDEX_TTL_SECONDS', 900.0)
+
+    # Per-shop low-stock set; rebuilt after this long to pick up other workers' writes
+    LOW_STOCK_SET_TTL_SECONDS = env_number('LOW_STOCK_SET_TTL_SECONDS', 300.0)
     
     @staticmethod
     def validate():
         """Validate required configuration"""
-        required = [
-            'OPENAI_API_KEY',
-            'FIREBASE_PROJECT_ID'
-        ]
+        required = ['OPENAI_API_KEY']
+        if Config.DATABASE_BACKEND == 'firestore':
+            required.append('FIREBASE_PROJECT_ID')
         
         missing = [key for key in required if not os.getenv(key)]
         
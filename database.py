@@ -3,13 +3,45 @@ Firebase Firestore database layer
 """
 import os
 import json
+import time
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Optional, List, Dict, Any
-from google.cloud import firestore
-from google.oauth2 import service_account
+from typing import Optional, List, Dict, Any, Sequence
 import uuid
 
-from models import Shop, User, Product, Transaction, UserRole, TransactionType, UdharEntry, UnrecognizedCommand, PendingSelection
+import aggregations
+import catalog_sync
+from config import Config
+import demand_forecast
+import firestore_accounting
+import idempotency
+import ledger_archive
+import low_stock
+import projections
+import reconciliation
+import sales_cube
+import shop_layout
+from sales_journal import WATERMARK_FIELD, JournalFlusher, SalesJournal
+from sqlite_store import AlreadyExists, Increment as SQLiteIncrement, SQLiteClient
+from expiry_index import ExpiryIndex, entries_for_product
+from models import Shop, User, Product, Transaction, Bill, UserRole, TransactionType, UdharEntry, UnrecognizedCommand, PendingSelection
+
+# Same value as firestore.Query.DESCENDING; both backends accept the string
+DESCENDING = "DESCENDING"
+
+
+def _firestore():
+    """google.cloud.firestore, imported on first use. It takes ~0.3s to import,
+    which the SQLite backend and processes that never reach the store skip."""
+    from google.cloud import firestore
+    return firestore
+
+
+def _google_already_exists():
+    from google.api_core import exceptions as google_exceptions
+    return google_exceptions.AlreadyExists
+
 
 # Dummy Indian products catalog for barcode-based demo.
 # In a real deployment you would load this from your own product master data.
@@ -77,6 +109,12 @@ HINDI_PRODUCT_CANONICAL = {
 }
 
 
+# Product fields that change what the expiry index/digest shows
+EXPIRY_FIELDS = {"batches", "expiry_date", "name", "brand", "unit", "current_stock"}
+# Product fields that can move a product in or out of the low-stock set
+LOW_STOCK_FIELDS = {"current_stock", "low_stock_threshold", "name", "brand", "unit"}
+
+
 def canonical_product_key(name: str) -> str:
     """Return a canonical normalized key for product lookup.
 
@@ -87,13 +125,78 @@ def canonical_product_key(name: str) -> str:
     return HINDI_PRODUCT_CANONICAL.get(base, base)
 
 
+# Journal entries per upstream write batch: each takes up to three writes
+# (ledger row, stock, sales cube), under Firestore's 500 with a bill's documents
+JOURNAL_BATCH_ENTRIES = 150
+
+
+def _stock_after_outflow(previous_stock: float, quantity: float) -> float:
+    """Stock after selling `quantity`: never below zero, and never raised.
+
+    Stock that is already negative (drift, or a sale racing a journal
+    flush) stays as it is, so the journaled delta of a sale is never
+    positive.
+    """
+    return previous_stock - min(quantity, max(previous_stock, 0.0))
+
+
 
 
 class FirestoreDB:
     """Firestore database manager"""
 
-    def __init__(self, credentials_path: Optional[str] = None, project_id: Optional[str] = None):
-        """Initialize Firestore client"""
+    def __init__(self, credentials_path: Optional[str] = None, project_id: Optional[str] = None,
+                 backend: Optional[str] = None, sqlite_path: Optional[str] = None,
+                 journal_path: Optional[str] = None):
+        """Initialize the document store client.
+
+        `backend` is "firestore" (default) or "sqlite"; both default to the
+        DATABASE_BACKEND / SQLITE_PATH environment variables. The SQLite
+        backend (sqlite_store.SQLiteClient) speaks the same client API, so
+        every method below works unchanged on either. Either client is
+        wrapped for read/write accounting (see firestore_accounting.py).
+
+        `journal_path` (default SALES_JOURNAL_PATH) enables the local sales
+        journal, see sales_journal.py and record_stock_movement.
+        """
+        # Per-shop demand forecasts, dropped whenever that shop records a sale.
+        # {shop_id: (forecast_date, DemandForecast)}
+        self._forecast_cache: Dict[str, Any] = {}
+        # Per-shop ExpiryIndex, see get_expiry_index. These per-shop caches are
+        # shared by request threads: whole-dict loops iterate over a copy.
+        self._expiry_indexes: Dict[str, ExpiryIndex] = {}
+        # Per-shop LowStockSet, see get_low_stock_set
+        self._low_stock_sets: Dict[str, low_stock.LowStockSet] = {}
+        # Per-shop data layout, see get_shop_layout: {shop_id: (layout, read_at)}
+        self._shop_layouts: Dict[str, Any] = {}
+        # Owning shop of shop-scoped documents looked up by id alone; a
+        # document never changes shop. {(collection, doc_id): shop_id}
+        self._doc_shops: Dict[Any, str] = {}
+        # Compacted ledger months per shop: {shop_id: (months, read_at)}
+        self._compacted_months: Dict[str, Any] = {}
+        self._ledger_archive = None
+        # First POS bill per shop, see get_shop_bills_since: {shop_id: (iso or None, read_at)}
+        self._bills_since: Dict[str, Any] = {}
+        # Recent keyed POS responses, see idempotency.py
+        self.pos_request_cache = idempotency.ResponseCache(idempotency.cache_size())
+
+        journal_path = journal_path or Config.SALES_JOURNAL_PATH
+        self.sales_journal: Optional[SalesJournal] = SalesJournal(journal_path) if journal_path else None
+        self.journal_flusher: Optional[JournalFlusher] = None
+
+        backend = (backend or Config.DATABASE_BACKEND).lower()
+        self.backend = backend
+        if backend == "sqlite":
+            sqlite_path = sqlite_path or Config.SQLITE_PATH
+            self.db = firestore_accounting.wrap(SQLiteClient(sqlite_path))
+            print(f"🗄️ Using SQLite backend: {sqlite_path}")
+            return
+        if backend != "firestore":
+            raise ValueError(f"Unknown DATABASE_BACKEND: {backend}")
+
+        firestore = _firestore()
+        from google.oauth2 import service_account
+
         print(f"🔥 FirestoreDB.__init__ called with:")
         print(f"   credentials_path: {credentials_path}")
         print(f"   project_id: {project_id}")
@@ -102,7 +205,7 @@ class FirestoreDB:
         if credentials_path and os.path.exists(credentials_path):
             credentials = service_account.Credentials.from_service_account_file(credentials_path)
             print(f"   Credentials loaded, project in file: {credentials.project_id}")
-            self.db = firestore.Client(credentials=credentials, project=project_id)
+            self.db = firestore_accounting.wrap(firestore.Client(credentials=credentials, project=project_id))
             print(f"   Firestore client created for project: {self.db.project}")
         else:
             # Option 2: Try credentials from environment JSON (for Railway, etc.)
@@ -113,7 +216,7 @@ class FirestoreDB:
                     credentials = service_account.Credentials.from_service_account_info(info)
                     effective_project = project_id or info.get("project_id")
                     print(f"   Loaded credentials from FIREBASE_CREDENTIALS_JSON, project: {effective_project}")
-                    self.db = firestore.Client(credentials=credentials, project=effective_project)
+                    self.db = firestore_accounting.wrap(firestore.Client(credentials=credentials, project=effective_project))
                     print(f"   Firestore client created for project: {self.db.project}")
                     return
                 except Exception as e:
@@ -121,21 +224,25 @@ class FirestoreDB:
                     # Fall through to default credentials
             # Option 3: Use default credentials (e.g., GOOGLE_APPLICATION_CREDENTIALS handled by SDK)
             print(f"   Using default credentials")
-            self.db = firestore.Client(project=project_id)
+            self.db = firestore_accounting.wrap(firestore.Client(project=project_id))
             print(f"   Firestore client created for project: {self.db.project}")
 
     # ==================== SHOP OPERATIONS ====================
 
     def create_shop(self, name: str, owner_phone: str, address: Optional[str] = None) -> Shop:
-        """Create a new shop"""
+        """Create a new shop (in the DEFAULT_DATA_LAYOUT layout, default global)"""
         shop_id = str(uuid.uuid4())
+        data_layout = Config.DEFAULT_DATA_LAYOUT
+        if data_layout not in shop_layout.LAYOUTS:
+            data_layout = shop_layout.GLOBAL
         shop = Shop(
             shop_id=shop_id,
             name=name,
             owner_phone=owner_phone,
             address=address,
             created_at=datetime.utcnow(),
-            active=True
+            active=True,
+            data_layout=data_layout,
         )
 
         self.db.collection('shops').document(shop_id).set(shop.to_dict())
@@ -155,6 +262,165 @@ class FirestoreDB:
             return Shop.from_dict(doc.to_dict())
         return None
 
+    # ==================== DATA LAYOUT ====================
+
+    def get_shop_layout(self, shop_id: str) -> str:
+        """Where a shop's products/ledger/udhar/commands live (see shop_layout.py).
+
+        Read from the shop document and cached for SHOP_LAYOUT_TTL_SECONDS
+        (default 30), so other workers follow a cut-over within that time.
+        """
+        ttl_seconds = Config.SHOP_LAYOUT_TTL_SECONDS
+
+        cached = self._shop_layouts.get(shop_id)
+        if cached and (datetime.utcnow() - cached[1]).total_seconds() <= ttl_seconds:
+            return cached[0]
+
+        layout = shop_layout.GLOBAL
+        if shop_id:
+            doc = self.db.collection('shops').document(shop_id).get()
+            if doc.exists:
+                layout = (doc.to_dict() or {}).get('data_layout') or shop_layout.GLOBAL
+        self._shop_layouts[shop_id] = (layout, datetime.utcnow())
+        return layout
+
+    def set_shop_layout(self, shop_id: str, layout: str) -> None:
+        """Switch a shop's layout (tools/migrate_shop_layout.py drives this)."""
+        if layout not in shop_layout.LAYOUTS:
+            raise ValueError(f"Unknown data layout: {layout}")
+        self.db.collection('shops').document(shop_id).update({'data_layout': layout})
+        self._shop_layouts[shop_id] = (layout, datetime.utcnow())
+
+    def migrate_shop_layout(self, shop_id: str, page_size: int = 300,
+                            settle_seconds: Optional[float] = None) -> Dict[str, Any]:
+        """Move a shop to the nested layout while it keeps trading.
+
+        Switches the shop to dual, waits for every worker's cached layout to
+        expire (`settle_seconds`, default SHOP_LAYOUT_TTL_SECONDS + 5), copies
+        each collection in checkpointed pages, verifies that every global
+        document has a nested copy and only then cuts over to nested.
+        Progress lives in layout_migrations/{shop_id}, so a rerun resumes
+        where it stopped; until the cut-over, set_shop_layout(shop_id,
+        "global") rolls back.
+        """
+        checkpoint_ref = self.db.collection('layout_migrations').document(shop_id)
+        layout = self.get_shop_layout(shop_id)
+        if layout == shop_layout.NESTED:
+            return {'success': True, 'layout': layout, 'message': 'Already nested'}
+
+        if layout != shop_layout.DUAL:
+            self.set_shop_layout(shop_id, shop_layout.DUAL)
+            checkpoint_ref.set({'shop_id': shop_id, 'state': 'dual', 'collections': {},
+                                'started_at': datetime.utcnow().isoformat()})
+            if settle_seconds is None:
+                settle_seconds = Config.SHOP_LAYOUT_TTL_SECONDS + 5
+            time.sleep(settle_seconds)
+
+        doc = checkpoint_ref.get()
+        progress = ((doc.to_dict() or {}) if doc.exists else {}).get('collections') or {}
+
+        for name in shop_layout.SHOP_COLLECTIONS:
+            done = progress.get(name) or {}
+            if done.get('complete'):
+                continue
+
+            def checkpoint(last_id, copied, skipped, name=name, done=done, complete=False):
+                progress[name] = {
+                    'last_id': last_id,
+                    'copied': done.get('copied', 0) + copied,
+                    'skipped': done.get('skipped', 0) + skipped,
+                    'complete': complete,
+                }
+                checkpoint_ref.set({'collections': {name: progress[name]},
+                                    'updated_at': datetime.utcnow().isoformat()}, merge=True)
+
+            result = shop_layout.backfill_collection(
+                self.db, shop_id, name, page_size=page_size,
+                after_id=done.get('last_id'), on_page=checkpoint,
+            )
+            checkpoint(progress.get(name, done).get('last_id'), result['copied'], result['skipped'], complete=True)
+            print(f"📦 {shop_id} {name}: {progress[name]['copied']} copied, {progress[name]['skipped']} already nested")
+
+        verification = {name: shop_layout.verify_collection(self.db, shop_id, name)
+                        for name in shop_layout.SHOP_COLLECTIONS}
+        ok = all(v['ok'] for v in verification.values())
+        if ok:
+            self.set_shop_layout(shop_id, shop_layout.NESTED)
+        checkpoint_ref.set({'state': 'nested' if ok else 'verify_failed', 'verification': verification,
+                            'updated_at': datetime.utcnow().isoformat()}, merge=True)
+        return {
+            'success': ok,
+            'layout': shop_layout.NESTED if ok else shop_layout.DUAL,
+            'collections': progress,
+            'verification': verification,
+        }
+
+    def _shop_collection(self, name: str, shop_id: str) -> Any:
+        """A shop-scoped collection ("products", "transactions", ...) in the shop's layout."""
+        layout = self.get_shop_layout(shop_id)
+        if layout == shop_layout.NESTED:
+            return shop_layout.nested_collection(self.db, shop_id, name)
+        if layout == shop_layout.DUAL:
+            return shop_layout.DualCollection(
+                shop_layout.nested_collection(self.db, shop_id, name), self.db.collection(name)
+            )
+        return self.db.collection(name)
+
+    def _shop_query(self, name: str, shop_id: str) -> Any:
+        """A shop's documents of a shop-scoped collection."""
+        return self._shop_collection(name, shop_id).where('shop_id', '==', shop_id)
+
+    def _ledger_query(self, shop_id: str, since: Optional[datetime] = None) -> Any:
+        """A shop's transactions, narrowed to `since` onwards where that's index-free.
+
+        A nested ledger holds one shop only, so the timestamp range is a
+        single-field query; other layouts need a composite index for it and
+        leave the window to the caller's Python filter, as before.
+        """
+        if since is not None and self.get_shop_layout(shop_id) == shop_layout.NESTED:
+            return self._shop_collection('transactions', shop_id).where('timestamp', '>=', since.isoformat())
+        return self._shop_query('transactions', shop_id)
+
+    def _doc_shop(self, name: str, doc_id: str) -> Optional[str]:
+        """Owning shop of a shop-scoped document known only by its id.
+
+        Found once (the global copy, else a collection group query on the
+        id field) and cached, since a document never changes shop.
+        """
+        key = (name, doc_id)
+        shop_id = self._doc_shops.get(key)
+        if shop_id:
+            return shop_id
+        doc = self.db.collection(name).document(doc_id).get()
+        if doc.exists:
+            shop_id = (doc.to_dict() or {}).get('shop_id')
+        else:
+            group = self.db.collection_group(shop_layout.SHOP_COLLECTIONS[name])
+            for found in group.where(shop_layout.ID_FIELDS[name], '==', doc_id).limit(1).stream():
+                shop_id = (found.to_dict() or {}).get('shop_id')
+        if shop_id:
+            self._doc_shops[key] = shop_id
+        return shop_id
+
+    def _shop_doc_ref(self, name: str, doc_id: str, shop_id: Optional[str] = None) -> Any:
+        """Reference to a shop-scoped document in its shop's layout."""
+        shop_id = shop_id or self._doc_shop(name, doc_id)
+        if not shop_id:
+            return self.db.collection(name).document(doc_id)
+        return self._shop_collection(name, shop_id).document(doc_id)
+
+    def _batch_write(self, batch: Any, op: str, ref: Any, data: Optional[Dict[str, Any]] = None,
+                     merge: bool = False) -> None:
+        """Add a set/update/delete to a write batch, on both copies for a dual-layout shop."""
+        refs = ref.write_refs(update=op == 'update') if isinstance(ref, shop_layout.DualDocument) else [ref]
+        for target in refs:
+            if op == 'update':
+                batch.update(target, data)
+            elif op == 'delete':
+                batch.delete(target)
+            else:
+                batch.set(target, data, merge=merge)
+
     # ==================== USER OPERATIONS ====================
 
     def create_user(self, phone: str, name: str, shop_id: str, role: UserRole) -> User:
@@ -187,6 +453,25 @@ class FirestoreDB:
 
     # ==================== PRODUCT OPERATIONS ====================
 
+    def _product_from_doc(self, data: Dict[str, Any], pending: Optional[Dict[str, List[Any]]] = None) -> Product:
+        """Build a Product, adding any stock change still in the sales journal.
+
+        `pending` is a shop's pending_entries map when reading many products.
+        Entries the document's journal stamp shows as applied are skipped.
+        """
+        product = Product.from_dict(data)
+        if product.shop_id:
+            self._doc_shops[("products", product.product_id)] = product.shop_id
+        if self.sales_journal is not None:
+            applied = self.sales_journal.applied_seq(data)
+            if pending is None:
+                delta = self.sales_journal.pending_delta(product.product_id, applied)
+            else:
+                delta = SalesJournal.pending_since(pending.get(product.product_id), applied)
+            if delta:
+                product.current_stock = (product.current_stock or 0.0) + delta
+        return product
+
     def get_or_create_product(self, shop_id: str, product_name: str, unit: str = "pieces") -> Product:
         """Get existing product or create new one.
 
@@ -203,14 +488,13 @@ class FirestoreDB:
 
         # 1) Try exact name match first (using canonical normalized_name)
         docs = (
-            self.db.collection("products")
-            .where("shop_id", "==", shop_id)
+            self._shop_query("products", shop_id)
             .where("normalized_name", "==", normalized_name)
             .limit(1)
             .stream()
         )
         for doc in docs:
-            return Product.from_dict(doc.to_dict())
+            return self._product_from_doc(doc.to_dict())
 
         # 2) If input looks like a barcode AND we have it in our demo catalog,
         #    use the demo product definition (brand + proper name).
@@ -242,7 +526,7 @@ class FirestoreDB:
                 created_at=datetime.utcnow(),
                 updated_at=datetime.utcnow(),
             )
-            self.db.collection("products").document(product_id).set(product.to_dict())
+            self._shop_collection("products", shop_id).document(product_id).set(product.to_dict())
             return product
 
         # 3) Fallback: create a new product with the given name
@@ -258,7 +542,7 @@ class FirestoreDB:
             updated_at=datetime.utcnow(),
         )
 
-        self.db.collection("products").document(product_id).set(product.to_dict())
+        self._shop_collection("products", shop_id).document(product_id).set(product.to_dict())
         return product
 
     def find_existing_product_by_name(self, shop_id: str, product_name: str) -> Optional[Product]:
@@ -284,25 +568,23 @@ class FirestoreDB:
         stripped = normalized_name.replace(" ", "")
         if stripped.isdigit() and 8 <= len(stripped) <= 16:
             docs = (
-                self.db.collection("products")
-                .where("shop_id", "==", shop_id)
+                self._shop_query("products", shop_id)
                 .where("barcode", "==", stripped)
                 .limit(1)
                 .stream()
             )
             for doc in docs:
-                return Product.from_dict(doc.to_dict())
+                return self._product_from_doc(doc.to_dict())
 
         # 1) Exact normalized_name match for text-based names
         docs = (
-            self.db.collection("products")
-            .where("shop_id", "==", shop_id)
+            self._shop_query("products", shop_id)
             .where("normalized_name", "==", normalized_name)
             .limit(1)
             .stream()
         )
         for doc in docs:
-            return Product.from_dict(doc.to_dict())
+            return self._product_from_doc(doc.to_dict())
 
         # 2) Fuzzy token-overlap match: handle cases like
         #    "add 10 Tata Sampann Toor Dal" vs stored "Tata Sampann Toor Dal 1kg".
@@ -364,7 +646,7 @@ class FirestoreDB:
         best_product = None
         best_score = 0
 
-        for p in self.get_products_by_shop(shop_id):
+        for p in self.get_products_by_shop(shop_id, projection=projections.PRODUCT_MATCH):
             name_norm = (p.normalized_name or "").strip().lower()
             if not name_norm:
                 continue
@@ -390,7 +672,8 @@ class FirestoreDB:
                 best_score = score
                 best_product = p
 
-        return best_product
+        # The scan only read matching fields; callers get the whole product
+        return self.get_product(best_product.product_id) if best_product else None
 
     def find_product_by_barcode(self, shop_id: str, barcode: str) -> Optional[Product]:
         """Find a product by its barcode.
@@ -413,15 +696,14 @@ class FirestoreDB:
 
         # Query Firestore for product with this barcode
         docs = (
-            self.db.collection("products")
-            .where("shop_id", "==", shop_id)
+            self._shop_query("products", shop_id)
             .where("barcode", "==", barcode_clean)
             .limit(1)
             .stream()
         )
 
         for doc in docs:
-            return Product.from_dict(doc.to_dict())
+            return self._product_from_doc(doc.to_dict())
 
         return None
 
@@ -464,7 +746,7 @@ class FirestoreDB:
 
         matching_products = []
 
-        for p in self.get_products_by_shop(shop_id):
+        for p in self.get_products_by_shop(shop_id, projection=projections.PRODUCT_MATCH):
             name_norm = (p.normalized_name or "").strip().lower()
             if not name_norm:
                 continue
@@ -505,12 +787,43 @@ class FirestoreDB:
             return []
 
 
-    def update_product_stock(self, product_id: str, new_stock: float) -> None:
-        """Update product stock"""
-        self.db.collection('products').document(product_id).update({
-            'current_stock': new_stock,
+    def update_product_stock(self, product_id: str, new_stock: float,
+                             product: Optional[Product] = None) -> None:
+        """Update product stock
+
+        `product` is the document as read before this change; pass it when
+        you have it so low-stock tracking doesn't need another read.
+        """
+        if product is None:
+            product = self.get_product(product_id)
+
+        self._shop_doc_ref('products', product_id, product.shop_id if product else None).update({
+            'current_stock': self._stock_write_value(product, new_stock),
             'updated_at': datetime.utcnow().isoformat()
         })
+
+        self._expiry_stock_changed(product.shop_id if product else None, product_id, new_stock, product)
+
+        if product is not None:
+            self._track_low_stock(product, product.current_stock, product, new_stock)
+
+    def _stock_write_value(self, product: Optional[Product], new_stock: float) -> Any:
+        """Value to store for an absolute stock change.
+
+        With unflushed journal entries the stored stock lags what `product`
+        shows, so the change is written as a delta that commutes with the
+        flusher's increments instead of overwriting them.
+        """
+        if self.sales_journal is None or product is None:
+            return new_stock
+        return self._increment(float(new_stock) - float(product.current_stock or 0.0))
+
+    def _increment(self, amount: float) -> Any:
+        """A server-side increment in this backend's form."""
+        if self.backend == "sqlite":
+            return SQLiteIncrement(amount)
+        return _firestore().Increment(amount)
+
     def update_product_fields(self, product_id: str, updates: Dict[str, Any]) -> None:
         """Update arbitrary fields on a product document.
 
@@ -520,10 +833,32 @@ class FirestoreDB:
         if not updates:
             return
 
+        tracked = EXPIRY_FIELDS.union(LOW_STOCK_FIELDS).intersection(updates)
+        before = self.get_product(product_id) if tracked else None
+
         # Always bump updated_at so changes are visible in Firestore history
         updates = dict(updates)
         updates["updated_at"] = datetime.utcnow().isoformat()
-        self.db.collection("products").document(product_id).update(updates)
+        write = dict(updates)
+        if "current_stock" in write:
+            write["current_stock"] = self._stock_write_value(before, write["current_stock"])
+        self._shop_doc_ref("products", product_id, before.shop_id if before else None).update(write)
+
+        if before is None:
+            return
+        after = Product.from_dict({**before.to_dict(), **updates})
+        if EXPIRY_FIELDS.intersection(updates):
+            self._reindex_product_expiry(after)
+        if LOW_STOCK_FIELDS.intersection(updates):
+            self._track_low_stock(before, before.current_stock, after, after.current_stock)
+
+    def save_product(self, product: Product) -> Product:
+        """Write a full product document (new products, seeding)."""
+        self._shop_collection("products", product.shop_id).document(product.product_id).set(product.to_dict())
+        if product.expiry_date or product.batches:
+            self._reindex_product_expiry(product)
+        self._track_low_stock(None, None, product, product.current_stock)
+        return product
 
     def set_low_stock_threshold(self, shop_id: str, product_name: str, threshold: float) -> Dict[str, Any]:
         """Set the low stock threshold for a product.
@@ -549,29 +884,56 @@ class FirestoreDB:
 
 
 
-    def get_product(self, product_id: str) -> Optional[Product]:
+    def get_product(self, product_id: str, shop_id: Optional[str] = None) -> Optional[Product]:
         """Get product by ID"""
-        doc = self.db.collection('products').document(product_id).get()
+        if shop_id is None and ('products', product_id) not in self._doc_shops:
+            # Owner not known yet: for global-layout shops the global copy is the answer
+            doc = self.db.collection('products').document(product_id).get()
+            data = doc.to_dict() if doc.exists else None
+            if data and self.get_shop_layout(data.get('shop_id')) == shop_layout.GLOBAL:
+                return self._product_from_doc(data)
+        doc = self._shop_doc_ref('products', product_id, shop_id).get()
         if doc.exists:
-            return Product.from_dict(doc.to_dict())
+            return self._product_from_doc(doc.to_dict())
         return None
 
-    def get_products_by_shop(self, shop_id: str) -> List[Product]:
-        """Get all products for a shop"""
-        docs = self.db.collection('products').where('shop_id', '==', shop_id).stream()
-        return [Product.from_dict(doc.to_dict()) for doc in docs]
+    def get_products_by_shop(self, shop_id: str, projection: Optional[Sequence[str]] = None) -> List[Product]:
+        """Get all products for a shop
+
+        `projection` (see projections.py) reads only those fields; the
+        products returned are then partial.
+        """
+        query = self._shop_query("products", shop_id)
+        docs = projections.select(query, projection).stream()
+        pending = self.sales_journal.pending_entries(shop_id) if self.sales_journal else None
+        return [self._product_from_doc(doc.to_dict(), pending) for doc in docs]
+
+    def count_products(self, shop_id: str) -> int:
+        """Number of products in a shop (aggregation query, no document reads)."""
+        return aggregations.count(self._shop_query("products", shop_id))
 
-    def get_products_summary(self, shop_id: str, keyword: Optional[str] = None) -> Dict[str, Any]:
+    def get_products_summary(self, shop_id: str, keyword: Optional[str] = None,
+                             limit: Optional[int] = None) -> Dict[str, Any]:
         """Get summary of products and current stock for a shop.
 
         If `keyword` is provided (e.g. "dal"), only products whose name,
         brand or normalized_name contains that keyword (case-insensitive)
         are returned.
-        """
-        products = self.get_products_by_shop(shop_id)
 
+        Without a keyword, `limit` caps how many products are listed;
+        `total_products` is still the full count, taken with an aggregation
+        query instead of reading every product.
+        """
         keyword_norm = (keyword or "").strip().lower() or None
 
+        if limit and not keyword_norm:
+            query = self._shop_query("products", shop_id).limit(limit)
+            docs = projections.select(query, projections.PRODUCT_MATCH).stream()
+            pending = self.sales_journal.pending_entries(shop_id) if self.sales_journal else None
+            products = [self._product_from_doc(doc.to_dict(), pending) for doc in docs]
+        else:
+            products = self.get_products_by_shop(shop_id, projection=projections.PRODUCT_MATCH)
+
         product_list = []
         for p in products:
             try:
@@ -596,37 +958,41 @@ class FirestoreDB:
                 # Be defensive; skip any bad records
                 continue
 
+        total_products = len(product_list)
+        if limit and not keyword_norm and total_products >= limit:
+            total_products = self.count_products(shop_id)
+
         return {
             "success": True,
-            "total_products": len(product_list),
+            "total_products": total_products,
             "products": product_list,
             "keyword": keyword_norm,
         }
 
     def get_low_stock_products(self, shop_id: str, threshold: Optional[float] = None) -> Dict[str, Any]:
-        """Get products whose stock is at or below a threshold"""
-        # Allow overriding threshold via env var, default to 5 units
-        if threshold is None:
-            try:
-                threshold_env = os.getenv("LOW_STOCK_THRESHOLD")
-                threshold = float(threshold_env) if threshold_env else 5.0
-            except Exception:
-                threshold = 5.0
-
-        products = self.get_products_by_shop(shop_id)
+        """Get products whose stock is at or below their low-stock threshold.
 
-        low_products = []
-        for p in products:
-            try:
-                if p.current_stock is not None and p.current_stock <= threshold:
-                    low_products.append({
-                        'name': p.name,
-                        'stock': p.current_stock,
-                        'unit': p.unit,
-                    })
-            except Exception:
-                # Be defensive; skip any bad records
-                continue
+        Each product uses its own `low_stock_threshold`, falling back to
+        LOW_STOCK_THRESHOLD (default 5 units); the answer comes from the
+        shop's LowStockSet. Passing `threshold` applies that one value to
+        every product instead, which needs a catalog scan.
+        """
+        if threshold is not None:
+            low_products = []
+            for p in self.get_products_by_shop(shop_id, projection=projections.PRODUCT_LOW_STOCK):
+                try:
+                    if low_stock.is_low(p.current_stock, threshold):
+                        low_products.append({
+                            'name': p.name,
+                            'stock': p.current_stock,
+                            'unit': p.unit,
+                        })
+                except Exception:
+                    # Be defensive; skip any bad records
+                    continue
+        else:
+            threshold = low_stock.default_threshold()
+            low_products = self.get_low_stock_set(shop_id).items()
 
         return {
             'success': True,
@@ -635,9 +1001,85 @@ class FirestoreDB:
             'total_low_products': len(low_products),
         }
 
+    def get_low_stock_set(self, shop_id: str, refresh: bool = False) -> low_stock.LowStockSet:
+        """Get the shop's set of products at or below their threshold.
+
+        Built from the catalog on first use and then kept current by every
+        stock mutation made through this instance. Mutations from other
+        workers are picked up after LOW_STOCK_SET_TTL_SECONDS.
+        """
+        ttl_seconds = Config.LOW_STOCK_SET_TTL_SECONDS
+
+        low_set = self._low_stock_sets.get(shop_id)
+        if low_set is not None and not refresh:
+            if (datetime.utcnow() - low_set.built_at).total_seconds() <= ttl_seconds:
+                return low_set
+
+        low_set = low_stock.LowStockSet.from_products(
+            self.get_products_by_shop(shop_id, projection=projections.PRODUCT_LOW_STOCK)
+        )
+        self._low_stock_sets[shop_id] = low_set
+        return low_set
 
+    def _track_low_stock(self, before: Optional[Product], previous_stock: Optional[float],
+                         after: Product, new_stock: Optional[float]) -> Optional[low_stock.LowStockEvent]:
+        """Keep the low-stock set current and record threshold crossings.
 
+        The previous state is judged against the threshold it had *before*
+        the change, so lowering a threshold under the current stock is a
+        "leave" just like a restock.
+        """
+        default = low_stock.default_threshold()
+        low_set = self._low_stock_sets.get(after.shop_id)
+        if low_set is not None:
+            low_set.update(after, new_stock, default)
+
+        was_low = before is not None and low_stock.is_low(previous_stock, low_stock.threshold_for(before, default))
+        threshold = low_stock.threshold_for(after, default)
+        now_low = low_stock.is_low(new_stock, threshold)
+        if was_low == now_low:
+            return None
 
+        event = low_stock.LowStockEvent(
+            shop_id=after.shop_id,
+            product_id=after.product_id,
+            product_name=after.name,
+            kind=low_stock.ENTER if now_low else low_stock.LEAVE,
+            stock=new_stock,
+            threshold=threshold,
+            unit=after.unit,
+            brand=getattr(after, "brand", None),
+        )
+        try:
+            self.db.collection("low_stock_events").add(event.to_dict())
+        except Exception as e:
+            print(f"⚠️ Could not record low stock event for {after.name}: {e}")
+        return event
+
+    def get_pending_low_stock_events(self, shop_id: Optional[str] = None, limit: int = 500) -> List[Dict[str, Any]]:
+        """The oldest `limit` threshold-crossing events not yet sent to the owner, oldest first."""
+        query = self.db.collection("low_stock_events").where("notified", "==", False)
+        if shop_id:
+            query = query.where("shop_id", "==", shop_id)
+        events = []
+        for doc in query.order_by("created_at").limit(limit).stream():
+            data = doc.to_dict() or {}
+            data["event_id"] = doc.id
+            events.append(data)
+        return events
+
+    def mark_low_stock_events_notified(self, event_ids: List[str]) -> int:
+        """Flag events as sent, in batches of up to 400 writes."""
+        marked = 0
+        now = datetime.utcnow().isoformat()
+        for start in range(0, len(event_ids), 400):
+            batch = self.db.batch()
+            for event_id in event_ids[start:start + 400]:
+                ref = self.db.collection("low_stock_events").document(event_id)
+                batch.update(ref, {"notified": True, "notified_at": now})
+                marked += 1
+            batch.commit()
+        return marked
 
     # ==================== TRANSACTION OPERATIONS ====================
 
@@ -673,7 +1115,15 @@ class FirestoreDB:
             notes=notes,
         )
 
-        self.db.collection("transactions").document(transaction_id).set(transaction.to_dict())
+        self._shop_collection("transactions", shop_id).document(transaction_id).set(transaction.to_dict())
+
+        # A new sale changes the demand picture for this shop
+        if transaction_type in (TransactionType.REDUCE_STOCK, TransactionType.SALE):
+            self._forecast_cache.pop(shop_id, None)
+        # Returns come off the month's net sales
+        if transaction_type in (TransactionType.REDUCE_STOCK, TransactionType.SALE, TransactionType.RETURN):
+            self._record_sale_in_cube(transaction)
+
         return transaction
 
     def get_transactions_by_shop(self, shop_id: str, limit: int = 100) -> List[Transaction]:
@@ -682,10 +1132,19 @@ class FirestoreDB:
         We intentionally avoid order_by('timestamp') in the Firestore query
         because combining where() + order_by() requires a composite index that
         may not exist. Sorting in Python is equivalent and index-free.
+        A nested ledger holds one shop only, so it is ordered server-side.
         """
+        if self.get_shop_layout(shop_id) == shop_layout.NESTED:
+            docs = (
+                self._shop_collection("transactions", shop_id)
+                .order_by("timestamp", direction=DESCENDING)
+                .limit(limit)
+                .stream()
+            )
+            return [Transaction.from_dict(doc.to_dict()) for doc in docs]
+
         docs = (
-            self.db.collection('transactions')
-            .where('shop_id', '==', shop_id)
+            self._shop_query("transactions", shop_id)
             .limit(limit * 3)   # fetch more to compensate for Python-side sort
             .stream()
         )
@@ -693,6 +1152,30 @@ class FirestoreDB:
         txns.sort(key=lambda t: t.timestamp, reverse=True)
         return txns[:limit]
 
+    def get_sales_totals(self, shop_id: str, since: datetime,
+                         until: Optional[datetime] = None) -> Dict[str, Any]:
+        """Count sale transactions and total their quantity/revenue in a time range.
+
+        `since`/`until` are naive UTC datetimes, matching how timestamps are
+        stored. Runs as a single Firestore aggregation query (needs the
+        transactions index in firestore.indexes.json).
+        """
+        query = (
+            self._shop_query("transactions", shop_id)
+            .where('transaction_type', 'in', list(sales_cube.SALE_TRANSACTION_TYPES))
+            .where('timestamp', '>=', since.isoformat())
+        )
+        if until is not None:
+            query = query.where('timestamp', '<', until.isoformat())
+
+        totals = aggregations.aggregate(
+            query,
+            count_alias='transactions',
+            sums={'items': 'quantity', 'revenue': 'total_amount'},
+        )
+        totals['success'] = True
+        return totals
+
 
     def undo_last_transaction_for_shop(self, shop_id: str, user_phone: str) -> Dict[str, Any]:
         """Undo the most recent inventory transaction for this shop.
@@ -719,7 +1202,7 @@ class FirestoreDB:
         # Revert stock back to the recorded previous_stock
         previous_stock = product.current_stock
         new_stock = last_tx.previous_stock
-        self.update_product_stock(product.product_id, new_stock)
+        self.update_product_stock(product.product_id, new_stock, product=product)
 
         # Record an adjustment transaction capturing the delta
         delta_effect = new_stock - previous_stock
@@ -748,9 +1231,116 @@ class FirestoreDB:
 
     def get_transactions_by_product(self, product_id: str, limit: int = 50) -> List[Transaction]:
         """Get recent transactions for a product"""
-        docs = self.db.collection('transactions').where('product_id', '==', product_id).order_by('timestamp', direction=firestore.Query.DESCENDING).limit(limit).stream()
+        shop_id = self._doc_shop('products', product_id)
+        ledger = self._shop_collection('transactions', shop_id) if shop_id else self.db.collection('transactions')
+        docs = ledger.where('product_id', '==', product_id).order_by('timestamp', direction=DESCENDING).limit(limit).stream()
         return [Transaction.from_dict(doc.to_dict()) for doc in docs]
 
+    # ==================== BILL OPERATIONS ====================
+
+    def get_shop_bills_since(self, shop_id: str) -> Optional[str]:
+        """When the shop's first POS bill was recorded (ISO UTC), if it has one.
+
+        Every checkout from then on has a bills document and every ledger row
+        a bill_id field (None off the POS), which is what lets sales reports
+        read bills. Once set it never changes, so it's cached for good;
+        shops without bills are re-read after 30 seconds.
+        """
+        cached = self._bills_since.get(shop_id)
+        if cached and (cached[0] or (datetime.utcnow() - cached[1]).total_seconds() <= 30):
+            return cached[0]
+        doc = self.db.collection('shops').document(shop_id).get()
+        since = (doc.to_dict() or {}).get('bills_since') if doc.exists else None
+        self._bills_since[shop_id] = (since, datetime.utcnow())
+        return since
+
+    def _mark_bills_since(self, shop_id: str, when: datetime) -> None:
+        if self.get_shop_bills_since(shop_id):
+            return
+        try:
+            self.db.collection('shops').document(shop_id).update({'bills_since': when.isoformat()})
+            self._bills_since[shop_id] = (when.isoformat(), datetime.utcnow())
+        except Exception as e:
+            print(f"⚠️ Could not mark bills_since for {shop_id}: {e}")
+
+    def _bill_query(self, shop_id: str, since: Optional[datetime] = None,
+                    until: Optional[datetime] = None) -> Any:
+        query = self._shop_query('bills', shop_id)
+        if since is not None:
+            query = query.where('timestamp', '>=', since.isoformat())
+        if until is not None:
+            query = query.where('timestamp', '<', until.isoformat())
+        return query
+
+    def get_bill(self, bill_id: str, shop_id: Optional[str] = None) -> Optional[Bill]:
+        """Get a bill by ID; with `shop_id`, None unless the bill is that shop's"""
+        doc = self._shop_doc_ref('bills', bill_id, shop_id).get()
+        if doc.exists:
+            bill = Bill.from_dict(doc.to_dict())
+            if shop_id is None or bill.shop_id == shop_id:
+                return bill
+        return None
+
+    def get_bills(self, shop_id: str, since: Optional[datetime] = None, until: Optional[datetime] = None,
+                  limit: int = 50, before: Optional[str] = None) -> Dict[str, Any]:
+        """A page of a shop's bills, newest first.
+
+        `before` is the `next_cursor` of the previous page (the timestamp of
+        its last bill); it is None on the last page.
+        """
+        query = self._bill_query(shop_id, since, until)
+        if before:
+            query = query.where('timestamp', '<', before)
+        docs = query.order_by('timestamp', direction=DESCENDING).limit(limit).stream()
+        bills = [Bill.from_dict(doc.to_dict()) for doc in docs]
+        return {
+            'success': True,
+            'bills': bills,
+            'next_cursor': bills[-1].timestamp.isoformat() if len(bills) == limit else None,
+        }
+
+    def get_bill_totals(self, shop_id: str, since: datetime, until: Optional[datetime] = None) -> Dict[str, Any]:
+        """Bill count, revenue and basket size for a time range (one aggregation query)."""
+        totals = aggregations.aggregate(
+            self._bill_query(shop_id, since, until),
+            count_alias='bills',
+            sums={'revenue': 'total_amount', 'items': 'total_quantity', 'lines': 'item_count'},
+        )
+        bills = totals['bills']
+        totals['avg_bill_value'] = round(totals['revenue'] / bills, 2) if bills else 0.0
+        totals['avg_lines_per_bill'] = round(totals['lines'] / bills, 2) if bills else 0.0
+        totals['success'] = True
+        return totals
+
+    def _bills_cover(self, shop_id: str, since: Optional[datetime]) -> bool:
+        """Whether every sale from `since` on is on a bill or a row with a bill_id field."""
+        bills_since = self.get_shop_bills_since(shop_id)
+        if since is None or not bills_since or since.isoformat() < bills_since:
+            return False
+        months = self.get_compacted_months(shop_id)
+        return not months or (sales_cube.month_key(since) or '') > months[-1]
+
+    def _sale_docs(self, shop_id: str, since: datetime, until: Optional[datetime] = None):
+        """Ledger rows for a sales report window, POS checkouts read per bill.
+
+        When the shop's bills cover the window, each checkout is read as one
+        bills document (its lines become ledger-shaped rows) and only rows
+        not on a bill come from the ledger, so a report reads one document
+        per basket instead of one per line. Otherwise it's the plain ledger
+        read with compacted months filled back in. Callers still filter rows
+        by time and type.
+        """
+        if not self._bills_cover(shop_id, since):
+            query = projections.select(self._ledger_query(shop_id, since=since), projections.TRANSACTION_SALES)
+            yield from self._with_compacted(shop_id, query.stream(), since=since, until=until)
+            return
+
+        for doc in self._bill_query(shop_id, since, until).stream():
+            for row in Bill.from_dict(doc.to_dict()).ledger_rows():
+                yield ledger_archive.ArchivedRow(row)
+        query = self._ledger_query(shop_id, since=since).where('bill_id', '==', None)
+        yield from projections.select(query, projections.TRANSACTION_SALES).stream()
+
     # ==================== INVENTORY OPERATIONS ====================
 
     def add_stock(self, shop_id: str, product_name: str, quantity: float, user_phone: str) -> Dict[str, Any]:
@@ -764,7 +1354,7 @@ class FirestoreDB:
         new_stock = previous_stock + quantity
 
         # Update product stock
-        self.update_product_stock(product.product_id, new_stock)
+        self.update_product_stock(product.product_id, new_stock, product=product)
 
         # Create transaction record
         self.create_transaction(
@@ -815,7 +1405,7 @@ class FirestoreDB:
                         unit_price = float(sp)
                         # Persist selling_price back to product document for future
                         try:
-                            self.db.collection("products").document(product.product_id).update(
+                            self._shop_doc_ref("products", product.product_id, shop_id).update(
                                 {
                                     "selling_price": unit_price,
                                     "updated_at": datetime.utcnow().isoformat(),
@@ -833,7 +1423,7 @@ class FirestoreDB:
             total_amount = None
 
         # Update product stock
-        self.update_product_stock(product.product_id, new_stock)
+        self.update_product_stock(product.product_id, new_stock, product=product)
 
         # Create transaction record
         self.create_transaction(
@@ -850,16 +1440,12 @@ class FirestoreDB:
             notes=f"Reduced {quantity} {product.unit}",
         )
 
-        # Check for low stock alert
+        # Check for low stock alert (same threshold rule as the low stock list)
         low_stock_alert = None
-        threshold = getattr(product, 'low_stock_threshold', None)
-
-        # If no custom threshold, use default of 10
-        if threshold is None:
-            threshold = 10
+        threshold = low_stock.threshold_for(product)
 
         # Trigger alert if new stock drops below threshold
-        if new_stock <= threshold and new_stock < previous_stock:
+        if low_stock.is_low(new_stock, threshold) and new_stock < previous_stock:
             low_stock_alert = {
                 'triggered': True,
                 'product_name': product.name,
@@ -893,7 +1479,7 @@ class FirestoreDB:
         # To avoid Firestore composite index requirements, we fetch all
         # transactions for this product_id and sort in Python by timestamp.
         trans_query = (
-            self.db.collection('transactions')
+            self._shop_collection('transactions', shop_id)
             .where('product_id', '==', product.product_id)
         )
 
@@ -953,7 +1539,7 @@ class FirestoreDB:
         new_stock = max(0, previous_stock + delta_effect)
 
         # Update product stock
-        self.update_product_stock(product.product_id, new_stock)
+        self.update_product_stock(product.product_id, new_stock, product=product)
 
         # Record an adjustment transaction
         notes = f"Adjustment for {product.name}: {original_qty} -> {correct_quantity}"
@@ -1003,7 +1589,7 @@ class FirestoreDB:
         yesterday_end = today_start  # End of yesterday is start of today
 
         # Build a cost map from products
-        products = self.get_products_by_shop(shop_id)
+        products = self.get_products_by_shop(shop_id, projection=projections.PRODUCT_COST)
         cost_by_id: Dict[str, float] = {}
         cost_by_name: Dict[str, float] = {}
         for p in products:
@@ -1020,8 +1606,7 @@ class FirestoreDB:
                 cost_by_name[p.name] = cp_val
 
         # Query transactions for yesterday
-        transactions_ref = self.db.collection("transactions").where("shop_id", "==", shop_id)
-        all_transactions = transactions_ref.stream()
+        all_transactions = self._sale_docs(shop_id, since=yesterday_start, until=yesterday_end)
 
         total_items_sold = 0.0
         total_revenue = 0.0
@@ -1110,7 +1695,7 @@ class FirestoreDB:
         today_start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
 
         # Build a cost map from products (so we can compute profit per sale)
-        products = self.get_products_by_shop(shop_id)
+        products = self.get_products_by_shop(shop_id, projection=projections.PRODUCT_COST)
         cost_by_id: Dict[str, float] = {}
         cost_by_name: Dict[str, float] = {}
         for p in products:
@@ -1126,11 +1711,8 @@ class FirestoreDB:
             if getattr(p, "name", None):
                 cost_by_name[p.name] = cp_val
 
-        # Query transactions for today
-        transactions_ref = self.db.collection("transactions").where("shop_id", "==", shop_id)
-
-        # Filter by date and type
-        all_transactions = transactions_ref.stream()
+        # Query transactions for today (filtered by date and type below)
+        all_transactions = self._sale_docs(shop_id, since=today_start)
 
         total_items_sold = 0.0
         total_revenue = 0.0
@@ -1227,7 +1809,7 @@ class FirestoreDB:
         month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
 
         # Build a cost map from products (so we can compute profit per sale)
-        products = self.get_products_by_shop(shop_id)
+        products = self.get_products_by_shop(shop_id, projection=projections.PRODUCT_COST)
         cost_by_id: Dict[str, float] = {}
         cost_by_name: Dict[str, float] = {}
         for p in products:
@@ -1243,8 +1825,7 @@ class FirestoreDB:
             if getattr(p, "name", None):
                 cost_by_name[p.name] = cp_val
 
-        transactions_ref = self.db.collection("transactions").where("shop_id", "==", shop_id)
-        all_transactions = transactions_ref.stream()
+        all_transactions = self._sale_docs(shop_id, since=month_start)
 
         total_items_sold = 0.0
         total_revenue = 0.0
@@ -1343,7 +1924,7 @@ class FirestoreDB:
         week_start = week_start.replace(hour=0, minute=0, second=0, microsecond=0)
 
         # Build a cost map from products (so we can compute profit per sale)
-        products = self.get_products_by_shop(shop_id)
+        products = self.get_products_by_shop(shop_id, projection=projections.PRODUCT_COST)
         cost_by_id: Dict[str, float] = {}
         cost_by_name: Dict[str, float] = {}
         for p in products:
@@ -1359,8 +1940,7 @@ class FirestoreDB:
             if getattr(p, "name", None):
                 cost_by_name[p.name] = cp_val
 
-        transactions_ref = self.db.collection("transactions").where("shop_id", "==", shop_id)
-        all_transactions = transactions_ref.stream()
+        all_transactions = self._sale_docs(shop_id, since=week_start)
 
         total_items_sold = 0.0
         total_revenue = 0.0
@@ -1460,7 +2040,7 @@ class FirestoreDB:
         year_start = now.replace(month=1, day=1, hour=0, minute=0, second=0, microsecond=0)
 
         # Build a cost map from products (so we can compute profit per sale)
-        products = self.get_products_by_shop(shop_id)
+        products = self.get_products_by_shop(shop_id, projection=projections.PRODUCT_COST)
         cost_by_id: Dict[str, float] = {}
         cost_by_name: Dict[str, float] = {}
         for p in products:
@@ -1476,8 +2056,7 @@ class FirestoreDB:
             if getattr(p, "name", None):
                 cost_by_name[p.name] = cp_val
 
-        transactions_ref = self.db.collection("transactions").where("shop_id", "==", shop_id)
-        all_transactions = transactions_ref.stream()
+        all_transactions = self._sale_docs(shop_id, since=year_start)
 
         total_items_sold = 0.0
         total_revenue = 0.0
@@ -1582,7 +2161,7 @@ class FirestoreDB:
             start_datetime, end_datetime = end_datetime, start_datetime
 
         # Build a cost map from products (so we can compute profit per sale)
-        products = self.get_products_by_shop(shop_id)
+        products = self.get_products_by_shop(shop_id, projection=projections.PRODUCT_COST)
         cost_by_id: Dict[str, float] = {}
         cost_by_name: Dict[str, float] = {}
         for p in products:
@@ -1598,8 +2177,7 @@ class FirestoreDB:
             if getattr(p, "name", None):
                 cost_by_name[p.name] = cp_val
 
-        transactions_ref = self.db.collection("transactions").where("shop_id", "==", shop_id)
-        all_transactions = transactions_ref.stream()
+        all_transactions = self._sale_docs(shop_id, since=start_datetime, until=end_datetime)
 
         total_items_sold = 0.0
         total_revenue = 0.0
@@ -1698,7 +2276,7 @@ class FirestoreDB:
         products_sold = sales_data.get("products_sold", {}) or {}
 
         # Then get all products for the shop
-        products = self.get_products_by_shop(shop_id)
+        products = self.get_products_by_shop(shop_id, projection=projections.PRODUCT_MATCH)
 
         zero_sale_products: List[Dict[str, Any]] = []
         for p in products:
@@ -1729,55 +2307,81 @@ class FirestoreDB:
             "date": sales_data.get("date"),
         }
 
+    def get_demand_forecast(self, shop_id: str) -> "demand_forecast.DemandForecast":
+        """Get the per-product daily demand forecast for a shop.
+
+        The forecast is cached per shop until the next sale for that shop
+        (see create_transaction) or until the day rolls over. Other gunicorn
+        workers don't see the invalidation, so entries also expire after
+        FORECAST_CACHE_TTL_SECONDS (default 10 minutes).
+        """
+        today = datetime.utcnow().date()
+        ttl_seconds = Config.FORECAST_CACHE_TTL_SECONDS
+
+        cached = self._forecast_cache.get(shop_id)
+        if cached:
+            cached_date, forecast = cached
+            age = (datetime.utcnow() - forecast.generated_at).total_seconds()
+            if cached_date == today and age <= ttl_seconds:
+                return forecast
+
+        window_days = Config.FORECAST_WINDOW_DAYS
+        half_life = Config.FORECAST_HALF_LIFE_DAYS
+        seasonality = Config.FORECAST_SEASONALITY
+
+        # Filter by shop only (index-free); the window is applied in Python.
+        query = self._shop_query("transactions", shop_id)
+        docs = projections.select(query, projections.TRANSACTION_SALES).stream()
+        forecast = demand_forecast.forecast_demand(
+            (doc.to_dict() for doc in docs),
+            today=today,
+            window_days=window_days,
+            half_life_days=half_life,
+            seasonality=seasonality,
+        )
+        self._forecast_cache[shop_id] = (today, forecast)
+        return forecast
+
     def get_predictive_alerts(self, shop_id: str) -> Dict[str, Any]:
         """Get predictive alerts for products that will run out soon.
 
-        Analyzes current month's sales velocity to predict when products will run out.
-        Formula: days_until_stockout = current_stock / daily_sales_rate
+        Uses the exponentially weighted daily demand from get_demand_forecast
+        (optionally weekday-seasonal) and predicts days until stockout for
+        the whole catalog in one pass. Alerts keep month_sales (from the
+        sales cube) and days_elapsed next to the forecast window's sales.
 
         Returns products that will run out in the next 7 days.
         """
         from datetime import datetime, timedelta
 
-        now = datetime.now()
-        # Get current month's start date
-        month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        now = datetime.utcnow()
+        today = now.date()
+        month = sales_cube.month_key(now)
+        days_elapsed = today.day
+        month_cells = self.get_sales_cube(shop_id, since_month=month).get(month) or {}
 
-        # Calculate days elapsed in current month
-        days_elapsed = (now - month_start).days + 1  # +1 to include today
+        forecast = self.get_demand_forecast(shop_id)
+        products = self.get_products_by_shop(shop_id, projection=projections.PRODUCT_MATCH)
+        product_by_id = {p.product_id: p for p in products}
 
-        # Get all products for this shop
-        products = self.get_products_by_shop(shop_id)
-
-        # Get current month's sales data
-        current_month_sales = self.get_total_sales_current_month(shop_id=shop_id)
-        products_sold_this_month = current_month_sales.get('products_sold', {}) or {}
+        stock_by_product = {p.product_id: float(p.current_stock or 0) for p in products}
+        stockout_days = demand_forecast.days_to_stockout(forecast, stock_by_product, today)
+        demand_by_product = forecast.demand_by_product()
+        window_sales = dict(zip(forecast.product_ids, forecast.window_sales))
 
         alerts = []
 
-        for product in products:
-            product_name = product.name
-            current_stock = product.current_stock or 0
-            unit = product.unit or 'pieces'
-            brand = product.brand
-
-            # Get this month's sales for this product
-            month_sales_qty = products_sold_this_month.get(product_name, 0)
-
-            # Skip products with no sales this month or no stock
-            if month_sales_qty <= 0 or current_stock <= 0:
+        for product_id, days_until_stockout in stockout_days.items():
+            product = product_by_id.get(product_id)
+            if not product:
                 continue
 
-            # Calculate daily sales rate (average per day)
-            daily_sales_rate = month_sales_qty / days_elapsed
+            daily_sales_rate = demand_by_product.get(product_id, 0.0)
 
             # Skip if daily sales rate is too low (less than 0.1 per day)
             if daily_sales_rate < 0.1:
                 continue
 
-            # Predict days until stockout
-            days_until_stockout = current_stock / daily_sales_rate
-
             # Alert if product will run out in next 7 days
             if days_until_stockout <= 7:
                 # Calculate the predicted date
@@ -1792,27 +2396,29 @@ class FirestoreDB:
                     urgency = 'medium'    # 🟡 Yellow - 5-7 days
 
                 alerts.append({
-                    'name': product_name,
-                    'brand': brand,
-                    'current_stock': current_stock,
-                    'unit': unit,
+                    'name': product.name,
+                    'brand': product.brand,
+                    'current_stock': product.current_stock or 0,
+                    'unit': product.unit or 'pieces',
                     'daily_sales_rate': round(daily_sales_rate, 2),
                     'days_until_stockout': round(days_until_stockout, 1),
                     'stockout_date': stockout_date.strftime('%Y-%m-%d'),
-                    'month_sales': month_sales_qty,
+                    'month_sales': float((month_cells.get(product_id) or {}).get('qty', 0) or 0),
                     'days_elapsed': days_elapsed,
+                    'window_sales': window_sales.get(product_id, 0.0),
                     'urgency': urgency
                 })
 
         # Sort by days_until_stockout (most urgent first)
         alerts.sort(key=lambda x: x['days_until_stockout'])
 
+        window_end = forecast.window_start + timedelta(days=forecast.window_days - 1)
         return {
             'success': True,
             'alerts': alerts,
             'total_alerts': len(alerts),
-            'analysis_period': f"{month_start.strftime('%Y-%m-%d')} to {now.strftime('%Y-%m-%d')}",
-            'days_analyzed': days_elapsed,
+            'analysis_period': f"{forecast.window_start.isoformat()} to {window_end.isoformat()}",
+            'days_analyzed': forecast.window_days,
         }
 
 
@@ -1835,7 +2441,7 @@ class FirestoreDB:
         last_month_start = last_month_end.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
 
         # Get all products for this shop
-        products = self.get_products_by_shop(shop_id)
+        products = self.get_products_by_shop(shop_id, projection=projections.PRODUCT_MATCH)
 
         # Get last month's sales data
         last_month_sales = self.get_total_sales_for_period(
@@ -1895,9 +2501,9 @@ class FirestoreDB:
     def get_seasonal_analysis(self, shop_id: str, season_or_festival: Optional[str] = None) -> Dict[str, Any]:
         """Get seasonal sales analysis and product suggestions.
 
-        Analyzes historical sales data to identify:
+        Reads the shop's monthly sales cube (see sales_cube.py) to identify:
         1. Top-selling products during specific festivals/seasons
-        2. Sales trends for different time periods
+        2. Year-over-year change against the previous occurrence of the season
         3. Product recommendations for upcoming festivals
 
         Args:
@@ -1909,155 +2515,48 @@ class FirestoreDB:
         """
         try:
             print(f"🎉 get_seasonal_analysis called: shop_id={shop_id}, season_or_festival={season_or_festival}")
-            from datetime import datetime, timedelta
-            from collections import defaultdict
-
-            now = datetime.now()
-            current_year = now.year
-            current_month = now.month
-
-            # Define festival/season periods (approximate dates)
-            festivals = {
-                'diwali': {
-                    'months': [10, 11],  # October-November
-                    'keywords': ['sweets', 'mithai', 'dry fruits', 'oil', 'ghee', 'crackers', 'diyas', 'decorations']
-                },
-                'holi': {
-                    'months': [3],  # March
-                    'keywords': ['colors', 'sweets', 'gujiya', 'thandai', 'snacks', 'namkeen']
-                },
-                'raksha bandhan': {
-                    'months': [8],  # August
-                    'keywords': ['sweets', 'mithai', 'dry fruits', 'chocolates', 'gifts']
-                },
-                'eid': {
-                    'months': [4, 5],  # April-May (varies)
-                    'keywords': ['dates', 'dry fruits', 'sweets', 'seviyan', 'biryani', 'meat']
-                },
-                'christmas': {
-                    'months': [12],  # December
-                    'keywords': ['cake', 'chocolates', 'dry fruits', 'wine', 'decorations']
-                },
-                'new year': {
-                    'months': [1, 12],  # December-January
-                    'keywords': ['snacks', 'drinks', 'party', 'decorations']
-                },
-                'summer': {
-                    'months': [4, 5, 6],  # April-June
-                    'keywords': ['cold drinks', 'ice cream', 'juice', 'water', 'coolers', 'aam panna']
-                },
-                'winter': {
-                    'months': [11, 12, 1, 2],  # November-February
-                    'keywords': ['tea', 'coffee', 'hot chocolate', 'dry fruits', 'gur', 'til']
-                },
-                'monsoon': {
-                    'months': [7, 8, 9],  # July-September
-                    'keywords': ['tea', 'pakora', 'snacks', 'umbrella', 'raincoat']
-                }
-            }
-
-            # Get all transactions for the shop (last 2 years for better analysis)
-            two_years_ago = now - timedelta(days=730)
 
-            # Get all products
-            products = self.get_products_by_shop(shop_id)
-            product_map = {p.product_id: p for p in products}
-
-            # Get transactions from last 2 years
-            # Note: We only filter by shop_id to avoid needing a composite index
-            # We'll filter by timestamp in Python
-            transactions_ref = (self.db.collection('transactions')
-                               .where('shop_id', '==', shop_id)
-                               .stream())
-
-            # Analyze sales by month and product
-            monthly_sales = defaultdict(lambda: defaultdict(float))  # {month: {product_name: quantity}}
-            product_sales_history = defaultdict(list)  # {product_name: [(month, quantity)]}
+            today = datetime.now().date()
+            current_month = today.month
 
-            for txn_doc in transactions_ref:
-                txn_data = txn_doc.to_dict()
-                txn_type = txn_data.get('type')
+            target_festival = sales_cube.match_season(season_or_festival, today)
+            target_months = sales_cube.SEASONAL_PERIODS[target_festival]['months'] if target_festival else []
 
-                # Only analyze sales transactions
-                if txn_type != 'sale':
-                    continue
+            # Two years of monthly cells is all the analysis needs
+            since_month = sales_cube.shift_month(sales_cube.month_key(today), -24)
+            cube = self.get_sales_cube(shop_id, since_month=since_month)
+            totals = sales_cube.seasonal_totals(cube, target_months, today)
 
-                timestamp = txn_data.get('timestamp')
-                if isinstance(timestamp, str):
-                    timestamp = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
+            products = self.get_products_by_shop(shop_id, projection=projections.PRODUCT_MATCH)
+            product_map = {p.product_id: p for p in products}
 
-                # Filter by timestamp in Python (to avoid needing Firestore index)
-                if timestamp < two_years_ago:
-                    continue
+            # Only suggest products that are still in the catalog
+            totals = {pid: t for pid, t in totals.items() if pid in product_map}
+            recent_total = sum(t['recent_qty'] for t in totals.values())
+            previous_total = sum(t['previous_qty'] for t in totals.values())
+            seasons_with_data = (recent_total > 0) + (previous_total > 0)
 
-                month = timestamp.month
-                product_id = txn_data.get('product_id')
-                quantity = abs(txn_data.get('quantity', 0))
-
-                if product_id in product_map:
-                    product_name = product_map[product_id].name
-                    monthly_sales[month][product_name] += quantity
-                    product_sales_history[product_name].append((month, quantity))
-
-            # Determine which festival/season to analyze
-            target_festival = None
-            target_months = []
-
-            if season_or_festival:
-                # User specified a festival/season
-                season_lower = season_or_festival.lower()
-                for fest_name, fest_data in festivals.items():
-                    if fest_name in season_lower or season_lower in fest_name:
-                        target_festival = fest_name
-                        target_months = fest_data['months']
-                        break
-
-            if not target_festival:
-                # Auto-detect upcoming festival based on current month
-                for fest_name, fest_data in festivals.items():
-                    if current_month in fest_data['months']:
-                        target_festival = fest_name
-                        target_months = fest_data['months']
-                        break
-
-                # If no current festival, find next upcoming one
-                if not target_festival:
-                    next_month = (current_month % 12) + 1
-                    for fest_name, fest_data in festivals.items():
-                        if next_month in fest_data['months']:
-                            target_festival = fest_name
-                            target_months = fest_data['months']
-                            break
-
-            # Calculate top products for target months
-            seasonal_products = defaultdict(float)
-            for month in target_months:
-                for product_name, quantity in monthly_sales[month].items():
-                    seasonal_products[product_name] += quantity
-
-            # Sort products by sales volume
             top_seasonal_products = sorted(
-                seasonal_products.items(),
-                key=lambda x: x[1],
+                totals.items(),
+                key=lambda x: x[1]['recent_qty'] + x[1]['previous_qty'],
                 reverse=True
             )[:10]  # Top 10 products
 
             # Build suggestions
             suggestions = []
-            for product_name, total_qty in top_seasonal_products:
-                # Find the product in current inventory
-                current_product = None
-                for p in products:
-                    if p.name == product_name:
-                        current_product = p
-                        break
-
-                current_stock = current_product.current_stock if current_product else 0
-                avg_seasonal_sales = total_qty / len(target_months) if target_months else total_qty
+            for product_id, t in top_seasonal_products:
+                current_product = product_map[product_id]
+                total_qty = t['recent_qty'] + t['previous_qty']
+                current_stock = current_product.current_stock or 0
+                month_count = len(target_months) * max(1, seasons_with_data)
+                avg_seasonal_sales = total_qty / month_count if month_count else total_qty
 
                 suggestions.append({
-                    'product_name': product_name,
+                    'product_name': current_product.name,
                     'historical_sales': total_qty,
+                    'recent_season_sales': t['recent_qty'],
+                    'previous_season_sales': t['previous_qty'],
+                    'yoy_change_pct': sales_cube.yoy_change_pct(t['recent_qty'], t['previous_qty']),
                     'avg_monthly_sales': round(avg_seasonal_sales, 2),
                     'current_stock': current_stock,
                     'stock_status': 'sufficient' if current_stock >= avg_seasonal_sales else 'low',
@@ -2072,7 +2571,10 @@ class FirestoreDB:
                 'current_month': current_month,
                 'top_products': suggestions,
                 'total_products_analyzed': len(suggestions),
-                'festival_keywords': festivals.get(target_festival, {}).get('keywords', []) if target_festival else [],
+                'recent_season_sales': recent_total,
+                'previous_season_sales': previous_total,
+                'yoy_change_pct': sales_cube.yoy_change_pct(recent_total, previous_total),
+                'festival_keywords': sales_cube.SEASONAL_PERIODS.get(target_festival, {}).get('keywords', []) if target_festival else [],
                 'message': f"Seasonal analysis for {target_festival or 'current period'}"
             }
         except Exception as e:
@@ -2084,21 +2586,101 @@ class FirestoreDB:
                 'message': f'Error analyzing seasonal data: {str(e)}'
             }
 
+    def get_expiry_index(self, shop_id: str, refresh: bool = False) -> ExpiryIndex:
+        """Get the date-ordered expiry index for a shop.
+
+        Built from the catalog on first use and kept current by product
+        writes made through this instance. Writes from other workers are
+        picked up on `refresh` or after EXPIRY_INDEX_TTL_SECONDS.
+        """
+        ttl_seconds = Config.EXPIRY_INDEX_TTL_SECONDS
+
+        index = self._expiry_indexes.get(shop_id)
+        if index is not None and not refresh:
+            if (datetime.utcnow() - index.built_at).total_seconds() <= ttl_seconds:
+                return index
+
+        index = ExpiryIndex.from_products(self.get_products_by_shop(shop_id))
+        self._expiry_indexes[shop_id] = index
+        return index
+
+    def _invalidate_expiry_digest(self, shop_id: str) -> None:
+        """Drop a shop's precomputed expiry digest after an expiry-relevant write."""
+        try:
+            self.db.collection("expiry_digests").document(shop_id).delete()
+        except Exception as e:
+            print(f"⚠️ Could not clear expiry digest for {shop_id}: {e}")
+
+    def _expiry_stock_changed(self, shop_id: Optional[str], product_id: str, new_stock: float,
+                              product: Optional[Product] = None) -> None:
+        """Refresh loaded expiry indexes after a stock change and drop a stale digest.
+
+        Products with a product-level expiry show live stock in the digest.
+        That is decided from `product` itself too, so the worker that sells
+        clears the digest even when it never loaded the shop's index.
+        """
+        shown = product is not None and any(e.qty is None for e in entries_for_product(product))
+        for index_shop, index in list(self._expiry_indexes.items()):
+            if index.update_stock(product_id, new_stock):
+                shown = True
+                shop_id = shop_id or index_shop
+        if shown and shop_id:
+            self._invalidate_expiry_digest(shop_id)
+
+    def _reindex_product_expiry(self, product: Product) -> None:
+        """Refresh one product in its shop's expiry index and digest."""
+        index = self._expiry_indexes.get(product.shop_id)
+        if index is not None:
+            index.set_product(product)
+        self._invalidate_expiry_digest(product.shop_id)
+
+    def build_expiry_digest(self, shop_id: str, days: int = 30) -> Dict[str, Any]:
+        """Precompute and store today's expiry report for a shop.
+
+        Stored at expiry_digests/{shop_id}; run daily by
+        tools/build_expiry_digests.py and rebuilt lazily after any
+        expiry-relevant product write.
+        """
+        today = datetime.utcnow().date()
+        index = self.get_expiry_index(shop_id, refresh=True)
+        report = self._expiry_report(index, today, days)
+
+        digest = dict(report)
+        digest.pop("success", None)
+        digest["shop_id"] = shop_id
+        digest["generated_at"] = datetime.utcnow().isoformat()
+        self.db.collection("expiry_digests").document(shop_id).set(digest)
+        return report
+
+    @staticmethod
+    def _expiry_report(index: ExpiryIndex, today, window_days: int) -> Dict[str, Any]:
+        cutoff = today + timedelta(days=window_days)
+        return {
+            "success": True,
+            "expired_products": [e.to_report() for e in index.expired(today)],
+            "expiring_products": [e.to_report() for e in index.expiring(today, cutoff)],
+            "days_ahead": window_days,
+            "today": today.isoformat(),
+        }
+
     def get_expiry_products(self, shop_id: str, days: int = 30) -> Dict[str, Any]:
         """Get products that are expired or expiring within the next `days` days.
 
         Supports two schemas on the Product document:
         1) Simple per-product expiry (legacy):
-           - `expiry_date`: string or timestamp for the whole product.
+           - `expiry_date`: "YYYY-MM-DD" for the whole product.
         2) Per-batch expiry (recommended):
            - `batches`: {
-           -   "batch_001": {"expiry": "2025-02-10", "qty": 12},
-           -   "batch_002": {"expiry": "2025-03-15", "qty": 10},
+           -   "batch_001": {"expiry_date": "2025-02-10", "qty": 12},
+           -   "batch_002": {"expiry_date": "2025-03-15", "qty": 10},
            - }
 
         We then split into:
         - `expired_products`: expiry date < today
         - `expiring_products`: today <= expiry date <= today + days
+
+        Today's report is served from the shop's precomputed digest when it
+        exists; otherwise it is sliced from the expiry index and stored.
         """
         # Allow overriding the window via environment if needed
         window_days = days
@@ -2110,128 +2692,1033 @@ class FirestoreDB:
             window_days = days
 
         today = datetime.utcnow().date()
-        cutoff = today + timedelta(days=window_days)
 
-        products = self.get_products_by_shop(shop_id)
-        expired: List[Dict[str, Any]] = []
-        expiring: List[Dict[str, Any]] = []
+        doc = self.db.collection("expiry_digests").document(shop_id).get()
+        if doc.exists:
+            digest = doc.to_dict() or {}
+            if digest.get("today") == today.isoformat() and digest.get("days_ahead") == window_days:
+                return {
+                    "success": True,
+                    "expired_products": digest.get("expired_products", []),
+                    "expiring_products": digest.get("expiring_products", []),
+                    "days_ahead": window_days,
+                    "today": digest["today"],
+                }
 
-        for p in products:
-            # Prefer per-batch expiry if available, but only skip the legacy
-            # per-product path if we actually manage to read at least one
-            # usable batch expiry.
-            any_batch_handled = False
-            batches_obj = getattr(p, "batches", None)
-
-            if isinstance(batches_obj, dict) and batches_obj:
-                for batch_id, batch_data in batches_obj.items():
-                    try:
-                        batch = batch_data or {}
-                        expiry_raw = batch.get("expiry") or batch.get("expiry_date")
-                        if not expiry_raw:
-                            continue
-
-                        exp_date = None
-                        if isinstance(expiry_raw, datetime):
-                            exp_date = expiry_raw.date()
-                        elif isinstance(expiry_raw, str):
-                            text = expiry_raw.strip()
-                            # First try flexible ISO-style parsing (handles
-                            # "2025-12-31" and "2025-12-31T00:00:00" etc.).
-                            try:
-                                exp_date = datetime.fromisoformat(text).date()
-                            except Exception:
-                                # Fall back to a few common day/month/year styles.
-                                for fmt in ("%Y-%m-%d", "%d-%m-%Y", "%d/%m/%Y", "%Y/%m/%d"):
-                                    try:
-                                        exp_date = datetime.strptime(text, fmt).date()
-                                        break
-                                    except Exception:
-                                        continue
-
-                        if not exp_date:
-                            continue
-
-                        qty_raw = batch.get("qty") or batch.get("quantity")
-                        try:
-                            stock_val = float(qty_raw) if qty_raw is not None else p.current_stock
-                        except Exception:
-                            stock_val = p.current_stock
-
-                        info = {
-                            "name": p.name,
-                            "brand": getattr(p, "brand", None),
-                            "stock": stock_val,
-                            "unit": p.unit,
-                            "expiry_date": exp_date.isoformat(),
-                            "batch_id": batch_id,
-                        }
-
-                        if exp_date < today:
-                            expired.append(info)
-                        elif today <= exp_date <= cutoff:
-                            expiring.append(info)
-
-                        any_batch_handled = True
-                    except Exception:
-                        # Be defensive: a bad batch should not break the whole report
-                        continue
+        return self.build_expiry_digest(shop_id, days=window_days)
 
-                # If we successfully handled at least one batch expiry, skip the
-                # legacy per-product expiry for this product to avoid double
-                # counting. If no batch expiries were usable (e.g. bad formats),
-                # fall through to the legacy path below.
-                if any_batch_handled:
-                    continue
+    # ==================== SALES CUBE OPERATIONS ====================
+
+    def _record_sale_in_cube(self, transaction: Transaction) -> None:
+        """Add a sale to (or take a return off) this month's sales cube cell.
 
-            # Legacy/simple per-product expiry path
-            expiry_raw = getattr(p, "expiry_date", None)
-            if not expiry_raw:
+        Best-effort: a failure here must never fail the sale itself, and
+        rebuild_sales_cube can always repair the cube from the ledger.
+        """
+        write = self._cube_increment(transaction.to_dict())
+        if write is None:
+            return
+        try:
+            ref, data = write
+            ref.set(data, merge=True)
+        except Exception as e:
+            print(f"⚠️ Could not update sales cube for {transaction.shop_id}: {e}")
+
+    def _cube_increment(self, txn: Dict[str, Any]):
+        """(doc ref, merge payload) adding one sale (or a negative return) to its cube cell, or None."""
+        cell = sales_cube.sale_cell(txn)
+        if cell is None:
+            return None
+        month, product_id, product_name, qty, revenue = cell
+        ref = self.db.collection("sales_cube").document(sales_cube.cube_doc_id(txn["shop_id"], month))
+        return ref, {
+            "shop_id": txn["shop_id"],
+            "month": month,
+            "products": {
+                product_id: {
+                    "name": product_name,
+                    "qty": self._increment(qty),
+                    "revenue": self._increment(revenue),
+                }
+            },
+        }
+
+    def rebuild_sales_cube(self, shop_id: str) -> Dict[str, Any]:
+        """Rebuild a shop's monthly sales cube from the transaction ledger.
+
+        Month documents are overwritten and months without sales are
+        deleted. Sales recorded while a rebuild is running may be counted
+        twice or missed, so run this off-hours (tools/rebuild_sales_cube.py).
+        """
+        query = self._shop_query("transactions", shop_id)
+        docs = projections.select(query, projections.TRANSACTION_SALES).stream()
+        cube = sales_cube.build_cube(doc.to_dict() for doc in self._with_compacted(shop_id, docs))
+
+        cube_ref = self.db.collection("sales_cube")
+        stale = [
+            doc.id for doc in cube_ref.where("shop_id", "==", shop_id).stream()
+            if (doc.to_dict() or {}).get("month") not in cube
+        ]
+
+        batch = self.db.batch()
+        pending = 0
+        for month, cells in cube.items():
+            batch.set(cube_ref.document(sales_cube.cube_doc_id(shop_id, month)), {
+                "shop_id": shop_id,
+                "month": month,
+                "products": cells,
+            })
+            pending += 1
+            if pending >= 400:  # stay under Firestore's 500 writes per batch
+                batch.commit()
+                batch = self.db.batch()
+                pending = 0
+        for doc_id in stale:
+            batch.delete(cube_ref.document(doc_id))
+            pending += 1
+            if pending >= 400:
+                batch.commit()
+                batch = self.db.batch()
+                pending = 0
+        if pending:
+            batch.commit()
+
+        built_at = datetime.utcnow().isoformat()
+        self.db.collection("sales_cube_meta").document(shop_id).set({
+            "shop_id": shop_id,
+            "built_at": built_at,
+            "months": len(cube),
+        })
+
+        return {
+            "success": True,
+            "shop_id": shop_id,
+            "months": len(cube),
+            "deleted_months": len(stale),
+            "built_at": built_at,
+        }
+
+    def get_sales_cube(self, shop_id: str, since_month: Optional[str] = None) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        """Get a shop's sales cube as {month: {product_id: cell}}.
+
+        The cube is built from the ledger the first time a shop asks for it;
+        after that create_transaction keeps it current.
+        """
+        meta = self.db.collection("sales_cube_meta").document(shop_id).get()
+        if not meta.exists:
+            self.rebuild_sales_cube(shop_id)
+
+        cube: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        for doc in self.db.collection("sales_cube").where("shop_id", "==", shop_id).stream():
+            data = doc.to_dict() or {}
+            month = data.get("month")
+            if not month or (since_month and month < since_month):
                 continue
+            cube[month] = data.get("products") or {}
+        return cube
+
+    # ==================== LEDGER COMPACTION ====================
+
+    def get_ledger_archive(self) -> Any:
+        """Where compacted rows go (see ledger_archive.configured_archive)."""
+        if self._ledger_archive is None:
+            self._ledger_archive = ledger_archive.configured_archive(self.db)
+        return self._ledger_archive
+
+    def get_compacted_months(self, shop_id: str) -> List[str]:
+        """A shop's compacted ledger months ("YYYY-MM"), cached for 10 minutes."""
+        cached = self._compacted_months.get(shop_id)
+        if cached and (datetime.utcnow() - cached[1]).total_seconds() <= 600:
+            return cached[0]
+        doc = self.db.collection(ledger_archive.STATE_COLLECTION).document(shop_id).get()
+        months = sorted((doc.to_dict() or {}).get("months") or []) if doc.exists else []
+        self._compacted_months[shop_id] = (months, datetime.utcnow())
+        return months
+
+    def _set_compacted_months(self, shop_id: str, months: List[str]) -> None:
+        months = sorted(set(months))
+        self.db.collection(ledger_archive.STATE_COLLECTION).document(shop_id).set({
+            "shop_id": shop_id,
+            "months": months,
+            "updated_at": datetime.utcnow().isoformat(),
+        })
+        self._compacted_months[shop_id] = (months, datetime.utcnow())
 
-            exp_date = None
-            # Handle Firestore timestamp or datetime
-            if isinstance(expiry_raw, datetime):
-                exp_date = expiry_raw.date()
-            elif isinstance(expiry_raw, str):
-                text = expiry_raw.strip()
-                # Try a few common formats
-                for fmt in ("%Y-%m-%d", "%d-%m-%Y", "%d/%m/%Y", "%Y/%m/%d"):
-                    try:
-                        exp_date = datetime.strptime(text, fmt).date()
-                        break
-                    except Exception:
-                        continue
+    def _with_compacted(self, shop_id: str, docs: Any, since: Optional[datetime] = None,
+                        until: Optional[datetime] = None):
+        """Ledger rows for a report window, with compacted months filled back in.
 
-            if not exp_date:
-                # Skip if we cannot parse the date safely
+        Live rows of compacted months are skipped (the summary or archive
+        already covers them). Compacted months the window covers completely
+        come from their summary, partly covered ones from the archive, so
+        per-row filters in the caller still apply. `since=None` means all
+        history.
+        """
+        months = self.get_compacted_months(shop_id)
+        if not months:
+            yield from docs
+            return
+
+        compacted = set(months)
+        for doc in docs:
+            if sales_cube.month_key((doc.to_dict() or {}).get("timestamp")) not in compacted:
+                yield doc
+
+        if since is not None:
+            wanted = set(ledger_archive.months_between(since, until or datetime.utcnow()))
+            months = [m for m in months if m in wanted]
+        for month in months:
+            start, end = ledger_archive.month_bounds(month)
+            if since is None or (start >= since and (until is None or end <= until)):
+                doc = self.db.collection(ledger_archive.SUMMARY_COLLECTION).document(
+                    ledger_archive.summary_id(shop_id, month)).get()
+                rows = ledger_archive.summary_rows(doc.to_dict()) if doc.exists else []
+            else:
+                rows = self.get_ledger_archive().read(shop_id, month)
+            for row in rows:
+                yield ledger_archive.ArchivedRow(row)
+
+    def compact_ledger(self, shop_id: str, horizon_days: Optional[int] = None,
+                       now: Optional[datetime] = None) -> Dict[str, Any]:
+        """Summarize and archive a shop's ledger months older than the horizon.
+
+        Per month: archive the raw rows (merged with anything already
+        archived), write the summary, delete the live rows, record the
+        month as compacted. Safe to re-run after a crash at any step.
+        """
+        horizon = horizon_days or ledger_archive.horizon_days()
+        # The demand forecast reads raw rows only; never compact inside its window
+        horizon = max(horizon, Config.FORECAST_WINDOW_DAYS + 31)
+        before = ledger_archive.cutoff_month(now or datetime.utcnow(), horizon)
+
+        live: Dict[str, Any] = {}
+        rows = []
+        for doc in self._shop_query("transactions", shop_id).stream():
+            txn = doc.to_dict() or {}
+            txn.setdefault("transaction_id", doc.id)
+            live[txn["transaction_id"]] = doc.id
+            rows.append(txn)
+        by_month = ledger_archive.group_by_month(rows, before)
+
+        archive = self.get_ledger_archive()
+        ledger = self._shop_collection("transactions", shop_id)
+        compacted = list(self.get_compacted_months(shop_id))
+        archived_rows = 0
+        for month in sorted(by_month):
+            month_rows = ledger_archive.merge_rows(by_month[month], archive.read(shop_id, month))
+            archive.write(shop_id, month, month_rows)
+
+            summary = ledger_archive.summarize(month_rows)
+            self.db.collection(ledger_archive.SUMMARY_COLLECTION).document(
+                ledger_archive.summary_id(shop_id, month)).set({
+                    "shop_id": shop_id,
+                    "month": month,
+                    **summary,
+                    "compacted_at": datetime.utcnow().isoformat(),
+                })
+            compacted.append(month)
+            self._set_compacted_months(shop_id, compacted)
+
+            doc_ids = [live[txn["transaction_id"]] for txn in by_month[month]]
+            for start in range(0, len(doc_ids), ledger_archive.BATCH_SIZE):
+                batch = self.db.batch()
+                for doc_id in doc_ids[start:start + ledger_archive.BATCH_SIZE]:
+                    self._batch_write(batch, "delete", ledger.document(doc_id))
+                batch.commit()
+            archived_rows += len(doc_ids)
+            print(f"🗜️ {shop_id} {month}: {len(month_rows)} rows archived, {len(summary['lines'])} summary lines")
+
+        return {
+            "success": True,
+            "before_month": before,
+            "months": sorted(by_month),
+            "rows_archived": archived_rows,
+        }
+
+    def restore_ledger_month(self, shop_id: str, month: str) -> Dict[str, Any]:
+        """Put a compacted month's raw rows back into the live ledger.
+
+        Rows are written back while the month still counts as compacted
+        (so reports never see them twice), then the month is released and
+        its summary and archive removed.
+        """
+        archive = self.get_ledger_archive()
+        rows = archive.read(shop_id, month)
+        if not rows and month not in self.get_compacted_months(shop_id):
+            return {"success": False, "message": f"{month} is not compacted"}
+
+        ledger = self._shop_collection("transactions", shop_id)
+        for start in range(0, len(rows), ledger_archive.BATCH_SIZE):
+            batch = self.db.batch()
+            for txn in rows[start:start + ledger_archive.BATCH_SIZE]:
+                self._batch_write(batch, "set", ledger.document(txn["transaction_id"]), txn)
+            batch.commit()
+
+        self._set_compacted_months(shop_id, [m for m in self.get_compacted_months(shop_id) if m != month])
+        self.db.collection(ledger_archive.SUMMARY_COLLECTION).document(
+            ledger_archive.summary_id(shop_id, month)).delete()
+        archive.delete(shop_id, month)
+        return {"success": True, "month": month, "rows_restored": len(rows)}
+
+    # ==================== STOCK RECONCILIATION ====================
+
+    def _replay_product_ledger(self, shop_id: str, product_id: str,
+                               compacted: List[str]) -> reconciliation.Replay:
+        """Replay one product's ledger, from its snapshot when that is usable."""
+        doc = self.db.collection(reconciliation.SNAPSHOT_COLLECTION).document(product_id).get()
+        snapshot = doc.to_dict() if doc.exists else None
+        if snapshot and not reconciliation.snapshot_usable(snapshot, compacted):
+            snapshot = None
+
+        query = self._shop_collection("transactions", shop_id).where("product_id", "==", product_id)
+        if snapshot:
+            query = query.where("timestamp", ">=", snapshot["as_of"])
+        rows = [doc.to_dict() or {} for doc in projections.select(query, projections.TRANSACTION_REPLAY).stream()]
+        return reconciliation.replay(rows, snapshot)
+
+    def reconcile_stock(self, shop_id: str, correct: bool = False, snapshot: bool = True,
+                        workers: Optional[int] = None, user_phone: str = "reconciliation") -> Dict[str, Any]:
+        """Check every product's current_stock against a replay of its ledger.
+
+        Products are replayed in parallel (`workers`, default
+        RECONCILE_WORKERS or 8). A product that looks drifted is read and
+        replayed once more, so a sale landing between the two reads isn't
+        reported. With `correct`, each drift is recorded as an ADJUSTMENT
+        row and current_stock is left as it is; drift on stock derived from
+        batch quantities is only flagged (`derived_stock`). With `snapshot`,
+        each replayed product's expected stock is saved so the next run
+        only reads newer rows. The report is also kept in
+        reconciliation_reports/{shop_id}.
+
+        Stored stock is compared without the sales journal overlay: rows
+        still in the journal have reached neither the stock nor the ledger.
+        """
+        started = time.perf_counter()
+        compacted = self.get_compacted_months(shop_id)
+        products: Dict[str, Dict[str, Any]] = {}
+        for doc in projections.select(self._shop_query("products", shop_id), projections.PRODUCT_CORE).stream():
+            data = doc.to_dict() or {}
+            products[data.get("product_id") or doc.id] = data
+
+        def check(product_id: str):
+            stock, derived = reconciliation.stored_stock(products[product_id])
+            result = self._replay_product_ledger(shop_id, product_id, compacted)
+            if reconciliation.is_drift(stock, result.expected):
+                doc = self._shop_doc_ref("products", product_id, shop_id).get()
+                if not doc.exists:
+                    return product_id, None, derived, result
+                stock, derived = reconciliation.stored_stock(doc.to_dict() or {})
+                result = self._replay_product_ledger(shop_id, product_id, compacted)
+            return product_id, stock, derived, result
+
+        # Each replay runs in a copy of this context, so the request's trace
+        # and Firestore usage scopes see the pool's reads
+        with ThreadPoolExecutor(max_workers=workers or reconciliation.worker_count()) as pool:
+            futures = [pool.submit(contextvars.copy_context().run, check, product_id) for product_id in products]
+            outcomes = [future.result() for future in futures]
+
+        now = datetime.utcnow().isoformat()
+        drifted: List[Dict[str, Any]] = []
+        snapshots: List[Any] = []
+        in_sync = no_ledger = replayed_rows = from_snapshot = adjustments = 0
+        for product_id, stock, derived, result in outcomes:
+            if stock is None:
+                continue
+            if result.expected is None:
+                no_ledger += 1
                 continue
+            replayed_rows += result.rows
+            from_snapshot += int(result.from_snapshot)
+
+            if reconciliation.is_drift(stock, result.expected):
+                name = products[product_id].get("name") or product_id
+                drift = round(stock - result.expected, 6)
+                entry = {
+                    "product_id": product_id,
+                    "product_name": name,
+                    "current_stock": stock,
+                    "expected_stock": result.expected,
+                    "drift": drift,
+                }
+                if derived:
+                    entry["derived_stock"] = True
+                elif correct:
+                    adjustment = self.create_transaction(
+                        shop_id=shop_id,
+                        product_id=product_id,
+                        product_name=name,
+                        transaction_type=TransactionType.ADJUSTMENT,
+                        quantity=drift,
+                        previous_stock=result.expected,
+                        new_stock=stock,
+                        user_phone=user_phone,
+                        notes=f"Reconciliation: ledger says {result.expected}, stock is {stock}",
+                    )
+                    entry["adjustment_id"] = adjustment.transaction_id
+                    adjustments += 1
+                drifted.append(entry)
+            else:
+                in_sync += 1
 
-            info = {
-                "name": p.name,
-                "brand": getattr(p, "brand", None),
-                "stock": p.current_stock,
-                "unit": p.unit,
-                "expiry_date": exp_date.isoformat(),
-            }
+            if snapshot and result.rows:
+                snapshots.append((product_id, reconciliation.snapshot_doc(shop_id, product_id, result, now)))
+
+        for start in range(0, len(snapshots), ledger_archive.BATCH_SIZE):
+            batch = self.db.batch()
+            for product_id, data in snapshots[start:start + ledger_archive.BATCH_SIZE]:
+                batch.set(self.db.collection(reconciliation.SNAPSHOT_COLLECTION).document(product_id), data)
+            batch.commit()
+
+        drifted.sort(key=lambda e: abs(e["drift"]), reverse=True)
+        report = {
+            "success": True,
+            "shop_id": shop_id,
+            "checked_at": now,
+            "products_checked": len(outcomes),
+            "in_sync": in_sync,
+            "no_ledger": no_ledger,
+            "drifted": drifted,
+            "adjustments_written": adjustments,
+            "snapshots_written": len(snapshots),
+            "rows_replayed": replayed_rows,
+            "from_snapshot": from_snapshot,
+            "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+        }
+        self.db.collection(reconciliation.REPORT_COLLECTION).document(shop_id).set(report)
+        return report
+
+    def get_reconciliation_report(self, shop_id: str) -> Optional[Dict[str, Any]]:
+        """The shop's latest reconcile_stock report, if it has one."""
+        doc = self.db.collection(reconciliation.REPORT_COLLECTION).document(shop_id).get()
+        return doc.to_dict() if doc.exists else None
+
+    # ==================== SALES JOURNAL ====================
+
+    def record_stock_movement(
+        self,
+        shop_id: str,
+        product: Product,
+        transaction_type: TransactionType,
+        quantity: float,
+        user_phone: str,
+        notes: Optional[str] = None,
+        idempotency_key: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """Record a POS sale or return against an already-resolved product.
 
-            if exp_date < today:
-                expired.append(info)
-            elif today <= exp_date <= cutoff:
-                expiring.append(info)
+        With the sales journal enabled the movement is committed locally and
+        flushed upstream in the background (see sales_journal.py); otherwise
+        it is written straight through like any other stock change.
+        """
+        previous_stock = float(product.current_stock or 0.0)
+        if transaction_type == TransactionType.RETURN:
+            new_stock = previous_stock + quantity
+        else:
+            new_stock = _stock_after_outflow(previous_stock, quantity)
 
-        # Sort by date (nearest first), then by name for stability
-        expiring_sorted = sorted(expiring, key=lambda item: (item["expiry_date"], item["name"]))
-        expired_sorted = sorted(expired, key=lambda item: (item["expiry_date"], item["name"]))
+        unit_price = float(product.selling_price) if getattr(product, "selling_price", None) is not None else None
+        total_amount = unit_price * quantity if unit_price is not None else None
 
+        if self.sales_journal is None:
+            self.update_product_stock(product.product_id, new_stock, product=product)
+            transaction = self.create_transaction(
+                shop_id=shop_id,
+                product_id=product.product_id,
+                product_name=product.name,
+                transaction_type=transaction_type,
+                quantity=quantity,
+                previous_stock=previous_stock,
+                new_stock=new_stock,
+                user_phone=user_phone,
+                unit_price=unit_price,
+                total_amount=total_amount,
+                notes=notes,
+            )
+            journaled = False
+        else:
+            transaction = Transaction(
+                transaction_id=idempotency_key or str(uuid.uuid4()),
+                shop_id=shop_id,
+                product_id=product.product_id,
+                product_name=product.name,
+                transaction_type=transaction_type,
+                quantity=quantity,
+                previous_stock=previous_stock,
+                new_stock=new_stock,
+                user_phone=user_phone,
+                timestamp=datetime.utcnow(),
+                unit_price=unit_price,
+                total_amount=total_amount,
+                notes=notes,
+            )
+            self.sales_journal.append([{
+                "idempotency_key": transaction.transaction_id,
+                "shop_id": shop_id,
+                "product_id": product.product_id,
+                "delta": new_stock - previous_stock,
+                "transaction": transaction.to_dict(),
+            }])
+            if self.journal_flusher is not None:
+                self.journal_flusher.wake()
+            journaled = True
+
+        return {
+            "transaction": transaction,
+            "previous_stock": previous_stock,
+            "new_stock": new_stock,
+            "unit_price": unit_price,
+            "total_amount": total_amount,
+            "journaled": journaled,
+        }
+
+    def _pos_lines(self, shop_id: str, lines: List[Any], transaction_type: TransactionType, user_phone: str,
+                   now: datetime, notes: Optional[str], bill_id: Optional[str] = None,
+                   idempotency_key: Optional[str] = None):
+        """Ledger rows for POS lines of (product, quantity), chaining repeated products.
+
+        Returns (transactions, stock after, products by id).
+        """
+        products: Dict[str, Product] = {}
+        stock: Dict[str, float] = {}
+        transactions: List[Transaction] = []
+        for i, (product, quantity) in enumerate(lines):
+            products.setdefault(product.product_id, product)
+            previous_stock = stock.get(product.product_id, float(product.current_stock or 0.0))
+            if transaction_type in (TransactionType.RETURN, TransactionType.ADD_STOCK):
+                new_stock = previous_stock + quantity
+            else:
+                new_stock = _stock_after_outflow(previous_stock, quantity)
+            stock[product.product_id] = new_stock
+            unit_price = None
+            if transaction_type != TransactionType.ADD_STOCK and getattr(product, "selling_price", None) is not None:
+                unit_price = float(product.selling_price)
+            transactions.append(Transaction(
+                transaction_id=(idempotency.derived_id(shop_id, idempotency_key, i) if idempotency_key
+                                else str(uuid.uuid4())),
+                shop_id=shop_id,
+                product_id=product.product_id,
+                product_name=product.name,
+                transaction_type=transaction_type,
+                quantity=quantity,
+                previous_stock=previous_stock,
+                new_stock=new_stock,
+                user_phone=user_phone,
+                timestamp=now,
+                unit_price=unit_price,
+                total_amount=unit_price * quantity if unit_price is not None else None,
+                notes=notes,
+                bill_id=bill_id,
+            ))
+        return transactions, stock, products
+
+    def _document_ref(self, collection: str, doc_id: str, shop_id: str) -> Any:
+        """A document in a shop-scoped collection (in the shop's layout) or a global one."""
+        if collection in shop_layout.SHOP_COLLECTIONS:
+            return self._shop_collection(collection, shop_id).document(doc_id)
+        return self.db.collection(collection).document(doc_id)
+
+    def _commit_pos_request(self, shop_id: str, transactions: List[Transaction], stock: Dict[str, float],
+                            products: Dict[str, Product], documents: List[Dict[str, Any]],
+                            request: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        """Write a POS request's ledger rows, stock changes and documents together.
+
+        Goes through the sales journal when it is enabled (the documents
+        ride with the last line), else one write batch. `request` is the
+        pos_requests record of a keyed request; if that request was already
+        applied nothing is written and its stored response is returned.
+        """
+        request_id = idempotency.record_id(shop_id, request["key"]) if request else None
+
+        if self.sales_journal is not None and transactions:
+            extra = documents + ([{"collection": idempotency.RECORD_COLLECTION, "id": request_id, "data": request}]
+                                 if request else [])
+            group_key = request_id or str(uuid.uuid4())
+            added = self.sales_journal.append([
+                {
+                    "idempotency_key": t.transaction_id,
+                    "shop_id": shop_id,
+                    "product_id": t.product_id,
+                    "delta": t.new_stock - t.previous_stock,
+                    "transaction": t.to_dict(),
+                    "documents": extra if i == len(transactions) - 1 else None,
+                    "request_key": request_id if i == len(transactions) - 1 else None,
+                    "group_key": group_key,
+                }
+                for i, t in enumerate(transactions)
+            ])
+            if request and added == 0:
+                # Same key, same derived ids: journaled before (maybe by another worker)
+                for doc in self.sales_journal.request_documents(request_id) or []:
+                    if doc.get("collection") == idempotency.RECORD_COLLECTION:
+                        return doc["data"].get("response")
+            if self.journal_flusher is not None:
+                self.journal_flusher.wake()
+            return None
+
+        now = datetime.utcnow().isoformat()
+        batch = self.db.batch()
+        if request:
+            batch.create(self.db.collection(idempotency.RECORD_COLLECTION).document(request_id), request)
+        for product_id, new_stock in stock.items():
+            self._batch_write(batch, "update", self._shop_doc_ref("products", product_id, shop_id), {
+                "current_stock": new_stock,
+                "updated_at": now,
+            })
+        for t in transactions:
+            txn = t.to_dict()
+            self._batch_write(batch, "set", self._shop_collection("transactions", shop_id).document(t.transaction_id), txn)
+            cube = self._cube_increment(txn)
+            if cube is not None:
+                batch.set(cube[0], cube[1], merge=True)
+        for doc in documents:
+            self._batch_write(batch, "set", self._document_ref(doc["collection"], doc["id"], shop_id), doc["data"])
+        try:
+            batch.commit()
+        except (AlreadyExists, _google_already_exists()):
+            # A concurrent duplicate committed first; nothing of ours was applied
+            doc = self.db.collection(idempotency.RECORD_COLLECTION).document(request_id).get()
+            return (doc.to_dict() or {}).get("response")
+
+        if any(t.transaction_type == TransactionType.SALE for t in transactions):
+            self._forecast_cache.pop(shop_id, None)
+        for product_id, new_stock in stock.items():
+            product = products[product_id]
+            self._expiry_stock_changed(shop_id, product_id, new_stock, product)
+            self._track_low_stock(product, product.current_stock, product, new_stock)
+        return None
+
+    def _pos_request_record(self, shop_id: str, key: str, kind: str, user_phone: str,
+                            response: Dict[str, Any]) -> Dict[str, Any]:
         return {
+            "shop_id": shop_id,
+            "key": key,
+            "kind": kind,
+            "user_phone": user_phone,
+            "response": response,
+            "created_at": datetime.utcnow().isoformat(),
+        }
+
+    def find_pos_request(self, key: str, user_phone: str, shop_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Stored response of a keyed POS request that was already applied.
+
+        The in-process cache is checked first and costs no reads; given the
+        shop, the local journal and pos_requests are checked too.
+        """
+        response = self.pos_request_cache.get(user_phone, key)
+        if response is not None or shop_id is None:
+            return response
+        request_id = idempotency.record_id(shop_id, key)
+        if self.sales_journal is not None:
+            for doc in self.sales_journal.request_documents(request_id) or []:
+                if doc.get("collection") == idempotency.RECORD_COLLECTION:
+                    response = doc["data"].get("response")
+        if response is None:
+            doc = self.db.collection(idempotency.RECORD_COLLECTION).document(request_id).get()
+            if doc.exists:
+                response = (doc.to_dict() or {}).get("response")
+        if response is not None:
+            self.pos_request_cache.put(user_phone, key, response)
+        return response
+
+    def record_bill(
+        self,
+        shop_id: str,
+        lines: List[Any],
+        user_phone: str,
+        payment_mode: str = "Cash",
+        cash_given: Optional[float] = None,
+        client_total: Optional[float] = None,
+        untracked: Optional[List[Dict[str, Any]]] = None,
+        notes: Optional[str] = None,
+        idempotency_key: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """Record a POS checkout: one bills document plus a sale row per line.
+
+        `lines` are (product, quantity) pairs of already-resolved products;
+        `untracked` are items the shop doesn't stock ({name, quantity,
+        price}), kept on the bill only. Stock changes, ledger rows, sales
+        cube increments and the bill commit as one batch, or go through the
+        sales journal (the bill rides with the last line) when it is enabled.
+
+        With `idempotency_key` (see idempotency.py) a repeat of an applied
+        checkout writes nothing and returns the original response with
+        `replayed` set.
+        """
+        now = datetime.utcnow()
+        bill_id = idempotency.derived_id(shop_id, idempotency_key, "bill") if idempotency_key else str(uuid.uuid4())
+        transactions, stock, products = self._pos_lines(
+            shop_id, lines, TransactionType.SALE, user_phone, now, notes,
+            bill_id=bill_id, idempotency_key=idempotency_key,
+        )
+        items: List[Dict[str, Any]] = [
+            {
+                "product_id": t.product_id,
+                "product_name": t.product_name,
+                "quantity": t.quantity,
+                "unit_price": t.unit_price,
+                "amount": t.total_amount,
+                "transaction_id": t.transaction_id,
+                "new_stock": t.new_stock,
+            }
+            for t in transactions
+        ]
+        for item in untracked or []:
+            price = item.get("price")
+            items.append({
+                "product_id": None,
+                "product_name": item.get("name"),
+                "quantity": item.get("quantity"),
+                "unit_price": price,
+                "amount": float(price) * float(item.get("quantity") or 0) if price is not None else None,
+                "transaction_id": None,
+            })
+
+        total_amount = round(sum(t.total_amount or 0.0 for t in transactions), 2)
+        bill = Bill(
+            bill_id=bill_id,
+            shop_id=shop_id,
+            user_phone=user_phone,
+            timestamp=now,
+            items=items,
+            item_count=len(transactions),
+            total_quantity=sum(t.quantity for t in transactions),
+            total_amount=total_amount,
+            payment_mode=payment_mode or "Cash",
+            cash_given=cash_given,
+            change_due=round(cash_given - (client_total or total_amount), 2) if cash_given is not None else None,
+            client_total=client_total,
+        )
+        response = {
             "success": True,
-            "expired_products": expired_sorted,
-            "expiring_products": expiring_sorted,
-            "days_ahead": window_days,
-            "today": today.isoformat(),
+            "bill_id": bill_id,
+            "items": [
+                {"name": item["product_name"], "quantity": item["quantity"], "new_stock": item["new_stock"]}
+                if item["transaction_id"] else
+                {"name": item["product_name"], "quantity": item["quantity"],
+                 "note": "product not in shop database — stock unchanged"}
+                for item in items
+            ],
+            "total": client_total if client_total is not None else total_amount,
+            "payment_mode": bill.payment_mode,
+        }
+
+        request = (self._pos_request_record(shop_id, idempotency_key, "sale", user_phone, response)
+                   if idempotency_key else None)
+        original = self._commit_pos_request(
+            shop_id, transactions, stock, products,
+            [{"collection": "bills", "id": bill_id, "data": bill.to_dict()}],
+            request=request,
+        )
+        if original is not None:
+            self.pos_request_cache.put(user_phone, idempotency_key, original)
+            return {"bill": None, "transactions": [], "journaled": False, "response": original, "replayed": True}
+        if idempotency_key:
+            self.pos_request_cache.put(user_phone, idempotency_key, response)
+
+        self._mark_bills_since(shop_id, now)
+        return {"bill": bill, "transactions": transactions, "journaled": self.sales_journal is not None,
+                "response": response, "replayed": False}
+
+    def record_returns(self, shop_id: str, lines: List[Any], user_phone: str, notes: Optional[str] = "POS return",
+                       idempotency_key: Optional[str] = None) -> Dict[str, Any]:
+        """Record POS returns of (product, quantity) lines as one write (see record_bill)."""
+        return self._record_pos_movements(shop_id, lines, TransactionType.RETURN, user_phone, notes, idempotency_key)
+
+    def record_stock_additions(self, shop_id: str, lines: List[Any], user_phone: str,
+                               notes: Optional[str] = None,
+                               idempotency_key: Optional[str] = None) -> Dict[str, Any]:
+        """Record restocking of (product, quantity) lines as one write (see record_bill)."""
+        return self._record_pos_movements(shop_id, lines, TransactionType.ADD_STOCK, user_phone, notes,
+                                          idempotency_key)
+
+    def _record_pos_movements(self, shop_id: str, lines: List[Any], transaction_type: TransactionType,
+                              user_phone: str, notes: Optional[str],
+                              idempotency_key: Optional[str]) -> Dict[str, Any]:
+        transactions, stock, products = self._pos_lines(
+            shop_id, lines, transaction_type, user_phone, datetime.utcnow(), notes,
+            idempotency_key=idempotency_key,
+        )
+        response = {
+            "success": True,
+            "items": [
+                {
+                    "name": t.product_name,
+                    "quantity": t.quantity,
+                    "previous_stock": t.previous_stock,
+                    "new_stock": t.new_stock,
+                    "refund": t.total_amount,
+                    "unit_price": t.unit_price,
+                }
+                if transaction_type == TransactionType.RETURN else
+                {
+                    "name": t.product_name,
+                    "quantity": t.quantity,
+                    "previous_stock": t.previous_stock,
+                    "new_stock": t.new_stock,
+                }
+                for t in transactions
+            ],
         }
 
+        request = (self._pos_request_record(shop_id, idempotency_key, transaction_type.value, user_phone, response)
+                   if idempotency_key else None)
+        original = self._commit_pos_request(shop_id, transactions, stock, products, [], request=request)
+        if original is not None:
+            self.pos_request_cache.put(user_phone, idempotency_key, original)
+            return {"transactions": [], "response": original, "replayed": True}
+        if idempotency_key:
+            self.pos_request_cache.put(user_phone, idempotency_key, response)
+        return {"transactions": transactions, "response": response, "replayed": False}
+
+    def set_product_price(self, shop_id: str, product_id: str, selling_price: Optional[float] = None,
+                          cost_price: Optional[float] = None,
+                          changed_at: Optional[datetime] = None,
+                          idempotency_key: Optional[str] = None, user_phone: str = "") -> Dict[str, Any]:
+        """Change a product's prices, last writer (by `changed_at`) wins.
+
+        `changed_at` is when the change was made, e.g. on an offline
+        device; a change older than the one already stored is not applied
+        and the result says so (`conflict`) with the current prices.
+
+        With `idempotency_key` an applied change is recorded in pos_requests
+        like a sale; a repeat returns that result with `replayed` set. The
+        record follows the price write (setting the same prices again is
+        harmless), so the two don't share a batch.
+        """
+        if idempotency_key:
+            original = self.find_pos_request(idempotency_key, user_phone, shop_id=shop_id)
+            if original is not None:
+                return {**original, 'replayed': True}
+        changed_at = changed_at or datetime.utcnow()
+        ref = self._shop_doc_ref('products', product_id, shop_id)
+        doc = ref.get()
+        data = doc.to_dict() if doc.exists else None
+        if not data or data.get('shop_id') != shop_id:
+            return {'success': False, 'status': 'not_found', 'message': f"Product {product_id} not found"}
+
+        current = {'selling_price': data.get('selling_price', data.get('price')), 'cost_price': data.get('cost_price')}
+        stored_at = data.get('price_updated_at')
+        if stored_at and stored_at > changed_at.isoformat():
+            return {'success': False, 'status': 'conflict', 'price_updated_at': stored_at, **current}
+
+        updates: Dict[str, Any] = {'price_updated_at': changed_at.isoformat()}
+        if selling_price is not None:
+            updates['selling_price'] = float(selling_price)
+        if cost_price is not None:
+            updates['cost_price'] = float(cost_price)
+        self.update_product_fields(product_id, updates)
+        result = {
+            'success': True,
+            'status': 'applied',
+            'price_updated_at': updates['price_updated_at'],
+            'selling_price': updates.get('selling_price', current['selling_price']),
+            'cost_price': updates.get('cost_price', current['cost_price']),
+        }
+        if idempotency_key:
+            record = self._pos_request_record(shop_id, idempotency_key, "price_change", user_phone, result)
+            try:
+                self.db.collection(idempotency.RECORD_COLLECTION).document(
+                    idempotency.record_id(shop_id, idempotency_key)).create(record)
+            except (AlreadyExists, _google_already_exists()):
+                pass  # a concurrent repeat recorded the same change
+            self.pos_request_cache.put(user_phone, idempotency_key, result)
+        return result
+
+    def get_catalog_delta(self, shop_id: str, since: Optional[str] = None) -> Dict[str, Any]:
+        """Products changed after `since` (a cursor from a previous delta; None = all).
+
+        With `since`, `deleted` lists the ids of products deleted after it
+        (see catalog_sync.py). `cursor` is the value to pass as `since` next
+        time.
+        """
+        query = self._shop_query('products', shop_id)
+        if since:
+            query = query.where('updated_at', '>', since)
+        pending = self.sales_journal.pending_entries(shop_id) if self.sales_journal else None
+        products = [self._product_from_doc(doc.to_dict(), pending) for doc in query.stream()]
+        if since and pending:
+            # Journaled stock changes haven't bumped updated_at upstream yet
+            seen = {p.product_id for p in products}
+            for product_id in set(pending) - seen:
+                product = self.get_product(product_id, shop_id)
+                if product:
+                    products.append(product)
+        deleted, stamps = [], [p.updated_at.isoformat() for p in products if p.updated_at]
+        if since:
+            tombstones = (self.db.collection(catalog_sync.TOMBSTONE_COLLECTION)
+                          .where('shop_id', '==', shop_id).where('deleted_at', '>', since))
+            for doc in tombstones.stream():
+                data = doc.to_dict() or {}
+                deleted.append(data.get('product_id', doc.id))
+                stamps.append(data.get('deleted_at') or since)
+        return {
+            'success': True,
+            'products': products,
+            'deleted': deleted,
+            'cursor': catalog_sync.next_cursor(stamps, since),
+        }
+
+    def get_catalog_version(self, shop_id: str) -> Optional[str]:
+        """Newest product write or deletion stamp of a shop's catalog (two single-document reads)."""
+        stamps = []
+        newest = (self._shop_query('products', shop_id)
+                  .order_by('updated_at', direction=DESCENDING).limit(1))
+        newest = projections.select(newest, ('updated_at',))
+        deleted = (self.db.collection(catalog_sync.TOMBSTONE_COLLECTION).where('shop_id', '==', shop_id)
+                   .order_by('deleted_at', direction=DESCENDING).limit(1))
+        for query, field in ((newest, 'updated_at'), (deleted, 'deleted_at')):
+            for doc in query.stream():
+                stamp = (doc.to_dict() or {}).get(field)
+                if stamp:
+                    stamps.append(str(stamp))
+        return max(stamps) if stamps else None
+
+    def get_catalog_etag(self, shop_id: str, variant: str = "") -> str:
+        """ETag of a shop's catalog as /api/stock/products would return it (see catalog_sync.representation)."""
+        pending = self.sales_journal.pending_deltas(shop_id) if self.sales_journal else None
+        return catalog_sync.catalog_etag(shop_id, self.get_catalog_version(shop_id), pending, variant)
+
+    def delete_product(self, shop_id: str, product_id: str) -> bool:
+        """Delete a product and leave a tombstone for catalog deltas."""
+        ref = self._shop_doc_ref('products', product_id, shop_id)
+        doc = ref.get()
+        if not doc.exists or (doc.to_dict() or {}).get('shop_id') != shop_id:
+            return False
+        batch = self.db.batch()
+        self._batch_write(batch, 'delete', ref, None)
+        batch.set(self.db.collection(catalog_sync.TOMBSTONE_COLLECTION).document(product_id), {
+            'shop_id': shop_id,
+            'product_id': product_id,
+            'deleted_at': datetime.utcnow().isoformat(),
+        })
+        batch.commit()
+
+        low_set = self._low_stock_sets.get(shop_id)
+        if low_set is not None:
+            low_set.remove(product_id)
+        index = self._expiry_indexes.get(shop_id)
+        if index is not None and index.remove_product(product_id):
+            self._invalidate_expiry_digest(shop_id)
+        self._forecast_cache.pop(shop_id, None)
+        print(f"🗑️ Deleted product {product_id} from shop {shop_id}")
+        return True
+
+    def start_journal_flusher(self) -> Optional[JournalFlusher]:
+        """Start the background flusher (and replay) if the journal is enabled."""
+        if self.sales_journal is None:
+            return None
+        if self.journal_flusher is None:
+            self.journal_flusher = JournalFlusher(self.sales_journal, self.apply_journal_entries,
+                                                  interval_seconds=Config.SALES_JOURNAL_FLUSH_SECONDS,
+                                                  max_attempts=Config.SALES_JOURNAL_MAX_ATTEMPTS)
+            self.journal_flusher.start()
+        return self.journal_flusher
+
+    def apply_journal_entries(self, entries: List[Dict[str, Any]]) -> List[int]:
+        """Write claimed journal entries upstream; returns the seqs applied.
+
+        Each entry becomes its ledger row (doc id = idempotency key), a stock
+        Increment and, for sales, a sales cube Increment. Entry groups (a
+        checkout's lines) always share one batch; up to JOURNAL_BATCH_ENTRIES
+        entries go per batch. Groups tried before are first checked for an
+        existing ledger row so a batch that already landed is never applied
+        twice. A keyed request's pos_requests record is created, not set: if
+        another worker (another journal) applied the same request first the
+        group's batch fails with AlreadyExists and counts as applied.
+        """
+        groups: Dict[Any, List[Dict[str, Any]]] = {}
+        for entry in entries:
+            groups.setdefault(entry.get("group_key") or entry["seq"], []).append(entry)
+
+        applied: List[int] = []
+        to_write: List[List[Dict[str, Any]]] = []
+        for group in groups.values():
+            first = group[0]
+            if first.get("attempts", 1) > 1:
+                ref = self._shop_collection("transactions", first["shop_id"]).document(first["idempotency_key"])
+                if ref.get().exists:
+                    applied.extend(entry["seq"] for entry in group)
+                    continue
+            to_write.append(group)
+
+        def commit(group: List[Dict[str, Any]]) -> None:
+            batch = self.db.batch()
+            now = datetime.utcnow().isoformat()
+            for entry in group:
+                txn = entry["transaction"]
+                shop_id = entry["shop_id"]
+                self._batch_write(batch, "set",
+                                  self._shop_collection("transactions", shop_id).document(entry["idempotency_key"]), txn)
+                self._batch_write(batch, "update", self._shop_doc_ref("products", entry["product_id"], shop_id), {
+                    "current_stock": self._increment(entry["delta"]),
+                    f"{WATERMARK_FIELD}.{self.sales_journal.journal_id}": entry["seq"],
+                    "updated_at": now,
+                })
+                cube = self._cube_increment(txn)
+                if cube is not None:
+                    batch.set(cube[0], cube[1], merge=True)
+                for doc in entry.get("documents") or []:
+                    ref = self._document_ref(doc["collection"], doc["id"], shop_id)
+                    if doc["collection"] == idempotency.RECORD_COLLECTION:
+                        batch.create(ref, doc["data"])
+                    else:
+                        self._batch_write(batch, "set", ref, doc["data"])
+            batch.commit()
+
+        chunks: List[List[List[Dict[str, Any]]]] = []
+        size = 0
+        for group in to_write:
+            if not chunks or size + len(group) > JOURNAL_BATCH_ENTRIES:
+                chunks.append([])
+                size = 0
+            chunks[-1].append(group)
+            size += len(group)
+
+        written: List[Dict[str, Any]] = []
+        for chunk in chunks:
+            try:
+                commit([entry for group in chunk for entry in group])
+                written.extend(entry for group in chunk for entry in group)
+            except Exception as e:
+                # Isolate the group that can't be applied (e.g. deleted product)
+                print(f"⚠️ Journal batch failed, retrying groups one by one: {e}")
+                for group in chunk:
+                    try:
+                        commit(group)
+                        written.extend(group)
+                    except (AlreadyExists, _google_already_exists()):
+                        # The same keyed request was applied from another journal
+                        applied.extend(entry["seq"] for entry in group)
+                    except Exception as group_err:
+                        print(f"❌ Journal entry {group[0]['idempotency_key']} not applied "
+                              f"({len(group)} in its group): {group_err}")
+
+        applied.extend(entry["seq"] for entry in written)
+        self._after_journal_flush(written)
+        return applied
+
+    def _after_journal_flush(self, written: List[Dict[str, Any]]) -> None:
+        """Refresh per-process caches for movements that just went upstream."""
+        by_product: Dict[str, List[Dict[str, Any]]] = {}
+        shops: Dict[str, str] = {}
+        for entry in written:
+            shops[entry["product_id"]] = entry["shop_id"]
+            by_product.setdefault(entry["product_id"], []).append(entry["transaction"])
+            if entry["transaction"].get("transaction_type") in sales_cube.SALE_TRANSACTION_TYPES:
+                self._forecast_cache.pop(entry["shop_id"], None)
+
+        for product_id, txns in by_product.items():
+            previous_stock, new_stock = txns[0].get("previous_stock"), txns[-1].get("new_stock")
+            product = None
+            try:
+                doc = self._shop_doc_ref("products", product_id, shops[product_id]).get()
+                if doc.exists:
+                    product = Product.from_dict(doc.to_dict())
+                    self._track_low_stock(product, previous_stock, product, new_stock)
+            except Exception as e:
+                print(f"⚠️ Low stock tracking skipped for {product_id}: {e}")
+            self._expiry_stock_changed(shops[product_id], product_id, new_stock, product)
+
     # ==================== UDHAR (CREDIT) OPERATIONS ====================
 
     def create_udhar_entry(
@@ -2282,7 +3769,7 @@ class FirestoreDB:
                 note=note,
             )
 
-            self.db.collection("udhar_entries").document(entry_id).set(entry.to_dict())
+            self._shop_collection("udhar_entries", shop_id).document(entry_id).set(entry.to_dict())
 
             balance = self.get_customer_udhar_balance(shop_id, customer_key)
 
@@ -2305,8 +3792,7 @@ class FirestoreDB:
         """Get current udhar balance for a single customer."""
         try:
             docs = (
-                self.db.collection("udhar_entries")
-                .where("shop_id", "==", shop_id)
+                self._shop_query("udhar_entries", shop_id)
                 .where("customer_key", "==", customer_key)
                 .stream()
             )
@@ -2326,7 +3812,7 @@ class FirestoreDB:
     def get_udhar_summary(self, shop_id: str) -> Dict[str, Any]:
         """Get summary of all customers with outstanding udhar."""
         try:
-            docs = self.db.collection("udhar_entries").where("shop_id", "==", shop_id).stream()
+            docs = self._shop_query("udhar_entries", shop_id).stream()
 
             by_customer: Dict[str, Dict[str, Any]] = {}
 
@@ -2397,8 +3883,7 @@ class FirestoreDB:
                 }
 
             docs = (
-                self.db.collection("udhar_entries")
-                .where("shop_id", "==", shop_id)
+                self._shop_query("udhar_entries", shop_id)
                 .where("customer_key", "==", customer_key)
                 .stream()
             )
@@ -2500,7 +3985,7 @@ class FirestoreDB:
                 resolution_notes=None,
             )
 
-            self.db.collection('unrecognized_commands').document(command_id).set(unrecognized_cmd.to_dict())
+            self._shop_collection('unrecognized_commands', shop_id).document(command_id).set(unrecognized_cmd.to_dict())
             print(f"✅ Saved unrecognized command: {command_id}")
             return unrecognized_cmd
         except Exception as e:
@@ -2513,10 +3998,16 @@ class FirestoreDB:
         include_resolved: bool = False,
         limit: int = 100
     ) -> List[UnrecognizedCommand]:
-        """Get unrecognized commands for a shop."""
+        """Get unrecognized commands for a shop.
+
+        Commands saved before `resolved` was always written are only listed
+        once backfill_command_resolved() has run for the shop.
+        """
         try:
-            # Query only by shop_id to avoid composite index requirement
-            query = self.db.collection('unrecognized_commands').where('shop_id', '==', shop_id)
+            # Equality filters only, so no composite index is required
+            query = self._shop_query("unrecognized_commands", shop_id)
+            if not include_resolved:
+                query = query.where('resolved', '==', False)
 
             docs = query.stream()
             commands = []
@@ -2538,14 +4029,50 @@ class FirestoreDB:
             print(f"Error getting unrecognized commands: {e}")
             return []
 
+    def count_unresolved_commands(self, shop_id: str) -> Dict[str, int]:
+        """Unresolved command counts for the bug dashboard, by message type.
+
+        Aggregation queries on equality filters only, so they are served
+        without downloading the commands or a composite index.
+        """
+        base = (
+            self._shop_query("unrecognized_commands", shop_id)
+            .where('resolved', '==', False)
+        )
+        return {
+            'unresolved': aggregations.count(base),
+            'voice': aggregations.count(base.where('message_type', '==', 'voice')),
+            'text': aggregations.count(base.where('message_type', '==', 'text')),
+        }
+
+    def backfill_command_resolved(self, shop_id: str) -> int:
+        """Write `resolved: False` on a shop's commands saved without the field.
+
+        The command list and the dashboard counts filter on `resolved` in
+        the query, which never matches a document missing it. Run once per
+        shop (tools/backfill_command_resolved.py); returns documents fixed.
+        """
+        missing = [
+            doc.id for doc in self._shop_query("unrecognized_commands", shop_id).stream()
+            if 'resolved' not in (doc.to_dict() or {})
+        ]
+        for start in range(0, len(missing), 400):
+            batch = self.db.batch()
+            for command_id in missing[start:start + 400]:
+                self._batch_write(batch, 'update', self._shop_doc_ref('unrecognized_commands', command_id, shop_id),
+                                  {'resolved': False})
+            batch.commit()
+        return len(missing)
+
     def mark_command_resolved(
         self,
         command_id: str,
-        resolution_notes: Optional[str] = None
+        resolution_notes: Optional[str] = None,
+        shop_id: Optional[str] = None,
     ) -> bool:
         """Mark an unrecognized command as resolved."""
         try:
-            self.db.collection('unrecognized_commands').document(command_id).update({
+            self._shop_doc_ref('unrecognized_commands', command_id, shop_id).update({
                 'resolved': True,
                 'resolution_notes': resolution_notes or "Marked as resolved",
             })
@@ -2555,10 +4082,10 @@ class FirestoreDB:
             print(f"❌ Error marking command as resolved: {e}")
             return False
 
-    def delete_unrecognized_command(self, command_id: str) -> bool:
+    def delete_unrecognized_command(self, command_id: str, shop_id: Optional[str] = None) -> bool:
         """Delete an unrecognized command."""
         try:
-            self.db.collection('unrecognized_commands').document(command_id).delete()
+            self._shop_doc_ref('unrecognized_commands', command_id, shop_id).delete()
             print(f"✅ Deleted unrecognized command: {command_id}")
             return True
         except Exception as e:
@@ -2641,8 +4168,7 @@ class FirestoreDB:
             """Get current udhar balance for a single customer."""
             try:
                 docs = (
-                    self.db.collection("udhar_entries")
-                    .where("shop_id", "==", shop_id)
+                    self._shop_query("udhar_entries", shop_id)
                     .where("customer_key", "==", customer_key)
                     .stream()
                 )
@@ -2662,7 +4188,7 @@ class FirestoreDB:
         def get_udhar_summary(self, shop_id: str) -> Dict[str, Any]:
             """Get summary of all customers with outstanding udhar."""
             try:
-                docs = self.db.collection("udhar_entries").where("shop_id", "==", shop_id).stream()
+                docs = self._shop_query("udhar_entries", shop_id).stream()
 
                 by_customer: Dict[str, Dict[str, Any]] = {}
 
@@ -0,0 +1,239 @@
+"""
+Demand forecasting for predictive stock-out alerts
+
+The old heuristic divided month-to-date sales by the number of days elapsed,
+which is very noisy on the 1st-3rd of a month. Here we look at a rolling
+window of daily per-product sales and compute an exponentially weighted
+daily demand for the whole catalog at once:
+
+    demand[p] = sum_d sales[p][d] * w[d] / sum_d w[d]
+
+The weights `w` are shared by every product, so the whole forecast is one
+matrix-vector product over the (product x day) sales matrix. Optional
+day-of-week seasonality is pooled across the shop (individual SKUs rarely
+have enough sales to estimate their own weekly profile) and folded into the
+same weight vector.
+"""
+from bisect import bisect_left
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# Transaction types that count as a sale (same set the sales reports use)
+SALE_TRANSACTION_TYPES = ("reduce_stock", "sale")
+
+DEFAULT_WINDOW_DAYS = 28
+DEFAULT_HALF_LIFE_DAYS = 7.0
+# Below this many units sold in the window we don't trust a weekday profile
+MIN_UNITS_FOR_SEASONALITY = 50.0
+
+
+@dataclass
+class DemandForecast:
+    """Per-product daily demand for one shop, aligned by index."""
+    product_ids: List[str]
+    daily_demand: List[float]  # exponentially weighted units/day
+    window_sales: List[float]  # raw units sold inside the window
+    weekday_factors: List[float] = field(default_factory=lambda: [1.0] * 7)  # Mon..Sun
+    window_start: Optional[date] = None
+    window_days: int = DEFAULT_WINDOW_DAYS
+    generated_at: Optional[datetime] = None
+
+    def demand_by_product(self) -> Dict[str, float]:
+        return dict(zip(self.product_ids, self.daily_demand))
+
+
+def _as_datetime(value: Any) -> Optional[datetime]:
+    """Parse a stored transaction timestamp (ISO string or datetime)."""
+    if isinstance(value, datetime):
+        return value.replace(tzinfo=None)
+    if isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value.replace("Z", "+00:00")).replace(tzinfo=None)
+        except Exception:
+            return None
+    return None
+
+
+def ewm_weights(window_days: int, half_life_days: float = DEFAULT_HALF_LIFE_DAYS) -> List[float]:
+    """Exponential weights for day offsets 0..window_days-1 (oldest first).
+
+    The most recent day has weight 1.0 and a day `half_life_days` older has
+    weight 0.5.
+    """
+    decay = 0.5 ** (1.0 / max(half_life_days, 1e-6))
+    return [decay ** (window_days - 1 - d) for d in range(window_days)]
+
+
+def build_daily_sales_matrix(
+    transactions: Iterable[Dict[str, Any]],
+    window_start: date,
+    window_days: int,
+) -> Tuple[List[str], List[List[float]]]:
+    """Bucket sale transactions into a (product x day) quantity matrix.
+
+    `transactions` are raw transaction dicts as stored in Firestore. Rows
+    follow the order in which products are first seen.
+    """
+    row_by_product: Dict[str, int] = {}
+    matrix: List[List[float]] = []
+
+    for txn in transactions:
+        if txn.get("transaction_type") not in SALE_TRANSACTION_TYPES:
+            continue
+        product_id = txn.get("product_id")
+        ts = _as_datetime(txn.get("timestamp"))
+        if not product_id or ts is None:
+            continue
+        day = (ts.date() - window_start).days
+        if not 0 <= day < window_days:
+            continue
+        try:
+            qty = abs(float(txn.get("quantity", 0) or 0))
+        except Exception:
+            continue
+
+        row = row_by_product.get(product_id)
+        if row is None:
+            row = len(matrix)
+            row_by_product[product_id] = row
+            matrix.append([0.0] * window_days)
+        matrix[row][day] += qty
+
+    return list(row_by_product), matrix
+
+
+def weekday_factors(matrix: List[List[float]], window_start: date) -> List[float]:
+    """Shop-wide day-of-week multipliers (Mon..Sun, mean 1.0).
+
+    Falls back to a flat profile when the window holds too few sales or
+    does not cover every weekday.
+    """
+    if not matrix:
+        return [1.0] * 7
+    window_days = len(matrix[0])
+    if window_days < 7:
+        return [1.0] * 7
+
+    # Column sums = total units sold per day across the catalog
+    day_totals = [sum(col) for col in zip(*matrix)]
+    total = sum(day_totals)
+    if total < MIN_UNITS_FOR_SEASONALITY:
+        return [1.0] * 7
+
+    start_wd = window_start.weekday()
+    per_weekday = [0.0] * 7
+    occurrences = [0] * 7
+    for d, units in enumerate(day_totals):
+        wd = (start_wd + d) % 7
+        per_weekday[wd] += units
+        occurrences[wd] += 1
+
+    daily_mean = total / window_days
+    factors = []
+    for wd in range(7):
+        raw = (per_weekday[wd] / occurrences[wd]) / daily_mean if occurrences[wd] else 1.0
+        # Clamp so one odd festival day can't dominate the profile
+        factors.append(min(4.0, max(0.25, raw)))
+
+    mean_factor = sum(factors) / 7.0
+    return [f / mean_factor for f in factors]
+
+
+def forecast_demand(
+    transactions: Iterable[Dict[str, Any]],
+    today: date,
+    window_days: int = DEFAULT_WINDOW_DAYS,
+    half_life_days: float = DEFAULT_HALF_LIFE_DAYS,
+    seasonality: bool = True,
+) -> DemandForecast:
+    """Compute exponentially weighted daily demand for every sold product.
+
+    The window ends yesterday (today is still in progress and would drag
+    every estimate down until closing time).
+    """
+    window_start = today - timedelta(days=window_days)
+    product_ids, matrix = build_daily_sales_matrix(transactions, window_start, window_days)
+
+    factors = weekday_factors(matrix, window_start) if seasonality else [1.0] * 7
+
+    # Fold de-seasonalization into the weight vector: sales on a busy
+    # weekday count for less, sales on a quiet weekday for more.
+    weights = ewm_weights(window_days, half_life_days)
+    weight_sum = sum(weights)
+    start_wd = window_start.weekday()
+    adjusted = [w / factors[(start_wd + d) % 7] for d, w in enumerate(weights)]
+
+    demand = [sum(q * a for q, a in zip(row, adjusted)) / weight_sum for row in matrix]
+    window_sales = [sum(row) for row in matrix]
+
+    return DemandForecast(
+        product_ids=product_ids,
+        daily_demand=demand,
+        window_sales=window_sales,
+        weekday_factors=factors,
+        window_start=window_start,
+        window_days=window_days,
+        generated_at=datetime.utcnow(),
+    )
+
+
+def days_to_stockout(
+    forecast: DemandForecast,
+    stock_by_product: Dict[str, float],
+    today: date,
+    horizon_days: int = 28,
+) -> Dict[str, float]:
+    """Predict days until each product's stock runs out.
+
+    Only products with positive demand and positive stock are returned.
+    Future demand follows the weekday profile starting today; beyond
+    `horizon_days` the average (flat) rate is assumed.
+    """
+    # Cumulative seasonal "demand-days" from today, shared by every SKU
+    today_wd = today.weekday()
+    day_factors = [forecast.weekday_factors[(today_wd + i) % 7] for i in range(horizon_days)]
+    cumulative: List[float] = []
+    running = 0.0
+    for f in day_factors:
+        running += f
+        cumulative.append(running)
+
+    result: Dict[str, float] = {}
+    for product_id, demand in zip(forecast.product_ids, forecast.daily_demand):
+        stock = stock_by_product.get(product_id)
+        if stock is None or stock <= 0 or demand <= 0:
+            continue
+        target = stock / demand
+        if target > cumulative[-1]:
+            result[product_id] = horizon_days + (target - cumulative[-1])
+            continue
+        idx = bisect_left(cumulative, target)
+        previous = cumulative[idx - 1] if idx > 0 else 0.0
+        result[product_id] = idx + (target - previous) / day_factors[idx]
+    return result
+
+
+def month_to_date_velocity(
+    transactions: Iterable[Dict[str, Any]],
+    now: datetime,
+) -> Tuple[Dict[str, float], int]:
+    """The previous heuristic (month-to-date units / days elapsed).
+
+    Kept for the accuracy benchmark in benchmarks/bench_demand_forecast.py.
+    """
+    month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    days_elapsed = (now - month_start).days + 1
+    sold: Dict[str, float] = {}
+    for txn in transactions:
+        if txn.get("transaction_type") not in SALE_TRANSACTION_TYPES:
+            continue
+        ts = _as_datetime(txn.get("timestamp"))
+        if ts is None or not month_start <= ts <= now:
+            continue
+        pid = txn.get("product_id")
+        try:
+            sold[pid] = sold.get(pid, 0.0) + abs(float(txn.get("quantity", 0) or 0))
+        except Exception:
+            continue
+    return {pid: qty / days_elapsed for pid, qty in sold.items()}, days_elapsed
@@ -0,0 +1,43 @@
+"""
+Demo catalog for POST /api/seed-demo-products (imported only when seeding)
+"""
+
+DEMO_PRODUCTS = [
+    # Vegetables (loose / per kg)
+    {"name":"Onion",              "barcode":"VEG-001", "selling_price":30,  "stock":50,  "unit":"kg"},
+    {"name":"Tomato",             "barcode":"VEG-002", "selling_price":25,  "stock":40,  "unit":"kg"},
+    {"name":"Potato",             "barcode":"VEG-003", "selling_price":22,  "stock":60,  "unit":"kg"},
+    {"name":"Garlic",             "barcode":"VEG-004", "selling_price":200, "stock":20,  "unit":"kg"},
+    {"name":"Ginger",             "barcode":"VEG-005", "selling_price":120, "stock":25,  "unit":"kg"},
+    {"name":"Carrot",             "barcode":"VEG-006", "selling_price":40,  "stock":35,  "unit":"kg"},
+    {"name":"Capsicum",           "barcode":"VEG-007", "selling_price":60,  "stock":30,  "unit":"kg"},
+    {"name":"Cauliflower",        "barcode":"VEG-008", "selling_price":35,  "stock":20,  "unit":"kg"},
+    {"name":"Spinach",            "barcode":"VEG-009", "selling_price":20,  "stock":15,  "unit":"kg"},
+    {"name":"Brinjal",            "barcode":"VEG-010", "selling_price":30,  "stock":25,  "unit":"kg"},
+    {"name":"Bhindi",             "barcode":"VEG-011", "selling_price":45,  "stock":20,  "unit":"kg"},
+    {"name":"Cucumber",           "barcode":"VEG-012", "selling_price":25,  "stock":30,  "unit":"kg"},
+    {"name":"Lemon",              "barcode":"VEG-013", "selling_price":80,  "stock":10,  "unit":"kg"},
+    {"name":"Green Chilli",       "barcode":"VEG-014", "selling_price":60,  "stock":15,  "unit":"kg"},
+    {"name":"Peas",               "barcode":"VEG-015", "selling_price":50,  "stock":20,  "unit":"kg"},
+    # Packaged goods
+    {"name":"Maggi Noodles",      "barcode":"8901058001329", "selling_price":14,  "stock":120, "unit":"pieces"},
+    {"name":"Amul Butter 500g",   "barcode":"8901063028481", "selling_price":55,  "stock":60,  "unit":"pieces"},
+    {"name":"Tata Salt 1kg",      "barcode":"8901058852017", "selling_price":22,  "stock":200, "unit":"pieces"},
+    {"name":"Parle-G Biscuit",    "barcode":"8901820000059", "selling_price":10,  "stock":300, "unit":"pieces"},
+    {"name":"Aashirvaad Atta 5kg","barcode":"8901725133496", "selling_price":280, "stock":45,  "unit":"pieces"},
+    {"name":"Surf Excel 1kg",     "barcode":"8901030827372", "selling_price":190, "stock":80,  "unit":"pieces"},
+    {"name":"Amul Milk 1L",       "barcode":"8901063013739", "selling_price":60,  "stock":150, "unit":"pieces"},
+    {"name":"Lifebuoy Soap",      "barcode":"8901030728931", "selling_price":35,  "stock":90,  "unit":"pieces"},
+    {"name":"Colgate 200g",       "barcode":"8901030038591", "selling_price":89,  "stock":70,  "unit":"pieces"},
+    {"name":"Dettol Handwash",    "barcode":"6290255052136", "selling_price":115, "stock":55,  "unit":"pieces"},
+    {"name":"Bru Coffee 100g",    "barcode":"8901030784576", "selling_price":199, "stock":40,  "unit":"pieces"},
+    {"name":"Good Day Biscuit",   "barcode":"8901820007812", "selling_price":30,  "stock":180, "unit":"pieces"},
+    {"name":"Haldiram Mixture",   "barcode":"8906002960019", "selling_price":50,  "stock":95,  "unit":"pieces"},
+    {"name":"Saffola Oil 1L",     "barcode":"8901058009622", "selling_price":165, "stock":35,  "unit":"pieces"},
+    {"name":"Lays Chips",         "barcode":"8901491502606", "selling_price":20,  "stock":200, "unit":"pieces"},
+    {"name":"Dairy Milk 40g",     "barcode":"8901233051400", "selling_price":40,  "stock":110, "unit":"pieces"},
+    {"name":"Tata Tea Gold 250g", "barcode":"8901058003279", "selling_price":165, "stock":60,  "unit":"pieces"},
+    {"name":"Vim Dishwash Bar",   "barcode":"8901030007490", "selling_price":30,  "stock":75,  "unit":"pieces"},
+    {"name":"Frooti Mango 200ml", "barcode":"8906022302888", "selling_price":15,  "stock":250, "unit":"pieces"},
+    {"name":"Rin Detergent 1kg",  "barcode":"8901030861278", "selling_price":90,  "stock":65,  "unit":"pieces"},
+]
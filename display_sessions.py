@@ -0,0 +1,90 @@
+"""
+Live customer-display sessions (the cart mirrored on a customer-facing screen)
+
+The cashier screen creates a session and PATCHes it on every scan; the
+customer screen polls it every ~1.5 s. Sessions live in the worker's
+memory, shared by all of its request threads/greenlets:
+
+- every read and update holds the store's lock, and readers get a copy,
+  so a poll never serializes a cart halfway through an update
+- sessions untouched for DISPLAY_SESSION_TTL_SECONDS (default 12 h) are
+  dropped, so a long-running worker doesn't keep every cart it ever saw
+"""
+import copy
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from config import Config
+
+UPDATABLE_FIELDS = ('items', 'grand_total', 'status', 'subtotal', 'tax_amt', 'tax_name', 'tax_rate', 'currency')
+
+
+def session_ttl_seconds() -> float:
+    return Config.DISPLAY_SESSION_TTL_SECONDS
+
+
+class DisplaySessionStore:
+    """Thread-safe in-memory display sessions, expired after a TTL."""
+
+    def __init__(self, ttl_seconds: Optional[float] = None):
+        self.ttl_seconds = session_ttl_seconds() if ttl_seconds is None else ttl_seconds
+        self._lock = threading.Lock()
+        self._sessions: Dict[str, Dict[str, Any]] = {}
+        self._touched: Dict[str, float] = {}
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def create(self, shop_name: str = 'Kirana Shop') -> str:
+        sid = str(uuid.uuid4())
+        session = {
+            'session_id': sid,
+            'shop_name': shop_name,
+            'items': [],
+            'grand_total': 0,
+            'subtotal': 0,
+            'tax_amt': 0,
+            'tax_name': None,
+            'tax_rate': 0,
+            'currency': '₹',
+            'status': 'active',
+            'updated_at': datetime.utcnow().isoformat(),
+        }
+        with self._lock:
+            self._expire()
+            self._sessions[sid] = session
+            self._touched[sid] = time.monotonic()
+        return sid
+
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """A copy of the session, or None if unknown or expired."""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None or self._expired(session_id):
+                return None
+            return copy.deepcopy(session)
+
+    def update(self, session_id: str, data: Dict[str, Any]) -> bool:
+        """Apply the cashier's changes; False if the session is unknown or expired."""
+        changes = {field: copy.deepcopy(data[field]) for field in UPDATABLE_FIELDS if field in data}
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None or self._expired(session_id):
+                return False
+            session.update(changes)
+            session['updated_at'] = datetime.utcnow().isoformat()
+            self._touched[session_id] = time.monotonic()
+            return True
+
+    def _expired(self, session_id: str) -> bool:
+        return time.monotonic() - self._touched.get(session_id, 0.0) > self.ttl_seconds
+
+    def _expire(self) -> None:
+        # Called with the lock held
+        cutoff = time.monotonic() - self.ttl_seconds
+        for sid in [sid for sid, touched in self._touched.items() if touched < cutoff]:
+            self._sessions.pop(sid, None)
+            self._touched.pop(sid, None)
@@ -0,0 +1,216 @@
+"""
+Expiry date normalization and per-shop expiry index
+
+Expiry dates are stored in one canonical form, "YYYY-MM-DD", normalized when
+products are written (stock UI PATCH, /api/stock/create-product,
+tools/reset_products.py). Because ISO dates sort the same way as strings,
+the index can answer "expired" and "expiring in N days" by bisecting a
+sorted list instead of parsing every batch of every product.
+"""
+import threading
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+# Formats accepted from older documents and hand-typed input
+_EXPIRY_FORMATS = ("%Y-%m-%d", "%d-%m-%Y", "%d/%m/%Y", "%Y/%m/%d")
+
+
+def normalize_expiry_date(value: Any) -> Optional[str]:
+    """Return an expiry date as "YYYY-MM-DD", or None if empty.
+
+    Raises ValueError for values that can't be read as a date so callers
+    can reject bad input at write time.
+    """
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.date().isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    if not isinstance(value, str):
+        raise ValueError(f"Invalid expiry date: {value!r}")
+
+    text = value.strip()
+    if not text:
+        return None
+    try:
+        return datetime.fromisoformat(text).date().isoformat()
+    except ValueError:
+        pass
+    for fmt in _EXPIRY_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).date().isoformat()
+        except ValueError:
+            continue
+    raise ValueError(f"Invalid expiry date: {value!r}")
+
+
+def normalize_batches(batches: Dict[str, Any]) -> Dict[str, Any]:
+    """Copy a batches map with every expiry under `expiry_date` in ISO form.
+
+    The legacy `expiry` key is folded into `expiry_date`.
+    """
+    normalized: Dict[str, Any] = {}
+    for batch_id, batch in (batches or {}).items():
+        if not isinstance(batch, dict):
+            normalized[batch_id] = batch
+            continue
+        batch = dict(batch)
+        raw = batch.pop("expiry", None)
+        if batch.get("expiry_date") is None:
+            batch["expiry_date"] = raw
+        batch["expiry_date"] = normalize_expiry_date(batch.get("expiry_date"))
+        normalized[batch_id] = batch
+    return normalized
+
+
+def _lenient_date(value: Any) -> Optional[str]:
+    try:
+        return normalize_expiry_date(value)
+    except ValueError:
+        return None
+
+
+@dataclass
+class ExpiryEntry:
+    """One dated stock item: a batch, or a whole product (legacy expiry)."""
+    expiry_date: str  # canonical YYYY-MM-DD
+    product_id: str
+    name: str
+    unit: str
+    brand: Optional[str] = None
+    batch_id: Optional[str] = None
+    qty: Optional[float] = None  # batch quantity; None -> use product stock
+    stock: float = 0.0  # product current_stock (used when qty is None)
+
+    def to_report(self) -> Dict[str, Any]:
+        info = {
+            "name": self.name,
+            "brand": self.brand,
+            "stock": self.qty if self.qty is not None else self.stock,
+            "unit": self.unit,
+            "expiry_date": self.expiry_date,
+        }
+        if self.batch_id is not None:
+            info["batch_id"] = self.batch_id
+        return info
+
+
+def entries_for_product(product: Any) -> List[ExpiryEntry]:
+    """Index entries for one Product.
+
+    Batch expiries win; the product-level `expiry_date` is only used when
+    no batch has a usable date (same rule the old report applied).
+    """
+    name = product.name
+    unit = product.unit
+    brand = getattr(product, "brand", None)
+    stock = float(product.current_stock or 0)
+    entries: List[ExpiryEntry] = []
+
+    batches = getattr(product, "batches", None)
+    if isinstance(batches, dict):
+        for batch_id, batch in batches.items():
+            if not isinstance(batch, dict):
+                continue
+            # Older documents may still hold non-canonical dates
+            exp = _lenient_date(batch.get("expiry_date") or batch.get("expiry"))
+            if not exp:
+                continue
+            qty_raw = batch.get("qty") or batch.get("quantity")
+            try:
+                qty = float(qty_raw) if qty_raw is not None else None
+            except Exception:
+                qty = None
+            entries.append(ExpiryEntry(exp, product.product_id, name, unit, brand, batch_id, qty, stock))
+
+    if not entries:
+        exp = _lenient_date(getattr(product, "expiry_date", None))
+        if exp:
+            entries.append(ExpiryEntry(exp, product.product_id, name, unit, brand, None, None, stock))
+    return entries
+
+
+class ExpiryIndex:
+    """Date-ordered expiry entries for one shop.
+
+    Request threads share a shop's index, so changes and range reads hold a
+    lock: _entries and _dates must move together.
+    """
+
+    def __init__(self, entries: Iterable[ExpiryEntry] = ()):
+        self._lock = threading.RLock()
+        self._entries: List[ExpiryEntry] = []
+        self._dates: List[str] = []
+        self._by_product: Dict[str, List[ExpiryEntry]] = {}
+        self.built_at = datetime.utcnow()
+        for entry in entries:
+            self._insert(entry)
+
+    @classmethod
+    def from_products(cls, products: Iterable[Any]) -> "ExpiryIndex":
+        entries: List[ExpiryEntry] = []
+        for p in products:
+            entries.extend(entries_for_product(p))
+        entries.sort(key=lambda e: (e.expiry_date, e.name))
+        index = cls()
+        index._entries = entries
+        index._dates = [e.expiry_date for e in entries]
+        for e in entries:
+            index._by_product.setdefault(e.product_id, []).append(e)
+        return index
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _insert(self, entry: ExpiryEntry) -> None:
+        # Keep (expiry_date, name) order; same-date runs are short. Caller holds the lock.
+        pos = bisect_left(self._dates, entry.expiry_date)
+        end = bisect_right(self._dates, entry.expiry_date)
+        while pos < end and self._entries[pos].name <= entry.name:
+            pos += 1
+        self._entries.insert(pos, entry)
+        self._dates.insert(pos, entry.expiry_date)
+        self._by_product.setdefault(entry.product_id, []).append(entry)
+
+    def remove_product(self, product_id: str) -> bool:
+        """Drop a product's entries; returns True if it had any."""
+        with self._lock:
+            if product_id not in self._by_product:
+                return False
+            self._by_product.pop(product_id)
+            kept = [e for e in self._entries if e.product_id != product_id]
+            self._entries = kept
+            self._dates = [e.expiry_date for e in kept]
+            return True
+
+    def set_product(self, product: Any) -> bool:
+        """Replace a product's entries; returns True if the index changed."""
+        entries = entries_for_product(product)
+        with self._lock:
+            had = self.remove_product(product.product_id)
+            for entry in entries:
+                self._insert(entry)
+        return had or bool(entries)
+
+    def update_stock(self, product_id: str, new_stock: float) -> bool:
+        """Refresh product stock; True if a product-level entry shows it."""
+        shown = False
+        for entry in self._by_product.get(product_id, []):
+            entry.stock = float(new_stock or 0)
+            shown = shown or entry.qty is None
+        return shown
+
+    def expired(self, today: date) -> List[ExpiryEntry]:
+        """Entries with expiry date before today."""
+        with self._lock:
+            return self._entries[:bisect_left(self._dates, today.isoformat())]
+
+    def expiring(self, today: date, cutoff: date) -> List[ExpiryEntry]:
+        """Entries expiring between today and cutoff (both inclusive)."""
+        with self._lock:
+            lo = bisect_left(self._dates, today.isoformat())
+            hi = bisect_right(self._dates, cutoff.isoformat())
+            return self._entries[lo:hi]
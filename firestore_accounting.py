@@ -0,0 +1,298 @@
+"""
+Firestore read/write accounting per request and per command
+
+Firestore bills per document read, written and deleted, so FirestoreDB and
+OTPService talk to the client through `wrap(client)`: a transparent proxy
+over the client and every reference, query, batch and snapshot it hands
+out, which counts what each call costs:
+
+    doc_ref.get()                   1 read
+    query.stream() / query.get()    1 read per document (1 if none match)
+    aggregation .get()              1 read (per 1000 index entries upstream)
+    ref.set/update/create/delete    1 write or delete
+    batch.commit()                  its writes and deletes, 1 round trip
+    client.get_all(refs)            1 read per document, 1 round trip
+
+Every call that reaches the server is also a round trip (rpc). Counts go to
+each open scope:
+
+    with firestore_accounting.measure() as usage:
+        db.get_sales_report(shop_id)
+    usage.reads, usage.writes, usage.deletes, usage.rpcs
+
+The app opens a scope per request and CommandProcessor one per command
+action; both are totalled in kirana_firestore_documents_total /
+kirana_firestore_rpcs_total (labelled by route) and
+kirana_firestore_command_documents_total (by action) on /metrics. With
+FIRESTORE_USAGE_HEADER=1 responses carry an X-Firestore-Usage header, and
+FIRESTORE_READ_BUDGET logs requests that read more than that.
+
+Tests pin a code path's cost with a read budget:
+
+    with firestore_accounting.read_budget(5):
+        db.get_product(product_id)      # ReadBudgetExceeded past 5 reads
+
+The SQLite backend is counted the same way, so budgets hold in tests.
+FIRESTORE_ACCOUNTING=0 hands out the bare client instead.
+"""
+import contextlib
+import contextvars
+import threading
+from dataclasses import dataclass
+from typing import Any, Iterator, Optional
+
+from config import Config
+import tracing
+
+# Store objects handed out through the proxy (same names on both backends)
+_WRAPPED_TYPES = {
+    "Client", "SQLiteClient", "CollectionReference", "DocumentReference", "Query",
+    "CollectionGroup", "WriteBatch", "AggregationQuery",
+}
+
+DOCUMENTS = tracing.REGISTRY.counter(
+    "kirana_firestore_documents_total",
+    "Firestore documents read, written and deleted, by route.",
+    ("op", "route"),
+)
+RPCS = tracing.REGISTRY.counter(
+    "kirana_firestore_rpcs_total",
+    "Firestore round trips, by route.",
+    ("route",),
+)
+COMMAND_DOCUMENTS = tracing.REGISTRY.counter(
+    "kirana_firestore_command_documents_total",
+    "Firestore documents read, written and deleted while executing a command, by action.",
+    ("op", "action"),
+)
+
+
+class ReadBudgetExceeded(AssertionError):
+    pass
+
+
+@dataclass
+class Usage:
+    reads: int = 0
+    writes: int = 0
+    deletes: int = 0
+    rpcs: int = 0
+
+    def header(self) -> str:
+        return f"reads={self.reads}; writes={self.writes}; deletes={self.deletes}; rpcs={self.rpcs}"
+
+
+_scopes: contextvars.ContextVar = contextvars.ContextVar("kirana_firestore_scopes", default=())
+# Worker threads running in a copy of the request's context share its scopes
+_record_lock = threading.Lock()
+
+
+def _record(reads: int = 0, writes: int = 0, deletes: int = 0, rpcs: int = 0) -> None:
+    scopes = _scopes.get()
+    if not scopes:
+        return
+    with _record_lock:
+        for usage in scopes:
+            usage.reads += reads
+            usage.writes += writes
+            usage.deletes += deletes
+            usage.rpcs += rpcs
+
+
+def begin() -> Usage:
+    """Open a scope in this context; close it with end()."""
+    usage = Usage()
+    _scopes.set(_scopes.get() + (usage,))
+    return usage
+
+
+def end(usage: Usage) -> Usage:
+    _scopes.set(tuple(u for u in _scopes.get() if u is not usage))
+    return usage
+
+
+@contextlib.contextmanager
+def measure() -> Iterator[Usage]:
+    usage = begin()
+    try:
+        yield usage
+    finally:
+        end(usage)
+
+
+@contextlib.contextmanager
+def read_budget(max_reads: int) -> Iterator[Usage]:
+    """Fail (ReadBudgetExceeded) if the block reads more than `max_reads` documents."""
+    with measure() as usage:
+        yield usage
+    if usage.reads > max_reads:
+        raise ReadBudgetExceeded(f"read {usage.reads} documents, budget is {max_reads} ({usage.header()})")
+
+
+def observe_request(route: str, usage: Usage) -> None:
+    for op, count in (("read", usage.reads), ("write", usage.writes), ("delete", usage.deletes)):
+        if count:
+            DOCUMENTS.inc(count, op=op, route=route)
+    if usage.rpcs:
+        RPCS.inc(usage.rpcs, route=route)
+
+
+def observe_command(action: str, usage: Usage) -> None:
+    for op, count in (("read", usage.reads), ("write", usage.writes), ("delete", usage.deletes)):
+        if count:
+            COMMAND_DOCUMENTS.inc(count, op=op, action=action)
+
+
+def read_budget_per_request() -> Optional[int]:
+    """FIRESTORE_READ_BUDGET, or None when unset."""
+    return Config.FIRESTORE_READ_BUDGET or None
+
+
+def usage_header_enabled() -> bool:
+    return Config.FIRESTORE_USAGE_HEADER
+
+
+def wrap(client: Any) -> Any:
+    """The client behind an accounting proxy (unless FIRESTORE_ACCOUNTING=0)."""
+    if not Config.FIRESTORE_ACCOUNTING:
+        return client
+    return _wrap(client)
+
+
+def _wrap(value: Any) -> Any:
+    name = type(value).__name__
+    if name == "DocumentSnapshot":
+        return _Snapshot(value)
+    if name in _WRAPPED_TYPES:
+        return _Proxy(value)
+    return value
+
+
+def _unwrap(value: Any) -> Any:
+    if isinstance(value, (_Proxy, _Snapshot)):
+        return value._target
+    if isinstance(value, list):
+        return [_unwrap(v) for v in value]
+    if isinstance(value, tuple):
+        return tuple(_unwrap(v) for v in value)
+    return value
+
+
+def _count_stream(docs: Any) -> Iterator[Any]:
+    _record(rpcs=1)
+    seen = 0
+    try:
+        for doc in docs:
+            seen += 1
+            _record(reads=1)
+            yield _wrap(doc)
+    finally:
+        if not seen:
+            # An empty query result is still billed one read
+            _record(reads=1)
+
+
+class _Proxy:
+    """Forwards everything to the wrapped store object, counting billable calls."""
+
+    __slots__ = ("_target", "_pending")
+
+    def __init__(self, target: Any):
+        object.__setattr__(self, "_target", target)
+        object.__setattr__(self, "_pending", [0, 0])  # batch writes, deletes
+
+    def __getattr__(self, name: str) -> Any:
+        value = getattr(self._target, name)
+        if not callable(value):
+            return _wrap(value)
+
+        def call(*args: Any, **kwargs: Any) -> Any:
+            return self._call(name, value, args, kwargs)
+        return call
+
+    def _call(self, name: str, method: Any, args: Any, kwargs: Any) -> Any:
+        kind = type(self._target).__name__
+        args = tuple(_unwrap(a) for a in args)
+        kwargs = {k: _unwrap(v) for k, v in kwargs.items()}
+
+        if kind == "WriteBatch" and name in ("set", "update", "create", "delete"):
+            self._pending[1 if name == "delete" else 0] += 1
+            return method(*args, **kwargs)
+        if kind == "WriteBatch" and name == "commit":
+            writes, deletes = self._pending
+            result = method(*args, **kwargs)
+            self._pending[0] = self._pending[1] = 0
+            _record(writes=writes, deletes=deletes, rpcs=1)
+            return result
+        if name == "stream" and kind != "AggregationQuery":
+            return _count_stream(method(*args, **kwargs))
+        if name == "get" and kind == "DocumentReference":
+            result = method(*args, **kwargs)
+            _record(reads=1, rpcs=1)
+            return _wrap(result)
+        if name in ("get", "stream") and kind == "AggregationQuery":
+            result = method(*args, **kwargs)
+            _record(reads=1, rpcs=1)
+            return result
+        if name == "get" and kind in ("Query", "CollectionReference", "CollectionGroup"):
+            docs = list(method(*args, **kwargs))
+            _record(reads=max(1, len(docs)), rpcs=1)
+            return [_wrap(doc) for doc in docs]
+        if name in ("set", "update", "create", "delete") and kind == "DocumentReference":
+            result = method(*args, **kwargs)
+            if name == "delete":
+                _record(deletes=1, rpcs=1)
+            else:
+                _record(writes=1, rpcs=1)
+            return result
+        if name == "add" and kind == "CollectionReference":
+            result = method(*args, **kwargs)
+            _record(writes=1, rpcs=1)
+            return result
+        if name in ("get_all", "list_documents"):
+            docs = list(method(*args, **kwargs))
+            _record(reads=len(docs), rpcs=1)
+            return [_wrap(doc) for doc in docs]
+        return _wrap(method(*args, **kwargs))
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        setattr(self._target, name, value)
+
+    def __eq__(self, other: Any) -> bool:
+        return self._target == _unwrap(other)
+
+    def __hash__(self) -> int:
+        return hash(self._target)
+
+    def __repr__(self) -> str:
+        return f"<accounted {self._target!r}>"
+
+
+class _Snapshot:
+    """A read result; nothing on it is billed, only its `reference` needs wrapping.
+
+    Kept apart from _Proxy because catalog scans create thousands of these.
+    """
+
+    __slots__ = ("_target",)
+
+    def __init__(self, target: Any):
+        self._target = target
+
+    def to_dict(self) -> Any:
+        return self._target.to_dict()
+
+    @property
+    def id(self) -> str:
+        return self._target.id
+
+    @property
+    def exists(self) -> bool:
+        return self._target.exists
+
+    @property
+    def reference(self) -> Any:
+        return _Proxy(self._target.reference)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._target, name)
@@ -1,6 +1,41 @@
 import os
+import sys
 
-bind    = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
-workers = 2
-timeout = 120
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
+import concurrency  # noqa: E402
+
+# SERVING_MODE=gthread (default) | gevent | sync; see concurrency.py
+_settings = concurrency.gunicorn_settings()
+
+bind               = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+worker_class       = _settings["worker_class"]
+workers            = _settings["workers"]
+threads            = _settings["threads"]
+worker_connections = _settings["worker_connections"]
+timeout            = _settings["timeout"]
+graceful_timeout   = _settings["graceful_timeout"]
+keepalive          = _settings["keepalive"]
+
+
+def when_ready(server):
+    per_worker = {"gthread": threads, "gevent": worker_connections}.get(worker_class, 1)
+    server.log.info(f"Serving mode {_settings['mode']}: {workers} workers x {per_worker} concurrent requests")
+
+
+def post_worker_init(worker):
+    """Fail fast on bad config, then build the services (database, OpenAI,
+    WhatsApp...) in the background so the worker can answer straight away.
+    WARM_SERVICES=0 leaves them to the first request that needs them."""
+    import services
+    from config import Config
+
+    concurrency.init_worker(_settings["mode"])
+    try:
+        services.check_config()
+    except ValueError as e:
+        worker.log.error(f"Configuration error: {e}")
+        # Exit code 3 is gunicorn's worker boot error: the arbiter stops instead of respawning
+        os._exit(3)
+    if Config.WARM_SERVICES:
+        services.warm_in_background()
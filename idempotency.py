@@ -0,0 +1,90 @@
+"""
+Idempotent POS requests: client-supplied keys for sales and returns
+
+The counter tablet sends an `Idempotency-Key` header (or `idempotency_key`
+in the body) with /api/sales/record and /api/sales/return, and reuses it
+when it retries after a timeout. The first request's answer is stored in
+pos_requests/{shop_id}_{key hash}, written in the same batch (or sales
+journal entry group) as its stock changes, so a request is either fully
+applied with its record or not at all. Ledger row and bill ids are derived
+from the key, so even a racing duplicate lands on the same documents.
+
+A repeat is answered with the stored response. A bounded in-process LRU of
+recent responses sits in front of the store, so retries that reach the same
+worker need no reads at all (IDEMPOTENCY_CACHE_SIZE, default 10000).
+"""
+import hashlib
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from config import Config
+
+RECORD_COLLECTION = "pos_requests"
+
+MAX_KEY_LENGTH = 128
+
+_NAMESPACE = uuid.UUID("6f1c1b8e-5d4a-4f5e-9a57-3b0c2e7d9a11")
+
+
+def cache_size() -> int:
+    """Response cache capacity (IDEMPOTENCY_CACHE_SIZE, default 10000)."""
+    return Config.IDEMPOTENCY_CACHE_SIZE
+
+
+def clean_key(key: Any) -> Optional[str]:
+    """The key as sent, or None if it's missing or unusable."""
+    if key is None:
+        return None
+    key = str(key).strip()
+    if not key or len(key) > MAX_KEY_LENGTH:
+        return None
+    return key
+
+
+def record_id(shop_id: str, key: str) -> str:
+    """Document id of a request's record (keys may hold characters ids can't)."""
+    return f"{shop_id}_{hashlib.sha256(key.encode('utf-8')).hexdigest()[:32]}"
+
+
+def derived_id(shop_id: str, key: str, part: Any) -> str:
+    """Stable document id for one write of a keyed request (a line, the bill)."""
+    return str(uuid.uuid5(_NAMESPACE, f"{shop_id}:{key}:{part}"))
+
+
+class ResponseCache:
+    """Thread-safe LRU of recent responses by (scope, key).
+
+    The scope is the caller's phone, known before any read.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._items: "OrderedDict[Any, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, scope: str, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            response = self._items.get((scope, key))
+            if response is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end((scope, key))
+            self.hits += 1
+            return response
+
+    def put(self, scope: str, key: str, response: Dict[str, Any]) -> None:
+        if self.capacity <= 0:
+            return
+        with self._lock:
+            self._items[(scope, key)] = response
+            self._items.move_to_end((scope, key))
+            while len(self._items) > self.capacity:
+                self._items.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"size": len(self._items), "capacity": self.capacity, "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,254 @@
+"""
+Transaction ledger compaction: monthly summaries plus a cold archive
+
+Ledger rows older than a horizon (LEDGER_COMPACTION_HORIZON_DAYS, default
+365) are compacted a whole month at a time by tools/compact_ledger.py:
+
+    1. the month's raw rows are written to the archive
+    2. ledger_summaries/{shop_id}_{YYYY-MM} records, per (product, name,
+       transaction type), the row count, summed quantity and summed amount
+    3. the raw rows are deleted from the live ledger
+    4. ledger_compaction/{shop_id} lists the shop's compacted months
+
+Every step can be re-run: a month found both in the archive and the live
+ledger (a crash between steps, or a late row) is merged and re-summarized.
+
+Reports that reach back into compacted months read the summary for months
+they cover completely and the archived rows for months they cover in part,
+so they answer exactly as before. FirestoreDB.restore_ledger_month puts
+the raw rows back.
+
+The archive is gzip'd NDJSON files under LEDGER_ARCHIVE_DIR when that is
+set, otherwise the `transactions_archive` collection (one document per row,
+outside every query the app runs).
+"""
+import gzip
+import json
+import os
+import tempfile
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from config import Config
+from sales_cube import month_key
+
+SUMMARY_COLLECTION = "ledger_summaries"
+STATE_COLLECTION = "ledger_compaction"
+ARCHIVE_COLLECTION = "transactions_archive"
+
+# Firestore batches allow 500 writes
+BATCH_SIZE = 400
+
+
+def horizon_days() -> int:
+    """Configured horizon (LEDGER_COMPACTION_HORIZON_DAYS, default 365)."""
+    return Config.LEDGER_COMPACTION_HORIZON_DAYS
+
+
+def cutoff_month(today: datetime, days: int) -> str:
+    """Months strictly before this "YYYY-MM" are old enough to compact."""
+    return (today - timedelta(days=days)).strftime("%Y-%m")
+
+
+def month_bounds(month: str) -> Tuple[datetime, datetime]:
+    """[start, end) of a "YYYY-MM" month."""
+    start = datetime.strptime(month, "%Y-%m")
+    end = (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return start, end
+
+
+def months_between(start: datetime, end: datetime) -> List[str]:
+    """Every "YYYY-MM" month touching [start, end]."""
+    months = []
+    cursor = start.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    while cursor <= end:
+        months.append(cursor.strftime("%Y-%m"))
+        cursor = month_bounds(months[-1])[1]
+    return months
+
+
+def summary_id(shop_id: str, month: str) -> str:
+    return f"{shop_id}_{month}"
+
+
+def row_amount(txn: Dict[str, Any]) -> float:
+    """Money value of a row, the way the sales reports count it."""
+    quantity = float(txn.get("quantity", 0) or 0)
+    try:
+        if txn.get("total_amount") is not None:
+            return float(txn["total_amount"])
+        if txn.get("unit_price") is not None:
+            return float(txn["unit_price"]) * quantity
+    except Exception:
+        pass
+    return 0.0
+
+
+def summarize(rows: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """Collapse one month of rows into per (product, name, type) lines."""
+    lines: Dict[Tuple[Any, str, Any], Dict[str, Any]] = {}
+    row_count = 0
+    for txn in rows:
+        row_count += 1
+        name = txn.get("product_name", "Unknown") or "Unknown"
+        key = (txn.get("product_id"), name, txn.get("transaction_type"))
+        line = lines.get(key)
+        if line is None:
+            line = lines[key] = {
+                "product_id": key[0],
+                "product_name": name,
+                "transaction_type": key[2],
+                "count": 0,
+                "quantity": 0.0,
+                "amount": 0.0,
+            }
+        line["count"] += 1
+        line["quantity"] += float(txn.get("quantity", 0) or 0)
+        line["amount"] += row_amount(txn)
+    return {"row_count": row_count, "lines": list(lines.values())}
+
+
+def summary_rows(summary: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Summary lines as ledger-shaped rows dated at the start of the month.
+
+    Quantities and amounts add up exactly like the rows they replace, so
+    code that sums ledger rows (reports, the sales cube) can consume them.
+    """
+    month = summary.get("month")
+    timestamp = month_bounds(month)[0].isoformat()
+    return [
+        {
+            "transaction_id": f"summary:{month}:{i}",
+            "shop_id": summary.get("shop_id"),
+            "product_id": line.get("product_id"),
+            "product_name": line.get("product_name"),
+            "transaction_type": line.get("transaction_type"),
+            "quantity": line.get("quantity", 0.0),
+            "total_amount": line.get("amount", 0.0),
+            "timestamp": timestamp,
+        }
+        for i, line in enumerate(summary.get("lines") or [])
+    ]
+
+
+def group_by_month(rows: Iterable[Dict[str, Any]], before_month: str) -> Dict[str, List[Dict[str, Any]]]:
+    """Rows of months earlier than `before_month`, keyed by month."""
+    months: Dict[str, List[Dict[str, Any]]] = {}
+    for txn in rows:
+        month = month_key(txn.get("timestamp"))
+        if month and month < before_month:
+            months.setdefault(month, []).append(txn)
+    return months
+
+
+def merge_rows(*groups: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Union of row lists, deduplicated by transaction_id (first wins)."""
+    merged: Dict[str, Dict[str, Any]] = {}
+    anonymous: List[Dict[str, Any]] = []
+    for rows in groups:
+        for txn in rows:
+            txn_id = txn.get("transaction_id")
+            if txn_id is None:
+                anonymous.append(txn)
+            else:
+                merged.setdefault(txn_id, txn)
+    rows = list(merged.values()) + anonymous
+    rows.sort(key=lambda t: str(t.get("timestamp") or ""))
+    return rows
+
+
+class FileArchive:
+    """Gzip'd NDJSON, one file per shop and month: <dir>/<shop_id>/<YYYY-MM>.ndjson.gz"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def _path(self, shop_id: str, month: str) -> str:
+        return os.path.join(self.directory, shop_id, f"{month}.ndjson.gz")
+
+    def write(self, shop_id: str, month: str, rows: List[Dict[str, Any]]) -> None:
+        path = self._path(shop_id, month)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as raw:
+                with gzip.GzipFile(fileobj=raw, mode="wb") as out:
+                    for txn in rows:
+                        out.write((json.dumps(txn, default=str) + "\n").encode("utf-8"))
+                # The live rows are deleted next, so the archive must be on disk
+                raw.flush()
+                os.fsync(raw.fileno())
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def read(self, shop_id: str, month: str) -> List[Dict[str, Any]]:
+        path = self._path(shop_id, month)
+        if not os.path.exists(path):
+            return []
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    def delete(self, shop_id: str, month: str) -> None:
+        path = self._path(shop_id, month)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+class CollectionArchive:
+    """Rows kept as documents of a cold collection, looked up by shop and month."""
+
+    def __init__(self, client: Any, collection: str = ARCHIVE_COLLECTION):
+        self.client = client
+        self.collection = collection
+
+    def _query(self, shop_id: str, month: str) -> Any:
+        return (
+            self.client.collection(self.collection)
+            .where("shop_id", "==", shop_id)
+            .where("archive_month", "==", month)
+        )
+
+    def write(self, shop_id: str, month: str, rows: List[Dict[str, Any]]) -> None:
+        col = self.client.collection(self.collection)
+        for start in range(0, len(rows), BATCH_SIZE):
+            batch = self.client.batch()
+            for txn in rows[start:start + BATCH_SIZE]:
+                doc_id = txn.get("transaction_id") or col.document().id
+                batch.set(col.document(doc_id), {**txn, "shop_id": shop_id, "archive_month": month})
+            batch.commit()
+
+    def read(self, shop_id: str, month: str) -> List[Dict[str, Any]]:
+        rows = []
+        for doc in self._query(shop_id, month).stream():
+            txn = doc.to_dict() or {}
+            txn.pop("archive_month", None)
+            rows.append(txn)
+        return rows
+
+    def delete(self, shop_id: str, month: str) -> None:
+        refs = [doc.reference for doc in self._query(shop_id, month).stream()]
+        for start in range(0, len(refs), BATCH_SIZE):
+            batch = self.client.batch()
+            for ref in refs[start:start + BATCH_SIZE]:
+                batch.delete(ref)
+            batch.commit()
+
+
+def configured_archive(client: Any) -> Any:
+    """FileArchive under LEDGER_ARCHIVE_DIR if set, else the cold collection."""
+    directory = Config.LEDGER_ARCHIVE_DIR
+    return FileArchive(directory) if directory else CollectionArchive(client)
+
+
+class ArchivedRow:
+    """Snapshot-like wrapper so archived/summary rows mix with query results."""
+
+    def __init__(self, data: Dict[str, Any]):
+        self._data = data
+        self.id = data.get("transaction_id")
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(self._data)
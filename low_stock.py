@@ -0,0 +1,146 @@
+"""
+Low-stock tracking: one threshold rule, a per-shop low-stock set and
+threshold-crossing events
+
+A product is low when `current_stock <= threshold`, where threshold is the
+product's own `low_stock_threshold` or, if unset, LOW_STOCK_THRESHOLD from
+the environment (default 5). The same rule drives the low-stock listing and
+the alert returned by FirestoreDB.reduce_stock.
+
+FirestoreDB keeps a LowStockSet per shop, updated on every stock mutation,
+so listing low products costs O(k) in the number of low products instead of
+a catalog scan. Each time a product crosses its threshold an "enter" or
+"leave" event is written to the `low_stock_events` collection;
+tools/notify_low_stock.py drains that stream and sends each owner one
+batched WhatsApp message.
+"""
+import os
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+DEFAULT_LOW_STOCK_THRESHOLD = 5.0
+
+ENTER = "enter"
+LEAVE = "leave"
+
+
+def default_threshold() -> float:
+    """Shop-wide default threshold (LOW_STOCK_THRESHOLD, default 5)."""
+    try:
+        threshold_env = os.getenv("LOW_STOCK_THRESHOLD")
+        return float(threshold_env) if threshold_env else DEFAULT_LOW_STOCK_THRESHOLD
+    except Exception:
+        return DEFAULT_LOW_STOCK_THRESHOLD
+
+
+def threshold_for(product: Any, default: Optional[float] = None) -> float:
+    """Effective threshold for a product: its own, else the default."""
+    threshold = getattr(product, "low_stock_threshold", None)
+    if threshold is not None:
+        try:
+            return float(threshold)
+        except Exception:
+            pass
+    return default_threshold() if default is None else default
+
+
+def is_low(stock: Optional[float], threshold: float) -> bool:
+    return stock is not None and float(stock) <= threshold
+
+
+@dataclass
+class LowStockEvent:
+    """A product entering or leaving the low-stock set."""
+    shop_id: str
+    product_id: str
+    product_name: str
+    kind: str  # ENTER or LEAVE
+    stock: float
+    threshold: float
+    unit: str
+    brand: Optional[str] = None
+    created_at: datetime = field(default_factory=datetime.utcnow)
+    notified: bool = False
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "shop_id": self.shop_id,
+            "product_id": self.product_id,
+            "product_name": self.product_name,
+            "kind": self.kind,
+            "stock": self.stock,
+            "threshold": self.threshold,
+            "unit": self.unit,
+            "brand": self.brand,
+            "created_at": self.created_at.isoformat(),
+            "notified": self.notified,
+        }
+
+
+class LowStockSet:
+    """Products of one shop that are currently at or below their threshold."""
+
+    def __init__(self):
+        self._items: Dict[str, Dict[str, Any]] = {}
+        self.built_at = datetime.utcnow()
+
+    @classmethod
+    def from_products(cls, products: Iterable[Any], default: Optional[float] = None) -> "LowStockSet":
+        low_set = cls()
+        default = default_threshold() if default is None else default
+        for p in products:
+            low_set.update(p, p.current_stock, default)
+        return low_set
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __contains__(self, product_id: str) -> bool:
+        return product_id in self._items
+
+    def update(self, product: Any, stock: Optional[float], default: Optional[float] = None) -> None:
+        """Add, refresh or drop a product after its stock/threshold changed."""
+        threshold = threshold_for(product, default)
+        if is_low(stock, threshold):
+            self._items[product.product_id] = {
+                "name": product.name,
+                "brand": getattr(product, "brand", None),
+                "stock": stock,
+                "unit": product.unit,
+                "threshold": threshold,
+            }
+        else:
+            self._items.pop(product.product_id, None)
+
+    def remove(self, product_id: str) -> None:
+        self._items.pop(product_id, None)
+
+    def items(self) -> List[Dict[str, Any]]:
+        """Low products sorted by how far below threshold they are."""
+        # list() copies in one step, so a concurrent update can't break the sort
+        return sorted(list(self._items.values()), key=lambda item: (item["stock"] - item["threshold"], item["name"]))
+
+
+def format_owner_digest(events: List[Dict[str, Any]]) -> Optional[str]:
+    """One WhatsApp message summarising a shop's pending events.
+
+    Only the latest event per product counts, so a product that dipped and
+    was restocked before the batch went out is not reported.
+    """
+    latest: Dict[str, Dict[str, Any]] = {}
+    for event in sorted(events, key=lambda e: e.get("created_at") or ""):
+        latest[event.get("product_id")] = event
+
+    entered = [e for e in latest.values() if e.get("kind") == ENTER]
+    if not entered:
+        return None
+
+    lines = ["⚠️ Low stock alert:"]
+    for e in sorted(entered, key=lambda e: e.get("stock") or 0):
+        name = e.get("product_name", "")
+        if e.get("brand"):
+            name = f"{name} ({e['brand']})"
+        lines.append(f"• {name}: {e.get('stock')} {e.get('unit', '')} left (alert at {e.get('threshold')})")
+    lines.append("\nJaldi order kar lijiye! 🛒")
+    return "\n".join(lines)
@@ -65,6 +65,8 @@ class Shop:
     created_at: datetime
     active: bool = True
     address: Optional[str] = None
+    data_layout: str = "global"  # where its products/ledger live, see shop_layout.py
+    bills_since: Optional[str] = None  # first POS bill; reports read bills from here on
 
     def to_dict(self) -> Dict[str, Any]:
         data = asdict(self)
@@ -230,6 +232,7 @@ class Product:
             'cost_price',
             'expiry_date',
             'batches',
+            'low_stock_threshold',
             'created_at',
             'updated_at',
         }
@@ -286,6 +289,7 @@ class Transaction:
     unit_price: Optional[float] = None  # price per unit at time of transaction (in rupees)
     total_amount: Optional[float] = None  # quantity * unit_price
     notes: Optional[str] = None
+    bill_id: Optional[str] = None  # POS checkout this line belongs to, see Bill
 
     def to_dict(self) -> Dict[str, Any]:
         data = asdict(self)
@@ -300,6 +304,57 @@ class Transaction:
         return Transaction(**data)
 
 
+@dataclass
+class Bill:
+    """One POS checkout.
+
+    Each stock-tracked line also has its own ledger row (same bill_id);
+    lines for items the shop doesn't stock have no transaction_id.
+    """
+    bill_id: str
+    shop_id: str
+    user_phone: str
+    timestamp: datetime
+    items: List[Dict[str, Any]]  # product_id, product_name, quantity, unit_price, amount, transaction_id
+    item_count: int  # stock-tracked lines
+    total_quantity: float
+    total_amount: float  # sum of line amounts
+    payment_mode: str = "Cash"
+    cash_given: Optional[float] = None
+    change_due: Optional[float] = None
+    client_total: Optional[float] = None  # total shown by the POS
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = asdict(self)
+        data['timestamp'] = self.timestamp.isoformat()
+        return data
+
+    @staticmethod
+    def from_dict(data: Dict[str, Any]) -> 'Bill':
+        data = dict(data)
+        data['timestamp'] = datetime.fromisoformat(data['timestamp'])
+        return Bill(**data)
+
+    def ledger_rows(self) -> List[Dict[str, Any]]:
+        """Stock-tracked lines shaped like their sale ledger rows (for reports)."""
+        return [
+            {
+                'transaction_id': item.get('transaction_id'),
+                'shop_id': self.shop_id,
+                'product_id': item.get('product_id'),
+                'product_name': item.get('product_name'),
+                'transaction_type': TransactionType.SALE.value,
+                'quantity': item.get('quantity', 0.0),
+                'unit_price': item.get('unit_price'),
+                'total_amount': item.get('amount'),
+                'timestamp': self.timestamp.isoformat(),
+                'bill_id': self.bill_id,
+            }
+            for item in self.items
+            if item.get('transaction_id')
+        ]
+
+
 
 
 @dataclass
@@ -0,0 +1,226 @@
+"""
+Bulk offline sync for the POS
+
+While offline, the React POS queues what happens at the counter (sales,
+returns, stock bills, price changes), each with a client op id and the time
+it happened. Back online, it posts the queue to /api/sync in order, up to
+MAX_OPS_PER_REQUEST operations per request:
+
+    {"phone": "+91...", "catalog_since": "<cursor from the last sync>",
+     "ops": [{"op_id": "...", "type": "sale", "client_ts": "...", "items": [...],
+              "total": 120.0, "payment_mode": "Cash", "cash_given": 150.0},
+             {"op_id": "...", "type": "return", "items": [...]},
+             {"op_id": "...", "type": "add_stock", "items": [{..., "cost_price": 10.5}]},
+             {"op_id": "...", "type": "price_change", "product_id": "...",
+              "selling_price": 15.0, "client_ts": "..."}]}
+
+Items name a product by product_id, barcode or name. Each op is applied
+once: its op_id is the idempotency key (see idempotency.py), so a queue
+resent after a dropped response, or an op that already reached
+/api/sales/record online, isn't applied twice. Every op is one write batch
+and gets its own result:
+
+    applied     written now
+    duplicate   applied before; `result` is the original answer
+    conflict    not applied, the server has newer data (a price changed
+                later elsewhere); `result` holds the current values
+    rejected    invalid, or nothing in it matches the catalog
+
+Products are resolved against one catalog read per request rather than a
+lookup per line. The response ends with the catalog delta since
+`catalog_since` and the cursor for the next sync.
+
+Ledger rows are stamped with the server time they are synced at, so stock
+snapshots and compacted months stay consistent; the client time is kept in
+the row notes.
+"""
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from database import canonical_product_key
+
+MAX_OPS_PER_REQUEST = 500
+OP_TYPES = ("sale", "return", "add_stock", "price_change")
+
+
+def parse_client_ts(value: Any) -> Optional[datetime]:
+    """A client timestamp as naive UTC (how the ledger stores time), or None."""
+    if not value:
+        return None
+    try:
+        ts = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except Exception:
+        return None
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(timezone.utc).replace(tzinfo=None)
+    return ts
+
+
+def _quantity(item: Dict[str, Any]) -> float:
+    try:
+        return abs(float(item.get("quantity") or 0))
+    except Exception:
+        return 0.0
+
+
+class Catalog:
+    """A shop's products read once, indexed by id, barcode and normalized name.
+
+    Stock is kept current as ops are applied, so later ops in the same
+    sync chain from it.
+    """
+
+    def __init__(self, db: Any, shop_id: str):
+        self.db = db
+        self.shop_id = shop_id
+        self.by_id: Dict[str, Any] = {}
+        self.by_barcode: Dict[str, Any] = {}
+        self.by_name: Dict[str, Any] = {}
+        for product in db.get_products_by_shop(shop_id):
+            self._index(product)
+
+    def _index(self, product: Any) -> None:
+        self.by_id[product.product_id] = product
+        if product.barcode:
+            self.by_barcode[str(product.barcode).replace(" ", "")] = product
+        self.by_name.setdefault(product.normalized_name, product)
+
+    def resolve(self, item: Dict[str, Any]) -> Optional[Any]:
+        product_id = (item.get("product_id") or "").strip()
+        if product_id and product_id in self.by_id:
+            return self.by_id[product_id]
+        barcode = str(item.get("barcode") or "").replace(" ", "")
+        if barcode and barcode in self.by_barcode:
+            return self.by_barcode[barcode]
+        name = (item.get("name") or "").strip()
+        if not name:
+            return None
+        product = self.by_name.get(canonical_product_key(name))
+        if product is None:
+            # Partial names ("Toor Dal" -> "Tata Sampann Toor Dal 1kg")
+            found = self.db.find_existing_product_by_name(self.shop_id, name)
+            product = self.by_id.get(found.product_id) if found else None
+        return product
+
+    def create(self, name: str) -> Any:
+        product = self.db.get_or_create_product(self.shop_id, name)
+        self._index(product)
+        return product
+
+    def apply(self, transactions: List[Any]) -> None:
+        for t in transactions:
+            if t.product_id in self.by_id:
+                self.by_id[t.product_id].current_stock = t.new_stock
+
+
+class OfflineSync:
+    """Applies queued POS operations for one shop (see module docstring)."""
+
+    def __init__(self, db: Any):
+        self.db = db
+
+    def apply(self, shop_id: str, user_phone: str, ops: List[Dict[str, Any]],
+              catalog_since: Optional[str] = None) -> Dict[str, Any]:
+        catalog = Catalog(self.db, shop_id)
+        results = []
+        for op in ops:
+            op = op if isinstance(op, dict) else {}
+            try:
+                result = self._apply_op(catalog, shop_id, user_phone, op)
+            except Exception as e:
+                print(f"❌ Sync op {op.get('op_id')} failed: {e}")
+                result = {"status": "rejected", "errors": [str(e)]}
+            results.append({"op_id": op.get("op_id"), "type": op.get("type"), **result})
+
+        summary = {status: 0 for status in ("applied", "duplicate", "conflict", "rejected")}
+        for result in results:
+            summary[result["status"]] += 1
+        delta = self.db.get_catalog_delta(shop_id, catalog_since)
+        return {
+            "success": True,
+            "results": results,
+            "summary": summary,
+            "catalog": {
+                "products": [p.to_dict() for p in delta["products"]],
+                "cursor": delta["cursor"],
+            },
+        }
+
+    def _apply_op(self, catalog: Catalog, shop_id: str, user_phone: str, op: Dict[str, Any]) -> Dict[str, Any]:
+        op_type = op.get("type")
+        key = op.get("op_id")
+        if op_type not in OP_TYPES:
+            return {"status": "rejected", "errors": [f"unknown op type: {op_type}"]}
+        if not key or not isinstance(key, str):
+            return {"status": "rejected", "errors": ["op_id is required"]}
+        client_ts = parse_client_ts(op.get("client_ts"))
+        notes = f"POS offline sync (made {client_ts.isoformat()})" if client_ts else "POS offline sync"
+
+        if op_type == "price_change":
+            product = catalog.resolve(op)
+            if product is None:
+                return {"status": "rejected", "errors": ["product not found"]}
+            result = self.db.set_product_price(
+                shop_id, product.product_id,
+                selling_price=op.get("selling_price"), cost_price=op.get("cost_price"),
+                changed_at=client_ts, idempotency_key=key, user_phone=user_phone,
+            )
+            if result.get("replayed"):
+                return {"status": "duplicate", "result": result}
+            if result["status"] == "applied":
+                product.selling_price = result["selling_price"]
+                product.cost_price = result["cost_price"]
+            status = {"applied": "applied", "conflict": "conflict"}.get(result["status"], "rejected")
+            return {"status": status, "result": result}
+
+        lines, errors, untracked, costs = [], [], [], []
+        for item in op.get("items") or []:
+            if not isinstance(item, dict):
+                continue
+            qty = _quantity(item)
+            if qty <= 0:
+                continue
+            product = catalog.resolve(item)
+            if product is None and op_type == "add_stock" and (item.get("name") or "").strip():
+                product = catalog.create(item["name"].strip())
+            if product is None:
+                label = item.get("name") or item.get("barcode") or item.get("product_id")
+                if op_type == "sale":
+                    untracked.append({"name": label, "quantity": qty, "price": item.get("price")})
+                else:
+                    errors.append(f"{label}: product not found")
+                continue
+            lines.append((product, qty))
+            if op_type == "add_stock" and item.get("cost_price") is not None:
+                costs.append((product, item["cost_price"]))
+
+        if not lines and not untracked:
+            return {"status": "rejected", "errors": errors or ["no valid items"]}
+
+        if op_type == "sale":
+            cash_given, total = op.get("cash_given"), op.get("total")
+            recorded = self.db.record_bill(
+                shop_id, lines, user_phone,
+                payment_mode=op.get("payment_mode", "Cash"),
+                cash_given=float(cash_given) if cash_given not in (None, "") else None,
+                client_total=float(total) if total not in (None, "") else None,
+                untracked=untracked, notes=notes, idempotency_key=key,
+            )
+        elif op_type == "return":
+            recorded = self.db.record_returns(shop_id, lines, user_phone, notes=notes, idempotency_key=key)
+        else:
+            recorded = self.db.record_stock_additions(shop_id, lines, user_phone, notes=notes, idempotency_key=key)
+
+        if recorded["replayed"]:
+            return {"status": "duplicate", "result": recorded["response"]}
+        catalog.apply(recorded["transactions"])
+        for product, cost in costs:
+            try:
+                self.db.update_product_fields(product.product_id, {"cost_price": float(cost)})
+                product.cost_price = float(cost)
+            except Exception as e:
+                errors.append(f"{product.name}: cost not updated ({e})")
+        result = {"status": "applied", "result": recorded["response"]}
+        if errors:
+            result["errors"] = errors
+        return result
@@ -0,0 +1,321 @@
+"""
+Guarded OpenAI calls: deadlines, a concurrency cap and a circuit breaker
+
+AIService hands out its OpenAI client wrapped in `GuardedClient`, so every
+Whisper and chat call goes through one process-wide `Guard` that:
+
+1. refuses straight away while the circuit breaker is open;
+2. gives the call a timeout: OPENAI_CHAT_TIMEOUT_SECONDS (10) or
+   OPENAI_AUDIO_TIMEOUT_SECONDS (20), cut to what is left of the request's
+   budget (REQUEST_BUDGET_SECONDS, 25, set per request by the app) minus a
+   second for the reply; with less than OPENAI_MIN_CALL_SECONDS (0.5) left
+   the call isn't made;
+3. waits at most OPENAI_QUEUE_WAIT_SECONDS (2) for one of
+   OPENAI_MAX_IN_FLIGHT (8) slots, so a slow OpenAI holds a bounded number
+   of request threads instead of all of them;
+4. feeds the outcome to the breaker: of the last OPENAI_BREAKER_WINDOW (20)
+   calls, if at least OPENAI_BREAKER_MIN_CALLS (5) were made and
+   OPENAI_BREAKER_FAILURE_RATIO (0.5) of them failed or took longer than
+   OPENAI_SLOW_CALL_SECONDS (8), the breaker opens for
+   OPENAI_BREAKER_COOLDOWN_SECONDS (30). It then lets one trial call
+   through (half-open) and closes again if that one is healthy.
+
+A refused call raises `Unavailable` (reason "breaker_open", "saturated" or
+"deadline"). parse_command answers from its local keyword parser instead,
+transcription reports itself unavailable. Metrics on /metrics:
+
+    kirana_openai_calls_total{kind, outcome}       ok / slow / error
+    kirana_openai_shed_total{kind, reason}         calls refused
+    kirana_openai_breaker_transitions_total{state}
+    kirana_openai_breaker_state                    0 closed, 1 half-open, 2 open
+    kirana_openai_in_flight
+"""
+import contextlib
+import contextvars
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Iterator, List, Optional
+
+import tracing
+from config import Config
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+# Left over after an OpenAI call for the rest of the request (reply, writes)
+REPLY_RESERVE_SECONDS = 1.0
+
+CALLS = tracing.REGISTRY.counter(
+    "kirana_openai_calls_total",
+    "OpenAI calls made, by kind (audio, chat) and outcome (ok, slow, error).",
+    ("kind", "outcome"),
+)
+SHED = tracing.REGISTRY.counter(
+    "kirana_openai_shed_total",
+    "OpenAI calls refused before being made, by kind and reason (breaker_open, saturated, deadline).",
+    ("kind", "reason"),
+)
+TRANSITIONS = tracing.REGISTRY.counter(
+    "kirana_openai_breaker_transitions_total",
+    "Circuit breaker state changes, by the state entered.",
+    ("state",),
+)
+
+
+class Unavailable(Exception):
+    """OpenAI was not called; `reason` is breaker_open, saturated or deadline."""
+
+    def __init__(self, reason: str, kind: str):
+        super().__init__(f"OpenAI {kind} call not made: {reason}")
+        self.reason = reason
+        self.kind = kind
+
+
+# ---- request budget ----
+
+_deadline: contextvars.ContextVar = contextvars.ContextVar("kirana_openai_deadline", default=None)
+
+
+def request_budget_seconds() -> float:
+    return Config.REQUEST_BUDGET_SECONDS
+
+
+def start_request(budget_seconds: Optional[float] = None) -> contextvars.Token:
+    """Start this request's budget; pass the token to end_request()."""
+    budget = request_budget_seconds() if budget_seconds is None else budget_seconds
+    return _deadline.set(time.monotonic() + budget)
+
+
+def end_request(token: contextvars.Token) -> None:
+    _deadline.reset(token)
+
+
+@contextlib.contextmanager
+def request_budget(seconds: float) -> Iterator[None]:
+    token = start_request(seconds)
+    try:
+        yield
+    finally:
+        end_request(token)
+
+
+def remaining() -> Optional[float]:
+    """Seconds left in the current request's budget (None outside a request)."""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+# ---- circuit breaker ----
+
+class CircuitBreaker:
+    """Failure-ratio breaker over the last `window` calls; slow calls count as failures."""
+
+    def __init__(self, window: int = 20, min_calls: int = 5, failure_ratio: float = 0.5,
+                 slow_seconds: float = 8.0, cooldown_seconds: float = 30.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.window = window
+        self.min_calls = min_calls
+        self.failure_ratio = failure_ratio
+        self.slow_seconds = slow_seconds
+        self.cooldown_seconds = cooldown_seconds
+        self._clock = clock
+        self._results: Deque[bool] = deque(maxlen=window)  # True = failed
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == OPEN and self._clock() - self._opened_at >= self.cooldown_seconds:
+                return HALF_OPEN
+            return self._state
+
+    def allow(self) -> bool:
+        """May a call go out now? In half-open, only one trial at a time."""
+        with self._lock:
+            if self._state == CLOSED:
+                return True
+            if self._state == OPEN:
+                if self._clock() - self._opened_at < self.cooldown_seconds:
+                    return False
+                self._enter(HALF_OPEN)
+            if self._trial_running:
+                return False
+            self._trial_running = True
+            return True
+
+    def release_trial(self) -> None:
+        """A half-open trial that never went out counts neither way."""
+        with self._lock:
+            self._trial_running = False
+
+    def record(self, failed: bool) -> None:
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._trial_running = False
+                self._results.clear()
+                if failed:
+                    self._open()
+                else:
+                    self._enter(CLOSED)
+                return
+            if self._state == OPEN:
+                return
+            self._results.append(failed)
+            failures = sum(self._results)
+            if len(self._results) >= self.min_calls and failures >= self.failure_ratio * len(self._results):
+                self._open()
+
+    def _open(self) -> None:
+        self._opened_at = self._clock()
+        self._results.clear()
+        self._enter(OPEN)
+
+    def _enter(self, state: str) -> None:
+        if state != self._state:
+            self._state = state
+            TRANSITIONS.inc(state=state)
+            tracing.log(f"⚡ OpenAI circuit breaker {state}")
+
+
+# ---- guard ----
+
+class Guard:
+    """Deadline, concurrency cap and breaker around every OpenAI call."""
+
+    def __init__(self, max_in_flight: int = 8, queue_wait_seconds: float = 2.0,
+                 chat_timeout: float = 10.0, audio_timeout: float = 20.0, min_call_seconds: float = 0.5,
+                 breaker: Optional[CircuitBreaker] = None):
+        self.max_in_flight = max_in_flight
+        self.queue_wait_seconds = queue_wait_seconds
+        self.timeouts = {"chat": chat_timeout, "audio": audio_timeout}
+        self.min_call_seconds = min_call_seconds
+        self.breaker = breaker or CircuitBreaker()
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._in_flight = 0
+        self._count_lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "Guard":
+        breaker = CircuitBreaker(
+            window=Config.OPENAI_BREAKER_WINDOW,
+            min_calls=Config.OPENAI_BREAKER_MIN_CALLS,
+            failure_ratio=Config.OPENAI_BREAKER_FAILURE_RATIO,
+            slow_seconds=Config.OPENAI_SLOW_CALL_SECONDS,
+            cooldown_seconds=Config.OPENAI_BREAKER_COOLDOWN_SECONDS,
+        )
+        return cls(
+            max_in_flight=Config.OPENAI_MAX_IN_FLIGHT,
+            queue_wait_seconds=Config.OPENAI_QUEUE_WAIT_SECONDS,
+            chat_timeout=Config.OPENAI_CHAT_TIMEOUT_SECONDS,
+            audio_timeout=Config.OPENAI_AUDIO_TIMEOUT_SECONDS,
+            min_call_seconds=Config.OPENAI_MIN_CALL_SECONDS,
+            breaker=breaker,
+        )
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def _shed(self, kind: str, reason: str) -> Unavailable:
+        SHED.inc(kind=kind, reason=reason)
+        tracing.annotate(f"shed:{reason}")
+        return Unavailable(reason, kind)
+
+    def _budget(self, kind: str) -> float:
+        timeout = self.timeouts.get(kind, self.timeouts["chat"])
+        left = remaining()
+        if left is not None:
+            timeout = min(timeout, left - REPLY_RESERVE_SECONDS)
+        return timeout
+
+    def call(self, kind: str, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """fn(*args, timeout=..., **kwargs) under the guard; Unavailable if refused."""
+        if self._budget(kind) < self.min_call_seconds:
+            raise self._shed(kind, "deadline")
+        if not self.breaker.allow():
+            raise self._shed(kind, "breaker_open")
+        wait = min(self.queue_wait_seconds, max(0.0, self._budget(kind) - self.min_call_seconds))
+        if not self._slots.acquire(timeout=wait):
+            self.breaker.release_trial()
+            raise self._shed(kind, "saturated")
+        try:
+            # Queueing used some of the budget
+            timeout = self._budget(kind)
+            if timeout < self.min_call_seconds:
+                self.breaker.release_trial()
+                raise self._shed(kind, "deadline")
+            return self._invoke(kind, fn, timeout, args, kwargs)
+        finally:
+            self._slots.release()
+
+    def _invoke(self, kind: str, fn: Callable[..., Any], timeout: float, args: Any, kwargs: Any) -> Any:
+        with self._count_lock:
+            self._in_flight += 1
+        started = time.monotonic()
+        try:
+            result = fn(*args, timeout=timeout, **kwargs)
+        except Exception:
+            CALLS.inc(kind=kind, outcome="error")
+            self.breaker.record(failed=True)
+            raise
+        finally:
+            with self._count_lock:
+                self._in_flight -= 1
+        slow = time.monotonic() - started > self.breaker.slow_seconds
+        CALLS.inc(kind=kind, outcome="slow" if slow else "ok")
+        self.breaker.record(failed=slow)
+        return result
+
+
+class _Endpoint:
+    def __init__(self, guard: Guard, kind: str, create: Callable[..., Any]):
+        self._guard = guard
+        self._kind = kind
+        self._create = create
+
+    def create(self, *args: Any, **kwargs: Any) -> Any:
+        return self._guard.call(self._kind, self._create, *args, **kwargs)
+
+
+class GuardedClient:
+    """The OpenAI client's audio and chat endpoints, each call through `guard`."""
+
+    def __init__(self, client: Any, guard: Optional[Guard] = None):
+        guard = guard or GUARD
+        self._client = client
+        self.audio = _Namespace(
+            translations=_Endpoint(guard, "audio", client.audio.translations.create),
+            transcriptions=_Endpoint(guard, "audio", client.audio.transcriptions.create),
+        ) if hasattr(client, "audio") else None
+        self.chat = _Namespace(
+            completions=_Endpoint(guard, "chat", client.chat.completions.create),
+        ) if hasattr(client, "chat") else None
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._client, name)
+
+
+class _Namespace:
+    def __init__(self, **endpoints: Any):
+        self.__dict__.update(endpoints)
+
+
+GUARD = Guard.from_env()
+
+
+def _collect() -> List[str]:
+    return [
+        "# HELP kirana_openai_breaker_state OpenAI circuit breaker: 0 closed, 1 half-open, 2 open.",
+        "# TYPE kirana_openai_breaker_state gauge",
+        f"kirana_openai_breaker_state {_STATE_VALUES[GUARD.breaker.state]}",
+        "# HELP kirana_openai_in_flight OpenAI calls in progress in this worker.",
+        "# TYPE kirana_openai_in_flight gauge",
+        f"kirana_openai_in_flight {GUARD.in_flight}",
+    ]
+
+
+tracing.REGISTRY.add_collector(_collect)
@@ -0,0 +1,65 @@
+"""
+Named field projections for catalog and ledger reads
+
+Product documents can carry large `batches` maps and ledger rows carry
+free-text `notes`, but most scans only need a handful of fields. Each
+projection below is a Firestore field mask (`Query.select`) named after the
+use case it serves, so the server only sends those fields and the client
+only deserializes them.
+
+Every product projection includes PRODUCT_CORE, the fields Product.from_dict
+needs, so projected documents still build a Product; the other fields keep
+their defaults. That includes `batches`: documents written without
+current_stock (tools/reset_products.py, console edits) get their stock from
+the batch quantities, and without them would read as 0. Products read this
+way are partial: don't write them back with save_product, and re-read with
+get_product before handing one to code that needs every field.
+"""
+from typing import Any, Optional, Sequence, Tuple
+
+# Required to build a Product (`batches` for stock derived from batch
+# quantities); `expiry_date` lets stock writes tell whether the shop's expiry
+# digest shows this product's stock, `journal_seqs` which sales journal
+# entries current_stock already includes
+PRODUCT_CORE: Tuple[str, ...] = ("product_id", "shop_id", "name", "normalized_name", "current_stock",
+                                 "batches", "expiry_date", "journal_seqs")
+
+# Name matching, catalog listings and stock views (`price` is the legacy
+# name of selling_price)
+PRODUCT_MATCH = PRODUCT_CORE + ("unit", "brand", "barcode", "selling_price", "price")
+
+# Low-stock set and threshold scans
+PRODUCT_LOW_STOCK = PRODUCT_CORE + ("unit", "brand", "low_stock_threshold")
+
+# Cost maps for sales/profit reports
+PRODUCT_COST = PRODUCT_CORE + ("cost_price",)
+
+# Sales aggregation, demand forecast and sales cube rebuilds
+TRANSACTION_SALES: Tuple[str, ...] = (
+    "shop_id",
+    "product_id",
+    "product_name",
+    "transaction_type",
+    "quantity",
+    "timestamp",
+    "unit_price",
+    "total_amount",
+)
+
+# Stock reconciliation replays (see reconciliation.py)
+TRANSACTION_REPLAY: Tuple[str, ...] = (
+    "transaction_id",
+    "product_id",
+    "transaction_type",
+    "quantity",
+    "previous_stock",
+    "new_stock",
+    "timestamp",
+)
+
+
+def select(query: Any, fields: Optional[Sequence[str]]) -> Any:
+    """Apply a field mask to `query`; None reads whole documents."""
+    if not fields:
+        return query
+    return query.select(list(fields))
@@ -0,0 +1,139 @@
+"""
+Stock reconciliation: replay the transaction ledger to check current_stock
+
+current_stock is rewritten in place by many code paths (sales, restocks,
+batch edits, adjust/undo), so nothing guarantees it still agrees with the
+ledger. Reconciliation replays a product's ledger rows in timestamp order:
+
+    expected = opening + sum(new_stock - previous_stock for each row)
+
+Each row counts the change it actually applied (clamped sales, undo and
+adjustment rows included), so concurrent writers whose previous_stock
+values overlap still add up. The opening balance is the product's snapshot
+in stock_snapshots/{product_id} when it has one, so only the ledger tail
+after the snapshot is read; otherwise it is the first row's previous_stock,
+which also covers stock that predates the ledger and months moved out by
+ledger compaction.
+
+drift = current_stock - expected. FirestoreDB.reconcile_stock can record
+the drift as an ADJUSTMENT row (current_stock stays as counted), after
+which ledger and shelf agree again. tools/reconcile_stock.py runs it.
+
+Documents without current_stock take their stock from the batch
+quantities. That figure was never counted, so drift on it is reported
+with `derived_stock` set and never adjusted.
+"""
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from config import Config
+from models import Product
+from sales_cube import SALE_TRANSACTION_TYPES, month_key
+
+SNAPSHOT_COLLECTION = "stock_snapshots"
+REPORT_COLLECTION = "reconciliation_reports"
+
+# Stock is a float; smaller differences are rounding, not drift
+TOLERANCE = 1e-6
+
+
+def worker_count() -> int:
+    """Replay pool size (RECONCILE_WORKERS, default 8)."""
+    return Config.RECONCILE_WORKERS
+
+
+def stored_stock(product: Dict[str, Any]) -> Tuple[float, bool]:
+    """(stock, derived) of a product document; derived when summed from its batches."""
+    if product.get("current_stock") is not None:
+        return float(product["current_stock"]), False
+    return float(Product.from_dict(product).current_stock or 0.0), True
+
+
+def row_delta(txn: Dict[str, Any]) -> float:
+    """Stock change a ledger row applied."""
+    previous_stock, new_stock = txn.get("previous_stock"), txn.get("new_stock")
+    if previous_stock is not None and new_stock is not None:
+        return float(new_stock) - float(previous_stock)
+    # Rows without before/after values: infer the direction from the type
+    quantity = float(txn.get("quantity", 0) or 0)
+    if txn.get("transaction_type") in SALE_TRANSACTION_TYPES:
+        return -quantity
+    return quantity
+
+
+@dataclass
+class Replay:
+    """Outcome of replaying one product's ledger."""
+    expected: Optional[float]  # None when there is nothing to replay from
+    opening: Optional[float] = None
+    rows: int = 0
+    from_snapshot: bool = False
+    # Newest timestamp covered and the row ids carrying it, for the next snapshot
+    as_of: Optional[str] = None
+    as_of_ids: List[str] = field(default_factory=list)
+
+
+def replay(rows: Iterable[Dict[str, Any]], snapshot: Optional[Dict[str, Any]] = None) -> Replay:
+    """Expected stock after `rows`, starting from `snapshot` if given.
+
+    Rows the snapshot already covers (older than its `as_of`, or at
+    `as_of` and listed in its `as_of_ids`) are skipped.
+    """
+    covered = set(snapshot.get("as_of_ids") or []) if snapshot else set()
+    since = str(snapshot.get("as_of") or "") if snapshot else ""
+    rows = sorted(
+        (txn for txn in rows
+         if str(txn.get("timestamp") or "") >= since and txn.get("transaction_id") not in covered),
+        key=lambda txn: str(txn.get("timestamp") or ""),
+    )
+
+    if snapshot:
+        opening = float(snapshot.get("stock") or 0.0)
+        as_of, as_of_ids = snapshot.get("as_of"), list(covered)
+    elif rows:
+        opening = float(rows[0].get("previous_stock") or 0.0)
+        as_of, as_of_ids = None, []
+    else:
+        return Replay(expected=None)
+
+    expected = opening
+    for txn in rows:
+        expected += row_delta(txn)
+        timestamp = str(txn.get("timestamp") or "")
+        if timestamp != as_of:
+            as_of, as_of_ids = timestamp, []
+        as_of_ids.append(txn.get("transaction_id"))
+
+    return Replay(
+        expected=round(expected, 6),
+        opening=opening,
+        rows=len(rows),
+        from_snapshot=bool(snapshot),
+        as_of=as_of,
+        as_of_ids=as_of_ids,
+    )
+
+
+def snapshot_usable(snapshot: Dict[str, Any], compacted_months: List[str]) -> bool:
+    """A snapshot is only a valid opening if no row after it was compacted away."""
+    if not snapshot or snapshot.get("as_of") is None:
+        return False
+    if not compacted_months:
+        return True
+    return (month_key(snapshot["as_of"]) or "") > max(compacted_months)
+
+
+def snapshot_doc(shop_id: str, product_id: str, result: Replay, taken_at: str) -> Dict[str, Any]:
+    """stock_snapshots/{product_id} document for a replay."""
+    return {
+        "shop_id": shop_id,
+        "product_id": product_id,
+        "stock": result.expected,
+        "as_of": result.as_of,
+        "as_of_ids": result.as_of_ids,
+        "taken_at": taken_at,
+    }
+
+
+def is_drift(current_stock: float, expected: Optional[float]) -> bool:
+    return expected is not None and abs(float(current_stock or 0.0) - expected) > TOLERANCE
@@ -0,0 +1,203 @@
+"""
+Monthly (month x product) sales cube for seasonal analysis
+
+Each shop has one `sales_cube` document per calendar month:
+
+    sales_cube/{shop_id}_{YYYY-MM} = {
+        "shop_id": ...,
+        "month": "2025-10",
+        "products": {
+            "<product_id>": {"name": "Maggi", "qty": 120.0, "revenue": 1680.0},
+            ...
+        },
+    }
+
+FirestoreDB.create_transaction increments the current month's cell on every
+sale and decrements it on every return, so cells hold net sales like the
+ledger; FirestoreDB.rebuild_sales_cube (tools/rebuild_sales_cube.py) can
+rebuild a shop's cube from the transaction ledger. Seasonal suggestions then
+read at most ~24 small documents instead of the whole ledger.
+"""
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+SALE_TRANSACTION_TYPES = ("reduce_stock", "sale")
+RETURN_TRANSACTION_TYPES = ("return",)
+
+# Festival/season periods (approximate months) and the product categories
+# that usually sell more during them.
+SEASONAL_PERIODS: Dict[str, Dict[str, Any]] = {
+    'diwali': {
+        'months': [10, 11],  # October-November
+        'keywords': ['sweets', 'mithai', 'dry fruits', 'oil', 'ghee', 'crackers', 'diyas', 'decorations']
+    },
+    'holi': {
+        'months': [3],  # March
+        'keywords': ['colors', 'sweets', 'gujiya', 'thandai', 'snacks', 'namkeen']
+    },
+    'raksha bandhan': {
+        'months': [8],  # August
+        'keywords': ['sweets', 'mithai', 'dry fruits', 'chocolates', 'gifts']
+    },
+    'eid': {
+        'months': [4, 5],  # April-May (varies)
+        'keywords': ['dates', 'dry fruits', 'sweets', 'seviyan', 'biryani', 'meat']
+    },
+    'christmas': {
+        'months': [12],  # December
+        'keywords': ['cake', 'chocolates', 'dry fruits', 'wine', 'decorations']
+    },
+    'new year': {
+        'months': [1, 12],  # December-January
+        'keywords': ['snacks', 'drinks', 'party', 'decorations']
+    },
+    'summer': {
+        'months': [4, 5, 6],  # April-June
+        'keywords': ['cold drinks', 'ice cream', 'juice', 'water', 'coolers', 'aam panna']
+    },
+    'winter': {
+        'months': [11, 12, 1, 2],  # November-February
+        'keywords': ['tea', 'coffee', 'hot chocolate', 'dry fruits', 'gur', 'til']
+    },
+    'monsoon': {
+        'months': [7, 8, 9],  # July-September
+        'keywords': ['tea', 'pakora', 'snacks', 'umbrella', 'raincoat']
+    }
+}
+
+Cube = Dict[str, Dict[str, Dict[str, Any]]]  # {month: {product_id: cell}}
+
+
+def cube_doc_id(shop_id: str, month: str) -> str:
+    """Document id for one shop-month of the cube."""
+    return f"{shop_id}_{month}"
+
+
+def month_key(value: Any) -> Optional[str]:
+    """Return "YYYY-MM" for a stored timestamp (ISO string or datetime)."""
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except Exception:
+            return None
+    if isinstance(value, (datetime, date)):
+        return f"{value.year:04d}-{value.month:02d}"
+    return None
+
+
+def shift_month(month: str, delta: int) -> str:
+    """Add `delta` months to a "YYYY-MM" key."""
+    year, mon = int(month[:4]), int(month[5:7])
+    index = year * 12 + (mon - 1) + delta
+    return f"{index // 12:04d}-{index % 12 + 1:02d}"
+
+
+def sale_cell(txn: Dict[str, Any]) -> Optional[Tuple[str, str, str, float, float]]:
+    """Extract (month, product_id, product_name, qty, revenue) from a sale or return.
+
+    Returns count negative (qty and refund subtracted from the month they
+    happen in). Returns None for anything else.
+    """
+    transaction_type = txn.get("transaction_type")
+    if transaction_type in SALE_TRANSACTION_TYPES:
+        sign = 1.0
+    elif transaction_type in RETURN_TRANSACTION_TYPES:
+        sign = -1.0
+    else:
+        return None
+    month = month_key(txn.get("timestamp"))
+    product_id = txn.get("product_id")
+    if not month or not product_id:
+        return None
+    try:
+        qty = abs(float(txn.get("quantity", 0) or 0))
+    except Exception:
+        return None
+
+    revenue = 0.0
+    try:
+        if txn.get("total_amount") is not None:
+            revenue = float(txn["total_amount"])
+        elif txn.get("unit_price") is not None:
+            revenue = float(txn["unit_price"]) * qty
+    except Exception:
+        revenue = 0.0
+
+    return month, product_id, txn.get("product_name") or "Unknown", sign * qty, sign * revenue
+
+
+def build_cube(transactions: Iterable[Dict[str, Any]], since_month: Optional[str] = None) -> Cube:
+    """Aggregate raw transaction dicts into a (month x product) cube."""
+    cube: Cube = {}
+    for txn in transactions:
+        cell = sale_cell(txn)
+        if cell is None:
+            continue
+        month, product_id, name, qty, revenue = cell
+        if since_month and month < since_month:
+            continue
+        entry = cube.setdefault(month, {}).setdefault(product_id, {"name": name, "qty": 0.0, "revenue": 0.0})
+        entry["name"] = name
+        entry["qty"] += qty
+        entry["revenue"] += revenue
+    return cube
+
+
+def match_season(season_or_festival: Optional[str], today: date) -> Optional[str]:
+    """Pick the festival/season to analyse.
+
+    An explicit name wins; otherwise the season covering this month, then
+    the one starting next month.
+    """
+    if season_or_festival:
+        season_lower = season_or_festival.lower()
+        for name in SEASONAL_PERIODS:
+            if name in season_lower or season_lower in name:
+                return name
+
+    for name, period in SEASONAL_PERIODS.items():
+        if today.month in period['months']:
+            return name
+
+    next_month = (today.month % 12) + 1
+    for name, period in SEASONAL_PERIODS.items():
+        if next_month in period['months']:
+            return name
+    return None
+
+
+def season_month_keys(months: List[int], today: date) -> Tuple[List[str], List[str]]:
+    """Month keys for the latest occurrence of a season and the one before.
+
+    For each calendar month in the season we take its most recent completed
+    occurrence (the current, partial month is skipped so year-over-year
+    numbers compare whole months), and the same month one year earlier.
+    """
+    recent, previous = [], []
+    for m in months:
+        year = today.year if m < today.month else today.year - 1
+        recent.append(f"{year:04d}-{m:02d}")
+        previous.append(f"{year - 1:04d}-{m:02d}")
+    return recent, previous
+
+
+def seasonal_totals(cube: Cube, months: List[int], today: date) -> Dict[str, Dict[str, Any]]:
+    """Per-product sales for the latest and previous occurrence of a season."""
+    recent_keys, previous_keys = season_month_keys(months, today)
+    totals: Dict[str, Dict[str, Any]] = {}
+
+    for bucket, keys in (("recent_qty", recent_keys), ("previous_qty", previous_keys)):
+        for key in keys:
+            for product_id, cell in (cube.get(key) or {}).items():
+                entry = totals.setdefault(
+                    product_id, {"name": cell.get("name"), "recent_qty": 0.0, "previous_qty": 0.0}
+                )
+                entry[bucket] += float(cell.get("qty", 0) or 0)
+    return totals
+
+
+def yoy_change_pct(recent: float, previous: float) -> Optional[float]:
+    """Year-over-year change in percent, or None without a baseline."""
+    if previous <= 0:
+        return None
+    return round((recent - previous) / previous * 100.0, 1)
@@ -0,0 +1,456 @@
+"""
+Local write-ahead journal for POS sales and returns
+
+With SALES_JOURNAL_PATH set, /api/sales/record and /api/sales/return commit
+each checkout to a local SQLite journal (WAL mode, synchronous=FULL so an
+acknowledged sale survives a crash or power cut) and answer the POS at once.
+A background JournalFlusher pushes journaled entries upstream in batches:
+
+    transactions/{idempotency_key}      the ledger row
+    products/{product_id}.current_stock Increment(delta)
+    sales_cube/{shop}_{month}           Increment(qty/revenue) for sales
+    bills/{bill_id}, pos_requests/...   a checkout's documents, with its last line
+
+all in one atomic write batch per entry group: the lines of one checkout
+share a group_key and are claimed, committed and retried together, so a
+bill never lands with only some of its lines. The transaction document id
+is the entry's idempotency key, so an entry whose batch may already have
+landed (flusher crashed before marking it, or two workers raced for it) is
+checked first and never applied twice.
+
+Until an entry is flushed its stock delta is still pending here, and
+FirestoreDB adds pending deltas to every product it reads, so stock shown
+to the shop is always current. The same batch that applies an entry stamps
+its seq on the product (journal_seqs.{journal_id}), so between the commit
+and mark_flushed() a reader already skips it instead of counting it twice.
+Only one process flushes a journal at a time, which keeps those stamps
+increasing.
+
+Entries are replayed on startup. An entry that still can't be applied after
+SALES_JOURNAL_MAX_ATTEMPTS (10) tries (e.g. its product was deleted) is
+dead-lettered: no longer claimed, counted in stats(), and given another
+chance by requeue_dead().
+"""
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+import concurrency
+
+# A claim older than this is assumed abandoned by a dead flusher
+CLAIM_LEASE_SECONDS = 60.0
+DEFAULT_MAX_ATTEMPTS = 10
+
+# Product field mapping journal_id -> seq of the newest entry applied upstream
+WATERMARK_FIELD = "journal_seqs"
+
+
+class SalesJournal:
+    """Durable append-only journal of stock movements awaiting upstream flush."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = concurrency.thread_local()
+        self._owner = f"{socket.gethostname()}:{os.getpid()}"
+        with self._write() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS journal ("
+                "seq INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "idempotency_key TEXT NOT NULL UNIQUE, "
+                "shop_id TEXT NOT NULL, "
+                "product_id TEXT NOT NULL, "
+                "delta REAL NOT NULL, "
+                "transaction_json TEXT NOT NULL, "
+                "created_at REAL NOT NULL, "
+                "attempts INTEGER NOT NULL DEFAULT 0, "
+                "claimed_by TEXT, "
+                "claimed_at REAL, "
+                "flushed_at REAL, "
+                "last_error TEXT)"
+            )
+            # Journals created before these columns existed
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(journal)")]
+            if "documents_json" not in columns:
+                conn.execute("ALTER TABLE journal ADD COLUMN documents_json TEXT")
+            if "request_key" not in columns:
+                conn.execute("ALTER TABLE journal ADD COLUMN request_key TEXT")
+            if "dead_at" not in columns:
+                conn.execute("ALTER TABLE journal ADD COLUMN dead_at REAL")
+            if "group_key" not in columns:
+                conn.execute("ALTER TABLE journal ADD COLUMN group_key TEXT")
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS ix_journal_group ON journal (group_key) "
+                "WHERE group_key IS NOT NULL AND flushed_at IS NULL"
+            )
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('journal_id', ?)", (uuid.uuid4().hex[:12],))
+            self.journal_id = conn.execute("SELECT value FROM meta WHERE key = 'journal_id'").fetchone()[0]
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS ix_journal_request ON journal (request_key) "
+                "WHERE request_key IS NOT NULL"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS ix_journal_pending_product "
+                "ON journal (product_id) WHERE flushed_at IS NULL"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS ix_journal_pending_shop "
+                "ON journal (shop_id, product_id) WHERE flushed_at IS NULL"
+            )
+
+    def _conn(self) -> sqlite3.Connection:
+        # One connection per OS thread; SQLite handles cross-process locking
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=FULL")
+            self._local.conn = conn
+        return conn
+
+    def _write(self) -> "_Transaction":
+        return _Transaction(self._conn())
+
+    # ---- writes ----
+
+    def append(self, entries: Iterable[Dict[str, Any]]) -> int:
+        """Durably record entries; returns how many were new.
+
+        Each entry has idempotency_key, shop_id, product_id, delta (signed
+        stock change), transaction (the ledger row as a dict) and optionally
+        documents, more documents to write in the same upstream batch
+        ([{"collection", "id", "data"}], e.g. the checkout's bill),
+        request_key, which request_documents() finds them by, and
+        group_key, shared by entries that must go upstream together.
+        Entries whose key is already journaled are ignored.
+        """
+        added = 0
+        now = time.time()
+        with self._write() as conn:
+            for entry in entries:
+                documents = entry.get("documents")
+                cur = conn.execute(
+                    "INSERT OR IGNORE INTO journal "
+                    "(idempotency_key, shop_id, product_id, delta, transaction_json, documents_json, "
+                    "request_key, group_key, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        entry["idempotency_key"],
+                        entry["shop_id"],
+                        entry["product_id"],
+                        float(entry["delta"]),
+                        json.dumps(entry["transaction"]),
+                        json.dumps(documents) if documents else None,
+                        entry.get("request_key"),
+                        entry.get("group_key"),
+                        now,
+                    ),
+                )
+                added += cur.rowcount
+        return added
+
+    def claim(self, limit: int = 150, lease_seconds: float = CLAIM_LEASE_SECONDS) -> List[Dict[str, Any]]:
+        """Claim up to `limit` unflushed entries (oldest first) for flushing.
+
+        Entries with attempts > 1 after claiming may already be upstream.
+        Nothing is claimed while another process holds a live claim, so
+        entries go upstream in seq order. A group is claimed whole, even if
+        that goes past `limit`.
+        """
+        now = time.time()
+        with self._write() as conn:
+            busy = conn.execute(
+                "SELECT 1 FROM journal WHERE flushed_at IS NULL AND claimed_by != ? AND claimed_at >= ? LIMIT 1",
+                (self._owner, now - lease_seconds),
+            ).fetchone()
+            if busy:
+                return []
+            rows = conn.execute(
+                "SELECT seq FROM journal WHERE flushed_at IS NULL AND dead_at IS NULL "
+                "AND (claimed_at IS NULL OR claimed_at < ?) ORDER BY seq LIMIT ?",
+                (now - lease_seconds, limit),
+            ).fetchall()
+            seqs = [r[0] for r in rows]
+            if not seqs:
+                return []
+            marks = ",".join("?" for _ in seqs)
+            groups = [r[0] for r in conn.execute(
+                f"SELECT DISTINCT group_key FROM journal WHERE seq IN ({marks}) AND group_key IS NOT NULL", seqs,
+            ).fetchall()]
+            if groups:
+                rest = conn.execute(
+                    f"SELECT seq FROM journal WHERE group_key IN ({','.join('?' for _ in groups)}) "
+                    f"AND flushed_at IS NULL AND dead_at IS NULL",
+                    groups,
+                ).fetchall()
+                seqs = sorted(set(seqs).union(r[0] for r in rest))
+                marks = ",".join("?" for _ in seqs)
+            conn.execute(
+                f"UPDATE journal SET attempts = attempts + 1, claimed_by = ?, claimed_at = ? "
+                f"WHERE seq IN ({marks})",
+                [self._owner, now] + seqs,
+            )
+            rows = conn.execute(
+                f"SELECT seq, idempotency_key, shop_id, product_id, delta, transaction_json, documents_json, attempts, "
+                f"group_key FROM journal WHERE seq IN ({marks}) ORDER BY seq",
+                seqs,
+            ).fetchall()
+        return [
+            {
+                "seq": seq,
+                "idempotency_key": key,
+                "shop_id": shop_id,
+                "product_id": product_id,
+                "delta": delta,
+                "transaction": json.loads(txn_json),
+                "documents": json.loads(docs_json) if docs_json else [],
+                "attempts": attempts,
+                "group_key": group_key,
+            }
+            for seq, key, shop_id, product_id, delta, txn_json, docs_json, attempts, group_key in rows
+        ]
+
+    def mark_flushed(self, seqs: List[int]) -> None:
+        if not seqs:
+            return
+        marks = ",".join("?" for _ in seqs)
+        with self._write() as conn:
+            conn.execute(
+                f"UPDATE journal SET flushed_at = ?, claimed_by = NULL, claimed_at = NULL, last_error = NULL "
+                f"WHERE seq IN ({marks})",
+                [time.time()] + list(seqs),
+            )
+
+    def release(self, seqs: List[int], error: str, max_attempts: Optional[int] = None) -> int:
+        """Give entries back after a failed flush so they are retried.
+
+        With `max_attempts`, entries tried that often are dead-lettered
+        instead; returns how many were.
+        """
+        if not seqs:
+            return 0
+        marks = ",".join("?" for _ in seqs)
+        with self._write() as conn:
+            conn.execute(
+                f"UPDATE journal SET claimed_by = NULL, claimed_at = NULL, last_error = ? WHERE seq IN ({marks})",
+                [error[:500]] + list(seqs),
+            )
+            if not max_attempts:
+                return 0
+            cur = conn.execute(
+                f"UPDATE journal SET dead_at = ? WHERE seq IN ({marks}) AND attempts >= ?",
+                [time.time()] + list(seqs) + [max_attempts],
+            )
+            return cur.rowcount
+
+    def requeue_dead(self) -> int:
+        """Make dead-lettered entries flushable again (after fixing their cause).
+
+        They restart at one attempt, so the next flush still checks whether
+        they are already upstream.
+        """
+        with self._write() as conn:
+            cur = conn.execute(
+                "UPDATE journal SET dead_at = NULL, attempts = 1 WHERE dead_at IS NOT NULL AND flushed_at IS NULL"
+            )
+            return cur.rowcount
+
+    def release_stale_claims(self) -> int:
+        """Startup replay: make entries claimed by earlier processes flushable now.
+
+        Safe even if another live worker holds the claim: entries that were
+        attempted before are checked upstream before being applied.
+        """
+        with self._write() as conn:
+            cur = conn.execute(
+                "UPDATE journal SET claimed_by = NULL, claimed_at = NULL "
+                "WHERE flushed_at IS NULL AND claimed_at IS NOT NULL AND claimed_by != ?",
+                (self._owner,),
+            )
+            return cur.rowcount
+
+    def prune(self, older_than_seconds: float) -> int:
+        """Delete flushed entries older than the retention window."""
+        with self._write() as conn:
+            cur = conn.execute(
+                "DELETE FROM journal WHERE flushed_at IS NOT NULL AND flushed_at < ?",
+                (time.time() - older_than_seconds,),
+            )
+            return cur.rowcount
+
+    # ---- reads ----
+
+    def applied_seq(self, product: Dict[str, Any]) -> int:
+        """Newest entry of this journal already applied to a product document."""
+        stamps = product.get(WATERMARK_FIELD)
+        return int(stamps.get(self.journal_id) or 0) if isinstance(stamps, dict) else 0
+
+    def pending_delta(self, product_id: str, applied_seq: int = 0) -> float:
+        """Unflushed stock change for one product, past its applied_seq()."""
+        row = self._conn().execute(
+            "SELECT TOTAL(delta) FROM journal WHERE product_id = ? AND flushed_at IS NULL AND seq > ?",
+            (product_id, applied_seq),
+        ).fetchone()
+        return float(row[0] or 0.0)
+
+    def pending_entries(self, shop_id: str) -> Dict[str, List[Any]]:
+        """Unflushed (seq, delta) pairs per product for a shop, for pending_since()."""
+        pending: Dict[str, List[Any]] = {}
+        rows = self._conn().execute(
+            "SELECT product_id, seq, delta FROM journal WHERE shop_id = ? AND flushed_at IS NULL ORDER BY seq",
+            (shop_id,),
+        ).fetchall()
+        for product_id, seq, delta in rows:
+            pending.setdefault(product_id, []).append((seq, delta))
+        return pending
+
+    @staticmethod
+    def pending_since(entries: Optional[List[Any]], applied_seq: int) -> float:
+        """Sum of the pending_entries() deltas not yet applied upstream."""
+        return float(sum(delta for seq, delta in entries or () if seq > applied_seq))
+
+    def pending_deltas(self, shop_id: str) -> Dict[str, float]:
+        """Unflushed stock change per product for a shop."""
+        rows = self._conn().execute(
+            "SELECT product_id, TOTAL(delta) FROM journal "
+            "WHERE shop_id = ? AND flushed_at IS NULL GROUP BY product_id",
+            (shop_id,),
+        ).fetchall()
+        return {product_id: float(delta) for product_id, delta in rows}
+
+    def request_documents(self, request_key: str) -> Optional[List[Dict[str, Any]]]:
+        """Documents journaled with a keyed request, flushed or not (None if never seen)."""
+        row = self._conn().execute(
+            "SELECT documents_json FROM journal WHERE request_key = ? LIMIT 1", (request_key,)
+        ).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]) if row[0] else []
+
+    def stats(self) -> Dict[str, Any]:
+        """Lag metrics: backlog size, age of the oldest pending entry, failures."""
+        now = time.time()
+        conn = self._conn()
+        pending, oldest, retrying = conn.execute(
+            "SELECT COUNT(*), MIN(created_at), SUM(CASE WHEN attempts > 0 THEN 1 ELSE 0 END) "
+            "FROM journal WHERE flushed_at IS NULL AND dead_at IS NULL"
+        ).fetchone()
+        dead = conn.execute(
+            "SELECT COUNT(*) FROM journal WHERE flushed_at IS NULL AND dead_at IS NOT NULL"
+        ).fetchone()[0]
+        flushed, last_flush = conn.execute(
+            "SELECT COUNT(*), MAX(flushed_at) FROM journal WHERE flushed_at IS NOT NULL"
+        ).fetchone()
+        last_error = conn.execute(
+            "SELECT last_error FROM journal WHERE flushed_at IS NULL AND last_error IS NOT NULL "
+            "ORDER BY seq DESC LIMIT 1"
+        ).fetchone()
+        return {
+            "pending_entries": pending,
+            "retrying_entries": retrying or 0,
+            "dead_letter_entries": dead,
+            "lag_seconds": round(now - oldest, 3) if oldest else 0.0,
+            "flushed_entries": flushed,
+            "seconds_since_last_flush": round(now - last_flush, 3) if last_flush else None,
+            "last_error": last_error[0] if last_error else None,
+        }
+
+
+class _Transaction:
+    """`with` wrapper: BEGIN IMMEDIATE ... COMMIT/ROLLBACK on one connection."""
+
+    def __init__(self, conn: sqlite3.Connection):
+        self._conn = conn
+
+    def __enter__(self) -> sqlite3.Connection:
+        self._conn.execute("BEGIN IMMEDIATE")
+        return self._conn
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        self._conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        return False
+
+
+class JournalFlusher:
+    """Background thread that drains the journal into the upstream store.
+
+    `apply_batch(entries)` writes claimed entries upstream and returns the
+    seqs it applied (FirestoreDB.apply_journal_entries). Entries it skips
+    are retried and dead-lettered after `max_attempts` tries; a failure of
+    the whole batch (upstream down) never dead-letters.
+    """
+
+    def __init__(self, journal: SalesJournal, apply_batch: Callable[[List[Dict[str, Any]]], List[int]],
+                 interval_seconds: float = 2.0, batch_size: int = 150,
+                 retention_seconds: float = 3 * 24 * 3600, max_attempts: int = DEFAULT_MAX_ATTEMPTS):
+        self.journal = journal
+        self.apply_batch = apply_batch
+        self.interval_seconds = interval_seconds
+        self.batch_size = batch_size
+        self.retention_seconds = retention_seconds
+        self.max_attempts = max_attempts
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def flush_once(self) -> int:
+        """Flush everything currently pending; returns entries applied."""
+        applied_total = 0
+        while True:
+            entries = self.journal.claim(self.batch_size)
+            if not entries:
+                return applied_total
+            seqs = [entry["seq"] for entry in entries]
+            try:
+                applied = self.apply_batch(entries)
+            except Exception as e:
+                print(f"⚠️ Journal flush failed, will retry: {e}")
+                self.journal.release(seqs, str(e))
+                return applied_total
+            self.journal.mark_flushed(applied)
+            applied_set = set(applied)
+            failed = [seq for seq in seqs if seq not in applied_set]
+            if failed:
+                dead = self.journal.release(failed, "entry could not be applied upstream", self.max_attempts)
+                if dead:
+                    print(f"❌ {dead} journal entries dead-lettered after {self.max_attempts} attempts")
+            applied_total += len(applied)
+            if failed:
+                return applied_total
+
+    def wake(self) -> None:
+        """Flush soon (called after each new checkout)."""
+        self._wake.set()
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        replayed = self.journal.release_stale_claims()
+        if replayed:
+            print(f"🔁 Replaying {replayed} journal entries from a previous run")
+        self._thread = threading.Thread(target=self._run, name="sales-journal-flusher", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self) -> None:
+        last_prune = 0.0
+        while not self._stop.is_set():
+            try:
+                self.flush_once()
+                if time.time() - last_prune > 3600:
+                    self.journal.prune(self.retention_seconds)
+                    last_prune = time.time()
+            except Exception as e:
+                print(f"⚠️ Journal flusher error: {e}")
+            self._wake.wait(self.interval_seconds)
+            self._wake.clear()
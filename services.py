@@ -0,0 +1,198 @@
+"""
+Lazily constructed service singletons
+
+Importing the app used to build the Firestore client, the OpenAI client, the
+WhatsApp and OTP services and the command processor before gunicorn could
+answer a request. Each of them is now a `LazyService`: a stand-in that
+builds the real object the first time anything on it is used, once per
+process even when several request threads get there together.
+
+    from services import db
+    db.get_products_by_shop(shop_id)    # the first call constructs FirestoreDB
+
+Config is validated when the first service is built (ValueError if anything
+required is missing). `warm()` builds everything up front and reports how
+long each took; GET /ready calls it, and gunicorn.conf.py starts it in the
+background in each worker.
+
+Tests and tools that never touch a service never pay for it.
+"""
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+from config import Config
+
+_config_lock = threading.Lock()
+_config_checked = False
+
+
+def check_config() -> None:
+    """Config.validate(), once per process; raises ValueError."""
+    global _config_checked
+    if _config_checked:
+        return
+    with _config_lock:
+        if not _config_checked:
+            Config.validate()
+            _config_checked = True
+
+
+class LazyService:
+    """Builds `factory()` on first use and forwards attribute access to it."""
+
+    def __init__(self, name: str, factory: Callable[[], Any], warm: Optional[Callable[[Any], Any]] = None):
+        object.__setattr__(self, "_name", name)
+        object.__setattr__(self, "_factory", factory)
+        object.__setattr__(self, "_warm", warm)
+        object.__setattr__(self, "_lock", threading.Lock())
+        object.__setattr__(self, "_instance", None)
+        object.__setattr__(self, "_seconds", None)
+
+    def get(self) -> Any:
+        instance = self._instance
+        if instance is not None:
+            return instance
+        with self._lock:
+            if self._instance is None:
+                started = time.perf_counter()
+                instance = self._factory()
+                if self._warm is not None:
+                    self._warm(instance)
+                object.__setattr__(self, "_seconds", time.perf_counter() - started)
+                object.__setattr__(self, "_instance", instance)
+            return self._instance
+
+    @property
+    def ready(self) -> bool:
+        return self._instance is not None
+
+    @property
+    def seconds(self) -> Optional[float]:
+        """How long construction took, once built."""
+        return self._seconds
+
+    def set(self, instance: Any) -> None:
+        """Use `instance` instead of building one (tests, load harness)."""
+        with self._lock:
+            object.__setattr__(self, "_instance", instance)
+
+    def reset(self) -> None:
+        with self._lock:
+            object.__setattr__(self, "_instance", None)
+            object.__setattr__(self, "_seconds", None)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.get(), name)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        setattr(self.get(), name, value)
+
+    def __repr__(self) -> str:
+        return f"<lazy {self._name} ({'ready' if self.ready else 'not built'})>"
+
+
+def _build_db():
+    from database import FirestoreDB
+
+    check_config()
+    print(f"🔧 Initializing database with:")
+    print(f"   backend: {Config.DATABASE_BACKEND}")
+    print(f"   credentials_path: {Config.GOOGLE_APPLICATION_CREDENTIALS}")
+    print(f"   project_id: {Config.FIREBASE_PROJECT_ID}")
+    database = FirestoreDB(
+        credentials_path=Config.GOOGLE_APPLICATION_CREDENTIALS,
+        project_id=Config.FIREBASE_PROJECT_ID,
+        backend=Config.DATABASE_BACKEND,
+        sqlite_path=Config.SQLITE_PATH,
+        journal_path=Config.SALES_JOURNAL_PATH,
+    )
+    print(f"✅ Database initialized")
+    if database.start_journal_flusher():
+        print(f"✅ Sales journal enabled: {Config.SALES_JOURNAL_PATH}")
+    return database
+
+
+def _build_otp_service():
+    from otp_service import OTPService
+
+    return OTPService(db.get().db)
+
+
+def _build_ai_service():
+    from ai_service import AIService
+
+    check_config()
+    return AIService(api_key=Config.OPENAI_API_KEY, model=Config.OPENAI_MODEL)
+
+
+def whatsapp_provider() -> str:
+    return "wati" if Config.WATI_API_KEY else "whatsapp_cloud"
+
+
+def _build_whatsapp_service():
+    from whatsapp_service import WhatsAppService
+
+    check_config()
+    if whatsapp_provider() == "wati":
+        return WhatsAppService(
+            provider="wati",
+            api_key=Config.WATI_API_KEY,
+            base_url=Config.WATI_BASE_URL
+        )
+    return WhatsAppService(
+        provider="whatsapp_cloud",
+        access_token=Config.WHATSAPP_ACCESS_TOKEN,
+        phone_number_id=Config.WHATSAPP_PHONE_NUMBER_ID
+    )
+
+
+def _build_command_processor():
+    from command_processor import CommandProcessor
+
+    return CommandProcessor(
+        db=db.get(),
+        ai_service=ai_service.get(),
+        whatsapp_service=whatsapp_service.get()
+    )
+
+
+db = LazyService("database", _build_db)
+otp_service = LazyService("otp_service", _build_otp_service)
+# Touching .client imports openai and builds the HTTP client
+ai_service = LazyService("ai_service", _build_ai_service, warm=lambda service: service.client)
+whatsapp_service = LazyService("whatsapp_service", _build_whatsapp_service)
+command_processor = LazyService("command_processor", _build_command_processor)
+
+ALL = (db, otp_service, ai_service, whatsapp_service, command_processor)
+
+
+def warm() -> Dict[str, Any]:
+    """Build every service now; per-service readiness, build time and error."""
+    report: Dict[str, Any] = {}
+    for service in ALL:
+        entry: Dict[str, Any] = {"ready": False}
+        try:
+            service.get()
+            entry["ready"] = True
+            entry["seconds"] = round(service.seconds or 0.0, 4)
+        except Exception as e:
+            entry["error"] = str(e)
+        report[service._name] = entry
+    return report
+
+
+def warm_in_background() -> threading.Thread:
+    """warm() on a daemon thread, so a worker can answer while it runs."""
+    def run():
+        started = time.perf_counter()
+        report = warm()
+        failed = [name for name, entry in report.items() if not entry["ready"]]
+        if failed:
+            print(f"⚠️ Services not ready: {', '.join(failed)}")
+        else:
+            print(f"✅ Services warmed in {time.perf_counter() - started:.2f}s")
+
+    thread = threading.Thread(target=run, name="kirana-warm-services", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,228 @@
+"""
+Per-shop data layout: global collections vs shops/{shop_id}/... subcollections
+
+Shop-scoped data lives in one of two layouts, chosen per shop by the
+`data_layout` field on its shops/{shop_id} document:
+
+    global   products/{id}, transactions/{id}, udhar_entries/{id},
+             unrecognized_commands/{id}, bills/{id}, filtered by shop_id
+             (the original layout; shops without the field use it)
+    nested   shops/{shop_id}/products/{id}, .../transactions/{id},
+             .../udhar/{id}, .../unrecognized_commands/{id}, .../bills/{id}
+    dual     cut-over state while a shop is being migrated: reads come from
+             the nested layout and fall back to the global one, writes go to
+             both so either side stays complete and the switch can be rolled
+             back at any point
+
+Nested queries only touch one shop's index entries, and per-shop ledgers can
+be range-filtered/ordered on a single field without composite indexes.
+
+FirestoreDB resolves every shop-scoped collection through the layout, and
+tools/migrate_shop_layout.py moves shops across: set dual, backfill in
+checkpointed batches, verify counts, then cut over to nested.
+"""
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+GLOBAL = "global"
+DUAL = "dual"
+NESTED = "nested"
+LAYOUTS = (GLOBAL, DUAL, NESTED)
+
+# Global collection name -> subcollection name under shops/{shop_id}
+SHOP_COLLECTIONS: Dict[str, str] = {
+    "products": "products",
+    "transactions": "transactions",
+    "udhar_entries": "udhar",
+    "unrecognized_commands": "unrecognized_commands",
+    "bills": "bills",
+}
+
+# Field holding the document id, for collection group lookups by id
+ID_FIELDS: Dict[str, str] = {
+    "products": "product_id",
+    "transactions": "transaction_id",
+    "udhar_entries": "entry_id",
+    "unrecognized_commands": "command_id",
+    "bills": "bill_id",
+}
+
+DESCENDING = "DESCENDING"
+
+
+def nested_collection(client: Any, shop_id: str, name: str) -> Any:
+    """shops/{shop_id}/<subcollection> for a global collection name."""
+    return client.collection("shops").document(shop_id).collection(SHOP_COLLECTIONS[name])
+
+
+def _sort_value(value: Any) -> Tuple[int, Any]:
+    # Missing fields sort first, like Firestore's null ordering
+    return (0, "") if value is None else (1, value)
+
+
+class DualQuery:
+    """The same query on the nested (primary) and global (fallback) layouts.
+
+    Results are merged by document id with the nested copy winning, then
+    ordered and limited in Python.
+    """
+
+    def __init__(self, primary: Any, fallback: Any, orders: Tuple = (), limit_n: Optional[int] = None):
+        self._primary = primary
+        self._fallback = fallback
+        self._orders = orders
+        self._limit = limit_n
+
+    def where(self, field: str, op: str, value: Any) -> "DualQuery":
+        return DualQuery(self._primary.where(field, op, value), self._fallback.where(field, op, value),
+                         self._orders, self._limit)
+
+    def order_by(self, field: str, direction: str = "ASCENDING") -> "DualQuery":
+        return DualQuery(self._primary.order_by(field, direction=direction),
+                         self._fallback.order_by(field, direction=direction),
+                         self._orders + ((field, direction),), self._limit)
+
+    def limit(self, count: int) -> "DualQuery":
+        return DualQuery(self._primary.limit(count), self._fallback.limit(count), self._orders, count)
+
+    def select(self, field_paths: List[str]) -> "DualQuery":
+        # Keep ordering fields so the merge can sort
+        fields = list(field_paths) + [f for f, _ in self._orders if f not in field_paths]
+        return DualQuery(self._primary.select(fields), self._fallback.select(fields), self._orders, self._limit)
+
+    def stream(self, **_: Any) -> Iterator[Any]:
+        merged: Dict[str, Any] = {}
+        for doc in self._primary.stream():
+            merged[doc.id] = doc
+        for doc in self._fallback.stream():
+            merged.setdefault(doc.id, doc)
+        docs = list(merged.values())
+        for field, direction in reversed(self._orders):
+            docs.sort(key=lambda d: _sort_value((d.to_dict() or {}).get(field)), reverse=direction == DESCENDING)
+        if self._limit is not None:
+            docs = docs[:self._limit]
+        return iter(docs)
+
+    def get(self, **kwargs: Any) -> List[Any]:
+        return list(self.stream(**kwargs))
+
+
+class DualCollection(DualQuery):
+    def __init__(self, primary: Any, fallback: Any):
+        super().__init__(primary, fallback)
+
+    def document(self, document_id: str) -> "DualDocument":
+        return DualDocument(self._primary.document(document_id), self._fallback.document(document_id))
+
+
+class DualDocument:
+    """A document written to both layouts and read nested-first."""
+
+    def __init__(self, primary: Any, fallback: Any):
+        self.primary = primary
+        self.fallback = fallback
+        self.id = primary.id
+
+    def get(self, **_: Any) -> Any:
+        doc = self.primary.get()
+        return doc if doc.exists else self.fallback.get()
+
+    def materialize(self) -> Any:
+        """Copy the global document into the nested layout if it isn't there yet."""
+        if not self.primary.get().exists:
+            doc = self.fallback.get()
+            if doc.exists:
+                self.primary.set(doc.to_dict())
+        return self.primary
+
+    def write_refs(self, update: bool = False) -> List[Any]:
+        """Refs a batch must write; for updates, only refs holding the doc."""
+        if not update:
+            return [self.primary, self.fallback]
+        refs = [self.materialize()]
+        if self.fallback.get().exists:
+            refs.append(self.fallback)
+        return refs
+
+    def set(self, data: Dict[str, Any], merge: bool = False) -> None:
+        if merge:
+            self.materialize()
+        self.primary.set(data, merge=merge)
+        self.fallback.set(data, merge=merge)
+
+    def update(self, data: Dict[str, Any]) -> None:
+        self.materialize().update(data)
+        try:
+            self.fallback.update(data)
+        except Exception:
+            # Created after the switch to dual; only the nested copy exists
+            pass
+
+    def delete(self) -> None:
+        self.primary.delete()
+        self.fallback.delete()
+
+
+# ---- migration ----
+
+def _stream_page(query: Any, page_size: int, after: Optional[Any]) -> List[Any]:
+    query = query.order_by("__name__")
+    if after is not None:
+        query = query.where("__name__", ">", after)
+    return list(query.limit(page_size).stream())
+
+
+def backfill_collection(client: Any, shop_id: str, name: str, page_size: int = 300,
+                        after_id: Optional[str] = None, on_page: Optional[Any] = None) -> Dict[str, int]:
+    """Copy a shop's global documents of one collection into its nested layout.
+
+    Documents already present in the nested layout were written after the
+    switch to dual and are newer, so they are left alone. Pages are ordered
+    by document id; `on_page(last_id, copied, skipped)` runs after each
+    committed page so the caller can checkpoint and resume from `after_id`.
+    """
+    source = client.collection(name)
+    target = nested_collection(client, shop_id, name)
+    shop_query = source.where("shop_id", "==", shop_id)
+    copied = skipped = 0
+    last_id = after_id
+
+    while True:
+        page = _stream_page(shop_query, page_size, source.document(last_id) if last_id else None)
+        if not page:
+            break
+        batch = client.batch()
+        pending = 0
+        for doc in page:
+            ref = target.document(doc.id)
+            if ref.get().exists:
+                skipped += 1
+                continue
+            batch.set(ref, doc.to_dict())
+            pending += 1
+        if pending:
+            batch.commit()
+        copied += pending
+        last_id = page[-1].id
+        if on_page is not None:
+            on_page(last_id, copied, skipped)
+        if len(page) < page_size:
+            break
+    return {"copied": copied, "skipped": skipped}
+
+
+def verify_collection(client: Any, shop_id: str, name: str) -> Dict[str, Any]:
+    """Compare a shop's global and nested copies of one collection.
+
+    The nested side may hold more (writes since the switch to dual) but
+    must contain every global document.
+    """
+    global_ids = {doc.id for doc in client.collection(name).where("shop_id", "==", shop_id).select(["shop_id"]).stream()}
+    nested_ids = {doc.id for doc in nested_collection(client, shop_id, name).select(["shop_id"]).stream()}
+    missing = sorted(global_ids - nested_ids)
+    return {
+        "global": len(global_ids),
+        "nested": len(nested_ids),
+        "missing": len(missing),
+        "missing_sample": missing[:10],
+        "ok": not missing,
+    }
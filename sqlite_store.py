@@ -0,0 +1,518 @@
+"""
+SQLite document store with the Firestore client API used by FirestoreDB
+
+FirestoreDB (and OTPService) talk to their storage through the small part of
+the google.cloud.firestore client API they actually use:
+
+    client.collection(name).document(id).set(data, merge=...) / create / update / get / delete
+    client.collection(name).where(field, op, value).order_by(...).limit(n).stream()
+    client.collection(name).add(data), client.batch(), query.count() / .sum()
+    client.collection_group(name), "__name__" (document id) filters/ordering
+    firestore.Increment(n) inside set(merge=True) and update()
+
+SQLiteClient implements that same surface on a single SQLite file, so the
+whole app can run on one box without Firestore (DATABASE_BACKEND=sqlite)
+and tests/benchmarks get a real local backend.
+
+Each collection id is one table of JSON documents keyed by (parent, id);
+`parent` is the owning document path for subcollections ("" at the root).
+Queries compile to SQL on json_extract() expressions, and the hot lookups
+have expression indexes, e.g. transactions (shop_id, timestamp) and
+products (shop_id, normalized_name) / (shop_id, barcode).
+"""
+import json
+import re
+import sqlite3
+import threading
+import uuid
+from datetime import date, datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# Indexed fields per collection id; every collection also gets (shop_id).
+INDEXES: Dict[str, List[Tuple[str, ...]]] = {
+    "transactions": [("shop_id", "timestamp"), ("product_id", "timestamp")],
+    "products": [("shop_id", "normalized_name"), ("shop_id", "barcode")],
+    "shops": [("owner_phone",)],
+    "users": [("phone",)],
+    "otps": [("phone",)],
+    "udhar": [("shop_id", "customer_key")],
+    "pending_selections": [("user_phone",)],
+    "unrecognized_commands": [("shop_id", "resolved")],
+}
+
+_FIELD_RE = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*(\.[A-Za-z0-9_\-]+)*$")
+_TABLE_RE = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+_OPERATORS = {"==": "=", "<": "<", "<=": "<=", ">": ">", ">=": ">=", "!=": "!="}
+
+DESCENDING = "DESCENDING"
+ASCENDING = "ASCENDING"
+
+
+class Increment:
+    """Stand-in for firestore.Increment, so the SQLite backend never imports google.cloud."""
+
+    __slots__ = ("value",)
+
+    def __init__(self, value: float):
+        self.value = value
+
+
+class NotFound(Exception):
+    """Raised by update() on a missing document, like Firestore's NotFound."""
+
+
+class AlreadyExists(Exception):
+    """Raised by create() on an existing document, like Firestore's AlreadyExists."""
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Cannot store {type(value).__name__} in a document")
+
+
+def _is_increment(value: Any) -> bool:
+    # Duck-typed so google.cloud.firestore.Increment works without importing it
+    return type(value).__name__ == "Increment" and hasattr(value, "value")
+
+
+def _json_path(field: str) -> str:
+    if not _FIELD_RE.match(field):
+        raise ValueError(f"Unsupported field path: {field!r}")
+    return "$" + "".join(f'."{part}"' for part in field.split("."))
+
+
+def _field_expr(field: str) -> str:
+    if field == "__name__":
+        return "id"
+    return f"json_extract(data, '{_json_path(field)}')"
+
+
+_MISSING = object()
+
+
+def _type_expr(field: str) -> str:
+    # 'null' for an explicit null, SQL NULL for a missing field
+    return f"json_type(data, '{_json_path(field)}')"
+
+
+def _select(data: Dict[str, Any], fields: Tuple[str, ...]) -> Dict[str, Any]:
+    """The listed field paths of `data`, nested paths as nested maps."""
+    out: Dict[str, Any] = {}
+    for path in fields:
+        node: Any = data
+        parts = path.split(".")
+        for part in parts:
+            node = node.get(part, _MISSING) if isinstance(node, dict) else _MISSING
+        if node is _MISSING:
+            continue
+        target = out
+        for part in parts[:-1]:
+            target = target.setdefault(part, {})
+        target[parts[-1]] = node
+    return out
+
+
+def _sql_value(value: Any) -> Any:
+    if isinstance(value, DocumentReference):
+        return value.id
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def _apply_value(current: Any, value: Any) -> Any:
+    if _is_increment(value):
+        base = current if isinstance(current, (int, float)) and not isinstance(current, bool) else 0
+        return base + value.value
+    return value
+
+
+def _merge(target: Dict[str, Any], updates: Dict[str, Any]) -> None:
+    """Deep-merge like set(merge=True): nested maps merge, leaves replace."""
+    for key, value in updates.items():
+        if isinstance(value, dict):
+            child = target.get(key)
+            if not isinstance(child, dict):
+                child = {}
+                target[key] = child
+            _merge(child, value)
+        else:
+            target[key] = _apply_value(target.get(key), value)
+
+
+def _resolve_increments(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Plain set(): Increment on a new value counts from zero."""
+    out: Dict[str, Any] = {}
+    for key, value in data.items():
+        if isinstance(value, dict):
+            out[key] = _resolve_increments(value)
+        else:
+            out[key] = _apply_value(None, value)
+    return out
+
+
+def _update_paths(target: Dict[str, Any], updates: Dict[str, Any]) -> None:
+    """update(): keys are field paths ("a.b"), values replace the field."""
+    for path, value in updates.items():
+        parts = path.split(".")
+        node = target
+        for part in parts[:-1]:
+            child = node.get(part)
+            if not isinstance(child, dict):
+                child = {}
+                node[part] = child
+            node = child
+        node[parts[-1]] = _apply_value(node.get(parts[-1]), value)
+
+
+class DocumentSnapshot:
+    def __init__(self, reference: "DocumentReference", data: Optional[Dict[str, Any]]):
+        self.reference = reference
+        self.id = reference.id
+        self._data = data
+        self.exists = data is not None
+
+    def to_dict(self) -> Optional[Dict[str, Any]]:
+        return None if self._data is None else json.loads(json.dumps(self._data))
+
+    def get(self, field: str) -> Any:
+        node: Any = self._data or {}
+        for part in field.split("."):
+            node = node.get(part) if isinstance(node, dict) else None
+        return node
+
+
+class AggregationResult:
+    def __init__(self, alias: str, value: Any):
+        self.alias = alias
+        self.value = value
+
+
+class AggregationQuery:
+    def __init__(self, query: "Query", aggregations: List[Tuple[str, str, Optional[str]]]):
+        self._query = query
+        self._aggregations = aggregations
+
+    def count(self, alias: Optional[str] = None) -> "AggregationQuery":
+        return AggregationQuery(self._query, self._aggregations + [("count", alias or "count", None)])
+
+    def sum(self, field: str, alias: Optional[str] = None) -> "AggregationQuery":
+        return AggregationQuery(self._query, self._aggregations + [("sum", alias or field, field)])
+
+    def get(self, **_: Any) -> List[List[AggregationResult]]:
+        columns = []
+        for kind, _alias, field in self._aggregations:
+            if kind == "count":
+                columns.append("COUNT(*)")
+            else:
+                # Numbers only: Firestore's sum() skips booleans and strings
+                columns.append(f"TOTAL(CASE WHEN {_type_expr(field)} IN ('integer', 'real') "
+                               f"THEN {_field_expr(field)} END)")
+        # Over the rows the query itself would return (its order_by and limit included)
+        source, params = self._query._rows_sql("data")
+        sql = f'SELECT {", ".join(columns)} FROM ({source})'
+        row = self._query._client._execute(self._query._table, sql, params).fetchone()
+        return [[AggregationResult(alias, row[i]) for i, (_k, alias, _f) in enumerate(self._aggregations)]]
+
+
+class Query:
+    def __init__(self, client: "SQLiteClient", table: str, parent: Optional[str],
+                 filters: Tuple = (), orders: Tuple = (), limit_n: Optional[int] = None,
+                 offset_n: Optional[int] = None, fields: Optional[Tuple[str, ...]] = None):
+        self._client = client
+        self._table = table
+        self._parent = parent
+        self._filters = filters
+        self._orders = orders
+        self._limit = limit_n
+        self._offset = offset_n
+        self._fields = fields
+
+    def _copy(self, **changes: Any) -> "Query":
+        state = dict(filters=self._filters, orders=self._orders, limit_n=self._limit,
+                     offset_n=self._offset, fields=self._fields)
+        state.update(changes)
+        return Query(self._client, self._table, self._parent, **state)
+
+    def where(self, field: str, op: str, value: Any) -> "Query":
+        if op not in _OPERATORS and op not in ("in", "not-in", "array_contains"):
+            raise ValueError(f"Unsupported operator: {op}")
+        return self._copy(filters=self._filters + ((field, op, value),))
+
+    def order_by(self, field: str, direction: str = ASCENDING) -> "Query":
+        return self._copy(orders=self._orders + ((field, direction),))
+
+    def limit(self, count: int) -> "Query":
+        return self._copy(limit_n=count)
+
+    def offset(self, count: int) -> "Query":
+        return self._copy(offset_n=count)
+
+    def select(self, field_paths: List[str]) -> "Query":
+        return self._copy(fields=tuple(field_paths))
+
+    def count(self, alias: Optional[str] = None) -> AggregationQuery:
+        return AggregationQuery(self, []).count(alias)
+
+    def sum(self, field: str, alias: Optional[str] = None) -> AggregationQuery:
+        return AggregationQuery(self, []).sum(field, alias)
+
+    def _where_sql(self) -> Tuple[str, List[Any]]:
+        # parent None = collection group query (every collection with this id)
+        clauses = ["parent = ?"] if self._parent is not None else ["1"]
+        params: List[Any] = [self._parent] if self._parent is not None else []
+        for field, op, value in self._filters:
+            expr = _field_expr(field)
+            if op in ("in", "not-in"):
+                values = [_sql_value(v) for v in value]
+                if not values:
+                    clauses.append("0" if op == "in" else "1")
+                    continue
+                marks = ", ".join("?" for _ in values)
+                clauses.append(f"{expr} {'IN' if op == 'in' else 'NOT IN'} ({marks})")
+                params.extend(values)
+            elif op == "array_contains":
+                clauses.append(f"EXISTS (SELECT 1 FROM json_each(data, '{_json_path(field)}') WHERE value = ?)")
+                params.append(_sql_value(value))
+            elif value is None and op == "==":
+                # An explicit null only, not a missing field
+                clauses.append(f"{_type_expr(field)} = 'null'")
+            elif value is None and op == "!=":
+                clauses.append(f"{expr} IS NOT NULL")
+            elif isinstance(value, bool) and op in ("==", "!="):
+                # JSON true/false, which json_extract() would turn into 1/0
+                clauses.append(f"{_type_expr(field)} {_OPERATORS[op]} ?")
+                params.append("true" if value else "false")
+            else:
+                clauses.append(f"{expr} {_OPERATORS[op]} ?")
+                params.append(_sql_value(value))
+                if isinstance(value, (int, float)) and field != "__name__":
+                    # ... and numbers don't match booleans
+                    clauses.append(f"{_type_expr(field)} IN ('integer', 'real')")
+        # Like Firestore, order_by() leaves out documents without the field
+        for field, _direction in self._orders:
+            if field != "__name__":
+                clauses.append(f"{_type_expr(field)} IS NOT NULL")
+        return " AND ".join(clauses), params
+
+    def _rows_sql(self, columns: str) -> Tuple[str, List[Any]]:
+        where, params = self._where_sql()
+        sql = f'SELECT {columns} FROM "{self._table}" WHERE {where}'
+        if self._orders:
+            parts = [f"{_field_expr(f)} {'DESC' if d == DESCENDING else 'ASC'}" for f, d in self._orders]
+            sql += " ORDER BY " + ", ".join(parts)
+        if self._limit is not None or self._offset is not None:
+            sql += " LIMIT ? OFFSET ?"
+            params = params + [self._limit if self._limit is not None else -1, self._offset or 0]
+        return sql, params
+
+    def stream(self, **_: Any) -> Iterator[DocumentSnapshot]:
+        sql, params = self._rows_sql("parent, id, data")
+        rows = self._client._execute(self._table, sql, params).fetchall()
+
+        for parent, doc_id, raw in rows:
+            data = json.loads(raw)
+            if self._fields is not None:
+                data = _select(data, self._fields)
+            yield DocumentSnapshot(DocumentReference(self._client, self._table, parent, doc_id), data)
+
+    def get(self, **kwargs: Any) -> List[DocumentSnapshot]:
+        return list(self.stream(**kwargs))
+
+
+class CollectionReference(Query):
+    def __init__(self, client: "SQLiteClient", table: str, parent: str = ""):
+        super().__init__(client, table, parent)
+        self.id = table
+
+    def document(self, document_id: Optional[str] = None) -> "DocumentReference":
+        return DocumentReference(self._client, self._table, self._parent, document_id or uuid.uuid4().hex[:20])
+
+    def add(self, data: Dict[str, Any]) -> Tuple[None, "DocumentReference"]:
+        ref = self.document()
+        ref.set(data)
+        return None, ref
+
+
+class DocumentReference:
+    def __init__(self, client: "SQLiteClient", table: str, parent: str, document_id: str):
+        self._client = client
+        self._table = table
+        self._parent = parent
+        self.id = document_id
+
+    @property
+    def path(self) -> str:
+        prefix = f"{self._parent}/" if self._parent else ""
+        return f"{prefix}{self._table}/{self.id}"
+
+    def collection(self, name: str) -> CollectionReference:
+        return self._client.collection(name, parent=self.path)
+
+    def get(self, **_: Any) -> DocumentSnapshot:
+        return DocumentSnapshot(self, self._client._read(self))
+
+    def create(self, data: Dict[str, Any]) -> None:
+        with self._client._write() as conn:
+            self._client._create(conn, self, data)
+
+    def set(self, data: Dict[str, Any], merge: bool = False) -> None:
+        with self._client._write() as conn:
+            self._client._set(conn, self, data, merge)
+
+    def update(self, data: Dict[str, Any]) -> None:
+        with self._client._write() as conn:
+            self._client._update(conn, self, data)
+
+    def delete(self) -> None:
+        with self._client._write() as conn:
+            self._client._delete(conn, self)
+
+
+class WriteBatch:
+    """Writes applied together in one SQLite transaction on commit()."""
+
+    def __init__(self, client: "SQLiteClient"):
+        self._client = client
+        self._ops: List[Tuple[str, DocumentReference, Any, bool]] = []
+
+    def create(self, reference: DocumentReference, data: Dict[str, Any]) -> None:
+        self._ops.append(("create", reference, data, False))
+
+    def set(self, reference: DocumentReference, data: Dict[str, Any], merge: bool = False) -> None:
+        self._ops.append(("set", reference, data, merge))
+
+    def update(self, reference: DocumentReference, data: Dict[str, Any]) -> None:
+        self._ops.append(("update", reference, data, False))
+
+    def delete(self, reference: DocumentReference) -> None:
+        self._ops.append(("delete", reference, None, False))
+
+    def commit(self) -> None:
+        with self._client._write() as conn:
+            for op, ref, data, merge in self._ops:
+                if op == "set":
+                    self._client._set(conn, ref, data, merge)
+                elif op == "create":
+                    self._client._create(conn, ref, data)
+                elif op == "update":
+                    self._client._update(conn, ref, data)
+                else:
+                    self._client._delete(conn, ref)
+        self._ops = []
+
+
+class SQLiteClient:
+    """Firestore-compatible document client on one SQLite database."""
+
+    def __init__(self, path: str = ":memory:"):
+        self.path = path
+        self.project = f"sqlite:{path}"
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        if path != ":memory:":
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._tables: set = set()
+
+    def collection(self, name: str, parent: str = "") -> CollectionReference:
+        if not _TABLE_RE.match(name):
+            raise ValueError(f"Unsupported collection name: {name!r}")
+        self._ensure_table(name)
+        return CollectionReference(self, name, parent)
+
+    def collection_group(self, name: str) -> Query:
+        if not _TABLE_RE.match(name):
+            raise ValueError(f"Unsupported collection name: {name!r}")
+        self._ensure_table(name)
+        return Query(self, name, None)
+
+    def batch(self) -> WriteBatch:
+        return WriteBatch(self)
+
+    def close(self) -> None:
+        self._conn.close()
+
+    # ---- internals ----
+
+    def _ensure_table(self, table: str) -> None:
+        if table in self._tables:
+            return
+        with self._lock:
+            self._conn.execute(
+                f'CREATE TABLE IF NOT EXISTS "{table}" ('
+                "parent TEXT NOT NULL, id TEXT NOT NULL, data TEXT NOT NULL, "
+                "PRIMARY KEY (parent, id))"
+            )
+            for fields in [("shop_id",)] + INDEXES.get(table, []):
+                name = f"ix_{table}_{'_'.join(fields)}"
+                columns = ", ".join(["parent"] + [_field_expr(f) for f in fields])
+                self._conn.execute(f'CREATE INDEX IF NOT EXISTS "{name}" ON "{table}" ({columns})')
+            self._tables.add(table)
+
+    def _execute(self, table: str, sql: str, params: List[Any]) -> sqlite3.Cursor:
+        with self._lock:
+            return self._conn.execute(sql, params)
+
+    def _write(self) -> "_WriteTransaction":
+        return _WriteTransaction(self)
+
+    def _read(self, ref: DocumentReference, conn: Optional[sqlite3.Connection] = None) -> Optional[Dict[str, Any]]:
+        conn = conn or self._conn
+        with self._lock:
+            row = conn.execute(
+                f'SELECT data FROM "{ref._table}" WHERE parent = ? AND id = ?', (ref._parent, ref.id)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _store(self, conn: sqlite3.Connection, ref: DocumentReference, data: Dict[str, Any]) -> None:
+        conn.execute(
+            f'INSERT OR REPLACE INTO "{ref._table}" (parent, id, data) VALUES (?, ?, ?)',
+            (ref._parent, ref.id, json.dumps(data, default=_json_default)),
+        )
+
+    def _set(self, conn, ref: DocumentReference, data: Dict[str, Any], merge: bool) -> None:
+        if merge:
+            current = self._read(ref, conn) or {}
+            _merge(current, data)
+            self._store(conn, ref, current)
+        else:
+            self._store(conn, ref, _resolve_increments(data))
+
+    def _create(self, conn, ref: DocumentReference, data: Dict[str, Any]) -> None:
+        if self._read(ref, conn) is not None:
+            raise AlreadyExists(f"Document already exists: {ref.path}")
+        self._store(conn, ref, _resolve_increments(data))
+
+    def _update(self, conn, ref: DocumentReference, data: Dict[str, Any]) -> None:
+        current = self._read(ref, conn)
+        if current is None:
+            raise NotFound(f"No document to update: {ref.path}")
+        _update_paths(current, data)
+        self._store(conn, ref, current)
+
+    def _delete(self, conn, ref: DocumentReference) -> None:
+        conn.execute(f'DELETE FROM "{ref._table}" WHERE parent = ? AND id = ?', (ref._parent, ref.id))
+
+
+class _WriteTransaction:
+    """Serialize writers and wrap them in BEGIN IMMEDIATE ... COMMIT."""
+
+    def __init__(self, client: SQLiteClient):
+        self._client = client
+
+    def __enter__(self) -> sqlite3.Connection:
+        self._client._lock.acquire()
+        self._client._conn.execute("BEGIN IMMEDIATE")
+        return self._client._conn
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        try:
+            self._client._conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        finally:
+            self._client._lock.release()
+        return False
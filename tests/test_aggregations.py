@@ -0,0 +1,113 @@
+"""
+Tests for aggregation queries and their streaming fallback
+"""
+import aggregations
+
+
+class _Doc:
+    def __init__(self, data):
+        self._data = data
+
+    def to_dict(self):
+        return dict(self._data)
+
+
+class _StreamOnlyQuery:
+    """A local backend query without count()/sum()."""
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def stream(self):
+        return iter(_Doc(r) for r in self.rows)
+
+
+class _Result:
+    def __init__(self, alias, value):
+        self.alias = alias
+        self.value = value
+
+
+class _AggQuery:
+    def __init__(self, parent, aggs):
+        self.parent = parent
+        self.aggs = aggs
+
+    def count(self, alias=None):
+        return _AggQuery(self.parent, self.aggs + [(alias, None)])
+
+    def sum(self, field, alias=None):
+        return _AggQuery(self.parent, self.aggs + [(alias, field)])
+
+    def get(self):
+        self.parent.aggregation_calls += 1
+        row = []
+        for alias, field in self.aggs:
+            if field is None:
+                row.append(_Result(alias, len(self.parent.rows)))
+            else:
+                row.append(_Result(alias, sum(r.get(field) or 0 for r in self.parent.rows)))
+        return [row]
+
+
+class _AggregatingQuery(_StreamOnlyQuery):
+    """A query that supports server-side aggregation and must not be streamed."""
+
+    def __init__(self, rows):
+        super().__init__(rows)
+        self.aggregation_calls = 0
+
+    def count(self, alias=None):
+        return _AggQuery(self, []).count(alias)
+
+    def sum(self, field, alias=None):
+        return _AggQuery(self, []).sum(field, alias)
+
+    def stream(self):
+        raise AssertionError("aggregation path should not stream documents")
+
+
+ROWS = [
+    {"quantity": 2, "total_amount": 28.0},
+    {"quantity": 1, "total_amount": None},
+    {"quantity": 5, "total_amount": 70.0},
+]
+
+
+def test_aggregation_and_fallback_agree():
+    """Server-side aggregation and streaming fallback give the same totals"""
+    sums = {"items": "quantity", "revenue": "total_amount"}
+    server = _AggregatingQuery(ROWS)
+
+    expected = {"count": 3, "items": 8.0, "revenue": 98.0}
+    assert aggregations.aggregate(server, sums=sums) == expected
+    assert server.aggregation_calls == 1
+    assert aggregations.aggregate(_StreamOnlyQuery(ROWS), sums=sums) == expected
+    assert aggregations.count(_StreamOnlyQuery(ROWS)) == 3
+    assert aggregations.sum_field(_StreamOnlyQuery(ROWS), "quantity") == 8.0
+
+
+def test_billed_reads():
+    """Aggregations bill one read per 1000 matched entries, minimum one"""
+    assert aggregations.billed_reads(0) == 1
+    assert aggregations.billed_reads(1000) == 1
+    assert aggregations.billed_reads(1001) == 2
+
+
+def test_commands_without_resolved_are_backfilled():
+    """Legacy commands missing `resolved` show up in the list and counts after the backfill"""
+    from database import FirestoreDB
+
+    db = FirestoreDB(backend="sqlite", sqlite_path=":memory:")
+    shop = db.create_shop("Bug Kirana", "+910000000000")
+    db.save_unrecognized_command(shop.shop_id, "+910000000000", "text", "maggi kitna")
+    legacy = db.save_unrecognized_command(shop.shop_id, "+910000000000", "voice", "cheeni do")
+    data = legacy.to_dict()
+    del data["resolved"]
+    db._shop_collection("unrecognized_commands", shop.shop_id).document(legacy.command_id).set(data)
+    assert db.count_unresolved_commands(shop.shop_id)["unresolved"] == 1
+
+    assert db.backfill_command_resolved(shop.shop_id) == 1
+    assert db.backfill_command_resolved(shop.shop_id) == 0
+    assert db.count_unresolved_commands(shop.shop_id) == {"unresolved": 2, "voice": 1, "text": 1}
+    assert len(db.get_unrecognized_commands(shop.shop_id)) == 2
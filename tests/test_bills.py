@@ -0,0 +1,97 @@
+"""
+POS bills: one document per checkout, bill pages and bill-backed sales reports
+"""
+from datetime import datetime, timedelta
+
+from database import FirestoreDB
+from sales_journal import JournalFlusher
+
+PHONE = "+910000000000"
+
+
+def _shop(db):
+    shop = db.create_shop("Bill Kirana", PHONE)
+    for name, price in (("Atta", 50.0), ("Dal", 120.0)):
+        db.add_stock(shop.shop_id, name, 10, PHONE)
+        product = db.find_existing_product_by_name(shop.shop_id, name)
+        db.update_product_fields(product.product_id, {"selling_price": price})
+    atta = db.find_existing_product_by_name(shop.shop_id, "Atta")
+    dal = db.find_existing_product_by_name(shop.shop_id, "Dal")
+    return shop.shop_id, atta, dal
+
+
+def _report(db, shop_id, since):
+    r = db.get_total_sales_for_period(shop_id, since, datetime.utcnow() + timedelta(minutes=1))
+    return r["total_items_sold"], r["total_revenue"], r["products_sold"]
+
+
+def test_checkout_writes_one_bill():
+    """Every line shares the bill; repeated products chain their stock"""
+    db = FirestoreDB(backend="sqlite", sqlite_path=":memory:")
+    shop_id, atta, dal = _shop(db)
+
+    bill = db.record_bill(shop_id, [(atta, 2), (dal, 1), (atta, 1)], PHONE, payment_mode="UPI",
+                          cash_given=500, client_total=290,
+                          untracked=[{"name": "Pen", "quantity": 1, "price": 10}])["bill"]
+
+    assert (bill.item_count, bill.total_quantity, bill.total_amount, bill.change_due) == (3, 4, 270.0, 210.0)
+    assert len(bill.items) == 4 and bill.items[-1]["transaction_id"] is None
+    assert db.check_stock(shop_id, "Atta")["current_stock"] == 7
+    rows = [t for t in db.get_transactions_by_shop(shop_id) if t.bill_id == bill.bill_id]
+    assert sorted(r.new_stock for r in rows) == [7, 8, 9]
+    assert db.get_bill(bill.bill_id).to_dict() == bill.to_dict()
+    assert db.get_bill(bill.bill_id, shop_id).to_dict() == bill.to_dict()
+    other = db.create_shop("Other Kirana", "+919999999999")
+    assert db.get_bill(bill.bill_id, other.shop_id) is None
+
+
+def test_bill_pages_and_totals():
+    """Bills page newest first and aggregate into basket metrics"""
+    db = FirestoreDB(backend="sqlite", sqlite_path=":memory:")
+    shop_id, atta, dal = _shop(db)
+    ids = [db.record_bill(shop_id, [(db.get_product(atta.product_id), 1)], PHONE)["bill"].bill_id
+           for _ in range(3)]
+
+    first = db.get_bills(shop_id, limit=2)
+    second = db.get_bills(shop_id, limit=2, before=first["next_cursor"])
+    assert [b.bill_id for b in first["bills"] + second["bills"]] == ids[::-1]
+    assert second["next_cursor"] is None
+
+    totals = db.get_bill_totals(shop_id, since=datetime.utcnow() - timedelta(hours=1))
+    assert (totals["bills"], totals["revenue"], totals["avg_bill_value"]) == (3, 150.0, 50.0)
+
+
+def test_reports_read_bills_and_match_the_ledger(tmp_path):
+    """A window the bills cover reads per bill and sums the same as the ledger"""
+    db = FirestoreDB(backend="sqlite", sqlite_path=":memory:", journal_path=str(tmp_path / "journal.db"))
+    shop_id, atta, dal = _shop(db)
+    db.record_bill(shop_id, [(atta, 2), (dal, 1)], PHONE)
+    JournalFlusher(db.sales_journal, db.apply_journal_entries).flush_once()
+    db.reduce_stock(shop_id, "Dal", 2, PHONE)   # chat sale, not on a bill
+
+    bills_since = datetime.fromisoformat(db.get_shop_bills_since(shop_id))
+    assert db._bills_cover(shop_id, bills_since)
+    assert not db._bills_cover(shop_id, bills_since - timedelta(days=1))
+    assert len(db.get_bills(shop_id)["bills"]) == 1
+
+    from_bills = _report(db, shop_id, bills_since)
+    from_ledger = _report(db, shop_id, bills_since - timedelta(days=1))
+    assert from_bills == from_ledger
+    assert from_bills[0] == 5 and from_bills[2] == {"Atta": 2.0, "Dal": 3.0}
+
+
+def test_journaled_checkout_flushes_as_one_group(tmp_path):
+    """A claim never splits a checkout, and a failing line holds back its whole bill"""
+    db = FirestoreDB(backend="sqlite", sqlite_path=":memory:", journal_path=str(tmp_path / "journal.db"))
+    shop_id, atta, dal = _shop(db)
+    bill = db.record_bill(shop_id, [(atta, 1), (dal, 1), (atta, 1)], PHONE)["bill"]
+
+    claimed = db.sales_journal.claim(limit=1)
+    assert len(claimed) == 3 and len({e["group_key"] for e in claimed}) == 1
+    db.sales_journal.release([e["seq"] for e in claimed], "test")
+
+    db.delete_product(shop_id, dal.product_id)
+    assert JournalFlusher(db.sales_journal, db.apply_journal_entries).flush_once() == 0
+    assert db.get_bill(bill.bill_id) is None
+    assert db.db.collection("products").document(atta.product_id).get().to_dict()["current_stock"] == 10
+    assert db.sales_journal.stats()["pending_entries"] == 3
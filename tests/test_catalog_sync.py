@@ -0,0 +1,82 @@
+"""
+Catalog sync: the ETag moves on product writes, deltas carry changes and tombstones
+"""
+import gzip
+from datetime import timedelta
+
+import catalog_sync
+from config import Config
+from database import FirestoreDB
+
+PHONE = "+910000000000"
+
+
+def test_etag_and_delta_follow_product_writes(tmp_path, monkeypatch):
+    """Unchanged catalog keeps its ETag; writes, journaled sales and deletions change it"""
+    monkeypatch.setattr(Config, "CATALOG_CURSOR_OVERLAP_SECONDS", 0.0)
+    db = FirestoreDB(backend="sqlite", sqlite_path=":memory:", journal_path=str(tmp_path / "j.db"))
+    shop = db.create_shop("Delta Kirana", PHONE)
+    db.add_stock(shop.shop_id, "Atta", 10, PHONE)
+    db.add_stock(shop.shop_id, "Sugar", 5, PHONE)
+    atta = db.find_existing_product_by_name(shop.shop_id, "Atta")
+    sugar = db.find_existing_product_by_name(shop.shop_id, "Sugar")
+
+    full = db.get_catalog_delta(shop.shop_id)
+    etag = db.get_catalog_etag(shop.shop_id)
+    assert len(full["products"]) == 2 and full["deleted"] == []
+    assert db.get_catalog_etag(shop.shop_id) == etag
+
+    db.record_bill(shop.shop_id, [(atta, 2)], PHONE)  # journaled, not upstream yet
+    after_sale = db.get_catalog_etag(shop.shop_id)
+    assert after_sale != etag
+
+    assert db.delete_product(shop.shop_id, sugar.product_id)
+    assert db.get_catalog_etag(shop.shop_id) != after_sale
+    delta = db.get_catalog_delta(shop.shop_id, full["cursor"])
+    assert [(p.name, p.current_stock) for p in delta["products"]] == [("Atta", 8)]
+    assert delta["deleted"] == [sugar.product_id]
+    assert delta["cursor"] > full["cursor"]
+    assert db.get_catalog_delta(shop.shop_id, delta["cursor"])["deleted"] == []
+    assert not db.delete_product(shop.shop_id, sugar.product_id)
+
+
+def test_conditional_and_gzip_helpers(monkeypatch):
+    """If-None-Match parsing and gzip only when accepted and worth it"""
+    etag = catalog_sync.catalog_etag("shop-1", "2026-06-01T10:00:00")
+    assert catalog_sync.etag_matches(f'W/{etag}, "other"', etag)
+    assert catalog_sync.etag_matches("*", etag)
+    assert not catalog_sync.etag_matches('"other"', etag)
+    assert catalog_sync.catalog_etag("shop-1", "2026-06-01T10:00:00", {"p1": -2.0}) != etag
+
+    # Full vs delta and gzip vs identity bodies never share an ETag
+    variants = {catalog_sync.representation(since, encoding)
+                for since in (None, "2026-06-01T09:00:00") for encoding in ("gzip", "identity", None)}
+    assert len(variants) == 4
+    assert len({catalog_sync.catalog_etag("shop-1", "v", None, v) for v in variants}) == 4
+
+    monkeypatch.setattr(Config, "CATALOG_GZIP_MIN_BYTES", 100)
+    body = b'{"products": []}' * 20
+    assert gzip.decompress(catalog_sync.compress(body, "br, gzip;q=0.8")) == body
+    assert catalog_sync.compress(body, "gzip;q=0") is None
+    assert catalog_sync.compress(body[:50], "gzip") is None
+
+
+def test_cursor_overlap_catches_late_stamps():
+    """A write stamped before the cursor but committed after it still reaches the next delta"""
+    db = FirestoreDB(backend="sqlite", sqlite_path=":memory:")
+    shop = db.create_shop("Late Kirana", PHONE)
+    db.add_stock(shop.shop_id, "Atta", 10, PHONE)
+    db.add_stock(shop.shop_id, "Dal", 4, PHONE)
+    atta = db.find_existing_product_by_name(shop.shop_id, "Atta")
+    dal = db.find_existing_product_by_name(shop.shop_id, "Dal")
+
+    first = db.get_catalog_delta(shop.shop_id)
+    newest = max(p.updated_at for p in first["products"])
+    assert first["cursor"] < newest.isoformat()
+
+    # Another worker stamped this write a few seconds before the newest one
+    late = (newest - timedelta(seconds=5)).isoformat()
+    db.db.collection("products").document(dal.product_id).update({"current_stock": 3, "updated_at": late})
+    delta = db.get_catalog_delta(shop.shop_id, first["cursor"])
+    assert {p.name for p in delta["products"]} == {"Atta", "Dal"}
+    assert delta["cursor"] == first["cursor"]
@@ -0,0 +1,88 @@
+"""
+Serving modes: settings derived from CPUs/env, and shared state safe under threads
+"""
+import threading
+from types import SimpleNamespace
+
+import concurrency
+from config import Config
+from display_sessions import DisplaySessionStore
+from expiry_index import ExpiryIndex
+
+
+def test_settings_follow_mode_cpu_count_and_env(monkeypatch):
+    """Workers come from the CPU count unless WEB_CONCURRENCY says otherwise; gevent needs the package"""
+    monkeypatch.setattr(Config, "WEB_CONCURRENCY", 0)
+    monkeypatch.setattr(Config, "GUNICORN_THREADS", 8)
+
+    assert concurrency.gunicorn_settings("sync", cpu_count=2)["workers"] == 5
+    threaded = concurrency.gunicorn_settings("gthread", cpu_count=1)
+    assert (threaded["worker_class"], threaded["workers"], threaded["threads"]) == ("gthread", 2, 8)
+
+    monkeypatch.setattr(Config, "WEB_CONCURRENCY", 3)
+    monkeypatch.setattr(Config, "GUNICORN_THREADS", 16)
+    threaded = concurrency.gunicorn_settings("gthread", cpu_count=8)
+    assert (threaded["workers"], threaded["threads"]) == (3, 16)
+
+    monkeypatch.setattr(Config, "SERVING_MODE", "gevent")
+    monkeypatch.setattr(concurrency, "gevent_available", lambda: False)
+    assert concurrency.serving_mode() == "gthread"
+    monkeypatch.setattr(Config, "SERVING_MODE", "bogus")
+    assert concurrency.serving_mode() == concurrency.DEFAULT_MODE
+
+
+def test_display_sessions_under_concurrent_updates():
+    """Polls see whole carts while the cashier updates, and idle sessions expire"""
+    store = DisplaySessionStore(ttl_seconds=60)
+    sid = store.create("Test Kirana")
+    torn = []
+
+    def cashier():
+        for n in range(300):
+            store.update(sid, {"items": [{"name": "Maggi", "qty": n}] * 3, "grand_total": n * 3})
+
+    def customer():
+        for _ in range(300):
+            session = store.get(sid)
+            if session["items"] and sum(i["qty"] for i in session["items"]) != session["grand_total"]:
+                torn.append(session)
+
+    threads = [threading.Thread(target=cashier)] + [threading.Thread(target=customer) for _ in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert not torn
+    assert store.get(sid)["grand_total"] == 299 * 3
+
+    store.get(sid)["items"].append("tampered")
+    assert "tampered" not in store.get(sid)["items"]
+
+    expired = DisplaySessionStore(ttl_seconds=0)
+    old = expired.create()
+    assert expired.get(old) is None and not expired.update(old, {"status": "checked_out"})
+    expired.create()
+    assert len(expired) == 1
+
+
+def test_expiry_index_stays_ordered_under_concurrent_changes():
+    """Threads replacing products keep the date list aligned with the entries"""
+    index = ExpiryIndex()
+
+    def product(pid, day):
+        return SimpleNamespace(product_id=f"p{pid}", name=f"Item {pid}", unit="pieces", brand=None,
+                               current_stock=5, batches=None, expiry_date=f"2030-01-{day:02d}")
+
+    def worker(offset):
+        for n in range(200):
+            index.set_product(product((offset + n) % 20, 1 + (offset * 7 + n) % 28))
+
+    threads = [threading.Thread(target=worker, args=(k,)) for k in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(index) == 20
+    assert index._dates == [e.expiry_date for e in index._entries]
+    assert index._dates == sorted(index._dates)
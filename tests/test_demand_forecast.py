@@ -0,0 +1,111 @@
+"""
+Tests for the demand forecasting module
+"""
+from datetime import date, datetime, timedelta
+
+import pytest
+
+import demand_forecast
+from config import Config
+
+
+def _sale(product_id, day, qty, txn_type="sale"):
+    return {
+        "product_id": product_id,
+        "transaction_type": txn_type,
+        "quantity": qty,
+        "timestamp": datetime.combine(day, datetime.min.time()).replace(hour=12).isoformat(),
+    }
+
+
+def test_constant_demand_is_recovered():
+    """A product selling 3/day every day has a forecast of 3/day"""
+    today = date(2026, 3, 2)
+    txns = [_sale("maggi", today - timedelta(days=d), 3) for d in range(1, 29)]
+
+    forecast = demand_forecast.forecast_demand(txns, today, seasonality=False)
+
+    assert forecast.product_ids == ["maggi"]
+    assert forecast.daily_demand[0] == pytest.approx(3.0)
+    assert forecast.window_sales[0] == 84
+
+
+def test_recent_sales_weigh_more():
+    """A product that started selling last week beats one that stopped"""
+    today = date(2026, 3, 2)
+    txns = [_sale("new", today - timedelta(days=d), 4) for d in range(1, 8)]
+    txns += [_sale("old", today - timedelta(days=d), 4) for d in range(22, 29)]
+
+    demand = demand_forecast.forecast_demand(txns, today, seasonality=False).demand_by_product()
+
+    assert demand["new"] > 2 * demand["old"]
+
+
+def test_ignores_non_sales_and_today():
+    """Stock additions and today's partial sales are not demand"""
+    today = date(2026, 3, 2)
+    txns = [
+        _sale("atta", today - timedelta(days=1), 5, txn_type="add_stock"),
+        _sale("atta", today, 5),
+    ]
+
+    forecast = demand_forecast.forecast_demand(txns, today)
+
+    assert forecast.product_ids == []
+
+
+def test_weekday_factors_follow_busy_days():
+    """Saturdays selling double shows up in the weekday profile"""
+    today = date(2026, 3, 2)  # Monday
+    txns = []
+    for d in range(1, 29):
+        day = today - timedelta(days=d)
+        txns.append(_sale("oil", day, 10 if day.weekday() == 5 else 5))
+
+    forecast = demand_forecast.forecast_demand(txns, today, seasonality=True)
+
+    assert forecast.weekday_factors[5] == pytest.approx(2 * forecast.weekday_factors[0])
+    assert sum(forecast.weekday_factors) == pytest.approx(7.0)
+
+
+def test_days_to_stockout_flat_and_beyond_horizon():
+    """Stock-out days are stock / demand with a flat weekday profile"""
+    forecast = demand_forecast.DemandForecast(
+        product_ids=["a", "b", "c"],
+        daily_demand=[2.0, 0.5, 0.0],
+        window_sales=[56.0, 14.0, 0.0],
+    )
+
+    days = demand_forecast.days_to_stockout(
+        forecast, {"a": 5.0, "b": 20.0, "c": 10.0}, date(2026, 3, 2), horizon_days=28
+    )
+
+    assert days["a"] == pytest.approx(2.5)
+    assert days["b"] == pytest.approx(40.0)
+    assert "c" not in days
+
+
+def test_predictive_alerts_keep_month_to_date_fields(monkeypatch):
+    """Alerts carry month_sales / days_elapsed (month to date) next to the forecast's window_sales"""
+    from database import FirestoreDB
+
+    monkeypatch.setattr(Config, "SALES_JOURNAL_PATH", None)
+    db = FirestoreDB(backend="sqlite", sqlite_path=":memory:")
+    shop = db.create_shop("Forecast Kirana", "+910000000026")
+    db.add_stock(shop.shop_id, "Atta", 10, "+910000000026")
+    atta = db.find_existing_product_by_name(shop.shop_id, "Atta")
+
+    now = datetime.utcnow()
+    days = [now - timedelta(days=d) for d in range(1, 8)]
+    for n, when in enumerate(days):
+        db.db.collection("transactions").document(f"sale-{n}").set({
+            "shop_id": shop.shop_id, "product_id": atta.product_id, "product_name": "Atta",
+            "transaction_type": "sale", "quantity": 5, "timestamp": when.isoformat(),
+        })
+
+    alerts = db.get_predictive_alerts(shop.shop_id)["alerts"]
+    assert [a["name"] for a in alerts] == ["Atta"]
+    alert = alerts[0]
+    assert alert["window_sales"] == 35
+    assert alert["month_sales"] == 5 * sum(1 for when in days if when.strftime("%Y-%m") == now.strftime("%Y-%m"))
+    assert alert["days_elapsed"] == now.day
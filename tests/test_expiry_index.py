@@ -0,0 +1,110 @@
+"""
+Tests for expiry date normalization and the per-shop expiry index
+"""
+from datetime import date, timedelta
+
+import pytest
+
+import expiry_index
+from models import Product
+
+
+def _product(product_id, name, batches=None, expiry_date=None, stock=5.0):
+    return Product(
+        product_id=product_id,
+        shop_id="shop-1",
+        name=name,
+        normalized_name=name.lower(),
+        current_stock=stock,
+        unit="pieces",
+        batches=batches,
+        expiry_date=expiry_date,
+    )
+
+
+def test_normalize_expiry_date_formats():
+    """Date inputs in common formats are stored as YYYY-MM-DD"""
+    assert expiry_index.normalize_expiry_date("2027-06-30") == "2027-06-30"
+    assert expiry_index.normalize_expiry_date(" 30/06/2027 ") == "2027-06-30"
+    assert expiry_index.normalize_expiry_date("30-06-2027") == "2027-06-30"
+    assert expiry_index.normalize_expiry_date("2027-06-30T00:00:00") == "2027-06-30"
+    assert expiry_index.normalize_expiry_date("") is None
+    assert expiry_index.normalize_expiry_date(None) is None
+    with pytest.raises(ValueError):
+        expiry_index.normalize_expiry_date("next week")
+
+
+def test_normalize_batches_folds_legacy_key():
+    """The old `expiry` batch key becomes a canonical `expiry_date`"""
+    batches = expiry_index.normalize_batches({
+        "b1": {"expiry": "31/12/2026", "qty": 4},
+        "b2": {"expiry_date": "2027-01-15", "qty": 2},
+    })
+    assert batches == {
+        "b1": {"expiry_date": "2026-12-31", "qty": 4},
+        "b2": {"expiry_date": "2027-01-15", "qty": 2},
+    }
+
+
+def test_range_queries_match_full_scan():
+    """Bisected expired/expiring slices equal a brute-force filter"""
+    today = date(2026, 3, 1)
+    products = []
+    for i in range(60):
+        offset = (i * 7) % 90 - 30
+        exp = (today + timedelta(days=offset)).isoformat()
+        if i % 3 == 0:
+            products.append(_product(f"p{i}", f"Item {i:02d}", expiry_date=exp))
+        else:
+            products.append(_product(f"p{i}", f"Item {i:02d}", batches={"b1": {"expiry_date": exp, "qty": i}}))
+
+    index = expiry_index.ExpiryIndex.from_products(products)
+    cutoff = today + timedelta(days=30)
+    entries = [e for p in products for e in expiry_index.entries_for_product(p)]
+
+    assert [e.product_id for e in index.expired(today)] == [
+        e.product_id for e in sorted(entries, key=lambda e: (e.expiry_date, e.name))
+        if e.expiry_date < today.isoformat()
+    ]
+    assert sorted(e.product_id for e in index.expiring(today, cutoff)) == sorted(
+        e.product_id for e in entries if today.isoformat() <= e.expiry_date <= cutoff.isoformat()
+    )
+
+
+def test_set_product_and_stock_updates():
+    """Product writes move entries; stock shows only on product-level expiry"""
+    today = date(2026, 3, 1)
+    index = expiry_index.ExpiryIndex.from_products([
+        _product("milk", "Milk", expiry_date="2026-03-03", stock=4),
+        _product("atta", "Atta", batches={"b1": {"expiry_date": "2026-02-20", "qty": 2}}),
+    ])
+    assert [e.name for e in index.expired(today)] == ["Atta"]
+
+    index.set_product(_product("atta", "Atta", batches={"b1": {"expiry_date": "2026-03-02", "qty": 2}}))
+    assert index.expired(today) == []
+    assert [e.name for e in index.expiring(today, date(2026, 3, 31))] == ["Atta", "Milk"]
+
+    assert index.update_stock("milk", 9) is True
+    assert index.update_stock("atta", 1) is False
+    assert index.expiring(today, date(2026, 3, 31))[1].to_report()["stock"] == 9.0
+
+
+def test_stock_change_clears_digest_without_loaded_index(monkeypatch):
+    """A worker that never built the shop's index still drops a digest showing stale stock"""
+    from database import FirestoreDB
+
+    monkeypatch.delenv("EXPIRY_ALERT_DAYS", raising=False)
+    db = FirestoreDB(backend="sqlite", sqlite_path=":memory:")
+    shop = db.create_shop("Expiry Kirana", "+910000000000")
+    milk = db.get_or_create_product(shop.shop_id, "Amul Milk")
+    soon = (date.today() + timedelta(days=3)).isoformat()
+    db.update_product_fields(milk.product_id, {"current_stock": 8.0, "expiry_date": soon})
+    assert db.get_expiry_products(shop.shop_id)["expiring_products"][0]["stock"] == 8.0
+
+    # As if another worker sold it
+    db._expiry_indexes.clear()
+    product = db.find_existing_product_by_name(shop.shop_id, "amul milk")
+    db.update_product_stock(product.product_id, 5.0, product=product)
+
+    assert not db.db.collection("expiry_digests").document(shop.shop_id).get().exists
+    assert db.get_expiry_products(shop.shop_id)["expiring_products"][0]["stock"] == 5.0
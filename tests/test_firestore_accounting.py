@@ -0,0 +1,68 @@
+"""
+Firestore accounting: reads, writes and round trips are counted per scope and budgeted
+"""
+import pytest
+
+import firestore_accounting
+from ai_service import AIService
+from command_processor import CommandProcessor
+from database import FirestoreDB
+
+PHONE = "+910000000000"
+
+
+def _shop(db):
+    shop = db.create_shop("Metered Kirana", PHONE)
+    for name in ("Atta", "Sugar", "Salt"):
+        db.add_stock(shop.shop_id, name, 10, PHONE)
+    return shop.shop_id
+
+
+def test_store_calls_are_counted():
+    """Document gets, streams, empty queries and batch commits cost what Firestore bills"""
+    db = FirestoreDB(backend="sqlite", sqlite_path=":memory:")
+    shop_id = _shop(db)
+
+    with firestore_accounting.measure() as usage:
+        db.db.collection("shops").document(shop_id).get()
+        products = list(db.db.collection("products").where("shop_id", "==", shop_id).stream())
+        list(db.db.collection("products").where("shop_id", "==", "nobody").stream())
+    assert len(products) == 3
+    assert (usage.reads, usage.writes, usage.rpcs) == (1 + 3 + 1, 0, 3)
+
+    with firestore_accounting.measure() as outer:
+        batch = db.db.batch()
+        batch.set(db.db.collection("notes").document("a"), {"x": 1})
+        batch.delete(products[0].reference)
+        with firestore_accounting.measure() as inner:
+            batch.commit()
+        db.db.collection("notes").document("b").set({"x": 2})
+    assert (inner.writes, inner.deletes, inner.rpcs) == (1, 1, 1)
+    assert (outer.writes, outer.deletes, outer.rpcs) == (2, 1, 2)
+
+
+def test_read_budget_fails_an_expensive_path():
+    """A budget passes a point read and fails a full catalog scan"""
+    db = FirestoreDB(backend="sqlite", sqlite_path=":memory:")
+    shop_id = _shop(db)
+    product = db.find_existing_product_by_name(shop_id, "Atta")
+
+    with firestore_accounting.read_budget(1):
+        db.get_product(product.product_id, shop_id)
+    with pytest.raises(firestore_accounting.ReadBudgetExceeded):
+        with firestore_accounting.read_budget(2):
+            db.get_products_by_shop(shop_id)
+
+
+def test_commands_are_totalled_by_action():
+    """CommandProcessor adds each command's reads and writes to the per-action counter"""
+    db = FirestoreDB(backend="sqlite", sqlite_path=":memory:")
+    _shop(db)
+    processor = CommandProcessor(db, AIService(api_key="test-key"), whatsapp_service=None)
+    before = firestore_accounting.COMMAND_DOCUMENTS.snapshot()
+
+    assert processor.process_message(PHONE, "text", text="2 atta add kar do")["success"]
+
+    after = firestore_accounting.COMMAND_DOCUMENTS.snapshot()
+    assert after[("write", "add_stock")] > before.get(("write", "add_stock"), 0)
+    assert after[("read", "add_stock")] > before.get(("read", "add_stock"), 0)
@@ -0,0 +1,78 @@
+"""
+Idempotent POS requests: retried sales and returns apply once
+"""
+import idempotency
+from database import FirestoreDB
+
+PHONE = "+910000000000"
+
+
+def _shop(db):
+    shop = db.create_shop("Retry Kirana", PHONE)
+    db.add_stock(shop.shop_id, "Atta", 10, PHONE)
+    return shop.shop_id, db.find_existing_product_by_name(shop.shop_id, "Atta")
+
+
+def test_retried_checkout_applies_once(tmp_path):
+    """A repeat key returns the first response; a fresh worker finds it in the store"""
+    db = FirestoreDB(backend="sqlite", sqlite_path=str(tmp_path / "store.db"))
+    shop_id, atta = _shop(db)
+
+    first = db.record_bill(shop_id, [(atta, 3)], PHONE, idempotency_key="tab-1")
+    again = db.record_bill(shop_id, [(db.get_product(atta.product_id), 3)], PHONE, idempotency_key="tab-1")
+
+    assert not first["replayed"] and again["replayed"]
+    assert again["response"] == first["response"]
+    assert db.check_stock(shop_id, "Atta")["current_stock"] == 7
+    assert len(db.get_bills(shop_id)["bills"]) == 1
+    assert db.find_pos_request("tab-1", PHONE) == first["response"]  # cache, no reads
+
+    other = FirestoreDB(backend="sqlite", sqlite_path=str(tmp_path / "store.db"))
+    assert other.find_pos_request("tab-1", PHONE) is None
+    assert other.find_pos_request("tab-1", PHONE, shop_id=shop_id) == first["response"]
+    # A racing duplicate that missed every check still can't apply twice
+    raced = other.record_bill(shop_id, [(atta, 3)], PHONE, idempotency_key="tab-1")
+    assert raced["replayed"] and db.check_stock(shop_id, "Atta")["current_stock"] == 7
+
+
+def test_retried_return_is_deduplicated_in_the_journal(tmp_path):
+    """Workers sharing a journal see each other's keyed requests before the flush"""
+    paths = dict(backend="sqlite", sqlite_path=str(tmp_path / "store.db"), journal_path=str(tmp_path / "j.db"))
+    db = FirestoreDB(**paths)
+    shop_id, atta = _shop(db)
+    first = db.record_returns(shop_id, [(atta, 2)], PHONE, idempotency_key="ret-1")
+
+    other = FirestoreDB(**paths)
+    assert other.find_pos_request("ret-1", PHONE, shop_id=shop_id) == first["response"]
+    raced = other.record_returns(shop_id, [(atta, 2)], PHONE, idempotency_key="ret-1")
+    assert raced["replayed"] and raced["response"] == first["response"]
+    assert other.get_product(atta.product_id).current_stock == 12
+
+
+def test_response_cache_is_bounded():
+    """The LRU keeps the most recently used responses only"""
+    cache = idempotency.ResponseCache(2)
+    cache.put(PHONE, "a", {"n": 1})
+    cache.put(PHONE, "b", {"n": 2})
+    assert cache.get(PHONE, "a") == {"n": 1}
+    cache.put(PHONE, "c", {"n": 3})
+    assert cache.get(PHONE, "b") is None and cache.get(PHONE, "a") == {"n": 1}
+    assert cache.stats()["size"] == 2
+
+
+def test_same_request_in_two_journals_applies_once(tmp_path):
+    """Hosts with their own journals both take a retried checkout; only one flush applies it"""
+    from sales_journal import JournalFlusher
+
+    store = str(tmp_path / "store.db")
+    host_a = FirestoreDB(backend="sqlite", sqlite_path=store, journal_path=str(tmp_path / "a.db"))
+    host_b = FirestoreDB(backend="sqlite", sqlite_path=store, journal_path=str(tmp_path / "b.db"))
+    shop_id, atta = _shop(host_a)
+    host_a.record_bill(shop_id, [(atta, 3)], PHONE, idempotency_key="tab-2")
+    host_b.record_bill(shop_id, [(host_b.get_product(atta.product_id), 3)], PHONE, idempotency_key="tab-2")
+
+    assert JournalFlusher(host_a.sales_journal, host_a.apply_journal_entries).flush_once() == 1
+    assert JournalFlusher(host_b.sales_journal, host_b.apply_journal_entries).flush_once() == 1
+    assert host_b.sales_journal.stats()["pending_entries"] == 0
+    assert host_a.check_stock(shop_id, "Atta")["current_stock"] == 7
+    assert len(host_a.get_bills(shop_id)["bills"]) == 1
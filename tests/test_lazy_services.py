@@ -0,0 +1,73 @@
+"""
+Lazy services: importing the app builds nothing, first use builds once, /ready warms
+"""
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from services import LazyService
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+CHILD = r"""
+import contextlib, io, json, sys
+with contextlib.redirect_stdout(io.StringIO()):
+    import app
+    heavy = sorted(m for m in ("openai", "google.cloud.firestore") if m in sys.modules)
+    response = app.app.test_client().get('/ready')
+print(json.dumps({"heavy_after_import": heavy, "status": response.status_code,
+                  "services": response.get_json()["services"], "openai_loaded": "openai" in sys.modules}))
+"""
+
+
+def _boot(**env):
+    child_env = dict(os.environ, DATABASE_BACKEND="sqlite", SQLITE_PATH=":memory:", SALES_JOURNAL_PATH="",
+                     WATI_API_KEY="", TRACE_LOG="0", **env)
+    out = subprocess.run([sys.executable, "-c", CHILD], cwd=ROOT, env=child_env,
+                         capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def test_service_is_built_once_under_concurrent_first_use():
+    """Threads racing on first use share one instance; set() and reset() replace it"""
+    built = []
+
+    def factory():
+        time.sleep(0.05)
+        built.append(object())
+        return built[-1]
+
+    service = LazyService("thing", factory)
+    assert not service.ready
+    seen = []
+    threads = [threading.Thread(target=lambda: seen.append(service.get())) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(built) == 1 and all(s is built[0] for s in seen)
+
+    stub = object()
+    service.set(stub)
+    assert service.get() is stub
+    service.reset()
+    assert service.get() is built[-1] and len(built) == 2
+
+
+def test_import_is_cheap_and_ready_warms_everything():
+    """`import app` loads neither openai nor google.cloud.firestore; /ready builds every service"""
+    result = _boot(OPENAI_API_KEY="test-key", WHATSAPP_ACCESS_TOKEN="test-token")
+    assert result["heavy_after_import"] == []
+    assert result["status"] == 200
+    assert all(entry["ready"] for entry in result["services"].values())
+    assert result["openai_loaded"]
+
+
+def test_missing_config_reports_not_ready_instead_of_exiting():
+    """Without an OpenAI key the app still imports; /ready is 503 and names the problem"""
+    result = _boot(OPENAI_API_KEY="", WHATSAPP_ACCESS_TOKEN="test-token")
+    assert result["status"] == 503
+    assert "OPENAI_API_KEY" in result["services"]["ai_service"]["error"]
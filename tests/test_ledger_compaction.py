@@ -0,0 +1,83 @@
+"""
+Ledger compaction: reports and the sales cube read the same after compaction and restore
+"""
+from datetime import datetime
+
+import pytest
+
+from config import Config
+from database import FirestoreDB
+
+PHONE = "+910000000000"
+NOW = datetime(2026, 6, 15)
+
+
+@pytest.fixture(params=["files", "collection"])
+def db(request, tmp_path, monkeypatch):
+    if request.param == "files":
+        monkeypatch.setattr(Config, "LEDGER_ARCHIVE_DIR", str(tmp_path / "archive"))
+    else:
+        monkeypatch.setattr(Config, "LEDGER_ARCHIVE_DIR", None)
+    return FirestoreDB(backend="sqlite", sqlite_path=":memory:")
+
+
+def _seed(db):
+    shop = db.create_shop("Archive Kirana", PHONE)
+    batch = db.db.batch()
+    for i, (ts, qty, amount) in enumerate([
+        ("2024-01-05T10:00:00", 2, 40.0),
+        ("2024-01-20T10:00:00", 1, 20.0),
+        ("2024-02-11T10:00:00", 3, None),
+        ("2026-06-01T10:00:00", 5, 100.0),
+    ]):
+        batch.set(db.db.collection("transactions").document(f"t{i}"), {
+            "transaction_id": f"t{i}", "shop_id": shop.shop_id, "product_id": "p1",
+            "product_name": "Atta", "transaction_type": "sale", "quantity": qty,
+            "unit_price": 20.0, "total_amount": amount, "timestamp": ts,
+            "previous_stock": 50, "new_stock": 48, "user_phone": PHONE,
+        })
+    batch.commit()
+    return shop.shop_id
+
+
+def _reports(db, shop_id):
+    full = db.get_total_sales_for_period(shop_id, datetime(2024, 1, 1), datetime(2024, 3, 1))
+    partial = db.get_total_sales_for_period(shop_id, datetime(2024, 1, 10), datetime(2024, 2, 15))
+    return (
+        (full["total_items_sold"], full["total_revenue"]),
+        (partial["total_items_sold"], partial["total_revenue"]),
+    )
+
+
+def test_compaction_keeps_reports_and_cube(db):
+    """Old months move out of the live ledger without changing any answer"""
+    shop_id = _seed(db)
+    before = _reports(db, shop_id)
+    db.rebuild_sales_cube(shop_id)
+    cube_before = db.get_sales_cube(shop_id)
+
+    result = db.compact_ledger(shop_id, horizon_days=365, now=NOW)
+
+    assert result["months"] == ["2024-01", "2024-02"] and result["rows_archived"] == 3
+    assert [t.transaction_id for t in db.get_transactions_by_shop(shop_id)] == ["t3"]
+    assert _reports(db, shop_id) == before == ((6.0, 120.0), (4.0, 80.0))
+    db.rebuild_sales_cube(shop_id)
+    assert db.get_sales_cube(shop_id) == cube_before
+
+    # Re-running finds nothing left to move
+    assert db.compact_ledger(shop_id, horizon_days=365, now=NOW)["rows_archived"] == 0
+
+
+def test_restore_puts_rows_back(db):
+    """A restored month is live again and its summary is gone"""
+    shop_id = _seed(db)
+    before = _reports(db, shop_id)
+    db.compact_ledger(shop_id, horizon_days=365, now=NOW)
+
+    result = db.restore_ledger_month(shop_id, "2024-01")
+
+    assert result == {"success": True, "month": "2024-01", "rows_restored": 2}
+    assert db.get_compacted_months(shop_id) == ["2024-02"]
+    assert len(db.get_transactions_by_shop(shop_id)) == 3
+    assert _reports(db, shop_id) == before
+    assert not db.restore_ledger_month(shop_id, "2023-12")["success"]
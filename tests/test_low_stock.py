@@ -0,0 +1,77 @@
+"""
+Tests for low-stock thresholds, the low-stock set and owner digests
+"""
+import low_stock
+from models import Product
+
+
+def _product(product_id, name, stock, threshold=None):
+    return Product(
+        product_id=product_id,
+        shop_id="shop-1",
+        name=name,
+        normalized_name=name.lower(),
+        current_stock=stock,
+        unit="pieces",
+        low_stock_threshold=threshold,
+    )
+
+
+def test_threshold_falls_back_to_env_default(monkeypatch):
+    """Products without their own threshold use LOW_STOCK_THRESHOLD"""
+    monkeypatch.delenv("LOW_STOCK_THRESHOLD", raising=False)
+    assert low_stock.threshold_for(_product("a", "Atta", 3)) == 5.0
+    monkeypatch.setenv("LOW_STOCK_THRESHOLD", "8")
+    assert low_stock.threshold_for(_product("a", "Atta", 3)) == 8.0
+    assert low_stock.threshold_for(_product("a", "Atta", 3, threshold=12)) == 12.0
+
+
+def test_set_matches_full_scan_after_updates():
+    """Incremental updates give the same set as rebuilding from the catalog"""
+    products = {f"p{i}": _product(f"p{i}", f"Item {i}", i % 9, threshold=(3 if i % 4 == 0 else None))
+                for i in range(40)}
+    low_set = low_stock.LowStockSet.from_products(products.values(), default=5.0)
+
+    for i, stock in [(1, 20), (7, 2), (8, 4), (12, 1), (30, 6)]:
+        products[f"p{i}"].current_stock = stock
+        low_set.update(products[f"p{i}"], stock, default=5.0)
+
+    rebuilt = low_stock.LowStockSet.from_products(products.values(), default=5.0)
+    assert low_set.items() == rebuilt.items()
+    assert "p1" not in low_set and "p7" in low_set and "p8" not in low_set
+
+
+def test_owner_digest_uses_latest_event_per_product():
+    """A product restocked before the batch went out is not reported"""
+    events = [
+        {"product_id": "a", "product_name": "Atta", "kind": "enter", "stock": 2, "unit": "kg",
+         "threshold": 5, "created_at": "2026-03-01T10:00:00"},
+        {"product_id": "a", "product_name": "Atta", "kind": "leave", "stock": 20, "unit": "kg",
+         "threshold": 5, "created_at": "2026-03-01T11:00:00"},
+        {"product_id": "m", "product_name": "Maggi", "brand": "Nestle", "kind": "enter", "stock": 3,
+         "unit": "pieces", "threshold": 5, "created_at": "2026-03-01T10:30:00"},
+    ]
+    message = low_stock.format_owner_digest(events)
+    assert "Maggi (Nestle): 3 pieces left" in message
+    assert "Atta" not in message
+    assert low_stock.format_owner_digest(events[:2]) is None
+
+
+def test_pending_events_are_per_shop_and_oldest_first():
+    """With more pending events than the limit, a shop still gets its own oldest events"""
+    from database import FirestoreDB
+
+    db = FirestoreDB(backend="sqlite", sqlite_path=":memory:")
+    events = db.db.collection("low_stock_events")
+    for n in range(12):
+        events.add({"shop_id": "shop-busy", "notified": False, "created_at": f"2026-06-01T09:{n:02d}:00"})
+    for n in (3, 1, 2):
+        events.add({"shop_id": "shop-quiet", "notified": False, "created_at": f"2026-06-01T08:0{n}:00"})
+    events.add({"shop_id": "shop-quiet", "notified": True, "created_at": "2026-06-01T07:00:00"})
+
+    quiet = db.get_pending_low_stock_events("shop-quiet", limit=5)
+    assert [e["created_at"][-5:] for e in quiet] == ["01:00", "02:00", "03:00"]
+    busy = db.get_pending_low_stock_events("shop-busy", limit=5)
+    assert [e["created_at"][-5:] for e in busy] == [f"{n:02d}:00" for n in range(5)]
+    oldest = db.get_pending_low_stock_events(limit=4)
+    assert [e["shop_id"] for e in oldest] == ["shop-quiet"] * 3 + ["shop-busy"]
@@ -0,0 +1,70 @@
+"""
+Offline sync: a queued batch of mixed POS ops applies in order, once, with per-op results
+"""
+import idempotency
+from offline_sync import OfflineSync
+from database import FirestoreDB
+
+PHONE = "+910000000000"
+
+
+def _shop(db):
+    shop = db.create_shop("Offline Kirana", PHONE)
+    db.add_stock(shop.shop_id, "Atta", 10, PHONE)
+    return shop.shop_id, db.find_existing_product_by_name(shop.shop_id, "Atta")
+
+
+def test_mixed_queue_applies_in_order_and_once():
+    """Sale, return, restock and price change chain stock; a resent queue is all duplicates"""
+    db = FirestoreDB(backend="sqlite", sqlite_path=":memory:")
+    shop_id, atta = _shop(db)
+    cursor = db.get_catalog_delta(shop_id)["cursor"]
+    ops = [
+        {"op_id": "op-1", "type": "sale", "client_ts": "2026-06-01T10:00:00Z",
+         "items": [{"product_id": atta.product_id, "quantity": 4}, {"name": "Loose Chilli", "quantity": 1, "price": 5}]},
+        {"op_id": "op-2", "type": "return", "items": [{"name": "atta", "quantity": 1}]},
+        {"op_id": "op-3", "type": "add_stock", "items": [{"name": "Sugar", "quantity": 6, "cost_price": 40}]},
+        {"op_id": "op-4", "type": "price_change", "product_id": atta.product_id, "selling_price": 55,
+         "client_ts": "2026-06-01T10:05:00+05:30"},
+        {"op_id": "op-5", "type": "refund"},
+    ]
+
+    result = OfflineSync(db).apply(shop_id, PHONE, ops, catalog_since=cursor)
+
+    assert [r["status"] for r in result["results"]] == ["applied"] * 4 + ["rejected"]
+    assert result["results"][1]["result"]["items"][0]["new_stock"] == 7
+    assert db.check_stock(shop_id, "Atta")["current_stock"] == 7
+    sugar = db.find_existing_product_by_name(shop_id, "Sugar")
+    assert sugar.current_stock == 6 and sugar.cost_price == 40
+    assert db.get_product(atta.product_id).selling_price == 55
+    assert {p["name"] for p in result["catalog"]["products"]} >= {"Atta", "Sugar"}
+    assert result["catalog"]["cursor"] > cursor
+
+    again = OfflineSync(db).apply(shop_id, PHONE, ops[:4])
+    assert [r["status"] for r in again["results"]] == ["duplicate"] * 4
+    assert again["results"][0]["result"] == result["results"][0]["result"]
+    assert again["results"][3]["result"]["price_updated_at"] == result["results"][3]["result"]["price_updated_at"]
+    assert db.db.collection("pos_requests").document(idempotency.record_id(shop_id, "op-4")).get().exists
+    assert db.check_stock(shop_id, "Atta")["current_stock"] == 7
+    assert len(db.get_bills(shop_id)["bills"]) == 1
+
+
+def test_older_price_change_is_a_conflict():
+    """Last writer by client time wins; the loser gets the current prices back"""
+    db = FirestoreDB(backend="sqlite", sqlite_path=":memory:")
+    shop_id, atta = _shop(db)
+    sync = OfflineSync(db)
+
+    sync.apply(shop_id, PHONE, [{"op_id": "p-2", "type": "price_change", "product_id": atta.product_id,
+                                 "selling_price": 60, "client_ts": "2026-06-02T09:00:00"}])
+    result = sync.apply(shop_id, PHONE, [
+        {"op_id": "p-1", "type": "price_change", "product_id": atta.product_id,
+         "selling_price": 50, "client_ts": "2026-06-01T09:00:00"},
+        {"op_id": "r-1", "type": "return", "items": [{"name": "Ghee", "quantity": 1}]},
+    ])
+
+    conflict, rejected = result["results"]
+    assert conflict["status"] == "conflict" and conflict["result"]["selling_price"] == 60
+    assert rejected["status"] == "rejected" and "Ghee: product not found" in rejected["errors"]
+    assert result["summary"] == {"applied": 0, "duplicate": 0, "conflict": 1, "rejected": 1}
+    assert db.get_product(atta.product_id).selling_price == 60
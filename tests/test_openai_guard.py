@@ -0,0 +1,121 @@
+"""
+OpenAI guard: the breaker trips and recovers, calls are shed on deadline and saturation, parsing falls back
+"""
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+import openai_guard
+from ai_service import AIService
+from models import CommandAction
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _fail(**_):
+    raise RuntimeError("upstream 500")
+
+
+def test_breaker_opens_on_failures_and_closes_after_a_good_trial():
+    """Half the window failing opens it; after the cooldown one trial decides"""
+    clock = _Clock()
+    guard = openai_guard.Guard(breaker=openai_guard.CircuitBreaker(
+        window=10, min_calls=4, failure_ratio=0.5, cooldown_seconds=30, clock=clock))
+
+    assert guard.call("chat", lambda timeout: timeout) == 10.0
+    for _ in range(3):
+        with pytest.raises(RuntimeError):
+            guard.call("chat", _fail)
+    assert guard.breaker.state == openai_guard.OPEN
+
+    with pytest.raises(openai_guard.Unavailable) as refused:
+        guard.call("chat", lambda timeout: "not called")
+    assert refused.value.reason == "breaker_open"
+
+    clock.now = 31
+    assert guard.breaker.state == openai_guard.HALF_OPEN
+    with pytest.raises(RuntimeError):
+        guard.call("chat", _fail)
+    assert guard.breaker.state == openai_guard.OPEN
+
+    clock.now = 62
+    assert guard.call("chat", lambda timeout: "ok") == "ok"
+    assert guard.breaker.state == openai_guard.CLOSED
+
+
+def test_calls_shed_on_deadline_and_saturation():
+    """The timeout follows the request budget; a full semaphore refuses after the queue wait"""
+    guard = openai_guard.Guard(max_in_flight=1, queue_wait_seconds=0.05)
+
+    with openai_guard.request_budget(4.0):
+        assert guard.call("audio", lambda timeout: timeout) == pytest.approx(3.0, abs=0.05)
+    with openai_guard.request_budget(1.2):
+        with pytest.raises(openai_guard.Unavailable) as late:
+            guard.call("chat", lambda timeout: "not called")
+    assert late.value.reason == "deadline"
+
+    entered, release = threading.Event(), threading.Event()
+
+    def slow(timeout):
+        entered.set()
+        release.wait(5)
+
+    holder = threading.Thread(target=guard.call, args=("chat", slow))
+    holder.start()
+    entered.wait(5)
+    assert guard.in_flight == 1
+    with pytest.raises(openai_guard.Unavailable) as busy:
+        guard.call("chat", lambda timeout: "not called")
+    release.set()
+    holder.join()
+    assert busy.value.reason == "saturated"
+    assert guard.in_flight == 0
+
+
+def test_parse_command_falls_back_to_keywords_when_openai_is_unavailable():
+    """A failing LLM answers UNKNOWN; once the breaker is open, plain add/sell/check phrases still parse"""
+    ai = AIService(api_key="test-key")
+    asked = []
+
+    def create(**kwargs):
+        asked.append(kwargs)
+        raise RuntimeError("upstream 500")
+
+    clock = _Clock()
+    guard = openai_guard.Guard(breaker=openai_guard.CircuitBreaker(min_calls=1, failure_ratio=1.0, clock=clock))
+    ai._client = openai_guard.GuardedClient(SimpleNamespace(chat=SimpleNamespace(
+        completions=SimpleNamespace(create=create))), guard)
+
+    failed = ai.parse_command("Maggi 10 packet laya")
+    assert asked and asked[0]["timeout"] > 0
+    assert failed.action == CommandAction.UNKNOWN
+    assert guard.breaker.state == openai_guard.OPEN
+
+    added = ai.parse_command("Maggi 10 packet laya")
+    sold = ai.parse_command("2 chips customer ko diya")
+    bought = ai.parse_command("got 6 milk packets")
+    assert len(asked) == 1
+    assert (added.action, added.product_name, added.quantity) == (CommandAction.ADD_STOCK, "maggi", 10)
+    assert (sold.action, sold.product_name, sold.quantity) == (CommandAction.REDUCE_STOCK, "chips", 2)
+    assert (bought.action, bought.product_name, bought.quantity) == (CommandAction.ADD_STOCK, "milk", 6)
+    assert added.confidence < 0.5 and sold.confidence < 0.5
+    assert ai.parse_command("hello bhai kaise ho").action == CommandAction.UNKNOWN
+
+
+def test_keyword_fallback_matches_whole_words_and_checks_before_adds():
+    """Products that start like a keyword stay products; a question about an add is a check"""
+    ai = AIService(api_key="test-key")
+
+    dal = ai._keyword_parse("daal 5 kg aaya", "daal 5 kg aaya")
+    assert (dal.action, dal.product_name, dal.quantity) == (CommandAction.ADD_STOCK, "daal", 5)
+    bhujia = ai._keyword_parse("bikaner bhujia 3 aaye", "bikaner bhujia 3 aaye")
+    assert (bhujia.action, bhujia.product_name) == (CommandAction.ADD_STOCK, "bikaner bhujia")
+    check = ai._keyword_parse("maggi kitna aaya", "maggi kitna aaya")
+    assert (check.action, check.product_name, check.confidence) == (CommandAction.CHECK_STOCK, "maggi", 0.6)
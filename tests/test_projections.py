@@ -0,0 +1,56 @@
+"""
+Field projections: projected scans skip heavy fields but answers don't change
+"""
+from database import FirestoreDB
+import projections
+
+PHONE = "+910000000000"
+
+
+def _shop_with_batches():
+    db = FirestoreDB(backend="sqlite", sqlite_path=":memory:")
+    shop = db.create_shop("Projection Kirana", PHONE)
+    atta = db.get_or_create_product(shop.shop_id, "Aashirvaad Atta 5kg")
+    db.update_product_fields(atta.product_id, {
+        "current_stock": 3.0,
+        "selling_price": 260.0,
+        "batches": {f"b{i}": {"expiry": "2026-12-31", "qty": 1} for i in range(20)},
+    })
+    return db, shop, atta
+
+
+def test_projected_products_omit_unused_fields():
+    """A projected catalog read builds Products with only the masked fields"""
+    db, shop, _ = _shop_with_batches()
+    db.update_product_fields(db.get_products_by_shop(shop.shop_id)[0].product_id, {"cost_price": 200.0})
+    full = db.get_products_by_shop(shop.shop_id)
+    projected = db.get_products_by_shop(shop.shop_id, projection=projections.PRODUCT_MATCH)
+
+    assert full[0].cost_price == 200.0
+    assert projected[0].cost_price is None
+    assert (projected[0].name, projected[0].current_stock, projected[0].selling_price) == ("Aashirvaad Atta 5kg", 3.0, 260.0)
+
+
+def test_batch_only_stock_survives_projection():
+    """A document without current_stock still reads its stock from the batch quantities"""
+    db, shop, atta = _shop_with_batches()
+    data = db.db.collection("products").document(atta.product_id).get().to_dict()
+    del data["current_stock"]
+    db.db.collection("products").document(atta.product_id).set(data)
+
+    for projection in (projections.PRODUCT_MATCH, projections.PRODUCT_LOW_STOCK, projections.PRODUCT_COST):
+        assert db.get_products_by_shop(shop.shop_id, projection=projection)[0].current_stock == 20.0
+    assert db.get_low_stock_products(shop.shop_id, threshold=5)["total_low_products"] == 0
+
+
+def test_projected_reads_keep_answers():
+    """Fuzzy match, listings and low-stock scans answer as before"""
+    db, shop, atta = _shop_with_batches()
+
+    match = db.find_existing_product_by_name(shop.shop_id, "aashirvaad atta")
+    assert match.product_id == atta.product_id and len(match.batches) == 20
+
+    summary = db.get_products_summary(shop.shop_id, limit=10)
+    assert summary["products"][0]["price"] == 260.0
+    assert db.get_low_stock_products(shop.shop_id)["low_products"][0]["name"] == "Aashirvaad Atta 5kg"
+    assert db.get_low_stock_products(shop.shop_id, threshold=5)["total_low_products"] == 1
@@ -0,0 +1,100 @@
+"""
+Stock reconciliation: ledger replay, drift correction and snapshot tails
+"""
+import pytest
+
+import reconciliation
+from database import FirestoreDB
+
+PHONE = "+910000000000"
+
+
+@pytest.fixture
+def db():
+    return FirestoreDB(backend="sqlite", sqlite_path=":memory:")
+
+
+def _shop(db):
+    shop = db.create_shop("Recon Kirana", PHONE)
+    db.add_stock(shop.shop_id, "Atta", 10, PHONE)
+    db.reduce_stock(shop.shop_id, "Atta", 3, PHONE)
+    db.add_stock(shop.shop_id, "Dal", 5, PHONE)
+    return shop.shop_id
+
+
+def test_replay_counts_applied_changes():
+    """Rows add what they applied, even when concurrent rows overlap"""
+    rows = [
+        {"transaction_id": "b", "timestamp": "2026-01-02T00:00:00", "previous_stock": 10, "new_stock": 9},
+        {"transaction_id": "a", "timestamp": "2026-01-01T00:00:00", "previous_stock": 4, "new_stock": 10},
+        {"transaction_id": "c", "timestamp": "2026-01-02T00:00:00", "previous_stock": 10, "new_stock": 9},
+        {"transaction_id": "d", "timestamp": "2026-01-03T00:00:00", "transaction_type": "sale", "quantity": 2},
+    ]
+    result = reconciliation.replay(rows)
+    assert (result.opening, result.expected, result.rows) == (4.0, 6.0, 4)
+
+    snapshot = {"stock": 8.0, "as_of": "2026-01-02T00:00:00", "as_of_ids": ["b", "c"]}
+    tail = reconciliation.replay(rows[1:], snapshot)
+    assert (tail.expected, tail.rows, tail.as_of_ids) == (6.0, 1, ["d"])
+    assert reconciliation.replay([]).expected is None
+
+
+def test_drift_is_found_and_corrected(db):
+    """An off-ledger stock edit shows up as drift until an ADJUSTMENT records it"""
+    shop_id = _shop(db)
+    atta = db.find_existing_product_by_name(shop_id, "Atta")
+    assert db.reconcile_stock(shop_id)["drifted"] == []
+
+    db.update_product_fields(atta.product_id, {"current_stock": 12})
+    report = db.reconcile_stock(shop_id, correct=True, workers=2)
+
+    assert [(e["product_name"], e["expected_stock"], e["drift"]) for e in report["drifted"]] == [("Atta", 7.0, 5.0)]
+    assert report["adjustments_written"] == 1
+    assert db.check_stock(shop_id, "Atta")["current_stock"] == 12
+    assert db.get_reconciliation_report(shop_id) == report
+
+    again = db.reconcile_stock(shop_id)
+    assert again["drifted"] == [] and again["in_sync"] == 2
+
+
+def test_snapshots_limit_replay_to_the_tail(db):
+    """After a snapshot only newer rows are replayed"""
+    shop_id = _shop(db)
+    first = db.reconcile_stock(shop_id)
+    assert (first["rows_replayed"], first["snapshots_written"]) == (3, 2)
+
+    db.reduce_stock(shop_id, "Dal", 1, PHONE)
+    second = db.reconcile_stock(shop_id)
+
+    assert second["drifted"] == []
+    assert (second["rows_replayed"], second["from_snapshot"], second["snapshots_written"]) == (1, 2, 1)
+
+
+def test_batch_derived_stock_is_flagged_not_adjusted(db):
+    """A product whose stock comes from its batches is read as such and never corrected"""
+    shop_id = _shop(db)
+    atta = db.find_existing_product_by_name(shop_id, "Atta")
+    data = db.db.collection("products").document(atta.product_id).get().to_dict()
+    del data["current_stock"]
+    data["batches"] = {"b1": {"expiry_date": "2030-01-01", "qty": 7}}
+    db.db.collection("products").document(atta.product_id).set(data)
+    assert db.reconcile_stock(shop_id)["drifted"] == []
+
+    data["batches"]["b1"]["qty"] = 9
+    db.db.collection("products").document(atta.product_id).set(data)
+    report = db.reconcile_stock(shop_id, correct=True)
+
+    assert [(e["current_stock"], e["drift"], e.get("derived_stock")) for e in report["drifted"]] == [(9.0, 2.0, True)]
+    assert report["adjustments_written"] == 0
+    assert "adjustment_id" not in report["drifted"][0]
+
+
+def test_pool_reads_count_toward_the_callers_scope(db):
+    """Ledger replays on the worker pool are billed to the request that asked for them"""
+    import firestore_accounting
+
+    shop_id = _shop(db)
+    with firestore_accounting.measure() as usage:
+        db.reconcile_stock(shop_id, snapshot=False, workers=2)
+    # Two product documents plus the three ledger rows replayed on the pool
+    assert usage.reads >= 5
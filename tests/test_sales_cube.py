@@ -0,0 +1,128 @@
+"""
+Tests for the monthly sales cube, checked against a synthetic ledger
+"""
+import random
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+
+import pytest
+
+import sales_cube
+from config import Config
+from database import FirestoreDB
+from models import TransactionType
+
+PHONE = "+910000000000"
+
+
+def _synthetic_ledger(seed=3, days=800):
+    """Random mix of sales, stock additions and returns over ~2 years."""
+    rng = random.Random(seed)
+    start = datetime(2024, 8, 1)
+    txns = []
+    for d in range(days):
+        day = start + timedelta(days=d)
+        for _ in range(rng.randint(0, 6)):
+            product = rng.choice(["maggi", "oil", "ghee", "atta"])
+            txns.append({
+                "product_id": product,
+                "product_name": product.title(),
+                "transaction_type": rng.choice(["sale", "reduce_stock", "add_stock", "return"]),
+                "quantity": rng.randint(1, 5),
+                "unit_price": 10.0,
+                "timestamp": (day + timedelta(hours=rng.randint(8, 21))).isoformat(),
+            })
+    return txns
+
+
+def _net(t):
+    return {"sale": 1, "reduce_stock": 1, "return": -1}.get(t["transaction_type"], 0) * t["quantity"]
+
+
+def test_build_cube_matches_brute_force():
+    """Cube cells equal a direct per-month count of sales net of returns"""
+    txns = _synthetic_ledger()
+    expected = defaultdict(float)
+    for t in txns:
+        if t["transaction_type"] in ("sale", "reduce_stock", "return"):
+            expected[(t["timestamp"][:7], t["product_id"])] += _net(t)
+
+    cube = sales_cube.build_cube(txns)
+
+    actual = {(m, pid): cell["qty"] for m, cells in cube.items() for pid, cell in cells.items()}
+    assert actual == dict(expected)
+    assert cube["2025-01"]["maggi"]["revenue"] == pytest.approx(cube["2025-01"]["maggi"]["qty"] * 10.0)
+
+
+def test_incremental_cells_match_rebuild():
+    """Folding sale_cell increments one by one gives the rebuilt cube"""
+    txns = _synthetic_ledger(seed=11)
+    incremental = {}
+    for t in txns:
+        cell = sales_cube.sale_cell(t)
+        if cell is None:
+            continue
+        month, pid, name, qty, revenue = cell
+        entry = incremental.setdefault(month, {}).setdefault(pid, {"name": name, "qty": 0.0, "revenue": 0.0})
+        entry["qty"] += qty
+        entry["revenue"] += revenue
+
+    assert incremental == sales_cube.build_cube(txns)
+
+
+def test_seasonal_totals_year_over_year():
+    """Diwali totals compare Oct-Nov 2025 with Oct-Nov 2024"""
+    txns = _synthetic_ledger()
+    today = date(2026, 9, 15)
+
+    totals = sales_cube.seasonal_totals(sales_cube.build_cube(txns), [10, 11], today)
+
+    for pid, t in totals.items():
+        recent = sum(_net(x) for x in txns if x["product_id"] == pid
+                     and x["timestamp"][:7] in ("2025-10", "2025-11"))
+        previous = sum(_net(x) for x in txns if x["product_id"] == pid
+                       and x["timestamp"][:7] in ("2024-10", "2024-11"))
+        assert t["recent_qty"] == recent
+        assert t["previous_qty"] == previous
+
+
+def test_live_cube_matches_ledger_replay(monkeypatch):
+    """Sales and returns written through the database leave the cube equal to a net replay of the ledger"""
+    monkeypatch.setattr(Config, "SALES_JOURNAL_PATH", None)
+    db = FirestoreDB(backend="sqlite", sqlite_path=":memory:")
+    shop = db.create_shop("Cube Kirana", PHONE)
+    for name in ("Atta", "Ghee"):
+        db.add_stock(shop.shop_id, name, 50, PHONE)
+    db.get_sales_cube(shop.shop_id)  # built (empty) now, kept current from here on
+
+    rng = random.Random(5)
+    for _ in range(40):
+        product = db.find_existing_product_by_name(shop.shop_id, rng.choice(["Atta", "Ghee"]))
+        kind = rng.choice([TransactionType.SALE, TransactionType.SALE, TransactionType.RETURN])
+        db.record_stock_movement(shop.shop_id, product, kind, rng.randint(1, 3), PHONE)
+
+    replay = defaultdict(float)
+    for t in db.get_transactions_by_shop(shop.shop_id, limit=1000):
+        row = t.to_dict()
+        if row["transaction_type"] in ("sale", "reduce_stock", "return"):
+            replay[(row["timestamp"][:7], row["product_id"])] += _net(row)
+
+    live = {(m, pid): cell["qty"] for m, cells in db.get_sales_cube(shop.shop_id).items() for pid, cell in cells.items()}
+    assert live == pytest.approx(dict(replay))
+    db.rebuild_sales_cube(shop.shop_id)
+    rebuilt = {(m, pid): cell["qty"] for m, cells in db.get_sales_cube(shop.shop_id).items()
+               for pid, cell in cells.items()}
+    assert rebuilt == pytest.approx(dict(replay))
+
+
+def test_season_selection_and_month_math():
+    """Explicit names win, otherwise the current month decides"""
+    assert sales_cube.match_season("Diwali ke liye", date(2026, 3, 1)) == "diwali"
+    assert sales_cube.match_season(None, date(2026, 3, 1)) == "holi"
+    assert sales_cube.season_month_keys([12, 1], date(2026, 1, 10)) == (
+        ["2025-12", "2025-01"], ["2024-12", "2024-01"]
+    )
+    assert sales_cube.shift_month("2026-01", -24) == "2024-01"
+    assert sales_cube.shift_month("2026-01", -1) == "2025-12"
+    assert sales_cube.yoy_change_pct(120, 100) == 20.0
+    assert sales_cube.yoy_change_pct(5, 0) is None
@@ -0,0 +1,105 @@
+"""
+Local sales journal: overlay, exactly-once flush, replay and lag stats
+"""
+from database import FirestoreDB
+from models import TransactionType
+from sales_journal import JournalFlusher
+
+PHONE = "+910000000000"
+
+
+def _db(tmp_path):
+    db = FirestoreDB(backend="sqlite", sqlite_path=":memory:", journal_path=str(tmp_path / "journal.db"))
+    shop = db.create_shop("Journal Kirana", PHONE)
+    db.add_stock(shop.shop_id, "Atta", 10, PHONE)
+    return db, shop, db.find_existing_product_by_name(shop.shop_id, "Atta")
+
+
+def _upstream_stock(db, product_id):
+    return db.db.collection("products").document(product_id).get().to_dict()["current_stock"]
+
+
+def test_unflushed_sales_show_in_reads(tmp_path):
+    """Stock read before the flush already reflects journaled sales and returns"""
+    db, shop, atta = _db(tmp_path)
+    result = db.record_stock_movement(shop.shop_id, atta, TransactionType.SALE, 3, PHONE)
+    db.record_stock_movement(shop.shop_id, db.get_product(atta.product_id), TransactionType.RETURN, 1, PHONE)
+
+    assert result["journaled"] and result["new_stock"] == 7
+    assert _upstream_stock(db, atta.product_id) == 10
+    assert db.get_product(atta.product_id).current_stock == 8
+    assert db.get_products_by_shop(shop.shop_id)[0].current_stock == 8
+    assert db.sales_journal.stats()["pending_entries"] == 2
+
+
+def test_flush_applies_each_entry_once(tmp_path):
+    """Flushing writes stock, ledger and cube; a retried entry is not re-applied"""
+    db, shop, atta = _db(tmp_path)
+    db.record_stock_movement(shop.shop_id, atta, TransactionType.SALE, 3, PHONE, idempotency_key="k1")
+    flusher = JournalFlusher(db.sales_journal, db.apply_journal_entries)
+
+    assert flusher.flush_once() == 1
+    assert _upstream_stock(db, atta.product_id) == 7
+    assert db.get_product(atta.product_id).current_stock == 7
+    assert [t.transaction_id for t in db.get_transactions_by_shop(shop.shop_id)][0] == "k1"
+
+    # Simulate a flusher that died after its batch landed but before marking it
+    journal = db.sales_journal
+    with journal._write() as conn:
+        conn.execute("UPDATE journal SET flushed_at = NULL WHERE idempotency_key = 'k1'")
+    assert flusher.flush_once() == 1
+    assert _upstream_stock(db, atta.product_id) == 7
+    assert journal.append([{"idempotency_key": "k1", "shop_id": shop.shop_id, "product_id": atta.product_id,
+                            "delta": -3, "transaction": {}}]) == 0
+
+
+def test_stats_report_lag_until_flushed(tmp_path):
+    """Pending entries report lag; a successful flush clears it"""
+    db, shop, atta = _db(tmp_path)
+    db.record_stock_movement(shop.shop_id, atta, TransactionType.SALE, 1, PHONE)
+    stats = db.sales_journal.stats()
+    assert stats["pending_entries"] == 1 and stats["lag_seconds"] >= 0
+
+    JournalFlusher(db.sales_journal, db.apply_journal_entries).flush_once()
+    stats = db.sales_journal.stats()
+    assert stats["pending_entries"] == 0 and stats["lag_seconds"] == 0.0
+    assert stats["flushed_entries"] == 1
+
+
+def test_landed_entries_are_not_counted_twice(tmp_path):
+    """Between the upstream commit and mark_flushed the overlay already skips the entry"""
+    db, shop, atta = _db(tmp_path)
+    db.record_stock_movement(shop.shop_id, atta, TransactionType.SALE, 3, PHONE)
+    journal = db.sales_journal
+
+    # The batch lands, the flusher dies before marking it
+    assert len(db.apply_journal_entries(journal.claim())) == 1
+    assert journal.stats()["pending_entries"] == 1
+    assert _upstream_stock(db, atta.product_id) == 7
+    assert db.get_product(atta.product_id).current_stock == 7
+    assert db.get_products_by_shop(shop.shop_id)[0].current_stock == 7
+
+    # A sale from already negative stock leaves it alone instead of raising it
+    atta.current_stock = -2.0
+    result = db.record_stock_movement(shop.shop_id, atta, TransactionType.SALE, 1, PHONE)
+    assert result["new_stock"] == -2.0
+    assert db.get_product(atta.product_id).current_stock == 7
+
+
+def test_unappliable_entries_are_dead_lettered(tmp_path):
+    """An entry that keeps failing stops being retried and shows in stats"""
+    db, shop, atta = _db(tmp_path)
+    db.record_stock_movement(shop.shop_id, atta, TransactionType.SALE, 1, PHONE)
+    db.sales_journal.append([{"idempotency_key": "ghost", "shop_id": shop.shop_id, "product_id": "deleted-product",
+                              "delta": -1, "transaction": {"transaction_type": "sale"}}])
+    flusher = JournalFlusher(db.sales_journal, db.apply_journal_entries, max_attempts=2)
+
+    assert flusher.flush_once() == 1
+    assert db.sales_journal.stats()["dead_letter_entries"] == 0
+    assert flusher.flush_once() == 0
+    stats = db.sales_journal.stats()
+    assert (stats["dead_letter_entries"], stats["pending_entries"]) == (1, 0)
+    assert flusher.flush_once() == 0 and db.sales_journal.claim() == []
+
+    assert db.sales_journal.requeue_dead() == 1
+    assert db.sales_journal.stats()["dead_letter_entries"] == 0
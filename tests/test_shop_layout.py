@@ -0,0 +1,95 @@
+"""
+Per-shop data layout: online migration, dual reads and checkpoint resume
+"""
+from datetime import datetime
+
+import shop_layout
+from database import FirestoreDB
+
+PHONE = "+910000000000"
+
+
+def _trading_shop(path):
+    db = FirestoreDB(backend="sqlite", sqlite_path=str(path))
+    shop = db.create_shop("Layout Kirana", PHONE)
+    for name in ("Atta", "Dal", "Chini"):
+        db.add_stock(shop.shop_id, name, 10, PHONE)
+    db.reduce_stock(shop.shop_id, "Dal", 2, PHONE)
+    db.create_udhar_entry(shop.shop_id, "Ramesh", 200, PHONE)
+    db.save_unrecognized_command(shop.shop_id, PHONE, "text", "asdf")
+    return db, shop
+
+
+def _nested_count(db, shop_id, name):
+    return len(list(shop_layout.nested_collection(db.db, shop_id, name).stream()))
+
+
+def test_migration_moves_shop_and_keeps_answers(tmp_path):
+    """A migrated shop reads the same from its subcollections, even by id alone"""
+    db, shop = _trading_shop(tmp_path / "layout.db")
+    before = db.get_total_sales_today(shop.shop_id)
+
+    result = db.migrate_shop_layout(shop.shop_id, page_size=2, settle_seconds=0)
+
+    assert result["success"] and db.get_shop_layout(shop.shop_id) == shop_layout.NESTED
+    assert _nested_count(db, shop.shop_id, "products") == 3
+    assert _nested_count(db, shop.shop_id, "transactions") == 4
+    assert db.get_total_sales_today(shop.shop_id)["total_items_sold"] == before["total_items_sold"]
+
+    # Writes after the cut-over only reach the nested layout
+    db.reduce_stock(shop.shop_id, "Atta", 1, PHONE)
+    assert db.check_stock(shop.shop_id, "Atta")["current_stock"] == 9
+    assert db.get_transactions_by_shop(shop.shop_id, limit=1)[0].quantity == 1
+
+    # A fresh process that only knows a command id still finds it
+    other = FirestoreDB(backend="sqlite", sqlite_path=str(tmp_path / "layout.db"))
+    command = db.get_unrecognized_commands(shop.shop_id)[0]
+    assert other.mark_command_resolved(command.command_id)
+    assert db.get_unrecognized_commands(shop.shop_id) == []
+
+
+def test_dual_layout_writes_both_and_rolls_back(tmp_path):
+    """While dual, reads merge both layouts and writes keep global complete"""
+    db, shop = _trading_shop(tmp_path / "dual.db")
+    db.set_shop_layout(shop.shop_id, shop_layout.DUAL)
+
+    db.reduce_stock(shop.shop_id, "Chini", 4, PHONE)
+    assert db.check_stock(shop.shop_id, "Chini")["current_stock"] == 6
+    assert len(db.get_products_by_shop(shop.shop_id)) == 3
+    assert _nested_count(db, shop.shop_id, "products") == 1  # copied on write
+
+    db.set_shop_layout(shop.shop_id, shop_layout.GLOBAL)
+    assert db.check_stock(shop.shop_id, "Chini")["current_stock"] == 6
+    assert len(db.get_transactions_by_shop(shop.shop_id)) == 5
+
+
+def test_interrupted_backfill_resumes_from_checkpoint(tmp_path):
+    """A backfill stopped mid-way picks up after its last committed page"""
+    db, shop = _trading_shop(tmp_path / "resume.db")
+    db.set_shop_layout(shop.shop_id, shop_layout.DUAL)
+    pages = []
+
+    def stop_after_first_page(last_id, copied, skipped):
+        pages.append(last_id)
+        db.db.collection("layout_migrations").document(shop.shop_id).set(
+            {"collections": {"transactions": {"last_id": last_id, "copied": copied, "skipped": skipped}}},
+            merge=True,
+        )
+        raise KeyboardInterrupt
+
+    try:
+        shop_layout.backfill_collection(db.db, shop.shop_id, "transactions", page_size=2,
+                                        on_page=stop_after_first_page)
+    except KeyboardInterrupt:
+        pass
+    assert _nested_count(db, shop.shop_id, "transactions") == 2
+
+    result = db.migrate_shop_layout(shop.shop_id, page_size=2, settle_seconds=0)
+    assert result["success"]
+    assert result["collections"]["transactions"]["copied"] == 4
+    assert result["verification"]["transactions"] == {
+        "global": 4, "nested": 4, "missing": 0, "missing_sample": [], "ok": True,
+    }
+    assert datetime.fromisoformat(
+        db.db.collection("layout_migrations").document(shop.shop_id).get().to_dict()["updated_at"]
+    )
@@ -0,0 +1,114 @@
+"""
+SQLite document store: fixed expectations for the Firestore semantics FirestoreDB relies on
+
+test_storage_parity.py compares whole FirestoreDB flows, but its Firestore
+half needs the emulator; these pin the client behaviour on its own.
+"""
+import pytest
+
+from sqlite_store import DESCENDING, AlreadyExists, Increment, NotFound, SQLiteClient
+
+
+@pytest.fixture
+def client():
+    client = SQLiteClient(":memory:")
+    items = client.collection("items")
+    items.document("a").set({"shop_id": "s1", "name": "Atta", "qty": 5, "tags": ["flour"], "meta": {"brand": "A"}})
+    items.document("b").set({"shop_id": "s1", "name": "Bread", "qty": 2, "rank": 2, "notified": False})
+    items.document("c").set({"shop_id": "s2", "name": "Chai", "qty": 9, "rank": 1, "notified": True})
+    items.document("d").set({"shop_id": "s2", "name": "Dal", "qty": 1, "rank": None})
+    return client
+
+
+def _ids(query):
+    return [doc.id for doc in query.stream()]
+
+
+def test_filters_match_firestore(client):
+    """in / not-in / != / array_contains / == None, and booleans stay booleans"""
+    items = client.collection("items")
+    assert _ids(items.where("shop_id", "in", ["s2", "s9"]).order_by("__name__")) == ["c", "d"]
+    assert _ids(items.where("shop_id", "in", [])) == []
+    assert _ids(items.where("qty", ">=", 2).where("qty", "<", 9).order_by("qty")) == ["b", "a"]
+    # != and not-in skip documents without the field; != None also skips explicit nulls
+    assert _ids(items.where("rank", "!=", 2)) == ["c"]
+    assert _ids(items.where("rank", "not-in", [1]).order_by("__name__")) == ["b"]
+    assert _ids(items.where("rank", "!=", None).order_by("__name__")) == ["b", "c"]
+    # == None matches an explicit null only, not a missing field
+    assert _ids(items.where("rank", "==", None)) == ["d"]
+    assert _ids(items.where("notified", "==", False)) == ["b"]
+    assert _ids(items.where("notified", "!=", False)) == ["c"]
+    assert _ids(items.where("notified", "==", 0)) == []
+    assert _ids(items.where("tags", "array_contains", "flour")) == ["a"]
+    assert _ids(items.where("meta.brand", "==", "A")) == ["a"]
+
+
+def test_order_by_skips_missing_fields_and_pages(client):
+    """order_by drops documents without the field (nulls sort first); limit/offset page the rest"""
+    items = client.collection("items")
+    assert _ids(items.order_by("rank")) == ["d", "c", "b"]
+    assert _ids(items.order_by("rank", direction=DESCENDING)) == ["b", "c", "d"]
+    assert _ids(items.order_by("qty", direction=DESCENDING).limit(2)) == ["c", "a"]
+    assert _ids(items.order_by("qty").offset(1).limit(2)) == ["b", "a"]
+    assert _ids(items.order_by("__name__", direction=DESCENDING).limit(1)) == ["d"]
+
+
+def test_select_keeps_only_the_requested_paths(client):
+    """select() returns the listed fields, nested paths as nested maps; ids survive an empty select"""
+    items = client.collection("items")
+    (atta,) = items.where("name", "==", "Atta").select(["name", "meta.brand", "missing"]).stream()
+    assert atta.to_dict() == {"name": "Atta", "meta": {"brand": "A"}}
+    ids_only = items.where("shop_id", "==", "s2").order_by("__name__").select([])
+    assert [(doc.id, doc.to_dict()) for doc in ids_only.stream()] == [("c", {}), ("d", {})]
+
+
+def test_aggregations_follow_filters_order_and_limit(client):
+    """count() and sum() see the same documents the query would stream"""
+    items = client.collection("items")
+    (row,) = items.where("shop_id", "==", "s1").count(alias="n").sum("qty", alias="units").get()
+    assert {r.alias: r.value for r in row} == {"n": 2, "units": 7}
+    (row,) = items.order_by("rank").count().get()
+    assert row[0].value == 3
+    (row,) = items.order_by("qty", direction=DESCENDING).limit(2).sum("qty").get()
+    assert row[0].value == 14
+    (row,) = items.sum("notified").sum("name", alias="names").get()
+    assert [r.value for r in row] == [0, 0]
+    (row,) = items.where("shop_id", "==", "s9").count().sum("qty").get()
+    assert [r.value for r in row] == [0, 0]
+
+
+def test_writes_follow_firestore(client):
+    """Increment, merge, dotted update paths, create/update errors and atomic batches"""
+    counters = client.collection("counters")
+    ref = counters.document("day")
+    ref.set({"sales": Increment(2), "by_product": {"p1": Increment(1)}}, merge=True)
+    ref.set({"sales": Increment(3), "by_product": {"p2": Increment(4)}}, merge=True)
+    ref.update({"by_product.p1": Increment(1), "last.seen": "09:00"})
+    assert ref.get().to_dict() == {"sales": 5, "by_product": {"p1": 2, "p2": 4}, "last": {"seen": "09:00"}}
+
+    ref.set({"fresh": Increment(7)})
+    assert ref.get().to_dict() == {"fresh": 7}
+
+    with pytest.raises(AlreadyExists):
+        ref.create({"fresh": 1})
+    with pytest.raises(NotFound):
+        counters.document("nope").update({"x": 1})
+    assert not counters.document("nope").get().exists
+
+    batch = client.batch()
+    batch.set(counters.document("one"), {"n": 1})
+    batch.create(ref, {"n": 2})
+    with pytest.raises(AlreadyExists):
+        batch.commit()
+    assert not counters.document("one").get().exists and ref.get().to_dict() == {"fresh": 7}
+
+
+def test_subcollections_and_collection_groups(client):
+    """Subcollections are scoped to their parent; collection_group() spans them all"""
+    for shop in ("s1", "s2"):
+        products = client.collection("shops").document(shop).collection("products")
+        products.document("p1").set({"shop_id": shop, "name": f"{shop} atta"})
+    assert _ids(client.collection("shops").document("s1").collection("products")) == ["p1"]
+    assert _ids(client.collection("products")) == []
+    group = client.collection_group("products").order_by("name")
+    assert [doc.reference.path for doc in group.stream()] == ["shops/s1/products/p1", "shops/s2/products/p1"]
@@ -0,0 +1,134 @@
+"""
+Storage backend parity: the same FirestoreDB operations on every backend
+
+SQLite always runs. Firestore runs against the emulator when
+FIRESTORE_EMULATOR_HOST is set (e.g. `gcloud emulators firestore start`).
+"""
+import os
+import uuid
+from datetime import datetime
+
+import pytest
+
+from config import Config
+from database import FirestoreDB
+from models import UserRole
+from otp_service import OTPService
+
+BACKENDS = [
+    "sqlite",
+    "sqlite-nested",
+    pytest.param("firestore", marks=pytest.mark.skipif(
+        not os.getenv("FIRESTORE_EMULATOR_HOST"), reason="Firestore emulator not running")),
+]
+
+
+@pytest.fixture(params=BACKENDS)
+def db(request, monkeypatch):
+    if request.param == "sqlite-nested":
+        # New shops start on the shops/{shop_id}/... layout
+        monkeypatch.setattr(Config, "DEFAULT_DATA_LAYOUT", "nested")
+    if request.param.startswith("sqlite"):
+        return FirestoreDB(backend="sqlite", sqlite_path=":memory:")
+    return FirestoreDB(project_id=os.getenv("FIRESTORE_EMULATOR_PROJECT", "kiranabuddy-test"), backend="firestore")
+
+
+def _phone():
+    # Unique per test so runs against a shared emulator don't collide
+    return "+91" + str(uuid.uuid4().int)[:10]
+
+
+def test_shops_users_and_products(db):
+    """Shops/users resolve by phone and products stay within their shop"""
+    phone = _phone()
+    shop = db.create_shop("Sharma Kirana", phone)
+    other = db.create_shop("Other Kirana", _phone())
+    db.create_user(phone, "Sharma", shop.shop_id, UserRole.OWNER)
+
+    assert db.get_shop_by_phone(phone).shop_id == shop.shop_id
+    assert db.get_user_by_phone(phone).shop_id == shop.shop_id
+
+    maggi = db.get_or_create_product(shop.shop_id, "Maggi")
+    db.get_or_create_product(other.shop_id, "Maggi")
+    db.update_product_fields(maggi.product_id, {"barcode": "8901058000017"})
+
+    assert [p.name.lower() for p in db.get_products_by_shop(shop.shop_id)] == ["maggi"]
+    assert db.find_existing_product_by_name(shop.shop_id, "maggi").product_id == maggi.product_id
+    assert db.find_product_by_barcode(shop.shop_id, "8901058000017").product_id == maggi.product_id
+    assert db.find_product_by_barcode(other.shop_id, "8901058000017") is None
+    assert db.count_products(shop.shop_id) == 1
+
+
+def test_stock_mutations_and_ledger(db):
+    """Stock updates, ledger order and sale totals agree across backends"""
+    shop = db.create_shop("Ledger Kirana", _phone())
+    db.add_stock(shop.shop_id, "Atta", 10, "+910000000000")
+    sale = db.reduce_stock(shop.shop_id, "Atta", 3, "+910000000000")
+    db.reduce_stock(shop.shop_id, "Atta", 2, "+910000000000")
+
+    assert sale["new_stock"] == 7
+    assert db.check_stock(shop.shop_id, "Atta")["current_stock"] == 5
+
+    txns = db.get_transactions_by_shop(shop.shop_id)
+    assert [t.quantity for t in txns] == [2, 3, 10]
+    by_product = db.get_transactions_by_product(txns[0].product_id)
+    assert [t.quantity for t in by_product] == [2, 3, 10]
+
+    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    totals = db.get_sales_totals(shop.shop_id, since=today)
+    assert totals["transactions"] == 2
+    assert totals["items"] == 5
+
+    undo = db.undo_last_transaction_for_shop(shop.shop_id, "+910000000000")
+    assert undo["success"] and db.check_stock(shop.shop_id, "Atta")["current_stock"] == 7
+
+
+def test_udhar_and_pending_selection(db):
+    """Udhar balances and pending selections round-trip"""
+    phone = _phone()
+    shop = db.create_shop("Udhar Kirana", phone)
+    db.create_udhar_entry(shop.shop_id, "Ramesh", 200, phone)
+    db.create_udhar_entry(shop.shop_id, "Ramesh", -50, phone)
+    summary = db.get_udhar_summary(shop.shop_id)
+    assert summary["total_udhar"] == 150
+
+    db.save_pending_selection(shop.shop_id, phone, "add_stock", 2, ["p1", "p2"], ["Dal A", "Dal B"])
+    assert db.get_pending_selection(phone).product_names == ["Dal A", "Dal B"]
+    db.delete_pending_selection(phone)
+    assert db.get_pending_selection(phone) is None
+
+
+def test_unrecognized_commands_and_otps(db, monkeypatch):
+    """Bug dashboard queries and the OTP flow behave the same"""
+    shop = db.create_shop("Bug Kirana", _phone())
+    first = db.save_unrecognized_command(shop.shop_id, "+91", "voice", "kuch bhi")
+    db.save_unrecognized_command(shop.shop_id, "+91", "text", "asdf")
+    db.mark_command_resolved(first.command_id)
+
+    assert [c.raw_text for c in db.get_unrecognized_commands(shop.shop_id)] == ["asdf"]
+    assert len(db.get_unrecognized_commands(shop.shop_id, include_resolved=True)) == 2
+    assert db.count_unresolved_commands(shop.shop_id) == {"unresolved": 1, "voice": 0, "text": 1}
+
+    monkeypatch.setenv("DEV_MODE", "false")
+    otp_service = OTPService(db.db)
+    phone = _phone()
+    created = otp_service.create_otp(phone)
+    wrong_code = "111111" if created["otp_code"] == "000000" else "000000"
+    assert otp_service.verify_otp(phone, wrong_code)["success"] is False
+    assert otp_service.verify_otp(phone, created["otp_code"])["success"] is True
+
+
+def test_sales_cube_increments(db):
+    """Merge writes with Increment accumulate per product and month"""
+    shop = db.create_shop("Cube Kirana", _phone())
+    db.get_or_create_product(shop.shop_id, "Oil")
+    db.update_product_fields(db.find_existing_product_by_name(shop.shop_id, "Oil").product_id,
+                             {"selling_price": 150.0})
+    db.add_stock(shop.shop_id, "Oil", 10, "+91")
+    db.reduce_stock(shop.shop_id, "Oil", 2, "+91")
+    db.reduce_stock(shop.shop_id, "Oil", 1, "+91")
+
+    cube = db.get_sales_cube(shop.shop_id)
+    (cells,) = cube.values()
+    (cell,) = cells.values()
+    assert cell["qty"] == 3 and cell["revenue"] == 450
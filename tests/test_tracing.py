@@ -0,0 +1,50 @@
+"""
+Tracing: message stages land on the trace and in the Prometheus histograms
+"""
+import pytest
+
+import tracing
+from ai_service import AIService
+from command_processor import CommandProcessor
+from database import FirestoreDB
+
+PHONE = "+910000000000"
+
+
+def test_process_message_records_stages(capsys):
+    """A text command is traced stage by stage and logged with its trace id"""
+    db = FirestoreDB(backend="sqlite", sqlite_path=":memory:")
+    shop = db.create_shop("Traced Kirana", PHONE)
+    db.add_stock(shop.shop_id, "Maggi", 5, PHONE)
+    processor = CommandProcessor(db, AIService(api_key="test-key"), whatsapp_service=None)
+
+    tracing.start_trace("POST /webhook", "req-123")
+    result = processor.process_message(PHONE, "text", text="10 maggi add kar do")
+    trace = tracing.end_trace()
+
+    assert result["success"]
+    stages = [(stage, detail) for stage, detail, _, outcome in trace.stages]
+    assert stages[0] == ("resolve_user", "")
+    assert ("parse_command", "heuristic") in stages
+    assert ("execute_command", "add_stock") in stages
+    assert all(outcome == "ok" for *_, outcome in trace.stages)
+    assert "🧭 [req-123] POST /webhook" in capsys.readouterr().out
+    assert tracing.current_trace_id() is None
+
+
+def test_spans_render_as_prometheus_histograms():
+    """Errors are labelled, annotate overrides the detail, buckets are cumulative"""
+    with tracing.span("unit_stage", detail="heuristic"):
+        tracing.annotate("llm")
+    with pytest.raises(ValueError):
+        with tracing.span("unit_stage"):
+            raise ValueError("boom")
+
+    counts = tracing.STAGE_SECONDS.snapshot()
+    assert counts[("unit_stage", "llm", "ok")]["count"] >= 1
+    assert counts[("unit_stage", "", "error")]["count"] >= 1
+
+    text = tracing.REGISTRY.render()
+    assert "# TYPE kirana_stage_duration_seconds histogram" in text
+    assert 'kirana_stage_duration_seconds_bucket{stage="unit_stage",detail="llm",outcome="ok",le="+Inf"}' in text
+    assert "# TYPE kirana_http_request_duration_seconds histogram" in text
@@ -0,0 +1,105 @@
+"""
+Transcript cache: repeats of a voice note skip Whisper, across workers via disk and across concurrent redeliveries
+"""
+import io
+import threading
+import time
+from types import SimpleNamespace
+
+import transcript_cache
+import voice_ingest
+from ai_service import AIService
+from transcript_cache import TranscriptCache
+
+
+def _note(data):
+    return voice_ingest.wrap_upload(io.BytesIO(data), "voice.ogg")
+
+
+def test_repeats_hit_memory_then_disk_and_modes_stay_apart(tmp_path):
+    """Same bytes and mode: one Whisper call; a fresh worker finds it on disk; LRU stays bounded"""
+    calls = []
+
+    def whisper(file):
+        calls.append(file.read())
+        return SimpleNamespace(text=f"note {len(calls)}", language="hindi")
+
+    cache = TranscriptCache(capacity=2, directory=str(tmp_path))
+    first = cache.transcribe(_note(b"voice-a"), "translate", whisper)
+    again = cache.transcribe(_note(b"voice-a"), "translate", whisper)
+    assert calls == [b"voice-a"]
+    assert (again.text, again.language) == (first.text, first.language) == ("note 1", "hindi")
+
+    assert cache.transcribe(_note(b"voice-a"), "transcribe-text-hi", lambda file: "नोट") == "नोट"
+    cache.transcribe(_note(b"voice-b"), "translate", whisper)
+    assert len(cache) == 2 and cache.stats()["hits"] == 1 and cache.stats()["misses"] == 3
+
+    other_worker = TranscriptCache(capacity=10, directory=str(tmp_path))
+    assert other_worker.transcribe(_note(b"voice-a"), "translate", whisper).text == "note 1"
+    assert other_worker.transcribe(_note(b"voice-a"), "transcribe-text-hi", whisper) == "नोट"
+    assert len(calls) == 2 and other_worker.stats()["hits"] == 2
+
+    off = TranscriptCache(capacity=0)
+    stream = _note(b"voice-a")
+    off.transcribe(stream, "translate", whisper)
+    assert len(calls) == 3 and stream._content is None
+
+
+def test_disk_store_works_without_the_memory_lru(tmp_path):
+    """TRANSCRIPT_CACHE_SIZE=0 with a directory: nothing kept in memory, repeats still come from disk"""
+    calls = []
+
+    def whisper(file):
+        calls.append(file.read())
+        return SimpleNamespace(text="2 atta sold", language="english")
+
+    cache = TranscriptCache(capacity=0, directory=str(tmp_path))
+    assert cache.enabled
+    first = cache.transcribe(_note(b"voice-a"), "translate", whisper)
+    again = cache.transcribe(_note(b"voice-a"), "translate", whisper)
+    assert calls == [b"voice-a"] and again.text == first.text == "2 atta sold"
+    assert len(cache) == 0 and transcript_cache.LOOKUPS.snapshot()[("upload", "disk")] >= 1
+    assert not TranscriptCache(capacity=0).enabled
+
+
+def test_concurrent_redeliveries_share_one_whisper_call():
+    """While the first delivery is with Whisper, duplicates wait for its answer"""
+    cache = TranscriptCache(capacity=10)
+    calls = []
+
+    def slow_whisper(file):
+        calls.append(file.read())
+        time.sleep(0.2)
+        return SimpleNamespace(text="Maggi 10 add", language="english")
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(
+        cache.transcribe(_note(b"same note"), "translate", slow_whisper).text)) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(calls) == 1 and results == ["Maggi 10 add"] * 4
+    assert cache.stats()["hits"] == 3
+    assert transcript_cache.LOOKUPS.snapshot()[("upload", "shared")] >= 3
+
+
+def test_transcribe_audio_uses_the_cache(monkeypatch):
+    """A redelivered WhatsApp voice note is answered without a second Whisper call"""
+    monkeypatch.setattr(transcript_cache, "CACHE", TranscriptCache(capacity=10))
+    chunks = [b"ogg-bytes-", b"of-one-note"]
+    monkeypatch.setattr(voice_ingest, "open_media", lambda url, fmt, headers=None: voice_ingest.VoiceStream(
+        iter(list(chunks)), "voice.ogg", "whatsapp"))
+    asked = []
+
+    def translate(model=None, file=None, **_):
+        asked.append(file.read())
+        return SimpleNamespace(text="5 sugar sold")
+
+    ai = AIService(api_key="test-key")
+    endpoint = SimpleNamespace(create=translate)
+    ai.client = SimpleNamespace(audio=SimpleNamespace(translations=endpoint, transcriptions=endpoint))
+    sizes = voice_ingest.BYTES.snapshot().get(("whatsapp",), {"sum": 0})["sum"]
+    assert ai.transcribe_audio("https://media.example/1", "ogg") == ai.transcribe_audio("https://media.example/1", "ogg")
+    assert asked == [b"ogg-bytes-of-one-note"]
+    assert voice_ingest.BYTES.snapshot()[("whatsapp",)]["sum"] - sizes == 2 * len(b"ogg-bytes-of-one-note")
@@ -0,0 +1,85 @@
+"""
+Transcription strategy: Hindi shops get one Hindi-forced pass, others auto-detect with a re-run on Urdu script
+"""
+import io
+from types import SimpleNamespace
+
+import pytest
+
+import transcript_cache
+import voice_ingest
+from transcript_cache import TranscriptCache
+from transcription_strategy import ENGLISH, HINDI, LanguageHistory, TranscriptionStrategy
+
+
+class _Whisper:
+    """Auto-detect answers in Urdu script (or English); language="hi" answers in Devanagari."""
+
+    def __init__(self, english=False):
+        self.english = english
+        self.calls = []
+
+    def __call__(self, file=None, **params):
+        file.read()
+        self.calls.append(params)
+        if params.get("language") == "hi":
+            return "मैगी दस पैकेट"
+        if self.english:
+            return SimpleNamespace(text="Maggi ten packets", language="english")
+        return SimpleNamespace(text="میگی دس پیکٹ", language="urdu")
+
+
+@pytest.fixture(autouse=True)
+def no_cache(monkeypatch):
+    monkeypatch.setattr(transcript_cache, "CACHE", TranscriptCache(capacity=0))
+
+
+def _note():
+    return voice_ingest.wrap_upload(io.BytesIO(b"voice note"), "voice.webm")
+
+
+def test_hindi_history_means_a_single_hinted_pass():
+    """Until the shop has history, Urdu script costs a second pass; then one Hindi pass, with a periodic probe"""
+    strategy = TranscriptionStrategy(min_history=3, hindi_share=0.6, probe_every=4)
+    whisper = _Whisper()
+
+    results = [strategy.transcribe("shop-1", _note(), whisper) for _ in range(3)]
+    assert [(r.hint, r.passes) for r in results] == [("auto", 2)] * 3
+    assert all(r.text == "मैगी दस पैकेट" and r.language == HINDI for r in results)
+
+    whisper.calls.clear()
+    hinted = [strategy.transcribe("shop-1", _note(), whisper) for _ in range(4)]
+    assert [(r.hint, r.passes) for r in hinted] == [("hi", 1)] * 3 + [("auto", 2)]
+    assert whisper.calls[0] == {"response_format": "text", "language": "hi"}
+    assert hinted[0].text == "मैगी दस पैकेट"
+
+    assert strategy.stats() == {"notes": 7, "second_passes": 4, "second_pass_ratio": 4 / 7}
+
+
+def test_english_and_unknown_shops_keep_auto_detect():
+    """English speakers stay on one auto pass; no shop id means no history at all"""
+    strategy = TranscriptionStrategy(min_history=2)
+    whisper = _Whisper(english=True)
+    for _ in range(3):
+        result = strategy.transcribe("shop-en", _note(), whisper)
+        assert (result.hint, result.passes, result.text) == ("auto", 1, "Maggi ten packets")
+    assert strategy.history.mix("shop-en") == {HINDI: 0, ENGLISH: 3}
+
+    strategy.transcribe(None, _note(), whisper)
+    assert strategy.plan(None) == "auto"
+
+
+def test_typed_messages_and_bounds_feed_the_plan():
+    """Typed Hindi messages alone can switch a shop to the hint; histories stay bounded"""
+    history = LanguageHistory(size=4, max_shops=2)
+    strategy = TranscriptionStrategy(history=history, min_history=3, probe_every=0)
+    for language in (ENGLISH, HINDI, HINDI, HINDI, HINDI):
+        history.record("shop-typed", language)
+    assert history.mix("shop-typed") == {HINDI: 4, ENGLISH: 0}
+    assert strategy.plan("shop-typed") == "hi"
+
+    history.record("shop-typed", "hinglish")
+    history.record("shop-b", HINDI)
+    history.record("shop-c", HINDI)
+    assert history.mix("shop-typed") == {HINDI: 0, ENGLISH: 0}
+    assert strategy.plan("shop-typed") == "auto"
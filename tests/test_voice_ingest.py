@@ -0,0 +1,110 @@
+"""
+Voice ingestion: media streams into the Whisper upload in chunks, capped, without temp files
+"""
+import io
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+import pytest
+
+import voice_ingest
+from ai_service import AIService
+from config import Config
+
+AUDIO = bytes(range(256)) * 1024  # 256 KB
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = AUDIO if self.path == "/note.ogg" else b""
+        self.send_response(200 if body else 404)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *_):
+        pass
+
+
+@pytest.fixture
+def media_url():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+
+
+class _Whisper:
+    """Reads the upload the way the OpenAI client does: a file object, chunk by chunk."""
+
+    def __init__(self):
+        self.reads = []
+        self.received = b""
+        endpoint = SimpleNamespace(create=self._create)
+        self.audio = SimpleNamespace(translations=endpoint, transcriptions=endpoint)
+
+    def _create(self, model=None, file=None, **_):
+        assert isinstance(file, io.IOBase) and file.name.startswith("voice.")
+        data = b""
+        chunk = file.read(65536)
+        while chunk:
+            self.reads.append(len(chunk))
+            data += chunk
+            chunk = file.read(65536)
+        self.received = data
+        return SimpleNamespace(text="Maggi 10 packet add karo")
+
+
+def test_whatsapp_media_streams_into_whisper(media_url, monkeypatch):
+    """The download feeds the upload chunk by chunk, nothing touches disk, stages are recorded"""
+    def no_temp_files(*_, **__):
+        raise AssertionError("temp file created")
+
+    monkeypatch.setattr(tempfile, "NamedTemporaryFile", no_temp_files)
+    ai = AIService(api_key="test-key")
+    whisper = _Whisper()
+    ai.client = whisper
+
+    def transfers():
+        return voice_ingest.STAGE_SECONDS.snapshot().get(("whatsapp", "transfer"), {"count": 0})["count"]
+
+    before = transfers()
+    text = ai.transcribe_audio(f"{media_url}/note.ogg", "ogg")
+
+    assert text and "maggi" in text.lower()
+    assert whisper.received == AUDIO
+    assert len(whisper.reads) == len(AUDIO) // 65536 and max(whisper.reads) == 65536
+    assert transfers() == before + 1
+
+    assert ai.transcribe_audio(f"{media_url}/missing.ogg", "ogg") is None
+
+
+def test_cap_applies_before_and_during_the_stream(media_url, monkeypatch):
+    """A declared length over the cap is refused up front; an undeclared one stops mid-stream"""
+    monkeypatch.setattr(Config, "MAX_VOICE_FILE_SIZE", len(AUDIO) - 1)
+    with pytest.raises(voice_ingest.VoiceTooLarge):
+        voice_ingest.open_media(f"{media_url}/note.ogg")
+
+    ai = AIService(api_key="test-key")
+    whisper = _Whisper()
+    ai.client = whisper
+    assert ai.transcribe_audio(f"{media_url}/note.ogg", "ogg") is None
+    assert whisper.received == b""
+
+    upload = voice_ingest.wrap_upload(io.BytesIO(AUDIO), "voice.webm")
+    with pytest.raises(voice_ingest.VoiceTooLarge):
+        upload.read()
+
+
+def test_upload_rewinds_for_a_second_pass():
+    """A browser upload can be read again from the start (Urdu-script re-transcription)"""
+    upload = voice_ingest.wrap_upload(io.BytesIO(b"abc" * 50000), "voice.webm", declared_length=150000)
+    assert upload.read() == b"abc" * 50000
+    upload.seek(0)
+    assert upload.read(6) == b"abcabc"
+    with pytest.raises(io.UnsupportedOperation):
+        upload.seek(10)
+    with pytest.raises(voice_ingest.VoiceTooLarge):
+        voice_ingest.wrap_upload(io.BytesIO(b""), "voice.webm", declared_length=voice_ingest.max_bytes() + 1)
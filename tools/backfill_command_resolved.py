@@ -0,0 +1,34 @@
+"""
+Write `resolved: False` on unrecognized commands saved without the field.
+
+The bug dashboard filters commands on `resolved` in the query, so older
+documents missing it are neither listed nor counted until this has run:
+
+    python tools/backfill_command_resolved.py            # every shop
+    python tools/backfill_command_resolved.py SHOP_ID    # one or more shops
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from config import Config  # noqa: E402
+from database import FirestoreDB  # noqa: E402
+
+
+def main(shop_ids):
+    db = FirestoreDB(
+        credentials_path=Config.GOOGLE_APPLICATION_CREDENTIALS,
+        project_id=Config.FIREBASE_PROJECT_ID,
+    )
+
+    if not shop_ids:
+        shop_ids = [doc.id for doc in db.db.collection("shops").stream()]
+
+    for shop_id in shop_ids:
+        fixed = db.backfill_command_resolved(shop_id)
+        print(f"{shop_id}: {fixed} commands backfilled")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,43 @@
+"""
+Precompute each shop's daily expiry report (expiry_digests/{shop_id}).
+
+Intended to run once a day shortly after midnight UTC (cron / Railway
+scheduled job) so the first expiry query of the day is a single read:
+
+    python tools/build_expiry_digests.py            # every shop
+    python tools/build_expiry_digests.py SHOP_ID    # one or more shops
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from config import Config  # noqa: E402
+from database import FirestoreDB  # noqa: E402
+
+
+def main(shop_ids):
+    db = FirestoreDB(
+        credentials_path=Config.GOOGLE_APPLICATION_CREDENTIALS,
+        project_id=Config.FIREBASE_PROJECT_ID,
+    )
+
+    if not shop_ids:
+        shop_ids = [doc.id for doc in db.db.collection("shops").stream()]
+
+    try:
+        days = int(os.getenv("EXPIRY_ALERT_DAYS", "30"))
+    except ValueError:
+        days = 30
+
+    for shop_id in shop_ids:
+        start = time.perf_counter()
+        result = db.build_expiry_digest(shop_id, days=days)
+        elapsed = time.perf_counter() - start
+        print(f"{shop_id}: {len(result['expired_products'])} expired, "
+              f"{len(result['expiring_products'])} expiring within {days} days ({elapsed:.1f}s)")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,54 @@
+"""
+Compact old ledger months into summaries and move their rows to the archive.
+
+Intended to run as a nightly/monthly background job (see ledger_archive.py):
+
+    python tools/compact_ledger.py                      # every shop
+    python tools/compact_ledger.py SHOP_ID [SHOP_ID]    # some shops
+    python tools/compact_ledger.py --horizon-days 540 SHOP_ID
+    python tools/compact_ledger.py --restore 2024-03 SHOP_ID
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from config import Config  # noqa: E402
+from database import FirestoreDB  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("shop_ids", nargs="*")
+    parser.add_argument("--horizon-days", type=int, default=None,
+                        help="compact months older than this (default LEDGER_COMPACTION_HORIZON_DAYS or 365)")
+    parser.add_argument("--restore", metavar="YYYY-MM", help="put this month's raw rows back instead")
+    args = parser.parse_args()
+
+    db = FirestoreDB(
+        credentials_path=Config.GOOGLE_APPLICATION_CREDENTIALS,
+        project_id=Config.FIREBASE_PROJECT_ID,
+        backend=Config.DATABASE_BACKEND,
+        sqlite_path=Config.SQLITE_PATH,
+    )
+
+    shop_ids = args.shop_ids or [doc.id for doc in db.db.collection("shops").stream()]
+    for shop_id in shop_ids:
+        start = time.perf_counter()
+        if args.restore:
+            result = db.restore_ledger_month(shop_id, args.restore)
+            if result["success"]:
+                print(f"{shop_id}: {result['rows_restored']} rows of {args.restore} restored")
+            else:
+                print(f"{shop_id}: {result['message']}")
+            continue
+        result = db.compact_ledger(shop_id, horizon_days=args.horizon_days)
+        elapsed = time.perf_counter() - start
+        print(f"{shop_id}: {len(result['months'])} months before {result['before_month']} compacted, "
+              f"{result['rows_archived']} rows archived ({elapsed:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
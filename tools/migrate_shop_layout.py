@@ -0,0 +1,88 @@
+"""
+Move shops from the global collections to shops/{shop_id}/... subcollections.
+
+Runs online, one shop at a time (see shop_layout.py and
+FirestoreDB.migrate_shop_layout): the shop is switched to dual, its
+documents are copied in checkpointed batches, counts are verified and only
+then is it cut over. Rerunning resumes from the last checkpoint.
+
+    python tools/migrate_shop_layout.py SHOP_ID [SHOP_ID ...]
+    python tools/migrate_shop_layout.py --all
+    python tools/migrate_shop_layout.py --status SHOP_ID
+    python tools/migrate_shop_layout.py --rollback SHOP_ID   # dual -> global
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import shop_layout  # noqa: E402
+from config import Config  # noqa: E402
+from database import FirestoreDB  # noqa: E402
+
+
+def status(db: FirestoreDB, shop_id: str) -> None:
+    doc = db.db.collection("layout_migrations").document(shop_id).get()
+    state = doc.to_dict() if doc.exists else {}
+    print(f"{shop_id}: layout={db.get_shop_layout(shop_id)} migration={state.get('state', 'not started')}")
+    for name, progress in (state.get("collections") or {}).items():
+        print(f"   {name}: {progress.get('copied', 0)} copied, {progress.get('skipped', 0)} skipped, "
+              f"complete={progress.get('complete', False)}")
+    for name in shop_layout.SHOP_COLLECTIONS:
+        v = shop_layout.verify_collection(db.db, shop_id, name)
+        print(f"   verify {name}: global={v['global']} nested={v['nested']} missing={v['missing']}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("shop_ids", nargs="*")
+    parser.add_argument("--all", action="store_true", help="every shop still on the global layout")
+    parser.add_argument("--page-size", type=int, default=300)
+    parser.add_argument("--settle", type=float, default=None,
+                        help="seconds to wait after switching to dual (default SHOP_LAYOUT_TTL_SECONDS + 5)")
+    parser.add_argument("--status", action="store_true")
+    parser.add_argument("--rollback", action="store_true")
+    args = parser.parse_args()
+
+    db = FirestoreDB(
+        credentials_path=Config.GOOGLE_APPLICATION_CREDENTIALS,
+        project_id=Config.FIREBASE_PROJECT_ID,
+        backend=Config.DATABASE_BACKEND,
+        sqlite_path=Config.SQLITE_PATH,
+    )
+
+    shop_ids = args.shop_ids
+    if args.all:
+        shop_ids = [
+            doc.id for doc in db.db.collection("shops").stream()
+            if (doc.to_dict() or {}).get("data_layout", shop_layout.GLOBAL) != shop_layout.NESTED
+        ]
+
+    for shop_id in shop_ids:
+        if args.status:
+            status(db, shop_id)
+            continue
+        if args.rollback:
+            if db.get_shop_layout(shop_id) != shop_layout.DUAL:
+                print(f"⚠️ {shop_id}: only a shop in dual layout can be rolled back")
+                continue
+            db.set_shop_layout(shop_id, shop_layout.GLOBAL)
+            print(f"↩️ {shop_id}: back on the global layout")
+            continue
+
+        start = time.perf_counter()
+        result = db.migrate_shop_layout(shop_id, page_size=args.page_size, settle_seconds=args.settle)
+        elapsed = time.perf_counter() - start
+        if result["success"]:
+            print(f"✅ {shop_id}: now {result['layout']} ({elapsed:.1f}s)")
+        else:
+            for name, v in result["verification"].items():
+                if not v["ok"]:
+                    print(f"❌ {shop_id} {name}: {v['missing']} documents missing, e.g. {v['missing_sample']}")
+            print(f"❌ {shop_id}: left in dual layout; rerun to resume")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+Send shop owners one batched WhatsApp message for new low-stock events.
+
+Drains the `low_stock_events` stream written by FirestoreDB whenever a
+product crosses its low-stock threshold. Run it every few minutes (cron /
+Railway scheduled job):
+
+    python tools/notify_low_stock.py            # every shop with pending events
+    python tools/notify_low_stock.py SHOP_ID    # one or more shops
+"""
+import os
+import sys
+from collections import defaultdict
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from config import Config  # noqa: E402
+from database import FirestoreDB  # noqa: E402
+from low_stock import format_owner_digest  # noqa: E402
+from whatsapp_service import WhatsAppService  # noqa: E402
+
+
+def main(shop_ids):
+    db = FirestoreDB(
+        credentials_path=Config.GOOGLE_APPLICATION_CREDENTIALS,
+        project_id=Config.FIREBASE_PROJECT_ID,
+    )
+    if Config.WATI_API_KEY:
+        whatsapp = WhatsAppService(provider="wati", api_key=Config.WATI_API_KEY, base_url=Config.WATI_BASE_URL)
+    else:
+        whatsapp = WhatsAppService(
+            provider="whatsapp_cloud",
+            access_token=Config.WHATSAPP_ACCESS_TOKEN,
+            phone_number_id=Config.WHATSAPP_PHONE_NUMBER_ID,
+        )
+
+    by_shop = defaultdict(list)
+    for shop_id in shop_ids or [None]:
+        for event in db.get_pending_low_stock_events(shop_id):
+            by_shop[event.get("shop_id")].append(event)
+
+    for shop_id, events in by_shop.items():
+        shop = db.get_shop(shop_id)
+        message = format_owner_digest(events)
+        if message and shop and shop.owner_phone:
+            if not whatsapp.send_message(shop.owner_phone, message):
+                print(f"❌ {shop_id}: send failed, will retry next run")
+                continue
+        # Events that net out to nothing (restocked already) are just marked
+        marked = db.mark_low_stock_events_notified([e["event_id"] for e in events])
+        print(f"✅ {shop_id}: {marked} events processed")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,37 @@
+"""
+Rebuild the monthly sales cube from the transaction ledger.
+
+Intended to run as a nightly background job (cron / Railway scheduled job):
+
+    python tools/rebuild_sales_cube.py            # every shop
+    python tools/rebuild_sales_cube.py SHOP_ID    # one or more shops
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from config import Config  # noqa: E402
+from database import FirestoreDB  # noqa: E402
+
+
+def main(shop_ids):
+    db = FirestoreDB(
+        credentials_path=Config.GOOGLE_APPLICATION_CREDENTIALS,
+        project_id=Config.FIREBASE_PROJECT_ID,
+    )
+
+    if not shop_ids:
+        shop_ids = [doc.id for doc in db.db.collection("shops").stream()]
+
+    for shop_id in shop_ids:
+        start = time.perf_counter()
+        result = db.rebuild_sales_cube(shop_id)
+        elapsed = time.perf_counter() - start
+        print(f"{shop_id}: {result['months']} months written, "
+              f"{result['deleted_months']} stale months removed ({elapsed:.1f}s)")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,57 @@
+"""
+Replay the ledger to check every product's current_stock.
+
+Intended to run as a nightly background job (see reconciliation.py); each
+run also refreshes the stock snapshots, so the next one only replays the
+rows written since:
+
+    python tools/reconcile_stock.py                       # every shop, report only
+    python tools/reconcile_stock.py SHOP_ID [SHOP_ID]     # some shops
+    python tools/reconcile_stock.py --fix SHOP_ID         # record drift as ADJUSTMENT rows
+    python tools/reconcile_stock.py --workers 16 --no-snapshot
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from config import Config  # noqa: E402
+from database import FirestoreDB  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("shop_ids", nargs="*")
+    parser.add_argument("--fix", action="store_true", help="write a corrective ADJUSTMENT row per drifted product")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="products replayed in parallel (default RECONCILE_WORKERS or 8)")
+    parser.add_argument("--no-snapshot", action="store_true", help="don't refresh stock snapshots")
+    args = parser.parse_args()
+
+    db = FirestoreDB(
+        credentials_path=Config.GOOGLE_APPLICATION_CREDENTIALS,
+        project_id=Config.FIREBASE_PROJECT_ID,
+        backend=Config.DATABASE_BACKEND,
+        sqlite_path=Config.SQLITE_PATH,
+    )
+
+    shop_ids = args.shop_ids or [doc.id for doc in db.db.collection("shops").stream()]
+    for shop_id in shop_ids:
+        report = db.reconcile_stock(shop_id, correct=args.fix, snapshot=not args.no_snapshot,
+                                    workers=args.workers)
+        icon = "⚠️" if report["drifted"] else "✅"
+        print(f"{icon} {shop_id}: {report['products_checked']} products, {report['in_sync']} in sync, "
+              f"{len(report['drifted'])} drifted, {report['no_ledger']} without ledger rows "
+              f"({report['rows_replayed']} rows replayed, {report['from_snapshot']} from snapshots, "
+              f"{report['duration_ms'] / 1000:.1f}s)")
+        for entry in report["drifted"]:
+            fixed = " -> adjusted" if entry.get("adjustment_id") else ""
+            if entry.get("derived_stock"):
+                fixed = " (stock from batches, not adjusted)"
+            print(f"   {entry['product_name']}: stock {entry['current_stock']} vs ledger "
+                  f"{entry['expected_stock']} (drift {entry['drift']:+g}){fixed}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,13 @@
 import os
+import sys
 
 from google.cloud import firestore
 from google.oauth2 import service_account
 
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from expiry_index import normalize_batches, normalize_expiry_date  # noqa: E402
+
 # Dummy product data for testing
 PRODUCTS = [
 
@@ -1388,9 +1393,18 @@ def reset_products():
     # Insert new products
     for p in PRODUCTS:
         product_id = p["product_id"]
+        p = dict(p)
+        # Store expiry dates in canonical YYYY-MM-DD form
+        if "batches" in p:
+            p["batches"] = normalize_batches(p["batches"])
+        if "expiry_date" in p:
+            p["expiry_date"] = normalize_expiry_date(p["expiry_date"])
         products_ref.document(product_id).set(p)
     print(f"Inserted {len(PRODUCTS)} products for shop {SHOP_ID}")
 
+    # Drop the precomputed expiry report so it is rebuilt from the new catalog
+    db.collection("expiry_digests").document(SHOP_ID).delete()
+
 
 if __name__ == "__main__":
     reset_products()
\ No newline at end of file
@@ -0,0 +1,291 @@
+"""
+Lightweight tracing: per-request trace ids, stage timings and Prometheus histograms
+
+Every Flask request runs in a trace (id from an incoming X-Request-Id /
+X-Trace-Id header, or a fresh one, echoed back as X-Trace-Id). Code marks
+the stages worth timing:
+
+    with tracing.span("transcribe_audio"):
+        text = ai_service.transcribe_audio(...)
+
+    with tracing.span("parse_command", detail="heuristic"):
+        parsed = ai_service.parse_command(text)   # calls tracing.annotate("llm") if it asks OpenAI
+
+Each span is observed into kirana_stage_duration_seconds{stage, detail,
+outcome} and recorded on the trace. When the request ends the trace is
+logged as one line with its id and per-stage milliseconds, so a slow
+WhatsApp reply shows whether it was Whisper, the LLM parse, Firestore or the
+WATI send. Request latency per route goes to
+kirana_http_request_duration_seconds. GET /metrics renders everything in
+the Prometheus text format.
+
+Histograms live in process memory: with several gunicorn workers each
+worker is its own scrape target.
+
+TRACE_LOG=0 turns the per-request log line off; TRACE_LOG_MIN_MS only logs
+traces at least that slow (default 0).
+"""
+import contextlib
+import contextvars
+import re
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from config import Config
+
+# Seconds; covers sub-millisecond cache hits through multi-second Whisper calls
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_TRACE_ID = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Histogram:
+    """Cumulative-bucket histogram with labels, rendered in Prometheus format."""
+
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...],
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = tuple(str(labels.get(name) or "") for name in self.label_names)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # One slot per bucket, then sum and count
+                series = self._series[key] = [0.0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def snapshot(self) -> Dict[Tuple[str, ...], Dict[str, float]]:
+        """{label values: {"count", "sum"}} for each series."""
+        with self._lock:
+            return {key: {"count": s[-1], "sum": s[-2]} for key, s in self._series.items()}
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((key, list(values)) for key, values in self._series.items())
+        for key, values in series:
+            labels = ",".join(f'{n}="{_escape(v)}"' for n, v in zip(self.label_names, key))
+            sep = "," if labels else ""
+            for bound, count in zip(self.buckets + (float("inf"),), values[:len(self.buckets)] + [values[-1]]):
+                lines.append(f'{self.name}_bucket{{{labels}{sep}le="{_number(bound)}"}} {_number(count)}')
+            suffix = f"{{{labels}}}" if labels else ""
+            lines.append(f"{self.name}_sum{suffix} {values[-2]!r}")
+            lines.append(f"{self.name}_count{suffix} {_number(values[-1])}")
+        return lines
+
+
+class Counter:
+    """Monotonic counter with labels, rendered in Prometheus format."""
+
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...]):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        key = tuple(str(labels.get(name) or "") for name in self.label_names)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def snapshot(self) -> Dict[Tuple[str, ...], float]:
+        with self._lock:
+            return dict(self._values)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            labels = ",".join(f'{n}="{_escape(v)}"' for n, v in zip(self.label_names, key))
+            lines.append(f"{self.name}{{{labels}}} {_number(value)}" if labels else f"{self.name} {_number(value)}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, Any] = {}
+        self._collectors: List[Callable[[], List[str]]] = []
+        self._lock = threading.Lock()
+
+    def histogram(self, name: str, help_text: str, label_names: Tuple[str, ...],
+                  buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = Histogram(name, help_text, label_names, buckets)
+            return self._metrics[name]
+
+    def counter(self, name: str, help_text: str, label_names: Tuple[str, ...]) -> Counter:
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = Counter(name, help_text, label_names)
+            return self._metrics[name]
+
+    def add_collector(self, collector: Callable[[], List[str]]) -> None:
+        """Register a callable returning extra exposition lines (gauges, counters) at scrape time."""
+        with self._lock:
+            self._collectors.append(collector)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors)
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        for collector in collectors:
+            try:
+                lines.extend(collector())
+            except Exception as e:
+                print(f"⚠️ Metrics collector failed: {e}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "kirana_stage_duration_seconds",
+    "Time spent in one stage of handling a message or request.",
+    ("stage", "detail", "outcome"),
+)
+HTTP_SECONDS = REGISTRY.histogram(
+    "kirana_http_request_duration_seconds",
+    "Flask request latency by route.",
+    ("method", "route", "status"),
+)
+
+
+@dataclass
+class Trace:
+    trace_id: str
+    name: str
+    started: float = field(default_factory=time.perf_counter)
+    duration: Optional[float] = None  # seconds, set by end_trace
+    # (stage, detail, seconds, outcome) in completion order
+    stages: List[Tuple[str, str, float, str]] = field(default_factory=list)
+
+
+@dataclass
+class Span:
+    stage: str
+    detail: Optional[str] = None
+
+
+_current_trace: contextvars.ContextVar = contextvars.ContextVar("kirana_trace", default=None)
+_open_spans: contextvars.ContextVar = contextvars.ContextVar("kirana_spans", default=())
+# Called with every finished trace (exporters, the load harness)
+_listeners: List[Callable[[Trace], None]] = []
+
+
+def add_trace_listener(listener: Callable[[Trace], None]) -> None:
+    _listeners.append(listener)
+
+
+def remove_trace_listener(listener: Callable[[Trace], None]) -> None:
+    if listener in _listeners:
+        _listeners.remove(listener)
+
+
+def new_trace_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+def start_trace(name: str, trace_id: Optional[str] = None) -> Trace:
+    """Begin a trace for this thread/context; a usable incoming id is kept."""
+    if not trace_id or not _TRACE_ID.match(trace_id):
+        trace_id = new_trace_id()
+    trace = Trace(trace_id=trace_id, name=name)
+    _current_trace.set(trace)
+    _open_spans.set(())
+    return trace
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+def current_trace_id() -> Optional[str]:
+    trace = _current_trace.get()
+    return trace.trace_id if trace else None
+
+
+def end_trace() -> Optional[Trace]:
+    """Finish the current trace and log its summary line."""
+    trace = _current_trace.get()
+    if trace is None:
+        return None
+    _current_trace.set(None)
+    _open_spans.set(())
+    total_ms = (time.perf_counter() - trace.started) * 1000
+    if Config.TRACE_LOG and total_ms >= Config.TRACE_LOG_MIN_MS:
+        stages = " ".join(
+            f"{stage}{'[' + detail + ']' if detail else ''}={seconds * 1000:.0f}ms"
+            + ("!" if outcome != "ok" else "")
+            for stage, detail, seconds, outcome in trace.stages
+        )
+        print(f"🧭 [{trace.trace_id}] {trace.name} {total_ms:.0f}ms{' · ' + stages if stages else ''}")
+    trace.duration = total_ms / 1000
+    for listener in list(_listeners):
+        try:
+            listener(trace)
+        except Exception as e:
+            print(f"⚠️ Trace listener failed: {e}")
+    return trace
+
+
+@contextlib.contextmanager
+def span(stage: str, detail: Optional[str] = None) -> Iterator[Span]:
+    """Time a stage into the histogram and the current trace (if any)."""
+    current = Span(stage=stage, detail=detail)
+    token = _open_spans.set(_open_spans.get() + (current,))
+    outcome = "ok"
+    start = time.perf_counter()
+    try:
+        yield current
+    except BaseException:
+        outcome = "error"
+        raise
+    finally:
+        seconds = time.perf_counter() - start
+        _open_spans.reset(token)
+        STAGE_SECONDS.observe(seconds, stage=current.stage, detail=current.detail, outcome=outcome)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.stages.append((current.stage, current.detail or "", seconds, outcome))
+
+
+def annotate(detail: str) -> None:
+    """Set the detail label of the innermost open span (e.g. which parser ran)."""
+    spans = _open_spans.get()
+    if spans:
+        spans[-1].detail = detail
+
+
+def log(message: str) -> None:
+    """print() prefixed with the current trace id."""
+    trace_id = current_trace_id()
+    print(f"[{trace_id}] {message}" if trace_id else message)
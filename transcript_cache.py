@@ -0,0 +1,219 @@
+"""
+Content-addressed Whisper transcript cache
+
+The same voice note keeps coming back: WhatsApp redelivers a webhook we
+were slow to answer, the shopkeeper resends after getting no reply, the
+test UI re-uploads. Each Whisper call is keyed by the SHA-256 of the audio
+bytes plus the call's mode (translation vs transcription, response format,
+forced language), and the raw Whisper answer is kept:
+
+- in a bounded in-process LRU (TRANSCRIPT_CACHE_SIZE, default 1000
+  entries; 0 keeps nothing in memory);
+- optionally on disk under TRANSCRIPT_CACHE_DIR, one small JSON file per
+  entry, so all workers on a host and restarts share it. The disk store
+  works on its own too, with TRANSCRIPT_CACHE_SIZE=0.
+
+With TRANSCRIPT_CACHE_SIZE=0 and no TRANSCRIPT_CACHE_DIR the cache is off
+and voice notes stream straight through.
+
+The raw answer is stored, not the cleaned text, so changes to
+clean_voice_text() apply to cached notes too. Concurrent misses for the
+same key (a redelivery while Whisper is still busy with the original)
+wait for the first call instead of making their own.
+
+Hashing needs the whole note before the upload starts, so with the cache
+on a note is read into memory once (capped by MAX_VOICE_FILE_SIZE) and the
+upload replays it; there is still no temp file.
+
+    kirana_transcript_cache_lookups_total{source, result}   memory, disk, shared, miss
+    kirana_transcript_cache_hit_ratio                       hits / lookups, this worker
+    kirana_transcript_cache_entries                         entries in memory
+"""
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Optional
+
+import tracing
+from config import Config
+
+# How long a concurrent miss waits for the call already in flight
+SHARED_WAIT_SECONDS = 30.0
+
+LOOKUPS = tracing.REGISTRY.counter(
+    "kirana_transcript_cache_lookups_total",
+    "Transcript cache lookups, by source (whatsapp, upload) and result (memory, disk, shared, miss).",
+    ("source", "result"),
+)
+
+
+def audio_key(audio: bytes, mode: str) -> str:
+    """Cache key of one Whisper call: the audio's SHA-256 and the call's mode."""
+    return f"{hashlib.sha256(audio).hexdigest()}-{mode}"
+
+
+def _to_entry(response: Any) -> Dict[str, Any]:
+    # response_format="text" answers with a plain string
+    if isinstance(response, str):
+        return {"text": response, "plain": True}
+    return {"text": getattr(response, "text", None), "language": getattr(response, "language", None)}
+
+
+def _from_entry(entry: Dict[str, Any]) -> Any:
+    if entry.get("plain"):
+        return entry["text"]
+    return SimpleNamespace(text=entry.get("text"), language=entry.get("language"))
+
+
+class TranscriptCache:
+    """Thread-safe LRU of Whisper answers by audio_key(), with an optional disk store."""
+
+    def __init__(self, capacity: int, directory: Optional[str] = None):
+        self.capacity = capacity
+        self.directory = directory
+        self._items: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._inflight: Dict[str, threading.Event] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_env(cls) -> "TranscriptCache":
+        return cls(Config.TRANSCRIPT_CACHE_SIZE, Config.TRANSCRIPT_CACHE_DIR)
+
+    @property
+    def enabled(self) -> bool:
+        return self.capacity > 0 or bool(self.directory)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def transcribe(self, audio: Any, mode: str, call: Callable[[Any], Any]) -> Any:
+        """call(audio) through the cache; `audio` is a voice_ingest.VoiceStream.
+
+        With the cache off the stream goes to `call` untouched.
+        """
+        if not self.enabled:
+            return call(audio)
+        key = audio_key(audio.content(), mode)
+        source = getattr(audio, "source", "")
+        owner = None
+        while True:
+            entry, result = self._lookup(key)
+            if entry is not None:
+                self._count(source, result)
+                tracing.annotate(f"cache_{result}")
+                return _from_entry(entry)
+            with self._lock:
+                waiting = self._inflight.get(key)
+                if waiting is None:
+                    owner = self._inflight[key] = threading.Event()
+                    break
+            # Someone else is transcribing this note: use their answer if it arrives
+            if not waiting.wait(SHARED_WAIT_SECONDS):
+                break
+            entry, _ = self._lookup(key)
+            if entry is not None:
+                self._count(source, "shared")
+                tracing.annotate("cache_shared")
+                return _from_entry(entry)
+            # Their call failed; try ourselves
+        self._count(source, "miss")
+        try:
+            response = call(audio)
+            self.put(key, _to_entry(response))
+            return response
+        finally:
+            if owner is not None:
+                with self._lock:
+                    self._inflight.pop(key, None)
+                owner.set()
+
+    def _lookup(self, key: str):
+        with self._lock:
+            entry = self._items.get(key)
+            if entry is not None:
+                self._items.move_to_end(key)
+                return entry, "memory"
+        entry = self._read_disk(key)
+        if entry is not None:
+            self._remember(key, entry)
+            return entry, "disk"
+        return None, "miss"
+
+    def _count(self, source: str, result: str) -> None:
+        LOOKUPS.inc(source=source, result=result)
+        with self._lock:
+            if result == "miss":
+                self.misses += 1
+            else:
+                self.hits += 1
+
+    def put(self, key: str, entry: Dict[str, Any]) -> None:
+        self._remember(key, entry)
+        self._write_disk(key, entry)
+
+    def _remember(self, key: str, entry: Dict[str, Any]) -> None:
+        if self.capacity <= 0:
+            return
+        with self._lock:
+            self._items[key] = entry
+            self._items.move_to_end(key)
+            while len(self._items) > self.capacity:
+                self._items.popitem(last=False)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def _read_disk(self, key: str) -> Optional[Dict[str, Any]]:
+        if not self.directory:
+            return None
+        try:
+            with open(self._path(key), encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"⚠️ Transcript cache read failed for {key[:12]}: {e}")
+            return None
+
+    def _write_disk(self, key: str, entry: Dict[str, Any]) -> None:
+        if not self.directory:
+            return
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            partial = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(partial, "w", encoding="utf-8") as f:
+                json.dump(entry, f, ensure_ascii=False)
+            # Readers in other workers never see half a file
+            os.replace(partial, path)
+        except Exception as e:
+            print(f"⚠️ Transcript cache write failed for {key[:12]}: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"size": len(self._items), "capacity": self.capacity, "hits": self.hits,
+                    "misses": self.misses, "directory": self.directory}
+
+
+CACHE = TranscriptCache.from_env()
+
+
+def _collect() -> List[str]:
+    stats = CACHE.stats()
+    lookups = stats["hits"] + stats["misses"]
+    return [
+        "# HELP kirana_transcript_cache_hit_ratio Transcript cache hits per lookup in this worker.",
+        "# TYPE kirana_transcript_cache_hit_ratio gauge",
+        f"kirana_transcript_cache_hit_ratio {stats['hits'] / lookups if lookups else 0.0}",
+        "# HELP kirana_transcript_cache_entries Transcripts held in memory.",
+        "# TYPE kirana_transcript_cache_entries gauge",
+        f"kirana_transcript_cache_entries {stats['size']}",
+    ]
+
+
+tracing.REGISTRY.add_collector(_collect)
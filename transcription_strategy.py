@@ -0,0 +1,205 @@
+"""
+Transcription strategy for /api/transcribe-voice: one Whisper pass where history allows
+
+Whisper's auto-detect often writes Hindi speech in Urdu script, and the
+route used to answer that with a second, Hindi-forced pass over the same
+audio (twice the latency and cost). Most shops speak one way, so the
+strategy decides up front from the shop's own history:
+
+- each shop keeps the languages of its last TRANSCRIBE_HISTORY_SIZE (50)
+  messages: auto-detected voice notes (Urdu-script counts as Hindi) and
+  typed WhatsApp messages (command_processor records those);
+- with at least TRANSCRIBE_MIN_HISTORY (5) of them and a Hindi share of
+  TRANSCRIBE_HINDI_SHARE (0.6) or more, the note is transcribed once with
+  language="hi" (Devanagari straight away);
+- otherwise, for new shops and mixed or English ones, the note is
+  auto-detected as before and re-run with language="hi" only when Urdu
+  script comes back.
+
+Hinted passes don't feed the history (they would only confirm the hint),
+so every TRANSCRIBE_PROBE_EVERY-th (10th) note of a Hindi shop is still
+auto-detected to notice a change of speaker. Histories are per worker,
+for the TRANSCRIBE_HISTORY_SHOPS (10000) most recent shops.
+
+    kirana_transcribe_requests_total{hint, passes}   hint: hi / auto
+    kirana_transcribe_seconds{hint, passes}          end to end, all passes
+    kirana_transcribe_second_pass_ratio              notes needing a second pass, this worker
+"""
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+import tracing
+import transcript_cache
+from config import Config
+
+HINDI, ENGLISH = "hindi", "english"
+
+_URDU_SCRIPT = re.compile(r"[\u0600-\u06FF]")
+_DEVANAGARI = re.compile(r"[\u0900-\u097F]")
+
+REQUESTS = tracing.REGISTRY.counter(
+    "kirana_transcribe_requests_total",
+    "Voice uploads transcribed, by language hint (hi, auto) and Whisper passes made (1, 2).",
+    ("hint", "passes"),
+)
+SECONDS = tracing.REGISTRY.histogram(
+    "kirana_transcribe_seconds",
+    "Voice upload transcription time over all passes, by hint and passes.",
+    ("hint", "passes"),
+)
+
+
+def detected_language(text: str, whisper_language: Optional[str] = None) -> Optional[str]:
+    """hindi or english for an auto-detected transcript (Urdu script is Hindi speech here)."""
+    if _URDU_SCRIPT.search(text or "") or _DEVANAGARI.search(text or ""):
+        return HINDI
+    language = (whisper_language or "").lower()
+    if language in ("hindi", "urdu", "hi", "ur"):
+        return HINDI
+    if language in ("english", "en"):
+        return ENGLISH
+    return None
+
+
+class LanguageHistory:
+    """Thread-safe recent languages per shop, bounded in shops and messages per shop."""
+
+    def __init__(self, size: int = 50, max_shops: int = 10000):
+        self.size = size
+        self.max_shops = max_shops
+        self._shops: "OrderedDict[str, Deque[str]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def record(self, shop_id: Optional[str], language: Optional[str]) -> None:
+        if not shop_id or language not in (HINDI, ENGLISH):
+            return
+        with self._lock:
+            recent = self._shops.get(shop_id)
+            if recent is None:
+                recent = self._shops[shop_id] = deque(maxlen=self.size)
+            recent.append(language)
+            self._shops.move_to_end(shop_id)
+            while len(self._shops) > self.max_shops:
+                self._shops.popitem(last=False)
+
+    def mix(self, shop_id: Optional[str]) -> Dict[str, int]:
+        """{language: messages} over the shop's recent messages."""
+        with self._lock:
+            recent = list(self._shops.get(shop_id) or ()) if shop_id else []
+        return {language: recent.count(language) for language in (HINDI, ENGLISH)}
+
+
+@dataclass
+class Transcription:
+    text: str
+    hint: str  # "hi" or "auto"
+    passes: int
+    language: Optional[str]
+    seconds: float
+
+
+class TranscriptionStrategy:
+    """Picks the Whisper call(s) for a voice upload and keeps the shop histories."""
+
+    def __init__(self, history: Optional[LanguageHistory] = None, min_history: int = 5,
+                 hindi_share: float = 0.6, probe_every: int = 10):
+        self.history = history or LanguageHistory()
+        self.min_history = min_history
+        self.hindi_share = hindi_share
+        self.probe_every = probe_every
+        self._hinted: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.notes = 0
+        self.second_passes = 0
+
+    @classmethod
+    def from_env(cls) -> "TranscriptionStrategy":
+        history = LanguageHistory(
+            size=Config.TRANSCRIBE_HISTORY_SIZE,
+            max_shops=Config.TRANSCRIBE_HISTORY_SHOPS,
+        )
+        return cls(
+            history=history,
+            min_history=Config.TRANSCRIBE_MIN_HISTORY,
+            hindi_share=Config.TRANSCRIBE_HINDI_SHARE,
+            probe_every=Config.TRANSCRIBE_PROBE_EVERY,
+        )
+
+    def plan(self, shop_id: Optional[str]) -> str:
+        """Either "hi" (transcribe once as Hindi) or "auto" (auto-detect, maybe re-run)."""
+        mix = self.history.mix(shop_id)
+        total = sum(mix.values())
+        if not shop_id or total < self.min_history or mix[HINDI] < self.hindi_share * total:
+            return "auto"
+        with self._lock:
+            hinted = self._hinted.get(shop_id, 0) + 1
+            probe = self.probe_every > 0 and hinted >= self.probe_every
+            self._hinted[shop_id] = 0 if probe else hinted
+            if len(self._hinted) > self.history.max_shops:
+                self._hinted.clear()
+        return "auto" if probe else "hi"
+
+    def transcribe(self, shop_id: Optional[str], audio: Any, create: Callable[..., Any]) -> Transcription:
+        """Transcribe `audio` (a voice_ingest.VoiceStream) with create(file=..., **params).
+
+        Every pass goes through transcript_cache.
+        """
+        started = time.perf_counter()
+        hint = self.plan(shop_id)
+        language = None
+        if hint == "hi":
+            text = self._hindi_pass(audio, create)
+            passes = 1
+        else:
+            detected = transcript_cache.CACHE.transcribe(
+                audio, "transcribe-verbose_json",
+                lambda file: create(file=file, response_format="verbose_json"))
+            text = detected.text or ""
+            passes = 1
+            language = detected_language(text, getattr(detected, "language", None))
+            self.history.record(shop_id, language)
+            if _URDU_SCRIPT.search(text):
+                tracing.log("🔄 Urdu script in the transcript, re-transcribing as Hindi (Devanagari)")
+                audio.seek(0)
+                text = self._hindi_pass(audio, create)
+                passes = 2
+        seconds = time.perf_counter() - started
+        with self._lock:
+            self.notes += 1
+            self.second_passes += passes > 1
+        REQUESTS.inc(hint=hint, passes=passes)
+        SECONDS.observe(seconds, hint=hint, passes=passes)
+        tracing.annotate(f"{hint}:{passes}")
+        return Transcription(text=text, hint=hint, passes=passes, language=language, seconds=seconds)
+
+    @staticmethod
+    def _hindi_pass(audio: Any, create: Callable[..., Any]) -> str:
+        transcript = transcript_cache.CACHE.transcribe(
+            audio, "transcribe-text-hi",
+            lambda file: create(file=file, response_format="text", language="hi"))
+        if isinstance(transcript, str):
+            return transcript
+        return getattr(transcript, "text", None) or ""
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            notes, second = self.notes, self.second_passes
+        return {"notes": notes, "second_passes": second, "second_pass_ratio": second / notes if notes else 0.0}
+
+
+STRATEGY = TranscriptionStrategy.from_env()
+
+
+def _collect() -> List[str]:
+    return [
+        "# HELP kirana_transcribe_second_pass_ratio Voice uploads that needed a second Whisper pass, this worker.",
+        "# TYPE kirana_transcribe_second_pass_ratio gauge",
+        f"kirana_transcribe_second_pass_ratio {STRATEGY.stats()['second_pass_ratio']}",
+    ]
+
+
+tracing.REGISTRY.add_collector(_collect)
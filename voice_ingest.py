@@ -0,0 +1,232 @@
+"""
+Voice ingestion: provider media streamed straight into the Whisper upload
+
+A voice note used to be downloaded whole into memory, written to a temp
+file, reopened and uploaded (WhatsApp path), or copied into two BytesIO
+buffers (browser path). Now the audio is only ever in flight:
+
+- `open_media(url)` starts the download on a pooled session and returns a
+  `VoiceStream`, a read-only file object that pulls the body in
+  VOICE_CHUNK_BYTES (64 KB) chunks as the OpenAI client uploads it;
+- `wrap_upload(stream)` gives a browser upload (Werkzeug's spooled file)
+  the same treatment, and can be rewound for a second Whisper pass;
+- both stop at MAX_VOICE_FILE_SIZE (25 MB, Whisper's upload limit) with
+  `VoiceTooLarge`, checked against Content-Length first when there is one.
+
+Connections to the media hosts are kept alive in one requests.Session per
+worker (VOICE_POOL_SIZE connections per host, default 16). Per voice note
+the stages are recorded on /metrics:
+
+    kirana_voice_bytes{source}                       audio size
+    kirana_voice_stage_seconds{source, stage}        connect (until the media
+                                                     headers), transfer (first to
+                                                     last byte read), transcribe
+                                                     (last byte to Whisper's answer)
+    kirana_voice_rejected_total{source, reason}      too_large, download_failed
+"""
+import io
+import threading
+import time
+from typing import Any, Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import tracing
+from config import Config
+
+BYTES = tracing.REGISTRY.histogram(
+    "kirana_voice_bytes",
+    "Voice note size in bytes, by source (whatsapp, upload).",
+    ("source",),
+    buckets=(8e3, 32e3, 64e3, 128e3, 256e3, 512e3, 1e6, 2e6, 4e6, 8e6, 16e6, 25e6),
+)
+STAGE_SECONDS = tracing.REGISTRY.histogram(
+    "kirana_voice_stage_seconds",
+    "Voice ingestion time per stage (connect, transfer, transcribe), by source.",
+    ("source", "stage"),
+)
+REJECTED = tracing.REGISTRY.counter(
+    "kirana_voice_rejected_total",
+    "Voice notes not transcribed, by source and reason (too_large, download_failed).",
+    ("source", "reason"),
+)
+
+
+class VoiceTooLarge(Exception):
+    """The voice note is over MAX_VOICE_FILE_SIZE."""
+
+
+class MediaDownloadFailed(Exception):
+    """The media host refused or failed the download."""
+
+
+def max_bytes() -> int:
+    return Config.MAX_VOICE_FILE_SIZE
+
+
+def chunk_bytes() -> int:
+    return Config.VOICE_CHUNK_BYTES
+
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+
+def session() -> requests.Session:
+    """The worker's pooled session for media downloads."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                pool = Config.VOICE_POOL_SIZE
+                new = requests.Session()
+                adapter = HTTPAdapter(pool_connections=pool, pool_maxsize=pool)
+                new.mount("https://", adapter)
+                new.mount("http://", adapter)
+                _session = new
+    return _session
+
+
+class VoiceStream(io.RawIOBase):
+    """Read-only file object over a voice note, counting bytes and enforcing the cap.
+
+    The OpenAI client accepts any io.IOBase as `file` and reads it in chunks
+    while uploading, so the note is never held whole. `finish()` records the
+    size and stage timings once Whisper has answered.
+    """
+
+    def __init__(self, chunks: Any, name: str, source: str, limit: Optional[int] = None,
+                 rewind: Any = None, connect_seconds: Optional[float] = None):
+        super().__init__()
+        self.name = name
+        self.source = source
+        self.limit = max_bytes() if limit is None else limit
+        self.bytes_read = 0
+        self.connect_seconds = connect_seconds
+        self._chunks = chunks
+        self._rewind = rewind
+        self._pending = b""
+        self._first_read: Optional[float] = None
+        self._last_read: Optional[float] = None
+        self._finished = False
+        self._content: Optional[bytes] = None
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return self._rewind is not None
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        # Only rewinding to the start, for a second pass
+        if self._rewind is None or offset != 0 or whence != io.SEEK_SET:
+            raise io.UnsupportedOperation("voice streams only rewind to the start")
+        if self.bytes_read:
+            self._chunks = self._rewind()
+            self._pending = b""
+            self.bytes_read = 0
+        return 0
+
+    def readinto(self, buffer: Any) -> int:
+        if self._first_read is None:
+            self._first_read = time.perf_counter()
+        while not self._pending:
+            chunk = next(self._chunks, b"")
+            if not chunk:
+                self._last_read = time.perf_counter()
+                return 0
+            self._pending = memoryview(chunk)
+        size = min(len(buffer), len(self._pending))
+        buffer[:size] = self._pending[:size]
+        self._pending = self._pending[size:]
+        self.bytes_read += size
+        if self.bytes_read > self.limit:
+            REJECTED.inc(source=self.source, reason="too_large")
+            raise VoiceTooLarge(f"voice note over {self.limit} bytes")
+        return size
+
+    def content(self) -> bytes:
+        """The whole note (up to the cap), read once; later reads replay it from memory.
+
+        For callers that need the bytes before the upload (the transcript
+        cache hashes them); the stream is left at the start, rewindable.
+        """
+        if self._content is None:
+            if self.bytes_read:
+                self.seek(0)
+            self._content = self.read()
+            self._rewind = lambda: iter((self._content,))
+            self._chunks = self._rewind()
+            self._pending = b""
+            self.bytes_read = 0
+        return self._content
+
+    def finish(self) -> None:
+        """Record size and stage timings (once) after the transcription returned."""
+        if self._finished:
+            return
+        self._finished = True
+        now = time.perf_counter()
+        # content() rewinds bytes_read; a cache hit never reads the replay at all
+        size = len(self._content) if self._content is not None else self.bytes_read
+        BYTES.observe(size, source=self.source)
+        if self.connect_seconds is not None:
+            STAGE_SECONDS.observe(self.connect_seconds, source=self.source, stage="connect")
+        if self._first_read is not None:
+            last = self._last_read or now
+            STAGE_SECONDS.observe(last - self._first_read, source=self.source, stage="transfer")
+            STAGE_SECONDS.observe(now - last, source=self.source, stage="transcribe")
+
+
+class _ResponseStream(VoiceStream):
+    """A VoiceStream that closes its HTTP response (returning the connection to the pool)."""
+
+    response: Any = None
+
+    def close(self) -> None:
+        if self.response is not None:
+            self.response.close()
+        super().close()
+
+
+def open_media(url: str, audio_format: str = "ogg", headers: Optional[Dict[str, str]] = None,
+               timeout: float = 30.0, source: str = "whatsapp") -> VoiceStream:
+    """Start downloading `url` and return it as a VoiceStream; the body is read on demand.
+
+    Raises VoiceTooLarge when Content-Length is already over the cap and
+    MediaDownloadFailed for connection errors and non-2xx answers. The
+    response is closed when the stream is.
+    """
+    started = time.perf_counter()
+    try:
+        response = session().get(url, headers=headers, stream=True, timeout=timeout)
+        response.raise_for_status()
+    except requests.RequestException as e:
+        REJECTED.inc(source=source, reason="download_failed")
+        raise MediaDownloadFailed(str(e)) from e
+    limit = max_bytes()
+    declared = response.headers.get("Content-Length")
+    if declared and declared.isdigit() and int(declared) > limit:
+        response.close()
+        REJECTED.inc(source=source, reason="too_large")
+        raise VoiceTooLarge(f"voice note is {declared} bytes, over {limit}")
+    stream = _ResponseStream(response.iter_content(chunk_bytes()), f"voice.{audio_format}", source,
+                             limit=limit, connect_seconds=time.perf_counter() - started)
+    stream.response = response
+    return stream
+
+
+def wrap_upload(stream: Any, name: str, declared_length: Optional[int] = None) -> VoiceStream:
+    """A browser upload (Werkzeug FileStorage.stream) as a rewindable VoiceStream."""
+    limit = max_bytes()
+    if declared_length and declared_length > limit:
+        REJECTED.inc(source="upload", reason="too_large")
+        raise VoiceTooLarge(f"voice note is {declared_length} bytes, over {limit}")
+    size = chunk_bytes()
+
+    def chunks():
+        stream.seek(0)
+        return iter(lambda: stream.read(size), b"")
+
+    return VoiceStream(chunks(), name, "upload", limit=limit, rewind=chunks)
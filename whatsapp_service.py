@@ -117,6 +117,15 @@ class WhatsAppService:
             return self._download_whatsapp_cloud_media(media_id)
         return None
     
+    def media_headers(self) -> Dict[str, str]:
+        """Headers for fetching a media URL from download_media()
+
+        WhatsApp Cloud media URLs only answer with the access token.
+        """
+        if self.provider == "whatsapp_cloud":
+            return {"Authorization": f"Bearer {self.access_token}"}
+        return {}
+
     def _download_wati_media(self, media_id: str) -> Optional[str]:
         """Download media via WATI API"""
         try: